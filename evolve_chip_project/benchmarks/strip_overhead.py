@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+evolve-stripのマイクロベンチマーク
+
+@evolve付きのモジュールを生成し、次の3つを比較します：
+- plain:    デコレータを付けずに書いたモジュール
+- decorated: @evolve付きのモジュール（開発時の状態）
+- stripped: decoratedをevolve-stripで書き換えたモジュール
+
+strippedはplainと同じ呼び出しコスト・インポートコストになり、
+evolve_chipを一切インポートしないことを確認します。
+
+使い方：python benchmarks/strip_overhead.py [--functions 200] [--runs 15]
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from evolve_chip.constraints.benchmark import BenchmarkConfig, benchmark
+from evolve_chip.core.strip import strip_source
+
+FUNCTION_TEMPLATE = '''
+{decorator}def func_{index}(x: int) -> int:
+    """サンプル関数 {index}"""
+    return x + {index}
+'''
+
+DECORATOR = "@evolve(goals=[EvolutionGoal.PERFORMANCE], constraints={'runtime': '< 0.1s'})\n"
+
+IMPORT_PROBE = """
+import sys, time, json
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "chip_loaded": any(m.startswith("evolve_chip") for m in sys.modules)}}))
+"""
+
+
+def build_module(count: int, decorated: bool) -> str:
+    header = ""
+    if decorated:
+        header = "from evolve_chip.core.decorators import evolve, EvolutionGoal\n"
+    body = "".join(
+        FUNCTION_TEMPLATE.format(index=i, decorator=DECORATOR if decorated else "")
+        for i in range(count)
+    )
+    return header + body
+
+
+def measure_import(directory: str, module: str, runs: int) -> dict:
+    """新しいインタプリタでモジュールのインポート時間を計測（中央値）"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([directory, root_dir]), PYTHONDONTWRITEBYTECODE="1")
+    samples = []
+    chip_loaded = False
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE.format(module=module)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output)
+        samples.append(result["seconds"])
+        chip_loaded = chip_loaded or result["chip_loaded"]
+    return {"seconds": statistics.median(samples), "chip_loaded": chip_loaded}
+
+
+def measure_call(source: str) -> float:
+    """モジュール内の関数1回の呼び出し時間（中央値、秒）"""
+    namespace = {"__name__": "bench"}
+    exec(compile(source, "<bench>", "exec"), namespace)
+    func = namespace["func_0"]
+    config = BenchmarkConfig(warmup=3, min_samples=15, max_samples=50, max_time=0.5)
+    return benchmark(lambda: func(1), config).median
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--functions", type=int, default=200, help="生成する関数の数")
+    parser.add_argument("--runs", type=int, default=15, help="インポート時間の計測回数")
+    args = parser.parse_args()
+
+    sources = {
+        "plain": build_module(args.functions, decorated=False),
+        "decorated": build_module(args.functions, decorated=True),
+    }
+    sources["stripped"] = strip_source(sources["decorated"]).source
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, source in sources.items():
+            with open(os.path.join(directory, f"bench_{name}.py"), "w", encoding="utf-8") as f:
+                f.write(source)
+
+        print(f"{args.functions} functions, import median of {args.runs} runs")
+        print(f"{'variant':<10} {'call (ns)':>10} {'import (ms)':>12}  evolve_chip loaded")
+        results = {}
+        for name, source in sources.items():
+            call = measure_call(source)
+            imported = measure_import(directory, f"bench_{name}", args.runs)
+            results[name] = (call, imported)
+            print(
+                f"{name:<10} {call * 1e9:>10.1f} {imported['seconds'] * 1e3:>12.2f}  "
+                f"{'yes' if imported['chip_loaded'] else 'no'}"
+            )
+
+    plain_call, plain_import = results["plain"]
+    stripped_call, stripped_import = results["stripped"]
+    print(
+        f"\nstripped vs plain: call {stripped_call / plain_call:.2f}x, "
+        f"import {stripped_import['seconds'] / plain_import['seconds']:.2f}x"
+    )
+    return 1 if stripped_import["chip_loaded"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
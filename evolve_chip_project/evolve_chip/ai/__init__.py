@@ -4,6 +4,7 @@
 
 from .base import AIClientBase
 from .mock import MockAIClient
+from .cache import CachedAIClient, ResponseCache
 
 __version__ = "0.1.0"
-__all__ = ['AIClientBase', 'MockAIClient'] 
\ No newline at end of file
+__all__ = ['AIClientBase', 'MockAIClient', 'CachedAIClient', 'ResponseCache'] 
\ No newline at end of file
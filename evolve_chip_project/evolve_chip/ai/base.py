@@ -3,7 +3,9 @@
 """
 
 import abc
-from typing import Dict, Any, Optional, List, Union
+import asyncio
+import functools
+from typing import Dict, Any, Iterator, Optional, List, Union
 
 
 class AIClientBase(abc.ABC):
@@ -66,4 +68,60 @@ class AIClientBase(abc.ABC):
         Returns:
             埋め込みベクトルまたはベクトルのリスト
         """
-        pass 
\ No newline at end of file
+        pass
+    
+    def stream_content(self, prompt: str) -> Iterator[str]:
+        """
+        テキスト生成をストリーミングで実行する
+        
+        デフォルト実装は生成結果全体を1つのチャンクとして返します。
+        逐次生成に対応したクライアントはオーバーライドしてください。
+        
+        Args:
+            prompt: 入力プロンプト
+            
+        Yields:
+            生成されたテキストのチャンク
+        """
+        yield self.generate_content(prompt)
+    
+    async def agenerate_content(
+        self,
+        prompt: str,
+        options: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        """
+        テキスト生成を非同期に実行する
+        
+        デフォルト実装は同期版のgenerate_contentをスレッドで実行します。
+        ネイティブな非同期処理を持つクライアントはオーバーライドしてください。
+        
+        Args:
+            prompt: 入力プロンプト
+            options: 生成オプション（温度、トークン数など）
+            
+        Returns:
+            generate_contentと同じ生成結果
+        """
+        args = (prompt,) if options is None else (prompt, options)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(self.generate_content, *args))
+    
+    async def achat(
+        self,
+        messages: List[Dict[str, str]],
+        options: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        """
+        チャット形式での対話を非同期に実行する
+        
+        Args:
+            messages: メッセージリスト（各メッセージは"role"と"content"を含む辞書）
+            options: 生成オプション（温度、トークン数など）
+            
+        Returns:
+            chatと同じ生成結果
+        """
+        args = (messages,) if options is None else (messages, options)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(self.chat, *args))
@@ -0,0 +1,405 @@
+"""
+AIレスポンスのディスクキャッシュ
+
+モデル名・プロンプト・生成オプションのハッシュをキーとして
+応答を圧縮保存し、同じリクエストの再送を防ぎます。
+"""
+
+import os
+import ast
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Any, Iterator, Optional, List, Union
+
+from .base import AIClientBase
+from ..core.response import CodeBlockStreamParser
+from ..metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CACHE_LOOKUPS = REGISTRY.counter(
+    "evolve_chip_response_cache_lookups", "AIの応答キャッシュの参照回数", ("result",)
+)
+_HITS = CACHE_LOOKUPS.labels("hit")
+_MISSES = CACHE_LOOKUPS.labels("miss")
+
+# キャッシュサイズ上限の既定値（圧縮後のバイト数）
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# エントリの有効期限の既定値（秒）
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60
+
+
+def default_cache_path() -> str:
+    """キャッシュファイルの既定パスを取得"""
+    path = os.environ.get("EVOLVE_CHIP_CACHE")
+    if path:
+        return path
+    return os.path.join(os.path.expanduser("~"), ".evolve_chip", "response_cache.db")
+
+
+@dataclass
+class CacheStats:
+    """キャッシュの統計情報"""
+
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+    entries: int = 0
+    total_bytes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """ヒット率（0.0〜1.0）"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class ResponseCache:
+    """
+    コンテンツアドレス型のレスポンスキャッシュ
+
+    SQLiteにzlib圧縮したエントリを保存し、サイズ上限を超えた場合は
+    最終アクセスが古いものから削除します（LRU）。
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS
+    ):
+        """
+        キャッシュの初期化
+
+        Args:
+            path: キャッシュファイルのパス（未指定時は~/.evolve_chip/response_cache.db）
+            max_bytes: 圧縮後の合計サイズ上限
+            ttl_seconds: エントリの有効期限（Noneの場合は無期限）
+        """
+        self.path = path or default_cache_path()
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._stats = CacheStats()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, prompt: Any, options: Optional[Dict[str, Any]] = None) -> str:
+        """
+        キャッシュキーを生成
+
+        Args:
+            model: モデル名
+            prompt: プロンプト（JSONに変換できる値）
+            options: 生成オプション
+
+        Returns:
+            SHA-256ハッシュの16進文字列
+        """
+        payload = json.dumps(
+            {"model": model, "prompt": prompt, "options": options or {}},
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        キャッシュから値を取得
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            保存された値。存在しない・期限切れの場合はNone
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._stats.misses += 1
+                _MISSES.inc()
+                return None
+
+            value, created_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self._stats.misses += 1
+                self._stats.evictions += 1
+                _MISSES.inc()
+                return None
+
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self._stats.hits += 1
+            _HITS.inc()
+        return json.loads(zlib.decompress(value).decode("utf-8"))
+
+    def put(self, key: str, value: Any) -> None:
+        """
+        値をキャッシュに保存
+
+        Args:
+            key: キャッシュキー
+            value: 保存する値（JSONに変換できる値）
+        """
+        blob = zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), now, now)
+            )
+            self._stats.stores += 1
+            self._evict_locked(now)
+            self._conn.commit()
+
+    def delete(self, key: str) -> bool:
+        """
+        エントリを削除
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            エントリが存在した場合はTrue
+        """
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def evict(self) -> int:
+        """
+        期限切れのエントリとサイズ上限を超えた分を削除
+
+        Returns:
+            削除したエントリ数
+        """
+        with self._lock:
+            removed = self._evict_locked(time.time())
+            self._conn.commit()
+        return removed
+
+    def _evict_locked(self, now: float) -> int:
+        """ロック取得済みの状態でエビクションを実行"""
+        removed = 0
+        if self.ttl_seconds is not None:
+            cursor = self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+            removed += cursor.rowcount
+
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            # 最終アクセスが古い順に、上限を下回るまで削除
+            victims = []
+            for key, size in self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+            ):
+                if total <= self.max_bytes:
+                    break
+                victims.append((key,))
+                total -= size
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+            removed += len(victims)
+
+        self._stats.evictions += removed
+        return removed
+
+    def clear(self) -> None:
+        """すべてのエントリを削除"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    @property
+    def stats(self) -> CacheStats:
+        """ヒット・ミスの統計と現在のエントリ数・サイズ"""
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            return CacheStats(
+                hits=self._stats.hits,
+                misses=self._stats.misses,
+                stores=self._stats.stores,
+                evictions=self._stats.evictions,
+                entries=entries,
+                total_bytes=total
+            )
+
+    def close(self) -> None:
+        """データベース接続を閉じる"""
+        with self._lock:
+            self._conn.close()
+
+
+def _has_complete_code_block(text: str) -> bool:
+    """閉じたコードブロックがあり、その中身が構文として正しいかどうか"""
+    parser = CodeBlockStreamParser()
+    parser.feed(text)
+    if not parser.complete:
+        return False
+    try:
+        ast.parse(parser.code)
+    except SyntaxError:
+        return False
+    return True
+
+
+class CachedAIClient(AIClientBase):
+    """
+    レスポンスキャッシュ付きAIクライアント
+
+    任意のAIClientBase実装をラップし、同じモデル・プロンプト・オプションの
+    リクエストにはキャッシュから応答します。
+    """
+
+    def __init__(self, client: AIClientBase, cache: Optional[ResponseCache] = None):
+        """
+        キャッシュ付きクライアントの初期化
+
+        Args:
+            client: ラップするAIクライアント
+            cache: 使用するキャッシュ（未指定時は既定パスのキャッシュ）
+        """
+        self.client = client
+        self.cache = cache or ResponseCache()
+        self.model = getattr(client, "model", type(client).__name__)
+
+    def _key(self, method: str, prompt: Any, options: Optional[Dict[str, Any]]) -> str:
+        return self.cache.make_key(f"{self.model}:{method}", prompt, options)
+
+    @staticmethod
+    def _args(value: Any, options: Optional[Dict[str, Any]]) -> tuple:
+        # オプションを受け取らないクライアントにも対応する
+        return (value,) if options is None else (value, options)
+
+    def generate_content(self, prompt: str, options: Optional[Dict[str, Any]] = None) -> Any:
+        """キャッシュを参照してテキスト生成を実行"""
+        key = self._key("generate_content", prompt, options)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        result = self.client.generate_content(*self._args(prompt, options))
+        self.cache.put(key, result)
+        return result
+
+    async def agenerate_content(self, prompt: str, options: Optional[Dict[str, Any]] = None) -> Any:
+        """キャッシュを参照してテキスト生成を非同期に実行"""
+        key = self._key("generate_content", prompt, options)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        result = await self.client.agenerate_content(*self._args(prompt, options))
+        self.cache.put(key, result)
+        return result
+
+    def stream_content(self, prompt: str) -> Iterator[str]:
+        """
+        キャッシュを参照してストリーミング生成を実行
+
+        ヒットした場合は保存済みのテキストを1チャンクで返します。
+        保存するのはストリームが最後まで届いた場合と、呼び出し元が閉じた時点で
+        構文の正しいコードブロックを受信し終えていた場合だけです。途中で
+        例外が発生した応答や、構文エラーで打ち切った応答は保存しません。
+        """
+        key = self._key("stream_content", prompt, None)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+        received = []
+        finished = False
+        try:
+            for chunk in self.client.stream_content(prompt):
+                received.append(chunk)
+                yield chunk
+            finished = True
+        except GeneratorExit:
+            finished = _has_complete_code_block("".join(received))
+            raise
+        finally:
+            if finished and received:
+                self.cache.put(key, "".join(received))
+
+    def invalidate(self, prompt: str, options: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        プロンプトに対して保存した応答を削除
+
+        使えなかった応答（検証を通らなかった候補など）を次回以降に再生しないために使います。
+        generate_contentとstream_contentのどちらで保存した応答も削除します。
+
+        Returns:
+            削除した応答があればTrue
+        """
+        removed = self.cache.delete(self._key("generate_content", prompt, options))
+        if options is None:
+            removed = self.cache.delete(self._key("stream_content", prompt, None)) or removed
+        return removed
+
+    def chat(self, messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None) -> Any:
+        """キャッシュを参照してチャットを実行"""
+        key = self._key("chat", messages, options)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        result = self.client.chat(*self._args(messages, options))
+        self.cache.put(key, result)
+        return result
+
+    def embed(
+        self,
+        text: Union[str, List[str]],
+        options: Optional[Dict[str, Any]] = None
+    ) -> List[List[float]]:
+        """キャッシュを参照して埋め込みベクトルを取得"""
+        key = self._key("embed", text, options)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        result = self.client.embed(*self._args(text, options))
+        self.cache.put(key, result)
+        return result
+
+    def __getattr__(self, name: str) -> Any:
+        # キャッシュ対象外のメソッド・属性はラップ先に委譲する
+        if name == "client":
+            raise AttributeError(name)
+        return getattr(self.client, name)
@@ -0,0 +1,150 @@
+"""
+コードの埋め込みベクトル
+
+AIクライアントの埋め込みAPIをまとめて呼び出し、使えない場合（オフライン、
+埋め込みに対応していないクライアント）はトークンn-gramを特徴ハッシュした
+ローカルの埋め込みに切り替えます。
+"""
+
+import re
+import hashlib
+import logging
+import threading
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ハッシュ埋め込みの次元数
+HASHED_DIM = 512
+HASHED_MODEL = "hashed-ngram"
+
+# 埋め込みAPIに1回で渡すテキスト数
+DEFAULT_BATCH_SIZE = 100
+
+_TOKEN_PATTERN = re.compile(r"[A-Za-z_]\w*|\d+(?:\.\d+)?|==|!=|<=|>=|\*\*|//|->|[^\s\w]")
+_COMMENT_PATTERN = re.compile(r"#[^\n]*")
+_KEYWORDS = frozenset(
+    "False None True and as assert async await break class continue def del elif else except "
+    "finally for from global if import in is lambda nonlocal not or pass raise return try while "
+    "with yield self".split()
+)
+
+
+def _abstract(token: str) -> str:
+    """識別子と数値を種類だけに置き換える（名前の違う同じ構造の関数を近づける）"""
+    if token[0].isdigit():
+        return "NUM"
+    if (token[0].isalpha() or token[0] == "_") and token not in _KEYWORDS:
+        return "ID"
+    return token
+
+
+def _bucket(feature: str, dim: int) -> int:
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    # 最上位ビットを符号に使い、ハッシュの衝突による偏りを打ち消す
+    value = int.from_bytes(digest, "little")
+    return (value >> 1) % dim if value & 1 else -((value >> 1) % dim) - 1
+
+
+def hashed_embedding(text: str, dim: int = HASHED_DIM) -> np.ndarray:
+    """
+    トークンn-gramの特徴ハッシュによる埋め込み（L2正規化済み）
+
+    コメントを除いたトークンの1〜2-gramと、識別子・数値を抽象化した
+    3-gramを特徴にします。同じ処理を別の名前で書いた関数ほど近くなります。
+
+    Args:
+        text: 対象のテキスト（主にソースコード）
+        dim: 次元数
+
+    Returns:
+        float32のベクトル。トークンがない場合はゼロベクトル
+    """
+    tokens = _TOKEN_PATTERN.findall(_COMMENT_PATTERN.sub("", text))
+    abstract = [_abstract(token) for token in tokens]
+    features = list(tokens)
+    features += [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    features += [f"~{a} {b} {c}" for a, b, c in zip(abstract, abstract[1:], abstract[2:])]
+
+    vector = np.zeros(dim, dtype=np.float32)
+    if not features:
+        return vector
+    buckets = np.fromiter((_bucket(f, dim) for f in features), dtype=np.int64, count=len(features))
+    signs = np.where(buckets >= 0, 1.0, -1.0).astype(np.float32)
+    np.add.at(vector, np.where(buckets >= 0, buckets, -buckets - 1), signs)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """各行をL2正規化（ゼロベクトルはそのまま）"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+class Embedder:
+    """
+    テキストをまとめて埋め込む
+
+    クライアントの埋め込みAPIをbatch_size件ずつ呼び出します。失敗した場合や
+    ベクトルが使えない（ゼロベクトル、次元の不一致）場合は、以降ハッシュ埋め込みを使います。
+    modelは生成したベクトルの空間を表し、異なるmodelのベクトルは比較できません。
+    """
+
+    def __init__(self, client: Optional[Any] = None, batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        初期化
+
+        Args:
+            client: 埋め込みAPIを持つAIクライアント（Noneの場合はハッシュ埋め込みのみ）
+            batch_size: 1回の呼び出しで渡すテキスト数
+        """
+        self.client = client
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        if client is None:
+            self.model = HASHED_MODEL
+        else:
+            self.model = getattr(client, "embedding_model", None) or type(client).__name__
+
+    @property
+    def uses_fallback(self) -> bool:
+        """ハッシュ埋め込みを使っているかどうか"""
+        return self.model == HASHED_MODEL
+
+    def _fall_back(self, reason: str) -> None:
+        with self._lock:
+            if not self.uses_fallback:
+                logger.warning(f"埋め込みAPIを使えないため、ローカルのハッシュ埋め込みに切り替えます: {reason}")
+                self.model = HASHED_MODEL
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        テキストを埋め込む
+
+        Args:
+            texts: 対象のテキスト
+
+        Returns:
+            (件数, 次元数)のL2正規化済みの配列
+        """
+        texts = list(texts)
+        if not self.uses_fallback and texts:
+            try:
+                vectors = []
+                for start in range(0, len(texts), self.batch_size):
+                    vectors.extend(self.client.embed(texts[start:start + self.batch_size]))
+                matrix = np.asarray(vectors, dtype=np.float32)
+                if matrix.ndim != 2 or len(matrix) != len(texts):
+                    raise ValueError(f"埋め込みの形状が不正です: {matrix.shape}")
+                if not np.linalg.norm(matrix, axis=1).all():
+                    raise ValueError("ゼロベクトルが含まれています")
+                return normalize_rows(matrix)
+            except Exception as e:
+                self._fall_back(str(e))
+        if not texts:
+            return np.zeros((0, HASHED_DIM), dtype=np.float32)
+        return np.stack([hashed_embedding(text) for text in texts])
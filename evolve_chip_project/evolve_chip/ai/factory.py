@@ -24,7 +24,7 @@ def create_ai_client(
     Args:
         provider: AIプロバイダー名（"mock"または"gemini"）
         api_key: APIキー（オプション）
-        **kwargs: その他のオプション
+        **kwargs: その他のオプション（Geminiの場合はmax_concurrencyなど）
         
     Returns:
         AIClientBaseのインスタンス
@@ -45,6 +45,6 @@ def create_ai_client(
             return MockAIClient(**kwargs)
         
         logger.info("Gemini APIクライアントを使用します")
-        return GeminiClient(api_key=api_key)
+        return GeminiClient(api_key=api_key, **kwargs)
     else:
         raise ValueError(f"不明なプロバイダー: {provider}") 
\ No newline at end of file
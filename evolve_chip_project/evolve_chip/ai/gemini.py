@@ -5,21 +5,136 @@ Google Gemini APIを利用したAIクライアント実装
 """
 
 import os
+import socket
+import asyncio
 import logging
 import json
+import threading
+import time
+import contextvars
 import requests
 import random
-from typing import Dict, Any, Optional, List, Union
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from typing import Callable, Dict, Any, Iterator, Optional, List, Set, Union
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 
 from .base import AIClientBase
+from .hedge import CancelToken, HedgeConfig, Hedger
+from .key_manager import APIKeyManager, KeyLease, mask_key, parse_retry_after
+from .retry import (
+    FATAL, KEY, DeadlineExceededError, FatalAPIError, RetryPolicy, RetryStats,
+    classify_error, describe_error, remaining_time, retry_after_of
+)
+from .tokens import estimate_tokens
+from .usage import TokenUsage, report_usage
 from .models import AIMessage, AIOptions, AIResponse, AIEmbedding
+from ..metrics import REGISTRY
 
 logger = logging.getLogger(__name__)
 
+API_REQUESTS = REGISTRY.counter(
+    "evolve_chip_gemini_requests", "Gemini APIへのリクエスト数（APIキー・結果ごと）", ("key", "status")
+)
+API_REQUEST_SECONDS = REGISTRY.histogram(
+    "evolve_chip_gemini_request_seconds", "Gemini APIへの1回のリクエストのレイテンシ（秒、APIキーごと）", ("key",)
+)
+
 # .envファイルを読み込み
 load_dotenv()
 
+# 同時に送信できるリクエスト数の既定値
+DEFAULT_MAX_CONCURRENCY = 8
+
+# 埋め込みモデルと、batchEmbedContentsの1リクエストあたりの最大件数
+DEFAULT_EMBEDDING_MODEL = "text-embedding-004"
+EMBED_BATCH_SIZE = 100
+
+def _env_float(name: str) -> Optional[float]:
+    """環境変数を数値として取得（未設定時はNone）"""
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+# 取り消し時に切断できるよう、各スレッドで送信に使った接続を通知する先
+_tracking = threading.local()
+
+
+def _track(conn) -> None:
+    track = getattr(_tracking, "callback", None)
+    if track is not None:
+        track(conn)
+
+
+class _TrackedHTTPConnection(HTTPConnection):
+    def request(self, *args, **kwargs):
+        _track(self)
+        return super().request(*args, **kwargs)
+
+
+class _TrackedHTTPSConnection(HTTPSConnection):
+    def request(self, *args, **kwargs):
+        _track(self)
+        return super().request(*args, **kwargs)
+
+
+class _TrackedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TrackedHTTPConnection
+
+
+class _TrackedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TrackedHTTPSConnection
+
+
+class _CancellableAdapter(HTTPAdapter):
+    """送信に使った接続を_AbortOnCancelで切断できるアダプタ"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TrackedHTTPConnectionPool,
+            "https": _TrackedHTTPSConnectionPool,
+        }
+
+
+def _disconnect(conn) -> None:
+    """送信中の接続を切断し、応答を待っているスレッドの読み込みを失敗させる"""
+    sock = getattr(conn, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class _AbortOnCancel:
+    """withブロック内でこのスレッドが送信に使った接続を、cancelがセットされたら切断する"""
+
+    def __init__(self, cancel: CancelToken):
+        self.cancel = cancel
+        self.conns: list = []
+
+    def _track(self, conn) -> None:
+        self.conns.append(conn)
+        if self.cancel.is_set():
+            _disconnect(conn)
+
+    def _abort(self) -> None:
+        for conn in list(self.conns):
+            _disconnect(conn)
+
+    def __enter__(self):
+        _tracking.callback = self._track
+        self._unregister = self.cancel.on_cancel(self._abort)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._unregister()
+        _tracking.callback = None
+
+
 class GeminiClient(AIClientBase):
     """
     Gemini APIクライアント
@@ -27,101 +142,430 @@ class GeminiClient(AIClientBase):
     Google Gemini APIを利用してコード生成を行うクライアント
     """
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        api_keys: Optional[List[str]] = None,
+        model: Optional[str] = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        embedding_model: Optional[str] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        hedge: Optional[HedgeConfig] = None
+    ):
         """
         Gemini APIクライアントの初期化
         
         Args:
             api_key: Gemini APIキー（未指定時は環境変数から取得）
+            api_keys: 追加のGemini APIキーのリスト
+            model: 使用するモデル名（デフォルト: gemini-pro）
+            max_concurrency: 同時に処理中にできるリクエスト数の上限。
+                             接続プールのサイズも同じ値になります
+            requests_per_minute: キーごとの1分あたりリクエスト数上限
+                                 （未指定時は環境変数GEMINI_RPM、なければ無制限）
+            tokens_per_minute: キーごとの1分あたりトークン数上限
+                               （未指定時は環境変数GEMINI_TPM、なければ無制限）
+            embedding_model: 埋め込みに使うモデル名
+                             （未指定時は環境変数GEMINI_EMBEDDING_MODEL、なければtext-embedding-004）
+            retry_policy: タイムアウト・呼び出しの期限・再試行の設定
+            hedge: 指定するとgenerate_contentで、応答が遅いリクエストの複製を別のキーで送る
             
         Raises:
             ValueError: 有効なAPIキーが1つも設定されていない場合
         """
-        self.api_keys = []
-        self.current_key_index = 0
+        requests_per_minute = requests_per_minute or _env_float("GEMINI_RPM")
+        tokens_per_minute = tokens_per_minute or _env_float("GEMINI_TPM")
         
-        # 明示的に指定されたキーを追加
-        if api_key:
-            self.api_keys.append(api_key)
-            
-        # 環境変数からキーを収集
-        env_keys = [
-            os.environ.get("GEMINI_API_KEY"),
-            os.environ.get("GEMINI_API_KEY1"),
-            os.environ.get("GEMINI_API_KEY2")
-        ]
-        
-        # 有効なキーを追加
-        for key in env_keys:
-            if key and key not in self.api_keys:
-                self.api_keys.append(key)
+        # 明示的に指定されたキーと環境変数のキーを収集
+        self.key_manager = APIKeyManager(
+            keys=[api_key] + list(api_keys or []),
+            env_vars=["GEMINI_API_KEY", "GEMINI_API_KEY1", "GEMINI_API_KEY2"],
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute
+        )
+        self.api_keys = self.key_manager.keys
                 
         if not self.api_keys:
             raise ValueError("有効なGemini APIキーが設定されていません")
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrencyは1以上である必要があります: {max_concurrency}")
             
         self.base_url = "https://generativelanguage.googleapis.com/v1beta/models"
-        self.model = "gemini-pro"
-        logger.info(f"Gemini APIクライアントを初期化しました（利用可能なキー: {len(self.api_keys)}個）")
+        self.model = model or "gemini-pro"
+        self.embedding_model = (
+            embedding_model or os.environ.get("GEMINI_EMBEDDING_MODEL") or DEFAULT_EMBEDDING_MODEL
+        )
+        self.max_concurrency = max_concurrency
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.stats = RetryStats()
+        
+        # Keep-Aliveで接続を使い回すセッション。プールサイズは同時実行数に合わせる
+        self._session = requests.Session()
+        # ヘッジで負けたリクエストは接続を切断して打ち切る
+        adapter = _CancellableAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self._session.mount("https://", adapter)
+        
+        # ワーカー数がそのまま処理中リクエスト数の上限になる
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency,
+            thread_name_prefix="gemini-client"
+        )
+        # ストリーミングは呼び出し元のスレッドで実行されるため、
+        # プールの処理と合わせた同時実行数をこのセマフォで制限する
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # 複製も_slotsの枠を取って送るため、処理中のリクエストはmax_concurrency以下に収まる。
+        # スレッドは取り消した負けたリクエストの終了待ちの分も含めて2倍用意する
+        self.hedger = Hedger(hedge, max_workers=2 * max_concurrency) if hedge else None
+        logger.info(
+            f"Gemini APIクライアントを初期化しました（利用可能なキー: {len(self.api_keys)}個、"
+            f"最大同時リクエスト数: {max_concurrency}）"
+        )
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+    
+    def close(self) -> None:
+        """ワーカースレッドと接続プールを解放"""
+        self._executor.shutdown(wait=True)
+        if self.hedger is not None:
+            self.hedger.shutdown()
+        self._session.close()
+    
+    def key_utilization(self) -> Dict[str, Dict[str, float]]:
+        """キーごとの直近1分間の利用状況を取得"""
+        return self.key_manager.utilization()
+    
+    def retry_stats(self) -> Dict[str, Any]:
+        """再試行とレイテンシの統計を取得（RetryStats.snapshot()を参照）"""
+        return self.stats.snapshot()
+    
+    def hedge_stats(self) -> Optional[Dict[str, Any]]:
+        """ヘッジの統計（複製の割合・複製が先に成功した割合・現在の閾値など）を取得（無効時はNone）"""
+        return self.hedger.snapshot() if self.hedger is not None else None
+    
+    def _deadline(self, deadline: Optional[float]) -> Optional[float]:
+        """呼び出しの期限（秒、未指定時はretry_policy.deadline）をtime.monotonic()基準の時刻に変換"""
+        seconds = self.retry_policy.deadline if deadline is None else deadline
+        return None if seconds is None else time.monotonic() + seconds
+    
+    def _submit(self, func, *args) -> Future:
+        """
+        リクエスト処理をワーカープールに投入
+        
+        同期・非同期どちらのAPIもここを経由するため、
+        処理中のリクエスト数は常にmax_concurrency以下に抑えられます。
+        トークン使用量の帰属などのため、呼び出し元のコンテキストを引き継ぎます。
+        """
+        return self._executor.submit(contextvars.copy_context().run, func, *args)
+    
+    async def agenerate_content(self, prompt: str, deadline: Optional[float] = None) -> str:
+        """
+        プロンプトからコンテンツを非同期に生成
+        
+        複数の呼び出しをasyncio.gatherで並行実行すると、
+        max_concurrencyの範囲でAPIの待ち時間が重なり合います。
+        
+        Args:
+            prompt: 生成のためのプロンプト
+            deadline: この呼び出し全体の期限（秒、未指定時はretry_policy.deadline）
+            
+        Returns:
+            生成されたコンテンツ
+        """
+        response = await asyncio.wrap_future(
+            self._submit(self._generate_content_blocking, prompt, self._deadline(deadline))
+        )
+        return response.text
     
-    def _get_next_api_key(self) -> str:
-        """次のAPIキーを取得"""
-        key = self.api_keys[self.current_key_index]
-        self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
-        return key
+    async def achat(self, messages: list) -> str:
+        """
+        チャット形式でコンテンツを非同期に生成
+        
+        Args:
+            messages: メッセージのリスト
+            
+        Returns:
+            生成された応答
+        """
+        return await self.agenerate_content(self._format_messages(messages))
     
-    def generate_content(self, prompt: str) -> str:
+    def generate_content(self, prompt: str, deadline: Optional[float] = None) -> str:
         """
         プロンプトからコンテンツを生成
         
+        agenerate_contentと同じワーカープールと接続プールを使用します。
+        期限はワーカープールの空き待ちの時間も含みます。
+        
         Args:
             prompt: 生成のためのプロンプト
+            deadline: この呼び出し全体の期限（秒、未指定時はretry_policy.deadline）
             
         Returns:
             生成されたコンテンツ
             
         Raises:
-            RuntimeError: すべてのAPIキーでリクエストが失敗した場合
-            ValueError: レスポンスに期待されるデータがない場合
-        """
-        # 全てのキーを試行
-        errors = []
-        for _ in range(len(self.api_keys)):
-            api_key = self._get_next_api_key()
-            url = f"{self.base_url}/{self.model}:generateContent"
-            headers = {
-                "Content-Type": "application/json",
-                "x-goog-api-key": api_key
-            }
-            data = {
-                "contents": [{
-                    "parts": [{
-                        "text": prompt
-                    }]
+            FatalAPIError: 再試行しても成功しないエラー（不正なリクエストなど）の場合
+            DeadlineExceededError: 期限内に成功しなかった場合
+            RuntimeError: 再試行の回数の上限まで失敗した場合
+        """
+        return self.generate_response(prompt, deadline).text
+    
+    def generate_response(self, prompt: str, deadline: Optional[float] = None) -> AIResponse:
+        """
+        プロンプトからコンテンツを生成し、トークン使用量とともに返す
+        
+        Args:
+            prompt: 生成のためのプロンプト
+            deadline: この呼び出し全体の期限（秒、未指定時はretry_policy.deadline）
+            
+        Returns:
+            生成されたテキスト・APIのレスポンス・使用量（usageMetadataから取得、
+            prompt_tokens・completion_tokens・total_tokens）
+        """
+        return self._submit(self._generate_content_blocking, prompt, self._deadline(deadline)).result()
+    
+    def _generate_content_blocking(self, prompt: str, deadline: Optional[float]) -> AIResponse:
+        """ワーカースレッド上でAPIを呼び出す"""
+        with self._slots:
+            return self._request_content(prompt, deadline)
+    
+    def _request_content(self, prompt: str, deadline: Optional[float]) -> AIResponse:
+        """generateContentを呼び出す"""
+        data = {
+            "contents": [{
+                "parts": [{
+                    "text": prompt
                 }]
-            }
+            }]
+        }
+        
+        def parse(result: Dict[str, Any]) -> AIResponse:
+            # レスポンスからテキストを抽出
+            if "candidates" in result and result["candidates"]:
+                content = result["candidates"][0]["content"]
+                if "parts" in content and content["parts"]:
+                    text = content["parts"][0]["text"]
+                    logger.debug(f"Gemini APIからの応答: {text[:100]}...")
+                    metadata = result.get("usageMetadata")
+                    return AIResponse(
+                        text=text,
+                        raw_response=result,
+                        model=self.model,
+                        usage=TokenUsage.from_metadata(metadata).to_dict() if metadata else None
+                    )
+            raise ValueError("APIレスポンスに期待されるデータがありません")
+        
+        method = f"{self.model}:generateContent"
+        estimated_tokens = estimate_tokens(prompt)
+        if self.hedger is None:
+            return self._post_json(method, data, estimated_tokens, parse, deadline)
+        return self.hedger.run(
+            lambda cancel, in_use: self._post_json(
+                method, data, estimated_tokens, parse, deadline,
+                cancel=cancel, in_use=in_use, observe=self.hedger.observe
+            ),
+            slots=self._slots
+        )
+    
+    def _headers(self, api_key: str) -> Dict[str, str]:
+        return {
+            "Content-Type": "application/json",
+            "x-goog-api-key": api_key
+        }
+    
+    def _check_status(self, response, api_key: str) -> None:
+        """エラーのステータスなら例外を送出（429の場合はキーをクールダウンさせる）"""
+        if response.status_code == 429:
+            self.key_manager.report_rate_limited(
+                api_key, parse_retry_after(response.headers.get("Retry-After"))
+            )
+        response.raise_for_status()
+    
+    def _post_json(
+        self,
+        method: str,
+        data: Dict[str, Any],
+        estimated_tokens: int,
+        parse,
+        deadline: Optional[float] = None,
+        cancel: Optional[CancelToken] = None,
+        in_use: Optional[Set[str]] = None,
+        observe: Optional[Callable[[float], None]] = None
+    ):
+        """
+        APIを呼び出してレスポンスを解析
+        
+        Args:
+            method: モデル名とメソッド（例: gemini-pro:generateContent）
+            data: リクエストボディ
+            estimated_tokens: レート制限の判定に使う見積もりトークン数
+            parse: レスポンスのJSONを受け取り結果を返す関数。
+                   ValueErrorなどを送出した場合は不正な応答として再試行します
+            deadline: 期限（time.monotonic()基準の時刻、Noneは無期限）
+            cancel: セットされると送信中の接続を切断し、以降の再試行を打ち切るトークン
+            in_use: 並行する複製のリクエストと共有する、送信中のキーの集合
+            observe: 成功したHTTPリクエストのレイテンシ（秒）を1回ごとに受け取る関数
+                   
+        Returns:
+            parseの戻り値
+            
+        Raises:
+            FatalAPIError: 再試行しても成功しないエラーの場合
+            DeadlineExceededError: 期限内に成功しなかった場合
+            RuntimeError: 再試行の回数の上限まで失敗した場合
+        """
+        url = f"{self.base_url}/{method}"
+        
+        def send(lease: KeyLease, timeout):
+            logger.debug(f"Gemini APIにリクエストを送信: {url}")
+            response = self._session.post(url, headers=self._headers(lease.key), json=data, timeout=timeout)
+            self._check_status(response, lease.key)
+            result = response.json()
+            
+            # 応答を解析できなくてもトークンは消費しているため先に記録する
+            usage = result.get("usageMetadata", {})
+            if "totalTokenCount" in usage:
+                self.key_manager.record_usage(lease, usage["totalTokenCount"])
+                report_usage(TokenUsage.from_metadata(usage), mask_key(lease.key))
+            return parse(result)
+        
+        return self._send_with_retries(send, estimated_tokens, deadline, cancel, in_use, observe)
+    
+    def _send_with_retries(
+        self,
+        send,
+        estimated_tokens: int,
+        deadline: Optional[float],
+        cancel: Optional[CancelToken] = None,
+        in_use: Optional[Set[str]] = None,
+        observe: Optional[Callable[[float], None]] = None
+    ):
+        """
+        キーを選んでリクエストを送り、失敗したら再試行する
+        
+        - 429: そのキーをRetry-Afterの間クールダウンさせ、他のキー
+          （なければクールダウン明けのキー）ですぐに再試行
+        - 接続エラー・タイムアウト・5xx・不正な応答: 指数バックオフ（ジッター付き、
+          Retry-Afterがあればそれ以上）で待ってから、できれば別のキーで再試行
+        - 無効なキー（401・403など）: そのキーを除外して再試行
+        - それ以外（400・404など）: 再試行せずにFatalAPIErrorを送出
+        
+        キーの空き待ち・バックオフ・リクエストのタイムアウトは期限までの残り時間に収めます。
+        
+        Args:
+            send: (キーの割り当て, (接続, 読み込み)タイムアウト)を受け取りリクエストを送って結果を返す関数
+            estimated_tokens: レート制限の判定に使う見積もりトークン数
+            deadline: 期限（time.monotonic()基準の時刻、Noneは無期限）
+            cancel: セットされると送信中の接続を切断し、以降の再試行を打ち切るトークン
+            in_use: 送信中のキーの集合。他に使えるキーがあればここにないキーを選ぶ
+            observe: 成功したHTTPリクエストのレイテンシ（秒）を1回ごとに受け取る関数
+                     （再試行の待ち時間や取り消されたリクエストは含まない）
+            
+        Returns:
+            sendの戻り値
+            
+        Raises:
+            CancelledError: cancelがセットされた場合
+        """
+        policy = self.retry_policy
+        started = time.monotonic()
+        errors: List[str] = []
+        invalid = set()
+        previous = None
+        expired = False
+        cancel = cancel or CancelToken()
+        
+        for attempt in range(policy.max_attempts):
+            if cancel.is_set():
+                raise CancelledError()
+            remaining = remaining_time(deadline)
+            if remaining is not None and remaining <= 0:
+                expired = True
+                break
+            # 一時的なエラーの後は、他に使えるキーがあれば別のキーで送る
+            exclude = set(invalid)
+            if previous is not None and len(self.api_keys) - len(invalid) > 1:
+                exclude.add(previous)
+            if in_use and any(key not in exclude and key not in in_use for key in self.api_keys):
+                exclude |= in_use
+            max_wait = 60.0 if remaining is None else remaining
+            lease = self.key_manager.acquire_lease(estimated_tokens, exclude=exclude, max_wait=max_wait)
+            if lease is None and exclude != invalid:
+                # 他のキーが期限内に使えなければ、直前に失敗したキーや送信中のキーでも送る
+                lease = self.key_manager.acquire_lease(estimated_tokens, exclude=invalid, max_wait=max_wait)
+            if lease is None:
+                if len(invalid) == len(self.api_keys):
+                    self.stats.record_result(time.monotonic() - started, ok=False, fatal=True)
+                    raise FatalAPIError(f"有効なAPIキーがありません: {'; '.join(errors)}")
+                errors.append("利用可能なAPIキーがありません")
+                expired = remaining is not None
+                break
+            api_key = lease.key
+            if in_use is not None:
+                in_use.add(api_key)
             
+            masked = mask_key(api_key)
+            sent_at = time.perf_counter()
             try:
-                logger.debug(f"Gemini APIにリクエストを送信: {url}")
-                response = requests.post(url, headers=headers, json=data)
-                response.raise_for_status()
-                result = response.json()
-                
-                # レスポンスからテキストを抽出
-                if "candidates" in result and result["candidates"]:
-                    content = result["candidates"][0]["content"]
-                    if "parts" in content and content["parts"]:
-                        text = content["parts"][0]["text"]
-                        logger.debug(f"Gemini APIからの応答: {text[:100]}...")
-                        return text
-                
-                raise ValueError("APIレスポンスに期待されるデータがありません")
-                
+                self.stats.record_attempt()
+                with _AbortOnCancel(cancel):
+                    value = send(lease, policy.timeout(remaining_time(deadline)))
             except Exception as e:
-                logger.warning(f"APIキーでのリクエストに失敗: {str(e)}")
+                if cancel.is_set():
+                    # 取り消しで切断したリクエストは失敗として扱わない
+                    API_REQUESTS.labels(masked, "cancelled").inc()
+                    raise CancelledError() from e
+                API_REQUEST_SECONDS.labels(masked).observe(time.perf_counter() - sent_at)
+                API_REQUESTS.labels(masked, describe_error(e)).inc()
+                self.stats.record_error(e)
                 errors.append(str(e))
+                kind = classify_error(e)
+                if kind == FATAL:
+                    logger.error(f"Gemini APIへのリクエストが失敗しました（再試行しません）: {e}")
+                    self.stats.record_result(time.monotonic() - started, ok=False, fatal=True)
+                    raise FatalAPIError(f"Gemini APIへのリクエストが失敗しました: {e}") from e
+                if kind == KEY:
+                    logger.warning(f"APIキー {mask_key(api_key)} は使用できません: {e}")
+                    invalid.add(api_key)
+                    delay = 0.0
+                else:
+                    logger.warning(
+                        f"Gemini APIへのリクエストに失敗しました（{attempt + 1}/{policy.max_attempts}回目）: {e}"
+                    )
+                    previous = api_key
+                    # 429のRetry-Afterはキーのクールダウンとしてacquire()が待つ
+                    delay = 0.0 if describe_error(e) == "429" else policy.backoff(attempt, retry_after_of(e))
+                if attempt + 1 == policy.max_attempts:
+                    break
+                remaining = remaining_time(deadline)
+                if remaining is not None and delay >= remaining:
+                    expired = True
+                    break
+                self.stats.record_retry(delay)
+                if delay > 0:
+                    cancel.wait(delay)
                 continue
+            
+            latency = time.perf_counter() - sent_at
+            API_REQUEST_SECONDS.labels(masked).observe(latency)
+            API_REQUESTS.labels(masked, "ok").inc()
+            if observe is not None and not cancel.is_set():
+                observe(latency)
+            self.stats.record_result(time.monotonic() - started, ok=True)
+            return value
         
-        error_msg = f"すべてのAPIキーでリクエストが失敗しました: {'; '.join(errors)}"
+        elapsed = time.monotonic() - started
+        self.stats.record_result(elapsed, ok=False, deadline=expired)
+        if expired:
+            error_msg = f"Gemini APIへのリクエストが期限内に成功しませんでした（{elapsed:.1f}秒）: {'; '.join(errors)}"
+            logger.error(error_msg)
+            raise DeadlineExceededError(error_msg)
+        error_msg = f"Gemini APIへのリクエストが{len(errors)}回失敗しました: {'; '.join(errors)}"
         logger.error(error_msg)
         raise RuntimeError(error_msg)
     
@@ -135,18 +579,138 @@ class GeminiClient(AIClientBase):
         Returns:
             生成された応答
         """
-        prompt = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
-        return self.generate_content(prompt)
+        return self.generate_content(self._format_messages(messages))
+    
+    def stream_content(self, prompt: str, deadline: Optional[float] = None) -> Iterator[str]:
+        """
+        streamGenerateContentでコンテンツを逐次生成
+        
+        生成されたテキストを届いた順にチャンクとして返します。
+        途中でイテレータを閉じる（close()またはループを抜ける）と
+        接続を切断し、残りの生成を打ち切ります。
+        ストリームの開始は再試行しますが、チャンクを返し始めた後の失敗は
+        重複を避けるため再試行しません。
+        
+        Args:
+            prompt: 生成のためのプロンプト
+            deadline: ストリーム全体の期限（秒、未指定時はretry_policy.deadline）
+            
+        Yields:
+            生成されたテキストのチャンク
+            
+        Raises:
+            FatalAPIError: 再試行しても成功しないエラーの場合
+            DeadlineExceededError: 期限内に開始または完了しなかった場合
+            RuntimeError: ストリームを開始できなかった場合
+        """
+        deadline = self._deadline(deadline)
+        with self._slots:
+            response, lease = self._open_stream(prompt, deadline)
+            metadata = None
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    remaining = remaining_time(deadline)
+                    if remaining is not None and remaining <= 0:
+                        raise DeadlineExceededError("ストリーミングが期限内に完了しませんでした")
+                    if not line or not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[len("data:"):].strip())
+                    # 各チャンクにはその時点までの使用量が含まれる
+                    metadata = event.get("usageMetadata", metadata)
+                    for candidate in event.get("candidates", [])[:1]:
+                        for part in candidate.get("content", {}).get("parts", []):
+                            if part.get("text"):
+                                yield part["text"]
+            finally:
+                response.close()
+                if metadata and "totalTokenCount" in metadata:
+                    self.key_manager.record_usage(lease, metadata["totalTokenCount"])
+                    report_usage(TokenUsage.from_metadata(metadata), mask_key(lease.key))
+    
+    def _open_stream(self, prompt: str, deadline: Optional[float] = None):
+        """ストリームを開始し、(レスポンス, キーの割り当て)を返す"""
+        estimated_tokens = estimate_tokens(prompt)
+        url = f"{self.base_url}/{self.model}:streamGenerateContent?alt=sse"
+        data = {"contents": [{"parts": [{"text": prompt}]}]}
+        
+        def send(lease: KeyLease, timeout):
+            logger.debug(f"Gemini APIにストリーミングリクエストを送信: {url}")
+            # 読み込みのタイムアウトはチャンク間の待ち時間に適用される
+            response = self._session.post(
+                url, headers=self._headers(lease.key), json=data, stream=True, timeout=timeout
+            )
+            try:
+                self._check_status(response, lease.key)
+            except Exception:
+                response.close()
+                raise
+            return response, lease
+        
+        return self._send_with_retries(send, estimated_tokens, deadline)
     
-    def embed(self, text: str) -> list:
+    @staticmethod
+    def _format_messages(messages: list) -> str:
+        """メッセージリストを単一のプロンプトに変換"""
+        return "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+    
+    def embed(
+        self,
+        text: Union[str, List[str]],
+        options: Optional[Dict[str, Any]] = None
+    ) -> Union[List[float], List[List[float]]]:
         """
-        テキストをベクトルに変換
+        テキストを埋め込みベクトルに変換
+        
+        batchEmbedContentsで最大EMBED_BATCH_SIZE件ずつまとめて送信し、
+        複数のバッチはワーカープールで並行に処理します。
         
         Args:
-            text: 変換するテキスト
+            text: 変換するテキスト（または複数テキスト）
+            options: 埋め込みオプション（task_type: RETRIEVAL_DOCUMENTなど）
             
         Returns:
-            埋め込みベクトル
+            textが文字列の場合はベクトル、リストの場合はベクトルのリスト
+            
+        Raises:
+            FatalAPIError: 再試行しても成功しないエラーの場合
+            DeadlineExceededError: 期限（retry_policy.deadline）内に成功しなかった場合
+            RuntimeError: 再試行の回数の上限まで失敗した場合
         """
-        logger.warning("Gemini APIは埋め込み機能を提供していません。モックの結果を返します")
-        return [0.0] * 512  # 512次元のゼロベクトル 
\ No newline at end of file
+        texts = [text] if isinstance(text, str) else list(text)
+        task_type = (options or {}).get("task_type")
+        deadline = self._deadline(None)
+        futures = [
+            self._submit(self._embed_blocking, texts[start:start + EMBED_BATCH_SIZE], task_type, deadline)
+            for start in range(0, len(texts), EMBED_BATCH_SIZE)
+        ]
+        vectors = [vector for future in futures for vector in future.result()]
+        return vectors[0] if isinstance(text, str) else vectors
+    
+    def _embed_blocking(
+        self, texts: List[str], task_type: Optional[str], deadline: Optional[float]
+    ) -> List[List[float]]:
+        """ワーカースレッド上でbatchEmbedContentsを呼び出す"""
+        model = f"models/{self.embedding_model}"
+        requests_data = []
+        for text in texts:
+            request = {"model": model, "content": {"parts": [{"text": text}]}}
+            if task_type:
+                request["taskType"] = task_type
+            requests_data.append(request)
+        
+        def parse(result: Dict[str, Any]) -> List[List[float]]:
+            embeddings = result.get("embeddings", [])
+            if len(embeddings) != len(texts):
+                raise ValueError(
+                    f"埋め込みの件数が一致しません（要求 {len(texts)}件、応答 {len(embeddings)}件）"
+                )
+            return [embedding["values"] for embedding in embeddings]
+        
+        with self._slots:
+            return self._post_json(
+                f"{self.embedding_model}:batchEmbedContents",
+                {"requests": requests_data},
+                sum(estimate_tokens(text) for text in texts),
+                parse,
+                deadline
+            )
@@ -0,0 +1,259 @@
+"""
+ヘッジリクエスト
+
+応答が遅いリクエストに対して、観測したレイテンシの分位点を過ぎた時点で
+同じリクエストを別のキーで送り、先に成功した応答を使います。
+負けたリクエストには取り消しを通知し、送信中の接続を切断させます。
+複製の数は呼び出し数に対する割合（予算）で制限します。
+"""
+
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Set, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 閾値の計算に使う直近のレイテンシの件数
+LATENCY_WINDOW = 512
+
+
+@dataclass
+class HedgeConfig:
+    """ヘッジの設定"""
+
+    quantile: float = 0.9         # 観測したレイテンシのこの分位点を過ぎたら複製を送る
+    budget: float = 0.1           # 呼び出し数に対する複製の割合の上限
+    min_samples: int = 20         # 分位点を使うのに必要な観測数（それまではinitial_delay）
+    initial_delay: float = 10.0   # 観測が少ない間の閾値（秒）
+    min_delay: float = 0.5        # 閾値の下限（秒）
+
+    def __post_init__(self):
+        if not 0 < self.quantile < 1 or not 0 <= self.budget <= 1:
+            raise ValueError(f"ヘッジの設定が不正です: quantile={self.quantile}, budget={self.budget}")
+
+
+@dataclass
+class HedgeStats:
+    """ヘッジの統計情報"""
+
+    calls: int = 0            # ヘッジの対象になった呼び出し
+    hedged: int = 0           # 複製を送った呼び出し
+    hedge_wins: int = 0       # 複製の応答を使った呼び出し
+    budget_denied: int = 0    # 閾値を過ぎたが予算か同時実行数の上限で複製を送らなかった呼び出し
+    cancelled: int = 0        # 送信前に取り消したリクエスト
+
+    @property
+    def hedge_rate(self) -> float:
+        """複製を送った割合（0.0〜1.0）"""
+        return self.hedged / self.calls if self.calls else 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        """複製を送った呼び出しのうち、複製が先に成功した割合（0.0〜1.0）"""
+        return self.hedge_wins / self.hedged if self.hedged else 0.0
+
+
+class CancelToken(threading.Event):
+    """
+    取り消し用のイベント
+
+    セットされると、on_cancel()で登録した処理（送信中の接続の切断など）を呼び出します。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._callbacks: List[Callable[[], None]] = []
+        self._callbacks_lock = threading.Lock()
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        取り消し時に呼ぶ処理を登録（取り消し済みならすぐに呼ぶ）
+
+        Returns:
+            登録を解除する関数
+        """
+        with self._callbacks_lock:
+            if not self.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback: Callable[[], None]) -> None:
+        with self._callbacks_lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def set(self) -> None:
+        with self._callbacks_lock:
+            super().set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug(f"取り消し時の処理に失敗しました: {e}")
+
+
+class Hedger:
+    """
+    ヘッジリクエストの実行
+
+    リクエストは専用のスレッドプールで実行します。各リクエストには取り消し用の
+    CancelTokenと、送信中のキーを共有する集合を渡します。負けたリクエストは
+    トークンへの通知で送信中の接続を切断し、次の再試行やバックオフの前に打ち切ります。
+    閾値には、リクエストがobserve()で報告した1回ごとのHTTPリクエストのレイテンシを使います。
+    """
+
+    def __init__(self, config: Optional[HedgeConfig] = None, max_workers: int = 16):
+        """
+        初期化
+
+        Args:
+            config: ヘッジの設定
+            max_workers: リクエストを実行するスレッド数（同時に処理中の呼び出し数の2倍が目安）
+        """
+        self.config = config or HedgeConfig()
+        self.stats = HedgeStats()
+        self._latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+    def shutdown(self) -> None:
+        """スレッドプールを解放"""
+        self._pool.shutdown(wait=True)
+
+    def threshold(self) -> float:
+        """複製を送るまでの待ち時間（秒）"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < max(1, self.config.min_samples):
+            delay = self.config.initial_delay
+        else:
+            delay = latencies[min(len(latencies) - 1, int(self.config.quantile * len(latencies)))]
+        return max(self.config.min_delay, delay)
+
+    def observe(self, latency: float) -> None:
+        """
+        成功した1回のHTTPリクエストのレイテンシ（秒）を記録
+
+        再試行の待ち時間や、取り消された負けたリクエストは含めないでください。
+        """
+        with self._lock:
+            self._latencies.append(latency)
+
+    def _try_spend(self, slots: Optional[threading.Semaphore]) -> bool:
+        """予算の範囲内で、slotsの枠がすぐに取れれば複製を1つ送る枠を消費する"""
+        with self._lock:
+            if self.stats.hedged + 1 > self.config.budget * self.stats.calls:
+                self.stats.budget_denied += 1
+                return False
+            if slots is not None and not slots.acquire(blocking=False):
+                self.stats.budget_denied += 1
+                return False
+            self.stats.hedged += 1
+            return True
+
+    def run(
+        self,
+        call: Callable[[CancelToken, Set[str]], T],
+        slots: Optional[threading.Semaphore] = None
+    ) -> T:
+        """
+        リクエストを実行し、閾値を過ぎても終わらなければ複製を送る
+
+        Args:
+            call: (CancelToken, 送信中のキーの集合)を受け取りリクエストを実行する関数。
+                  送信に使うキーを集合に追加し、集合にないキーを優先して選ぶ。
+                  成功したHTTPリクエストのレイテンシはobserve()で報告する
+            slots: 同時実行数を制限するセマフォ。元のリクエストの枠は呼び出し元が持ち、
+                   複製は送るときに枠を1つ取って終了時に返す（空きがなければ送らない）
+
+        Returns:
+            先に成功したリクエストの結果
+
+        Raises:
+            Exception: すべてのリクエストが失敗した場合は最初の例外
+        """
+        with self._lock:
+            self.stats.calls += 1
+        in_use: Set[str] = set()
+        cancels: List[CancelToken] = []
+
+        def submit(release: Optional[Callable[[], None]] = None) -> Future:
+            cancel = CancelToken()
+            cancels.append(cancel)
+
+            def attempt():
+                try:
+                    return call(cancel, in_use)
+                finally:
+                    if release is not None:
+                        release()
+
+            # トークン使用量の帰属などのコンテキストを引き継ぐ
+            return self._pool.submit(contextvars.copy_context().run, attempt)
+
+        started = time.monotonic()
+        pending: Dict[Future, bool] = {submit(): False}   # Future -> 複製かどうか
+        errors: List[BaseException] = []
+        threshold: Optional[float] = self.threshold()
+        try:
+            while pending:
+                timeout = None if threshold is None else max(0.0, started + threshold - time.monotonic())
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    if self._try_spend(slots):
+                        logger.debug(f"{threshold:.2f}秒以内に応答がないため複製を送信します")
+                        pending[submit(slots.release if slots is not None else None)] = True
+                    threshold = None
+                    continue
+                for future in done:
+                    is_hedge = pending.pop(future)
+                    try:
+                        value = future.result()
+                    except Exception as e:
+                        errors.append(e)
+                        continue
+                    if is_hedge:
+                        with self._lock:
+                            self.stats.hedge_wins += 1
+                    return value
+            raise errors[0]
+        finally:
+            for cancel in cancels:
+                cancel.set()
+            for future, is_hedge in pending.items():
+                if future.cancel():
+                    with self._lock:
+                        self.stats.cancelled += 1
+                    # 開始前に取り消した複製は、持っていた枠を返す
+                    if is_hedge and slots is not None:
+                        slots.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """統計と現在の閾値を取得"""
+        with self._lock:
+            stats = HedgeStats(**asdict(self.stats))
+        return {
+            **asdict(stats),
+            "hedge_rate": stats.hedge_rate,
+            "hit_rate": stats.hit_rate,
+            "threshold": self.threshold(),
+        }
+
+    def format_report(self) -> str:
+        """統計を整形して返す"""
+        s = self.snapshot()
+        return (
+            f"{s['calls']} calls, {s['hedged']} hedged ({s['hedge_rate']:.1%}), "
+            f"{s['hedge_wins']} hedge wins ({s['hit_rate']:.1%}), "
+            f"{s['budget_denied']} denied by budget, threshold {s['threshold']:.2f}s"
+        )
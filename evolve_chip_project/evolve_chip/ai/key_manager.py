@@ -3,11 +3,87 @@ APIキー管理ユーティリティ
 """
 
 import os
+import time
 import logging
-from typing import List, Optional, Dict
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Deque, List, Optional, Dict, Iterable
 
 logger = logging.getLogger(__name__)
 
+# Retry-Afterが指定されなかった場合のクールダウン秒数
+DEFAULT_COOLDOWN_SECONDS = 30.0
+
+# 利用状況を集計する時間窓（秒）
+USAGE_WINDOW_SECONDS = 60.0
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """
+    Retry-Afterヘッダーの値を待機秒数に変換
+
+    Args:
+        value: ヘッダーの値（秒数またはHTTP日付）
+        now: 現在時刻（UNIX時間、省略時はtime.time()）
+
+    Returns:
+        待機秒数。解釈できない場合はNone
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at - (time.time() if now is None else now))
+
+
+def mask_key(key: str) -> str:
+    """ログや統計に出力するためにAPIキーを伏せ字にする"""
+    if len(key) <= 8:
+        return "*" * len(key)
+    return f"{key[:4]}...{key[-4:]}"
+
+
+@dataclass
+class UsageEntry:
+    """1リクエスト分の利用履歴"""
+
+    timestamp: float
+    tokens: int
+
+
+@dataclass
+class KeyLease:
+    """acquire_lease()で割り当てたキー"""
+
+    key: str
+    estimated_tokens: int
+    entry: UsageEntry
+
+
+@dataclass
+class KeyState:
+    """APIキーごとのトークンバケットと利用履歴"""
+
+    key: str
+    request_budget: float
+    token_budget: float
+    updated_at: float
+    cooldown_until: float = 0.0
+    last_used_at: float = 0.0
+    total_requests: int = 0
+    total_tokens: int = 0
+    rate_limited: int = 0
+    history: Deque[UsageEntry] = field(default_factory=deque)
+
 
 class APIKeyManager:
     """
@@ -15,13 +91,19 @@ class APIKeyManager:
     
     複数のAPIキーを管理し、ローテーションによって
     レート制限の問題を緩和します。
+
+    requests_per_minute / tokens_per_minuteを指定すると、キーごとに
+    トークンバケットで残り枠を追跡し、acquire()は最も余裕のあるキーを返します。
+    429を受けたキーはreport_rate_limited()でクールダウンさせます。
     """
     
     def __init__(
         self, 
         keys: List[str] = None, 
         env_vars: List[str] = None,
-        default_env_var: str = None
+        default_env_var: str = None,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None
     ):
         """
         APIキーマネージャーの初期化
@@ -30,9 +112,15 @@ class APIKeyManager:
             keys: 直接指定されたAPIキーのリスト
             env_vars: 環境変数名のリスト。指定された環境変数からAPIキーを取得
             default_env_var: デフォルトのAPIキー環境変数名
+            requests_per_minute: キーごとの1分あたりリクエスト数上限（Noneは無制限）
+            tokens_per_minute: キーごとの1分あたりトークン数上限（Noneは無制限）
         """
         self.keys = []
         self.current_index = 0
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._states: Dict[str, KeyState] = {}
+        self._lock = threading.Lock()
         
         # 直接指定されたキーを追加
         if keys:
@@ -55,6 +143,12 @@ class APIKeyManager:
         """単一のAPIキーを追加"""
         if key and key not in self.keys:
             self.keys.append(key)
+            self._states[key] = KeyState(
+                key=key,
+                request_budget=self.requests_per_minute or 0.0,
+                token_budget=self.tokens_per_minute or 0.0,
+                updated_at=time.monotonic()
+            )
     
     def add_keys(self, keys: List[str]) -> None:
         """複数のAPIキーを追加"""
@@ -81,4 +175,194 @@ class APIKeyManager:
     
     def get_key_count(self) -> int:
         """APIキーの数を取得"""
-        return len(self.keys) 
\ No newline at end of file
+        return len(self.keys) 
+
+    def _trim_history(self, state: KeyState, now: float) -> None:
+        """集計の時間窓より古い利用履歴を捨てる"""
+        while state.history and now - state.history[0].timestamp > USAGE_WINDOW_SECONDS:
+            state.history.popleft()
+
+    def _refill(self, state: KeyState, now: float) -> None:
+        """経過時間に応じてバケットを補充"""
+        elapsed = now - state.updated_at
+        state.updated_at = now
+        if self.requests_per_minute:
+            state.request_budget = min(
+                self.requests_per_minute,
+                state.request_budget + elapsed * self.requests_per_minute / 60.0
+            )
+        if self.tokens_per_minute:
+            state.token_budget = min(
+                self.tokens_per_minute,
+                state.token_budget + elapsed * self.tokens_per_minute / 60.0
+            )
+
+    def _headroom(self, state: KeyState) -> float:
+        """残り枠の割合（0.0〜1.0）。制限なしの場合は1.0"""
+        ratios = [1.0]
+        if self.requests_per_minute:
+            ratios.append(state.request_budget / self.requests_per_minute)
+        if self.tokens_per_minute:
+            ratios.append(state.token_budget / self.tokens_per_minute)
+        return min(ratios)
+
+    def _wait_time(self, state: KeyState, estimated_tokens: int, now: float) -> float:
+        """このキーでリクエストを送れるようになるまでの秒数"""
+        wait = max(0.0, state.cooldown_until - now)
+        if self.requests_per_minute and state.request_budget < 1:
+            wait = max(wait, (1 - state.request_budget) * 60.0 / self.requests_per_minute)
+        if self.tokens_per_minute:
+            needed = min(estimated_tokens, self.tokens_per_minute)
+            if state.token_budget < needed:
+                wait = max(wait, (needed - state.token_budget) * 60.0 / self.tokens_per_minute)
+        return wait
+
+    def acquire(
+        self,
+        estimated_tokens: int = 0,
+        exclude: Optional[Iterable[str]] = None,
+        max_wait: Optional[float] = 60.0
+    ) -> Optional[str]:
+        """
+        最も残り枠の多いキーを選び、その枠を消費して返す
+
+        すぐに使えるキーがない場合は、最初に使えるようになるキーを待ちます。
+
+        Args:
+            estimated_tokens: このリクエストで消費する見込みのトークン数
+            exclude: 候補から除外するキー（このリクエストで試行済みのキーなど）
+            max_wait: 待機する最大秒数（Noneは無制限）
+
+        Returns:
+            使用するAPIキー。候補がない、または待機時間が上限を超える場合はNone
+        """
+        lease = self.acquire_lease(estimated_tokens, exclude, max_wait)
+        return lease.key if lease is not None else None
+
+    def acquire_lease(
+        self,
+        estimated_tokens: int = 0,
+        exclude: Optional[Iterable[str]] = None,
+        max_wait: Optional[float] = 60.0
+    ) -> Optional[KeyLease]:
+        """
+        acquire()と同じくキーを選び、実際の使用量を反映するための割り当てを返す
+
+        引数はacquire()と同じです。
+
+        Returns:
+            割り当て（record_usage()に渡す）。キーがない場合はNone
+        """
+        excluded = set(exclude or ())
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                candidates = []
+                for key in self.keys:
+                    if key in excluded:
+                        continue
+                    state = self._states[key]
+                    self._refill(state, now)
+                    candidates.append((self._wait_time(state, estimated_tokens, now), state))
+
+                if not candidates:
+                    return None
+
+                ready = [state for wait, state in candidates if wait <= 0]
+                if ready:
+                    # 残り枠が最も大きいキー、同じなら最も長く使われていないキー
+                    state = max(ready, key=lambda s: (self._headroom(s), -s.last_used_at))
+                    if self.requests_per_minute:
+                        state.request_budget -= 1
+                    if self.tokens_per_minute:
+                        state.token_budget -= estimated_tokens
+                    state.last_used_at = now
+                    state.total_requests += 1
+                    state.total_tokens += estimated_tokens
+                    entry = UsageEntry(now, estimated_tokens)
+                    state.history.append(entry)
+                    self._trim_history(state, now)
+                    self.current_index = self.keys.index(state.key)
+                    return KeyLease(state.key, estimated_tokens, entry)
+
+                wait = min(wait for wait, _ in candidates)
+
+            if deadline is not None and time.monotonic() + wait > deadline:
+                logger.warning(f"利用可能なAPIキーがありません（次に使えるまで{wait:.1f}秒）")
+                return None
+            time.sleep(wait)
+
+    def record_usage(self, lease: KeyLease, actual_tokens: int) -> None:
+        """
+        実際に消費したトークン数を反映
+
+        割り当て時の見積もりとの差分だけバケットと、そのリクエストの
+        利用履歴を調整します（同じキーへの他のリクエストの履歴は変えない）。
+
+        Args:
+            lease: acquire_lease()の戻り値
+            actual_tokens: レスポンスで報告されたトークン数
+        """
+        with self._lock:
+            state = self._states.get(lease.key)
+            if state is None:
+                return
+            delta = actual_tokens - lease.estimated_tokens
+            if self.tokens_per_minute:
+                state.token_budget -= delta
+            state.total_tokens += delta
+            lease.entry.tokens += delta
+
+    def report_rate_limited(self, key: str, retry_after: Optional[float] = None) -> None:
+        """
+        レート制限（429）を受けたキーをクールダウンさせる
+
+        Args:
+            key: レート制限を受けたAPIキー
+            retry_after: Retry-Afterで指定された待機秒数
+        """
+        cooldown = DEFAULT_COOLDOWN_SECONDS if retry_after is None else retry_after
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                return
+            state.cooldown_until = max(state.cooldown_until, time.monotonic() + cooldown)
+            state.rate_limited += 1
+            # サーバー側の枠が尽きているので、手元のバケットも空にする
+            state.request_budget = min(state.request_budget, 0.0)
+        logger.warning(f"APIキー {mask_key(key)} がレート制限を受けました（{cooldown:.1f}秒クールダウン）")
+
+    def utilization(self) -> Dict[str, Dict[str, float]]:
+        """
+        キーごとの直近1分間の利用状況を取得
+
+        Returns:
+            伏せ字にしたキーをキーとし、リクエスト数・トークン数・上限に対する
+            利用率・クールダウン残り秒数などを含む辞書
+        """
+        result = {}
+        with self._lock:
+            now = time.monotonic()
+            for key in self.keys:
+                state = self._states[key]
+                self._refill(state, now)
+                self._trim_history(state, now)
+                requests = len(state.history)
+                tokens = sum(entry.tokens for entry in state.history)
+                result[mask_key(key)] = {
+                    "requests_last_minute": requests,
+                    "tokens_last_minute": tokens,
+                    "request_utilization": (
+                        requests / self.requests_per_minute if self.requests_per_minute else 0.0
+                    ),
+                    "token_utilization": (
+                        tokens / self.tokens_per_minute if self.tokens_per_minute else 0.0
+                    ),
+                    "headroom": self._headroom(state),
+                    "cooldown_remaining": max(0.0, state.cooldown_until - now),
+                    "total_requests": state.total_requests,
+                    "rate_limited": state.rate_limited,
+                }
+        return result
@@ -0,0 +1,142 @@
+"""
+AIクライアントの呼び出しの計測
+
+呼び出しの回数・結果・レイテンシをメトリクスに記録し、UsageLedgerを指定した
+場合はトークンの使用量を計上して予算を超える呼び出しを止めます。
+"""
+
+import time
+import logging
+from contextlib import nullcontext
+from typing import Dict, Any, Iterator, Optional, List, Union
+
+from .base import AIClientBase
+from .usage import UsageLedger
+from ..metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+AI_CALLS = REGISTRY.counter(
+    "evolve_chip_ai_calls", "AIクライアントの呼び出し回数", ("client", "method", "outcome")
+)
+AI_CALL_SECONDS = REGISTRY.histogram(
+    "evolve_chip_ai_call_seconds", "AIクライアントの呼び出しのレイテンシ（秒、再試行を含む）", ("client", "method")
+)
+AI_IN_FLIGHT = REGISTRY.gauge(
+    "evolve_chip_ai_in_flight", "処理中のAIクライアントの呼び出し数", ("client",)
+)
+
+
+class MeteredAIClient(AIClientBase):
+    """
+    計測付きAIクライアント
+
+    任意のAIClientBase実装をラップし、メソッドごとの呼び出し回数（成功・失敗の
+    例外の型）とレイテンシを記録します。ストリーミングはストリームを閉じるまでを
+    1回の呼び出しとして数えます。
+
+    usageを指定すると、呼び出しごとのトークン使用量を記録します。予算を
+    超える呼び出しはラップ先を呼ばずにBudgetExceededErrorを送出します。
+    """
+
+    def __init__(self, client: AIClientBase, usage: Optional[UsageLedger] = None):
+        """
+        計測付きクライアントの初期化
+
+        Args:
+            client: ラップするAIクライアント
+            usage: トークン使用量の集計先（未指定時は集計しない）
+        """
+        self.client = client
+        self.usage = usage
+        self.model = getattr(client, "model", type(client).__name__)
+        self._name = type(client).__name__
+        self._in_flight = AI_IN_FLIGHT.labels(self._name)
+
+    @staticmethod
+    def _args(value: Any, options: Optional[Dict[str, Any]]) -> tuple:
+        # オプションを受け取らないクライアントにも対応する
+        return (value,) if options is None else (value, options)
+
+    def _record(self, method: str, started: float, error: Optional[BaseException]) -> None:
+        outcome = "ok" if error is None else type(error).__name__
+        AI_CALLS.labels(self._name, method, outcome).inc()
+        AI_CALL_SECONDS.labels(self._name, method).observe(time.perf_counter() - started)
+        self._in_flight.dec()
+
+    def _metered(self, prompt: Any):
+        # 予算の確認は計測の前に行い、送信しなかった呼び出しは数えない
+        return self.usage.call(prompt) if self.usage is not None else nullcontext()
+
+    def _call(self, method: str, *args) -> Any:
+        with self._metered(args[0]) as call:
+            started = time.perf_counter()
+            self._in_flight.inc()
+            try:
+                result = getattr(self.client, method)(*args)
+            except BaseException as e:
+                self._record(method, started, e)
+                raise
+            self._record(method, started, None)
+            if call is not None:
+                call.completion = None if method == "embed" else result
+            return result
+
+    def generate_content(self, prompt: str, options: Optional[Dict[str, Any]] = None) -> Any:
+        """計測してテキスト生成を実行"""
+        return self._call("generate_content", *self._args(prompt, options))
+
+    async def agenerate_content(self, prompt: str, options: Optional[Dict[str, Any]] = None) -> Any:
+        """計測してテキスト生成を非同期に実行"""
+        with self._metered(prompt) as call:
+            started = time.perf_counter()
+            self._in_flight.inc()
+            try:
+                result = await self.client.agenerate_content(*self._args(prompt, options))
+            except BaseException as e:
+                self._record("agenerate_content", started, e)
+                raise
+            self._record("agenerate_content", started, None)
+            if call is not None:
+                call.completion = result
+            return result
+
+    def stream_content(self, prompt: str) -> Iterator[str]:
+        """計測してストリーミング生成を実行"""
+        with self._metered(prompt) as call:
+            started = time.perf_counter()
+            self._in_flight.inc()
+            error = None
+            chunks = []
+            try:
+                for chunk in self.client.stream_content(prompt):
+                    chunks.append(chunk)
+                    yield chunk
+            except GeneratorExit:
+                # 呼び出し元が必要な分を受け取って閉じた場合は成功として数える
+                raise
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                self._record("stream_content", started, error)
+                if call is not None:
+                    call.completion = "".join(chunks)
+
+    def chat(self, messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None) -> Any:
+        """計測してチャットを実行"""
+        return self._call("chat", *self._args(messages, options))
+
+    def embed(
+        self,
+        text: Union[str, List[str]],
+        options: Optional[Dict[str, Any]] = None
+    ) -> List[List[float]]:
+        """計測して埋め込みベクトルを取得"""
+        return self._call("embed", *self._args(text, options))
+
+    def __getattr__(self, name: str) -> Any:
+        # 計測対象外のメソッド・属性はラップ先に委譲する
+        if name == "client":
+            raise AttributeError(name)
+        return getattr(self.client, name)
@@ -5,9 +5,10 @@
 """
 
 import time
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Union
 
 from .base import AIClientBase
+from .embeddings import HASHED_MODEL, hashed_embedding
 
 class MockAIClient(AIClientBase):
     """
@@ -16,6 +17,9 @@ class MockAIClient(AIClientBase):
     テストとデモ用の擬似AIクライアント実装
     """
     
+    # embedはローカルのハッシュ埋め込みと同じベクトルを返す
+    embedding_model = HASHED_MODEL
+    
     def __init__(self, delay_seconds: float = 1.0):
         """
         モックAIクライアントの初期化
@@ -114,7 +118,9 @@ class MockAIClient(AIClientBase):
         time.sleep(self.delay_seconds)
         return "Hello World"
     
-    def embed(self, text: str) -> list:
-        """テキストをベクトルに変換（モック）"""
+    def embed(self, text: Union[str, List[str]], options: Optional[Dict[str, Any]] = None) -> list:
+        """テキストをベクトルに変換（モック、ローカルのハッシュ埋め込みを返す）"""
         time.sleep(self.delay_seconds)
-        return [0.1, 0.2, 0.3] 
\ No newline at end of file
+        if isinstance(text, str):
+            return hashed_embedding(text).tolist()
+        return [hashed_embedding(t).tolist() for t in text] 
\ No newline at end of file
@@ -0,0 +1,228 @@
+"""
+APIリクエストの再試行
+
+タイムアウト・呼び出しごとの期限・指数バックオフ（ジッター付き）の設定と、
+エラーを再試行できるもの・キーを替えれば成功しうるもの・再試行しても
+成功しないものに分類する処理、再試行とレイテンシの統計を提供します。
+"""
+
+import json
+import time
+import random
+import threading
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+
+# 分類
+RETRY = "retry"   # 同じリクエストを待ってから再試行する
+KEY = "key"       # このキーは使えないが、他のキーなら成功しうる
+FATAL = "fatal"   # 再試行しても成功しない
+
+# 再試行するHTTPステータス
+RETRYABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+
+# レイテンシの統計に使う直近の件数
+LATENCY_WINDOW = 1024
+
+
+class FatalAPIError(RuntimeError):
+    """再試行しても成功しないエラー（不正なリクエスト、存在しないモデルなど）"""
+
+
+class DeadlineExceededError(RuntimeError):
+    """呼び出しの期限内に成功しなかった"""
+
+
+@dataclass
+class RetryPolicy:
+    """再試行とタイムアウトの設定"""
+
+    max_attempts: int = 5               # 1回の呼び出しで送信するリクエスト数の上限
+    base_delay: float = 0.5             # 1回目の再試行までの待機時間の上限（秒）
+    max_delay: float = 30.0             # 待機時間の上限（秒）
+    multiplier: float = 2.0             # 再試行ごとに待機時間の上限を何倍にするか
+    connect_timeout: float = 10.0       # 接続のタイムアウト（秒）
+    read_timeout: float = 120.0         # 応答（ストリームではチャンク間）のタイムアウト（秒）
+    deadline: Optional[float] = 300.0   # 呼び出し全体の期限の既定値（秒、Noneで無期限）
+
+    def __post_init__(self):
+        if self.max_attempts < 1:
+            raise ValueError(f"max_attemptsは1以上である必要があります: {self.max_attempts}")
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None, rng: Optional[random.Random] = None) -> float:
+        """
+        再試行までの待機時間
+
+        上限が指数的に増える区間から一様に選ぶ（フルジッター）ことで、
+        同時に失敗したリクエストの再試行が集中しないようにします。
+
+        Args:
+            attempt: 失敗したリクエストの番号（0から）
+            retry_after: サーバーがRetry-Afterで指定した秒数（これより短くは待たない）
+            rng: 乱数生成器
+
+        Returns:
+            待機秒数
+        """
+        cap = min(self.max_delay, self.base_delay * self.multiplier ** attempt)
+        delay = (rng or random).uniform(0, cap)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def timeout(self, remaining: Optional[float]) -> Tuple[float, float]:
+        """期限までの残り時間を超えない(接続, 読み込み)タイムアウト"""
+        if remaining is None:
+            return (self.connect_timeout, self.read_timeout)
+        remaining = max(remaining, 0.001)
+        return (min(self.connect_timeout, remaining), min(self.read_timeout, remaining))
+
+
+def _is_key_error(response: Any) -> bool:
+    status = response.status_code
+    if status in (401, 403):
+        return True
+    # Gemini APIは無効なキーを400（API_KEY_INVALID）で返す
+    return status == 400 and "API_KEY_INVALID" in (getattr(response, "text", "") or "")
+
+
+def classify_error(error: BaseException) -> str:
+    """
+    エラーを分類
+
+    Args:
+        error: リクエスト中に発生した例外
+
+    Returns:
+        RETRY、KEY、FATALのいずれか
+    """
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        if error.response.status_code in RETRYABLE_STATUS:
+            return RETRY
+        return KEY if _is_key_error(error.response) else FATAL
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)):
+        return RETRY
+    # 途中で切れた応答や期待した形式でない応答は、もう一度送れば成功しうる
+    if isinstance(error, (ValueError, KeyError, IndexError, json.JSONDecodeError)):
+        return RETRY
+    return FATAL
+
+
+def retry_after_of(error: BaseException) -> Optional[float]:
+    """HTTPエラーのRetry-Afterヘッダーの秒数（なければNone）"""
+    from .key_manager import parse_retry_after
+
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    return parse_retry_after((getattr(response, "headers", None) or {}).get("Retry-After"))
+
+
+def describe_error(error: BaseException) -> str:
+    """統計の分類に使うエラーの名前（HTTPエラーはステータスコード）"""
+    response = getattr(error, "response", None)
+    if isinstance(error, requests.HTTPError) and response is not None:
+        return str(response.status_code)
+    return type(error).__name__
+
+
+class RetryStats:
+    """
+    再試行とレイテンシの統計
+
+    操作はスレッドセーフです。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.attempts = 0
+        self.retries = 0
+        self.fatal = 0
+        self.deadline_exceeded = 0
+        self.backoff_seconds = 0.0
+        self.errors: Counter = Counter()
+        self._latencies: deque = deque(maxlen=LATENCY_WINDOW)
+
+    def record_attempt(self) -> None:
+        with self._lock:
+            self.attempts += 1
+
+    def record_error(self, error: BaseException) -> None:
+        with self._lock:
+            self.errors[describe_error(error)] += 1
+
+    def record_retry(self, delay: float) -> None:
+        with self._lock:
+            self.retries += 1
+            self.backoff_seconds += delay
+
+    def record_result(self, latency: float, ok: bool, fatal: bool = False, deadline: bool = False) -> None:
+        """
+        呼び出し1回分の結果を記録
+
+        Args:
+            latency: 再試行を含む呼び出し全体の所要時間（秒）
+            ok: 成功したかどうか
+            fatal: 再試行しても成功しないエラーで失敗したかどうか
+            deadline: 期限切れで失敗したかどうか
+        """
+        with self._lock:
+            self.calls += 1
+            if ok:
+                self.successes += 1
+                self._latencies.append(latency)
+            else:
+                self.failures += 1
+                self.fatal += int(fatal)
+                self.deadline_exceeded += int(deadline)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        統計を取得
+
+        Returns:
+            呼び出し・成功・失敗・送信・再試行の回数、エラーの内訳、
+            成功した呼び出しのレイテンシ（p50・p90・p99、秒）を含む辞書
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            snapshot = {
+                "calls": self.calls,
+                "successes": self.successes,
+                "failures": self.failures,
+                "attempts": self.attempts,
+                "retries": self.retries,
+                "fatal": self.fatal,
+                "deadline_exceeded": self.deadline_exceeded,
+                "backoff_seconds": self.backoff_seconds,
+                "errors": dict(self.errors),
+            }
+        for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+            snapshot[f"latency_{name}"] = latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else None
+        return snapshot
+
+    def format_report(self) -> str:
+        """統計を整形して返す"""
+        s = self.snapshot()
+        latency = (
+            f", latency p50 {s['latency_p50']:.2f}s / p99 {s['latency_p99']:.2f}s"
+            if s["latency_p50"] is not None else ""
+        )
+        errors = ", ".join(f"{name}: {count}" for name, count in sorted(s["errors"].items()))
+        return (
+            f"{s['calls']} calls ({s['successes']} ok, {s['failures']} failed), "
+            f"{s['attempts']} attempts, {s['retries']} retries "
+            f"({s['backoff_seconds']:.1f}s backoff){latency}"
+            + (f"\n- errors: {errors}" if errors else "")
+        )
+
+
+def remaining_time(deadline: Optional[float]) -> Optional[float]:
+    """期限（time.monotonic()基準）までの残り秒数（期限なしはNone）"""
+    return None if deadline is None else deadline - time.monotonic()
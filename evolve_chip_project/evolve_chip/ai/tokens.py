@@ -0,0 +1,27 @@
+"""
+ローカルのトークン数見積もり
+
+APIを呼ばずにプロンプトのおおよそのトークン数を求めます。
+"""
+
+import re
+
+# 英数字・記号はおよそ4文字で1トークン、CJK文字は1文字でおよそ1トークン
+_CJK_PATTERN = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    テキストのトークン数を概算
+
+    Args:
+        text: 見積もり対象のテキスト
+
+    Returns:
+        見積もったトークン数（空文字列の場合は0）
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
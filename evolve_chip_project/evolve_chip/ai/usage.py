@@ -0,0 +1,364 @@
+"""
+トークン使用量の集計と予算
+
+AIの呼び出しごとのプロンプト・生成トークン数を、実行・タスク・APIキーごとに
+集計し、実行全体とタスクごとのトークン予算を超える呼び出しを送信前に止めます。
+
+呼び出しの帰属（実行・タスク）はusage_scope()で指定します。APIの応答から実際の
+使用量が分かるクライアントはreport_usage()で報告し、報告がなかった呼び出しは
+テキストから見積もった値で集計します。
+"""
+
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .tokens import estimate_tokens
+from ..metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+AI_TOKENS = REGISTRY.counter(
+    "evolve_chip_ai_tokens", "AIの呼び出しで消費したトークン数", ("kind", "source")
+)
+
+
+class BudgetExceededError(RuntimeError):
+    """トークン予算を超えるため呼び出しを送信しなかった"""
+
+
+@dataclass
+class TokenUsage:
+    """トークンの使用量"""
+
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    calls: int = 0
+    estimated_calls: int = 0   # APIから使用量が得られず見積もった呼び出しの数
+
+    @classmethod
+    def from_metadata(cls, metadata: Dict[str, Any]) -> "TokenUsage":
+        """Gemini APIのusageMetadataから作成（思考のトークンは生成トークンに含める）"""
+        prompt = int(metadata.get("promptTokenCount", 0))
+        completion = int(metadata.get("candidatesTokenCount", 0)) + int(metadata.get("thoughtsTokenCount", 0))
+        total = int(metadata.get("totalTokenCount", prompt + completion))
+        return cls(prompt_tokens=prompt, completion_tokens=completion, total_tokens=total, calls=1)
+
+    @classmethod
+    def estimate(cls, prompt: Any, completion: Any = None) -> "TokenUsage":
+        """プロンプトと応答のテキストから見積もる"""
+        prompt_tokens = _estimate(prompt)
+        completion_tokens = _estimate(completion)
+        return cls(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+            calls=1,
+            estimated_calls=1
+        )
+
+    def add(self, other: "TokenUsage") -> None:
+        """使用量を加算"""
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.total_tokens += other.total_tokens
+        self.calls += other.calls
+        self.estimated_calls += other.estimated_calls
+
+    def split(self, parts: int) -> List["TokenUsage"]:
+        """使用量をparts個に分ける（端数は先頭から1ずつ配る。呼び出し数は分けない）"""
+        def divide(value: int) -> List[int]:
+            base, rest = divmod(value, parts)
+            return [base + (1 if i < rest else 0) for i in range(parts)]
+
+        return [
+            TokenUsage(prompt, completion, total, self.calls, self.estimated_calls)
+            for prompt, completion, total in zip(
+                divide(self.prompt_tokens), divide(self.completion_tokens), divide(self.total_tokens)
+            )
+        ]
+
+    def to_dict(self) -> Dict[str, int]:
+        """AIResponse.usageの形式に変換"""
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+        }
+
+
+def _estimate(value: Any) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return estimate_tokens(value)
+    if isinstance(value, dict):
+        return sum(_estimate(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_estimate(v) for v in value if not isinstance(v, (int, float)))
+    return estimate_tokens(str(value))
+
+
+@dataclass
+class TokenBudget:
+    """トークン予算"""
+
+    run: Optional[int] = None       # 実行全体の合計トークン数の上限
+    task: Optional[int] = None      # タスク（関数）ごとの合計トークン数の上限
+    downgrade_ratio: float = 0.2    # 残りがこの割合を下回ったら、少ないトークンで済む方法に切り替える
+
+    def __post_init__(self):
+        if not 0 <= self.downgrade_ratio < 1:
+            raise ValueError(f"downgrade_ratioは0以上1未満である必要があります: {self.downgrade_ratio}")
+
+
+@dataclass
+class _Scope:
+    run: Optional[str] = None
+    tasks: Tuple[str, ...] = ()
+
+
+@dataclass
+class _Call:
+    ledger: "UsageLedger"
+    scope: _Scope
+    reported: bool = False
+    completion: Any = None
+
+
+_SCOPE: contextvars.ContextVar = contextvars.ContextVar("evolve_chip_usage_scope", default=_Scope())
+_CALL: contextvars.ContextVar = contextvars.ContextVar("evolve_chip_usage_call", default=None)
+
+
+@contextmanager
+def usage_scope(run: Optional[str] = None, tasks: Sequence[str] = ()) -> Iterator[None]:
+    """
+    ブロック内のAIの呼び出しを実行・タスクに帰属させる
+
+    複数のタスクをまとめた呼び出しの使用量はタスクの間で均等に分けます。
+
+    Args:
+        run: 実行のID
+        tasks: タスクのID（関数名など）
+    """
+    token = _SCOPE.set(_Scope(run=run, tasks=tuple(tasks)))
+    try:
+        yield
+    finally:
+        _SCOPE.reset(token)
+
+
+def report_usage(usage: TokenUsage, key: Optional[str] = None) -> None:
+    """
+    APIの応答から分かった実際の使用量を報告
+
+    UsageLedger.call()の中の呼び出しでなければ何もしません。別スレッドで
+    リクエストを送るクライアントは、contextvars.copy_context()で呼び出し元の
+    コンテキストを引き継いでください。
+
+    Args:
+        usage: 使用量
+        key: 使用したAPIキー（伏せ字にしたもの）
+    """
+    call = _CALL.get()
+    if call is None:
+        return
+    call.reported = True
+    call.ledger.record(usage, call.scope.run, call.scope.tasks, key)
+
+
+class UsageLedger:
+    """
+    トークン使用量の集計と予算の管理
+
+    操作はスレッドセーフです。
+    """
+
+    def __init__(self, budget: Optional[TokenBudget] = None):
+        """
+        初期化
+
+        Args:
+            budget: トークン予算（未指定時は無制限）
+        """
+        self.budget = budget or TokenBudget()
+        self.total = TokenUsage()
+        self._by: Dict[str, Dict[str, TokenUsage]] = {"run": {}, "task": {}, "key": {}}
+        self._lock = threading.Lock()
+        self._warned = set()
+
+    def _add(self, dimension: str, name: Optional[str], usage: TokenUsage) -> None:
+        if name is None:
+            return
+        self._by[dimension].setdefault(name, TokenUsage()).add(usage)
+
+    def record(
+        self,
+        usage: TokenUsage,
+        run: Optional[str] = None,
+        tasks: Sequence[str] = (),
+        key: Optional[str] = None
+    ) -> None:
+        """
+        使用量を記録
+
+        Args:
+            usage: 使用量
+            run: 実行のID
+            tasks: タスクのID（複数の場合は均等に分ける）
+            key: 使用したAPIキー（伏せ字にしたもの）
+        """
+        source = "estimated" if usage.estimated_calls else "reported"
+        AI_TOKENS.labels("prompt", source).inc(usage.prompt_tokens)
+        AI_TOKENS.labels("completion", source).inc(usage.completion_tokens)
+        self.restore(usage, run, tasks, key)
+
+    def restore(
+        self,
+        usage: TokenUsage,
+        run: Optional[str] = None,
+        tasks: Sequence[str] = (),
+        key: Optional[str] = None
+    ) -> None:
+        """
+        以前のプロセスで記録した使用量を集計に戻す
+
+        再開した実行の予算に前回までの使用量を含めるために使います。
+        メトリクスには加算しません。引数はrecord()と同じです。
+        """
+        with self._lock:
+            self.total.add(usage)
+            self._add("run", run, usage)
+            self._add("key", key, usage)
+            if tasks:
+                for task, part in zip(tasks, usage.split(len(tasks))):
+                    self._add("task", task, part)
+
+    def usage(self, dimension: str, name: str) -> TokenUsage:
+        """
+        実行・タスク・キーごとの使用量
+
+        Args:
+            dimension: "run"、"task"、"key"のいずれか
+            name: ID
+
+        Returns:
+            使用量のコピー（記録がなければ0）
+        """
+        with self._lock:
+            return TokenUsage(**asdict(self._by[dimension].get(name, TokenUsage())))
+
+    def totals(self, dimension: str) -> Dict[str, TokenUsage]:
+        """実行・タスク・キーごとの使用量の一覧"""
+        with self._lock:
+            return {name: TokenUsage(**asdict(usage)) for name, usage in self._by[dimension].items()}
+
+    def _expected_completion(self, prompt_tokens: int) -> int:
+        # 生成トークン数はこれまでの平均（記録がなければプロンプトと同程度）と見込む
+        if self.total.calls:
+            return self.total.completion_tokens // self.total.calls
+        return prompt_tokens
+
+    def _limits(self, scope: _Scope) -> List[Tuple[str, str, int]]:
+        limits = []
+        if self.budget.run is not None and scope.run is not None:
+            limits.append(("run", scope.run, self.budget.run))
+        if self.budget.task is not None:
+            limits.extend(("task", task, self.budget.task) for task in scope.tasks)
+        return limits
+
+    def check(self, prompt_tokens: int, scope: Optional[_Scope] = None) -> None:
+        """
+        呼び出しが予算内に収まるか確認
+
+        プロンプトの見積もりに見込みの生成トークン数を加えた量で判定します。
+
+        Args:
+            prompt_tokens: プロンプトの見積もりトークン数
+            scope: 帰属先（未指定時は現在のusage_scope）
+
+        Raises:
+            BudgetExceededError: 実行またはタスクの予算を超える場合
+        """
+        scope = scope or _SCOPE.get()
+        with self._lock:
+            expected = prompt_tokens + self._expected_completion(prompt_tokens)
+            for dimension, name, limit in self._limits(scope):
+                share = expected // max(1, len(scope.tasks)) if dimension == "task" else expected
+                used = self._by[dimension].get(name, TokenUsage()).total_tokens
+                if used + share > limit:
+                    label = "実行" if dimension == "run" else f"タスク{name}"
+                    raise BudgetExceededError(
+                        f"{label}のトークン予算を超えるため呼び出しを中止しました"
+                        f"（使用済み {used}、見込み {share}、上限 {limit}）"
+                    )
+
+    def remaining_ratio(self, run: Optional[str] = None, tasks: Sequence[str] = ()) -> float:
+        """実行とタスクの予算のうち最も少ない残りの割合（予算がなければ1.0）"""
+        scope = _Scope(run=run, tasks=tuple(tasks))
+        ratio = 1.0
+        with self._lock:
+            for dimension, name, limit in self._limits(scope):
+                used = self._by[dimension].get(name, TokenUsage()).total_tokens
+                ratio = min(ratio, max(0.0, (limit - used) / limit) if limit > 0 else 0.0)
+        return ratio
+
+    def should_downgrade(self, run: Optional[str] = None, tasks: Sequence[str] = ()) -> bool:
+        """予算の残りが少なく、トークンの少ない方法に切り替えるべきかどうか"""
+        downgrade = self.remaining_ratio(run, tasks) < self.budget.downgrade_ratio
+        if downgrade:
+            scope = (run, tuple(tasks))
+            with self._lock:
+                first = scope not in self._warned
+                self._warned.add(scope)
+            if first:
+                logger.warning(
+                    f"トークン予算の残りが{self.budget.downgrade_ratio:.0%}を下回ったため"
+                    f"少ないトークンで済む方法に切り替えます: {run or ''} {', '.join(tasks)}"
+                )
+        return downgrade
+
+    @contextmanager
+    def call(self, prompt: Any) -> Iterator[_Call]:
+        """
+        1回のAIの呼び出しを計上
+
+        予算を確認してから呼び出しを実行させ、クライアントがreport_usage()で
+        使用量を報告しなかった場合は、プロンプトとcall.completionに設定した
+        応答から見積もって記録します。
+
+        Args:
+            prompt: プロンプト（メッセージのリストや埋め込むテキストも可）
+
+        Yields:
+            呼び出しの記録（応答をcompletionに設定する）
+
+        Raises:
+            BudgetExceededError: 予算を超える場合（呼び出しは実行されない）
+        """
+        scope = _SCOPE.get()
+        self.check(_estimate(prompt), scope)
+        call = _Call(ledger=self, scope=scope)
+        token = _CALL.set(call)
+        try:
+            yield call
+        finally:
+            _CALL.reset(token)
+            if not call.reported:
+                self.record(TokenUsage.estimate(prompt, call.completion), scope.run, scope.tasks)
+
+    def format_report(self) -> str:
+        """使用量を整形して返す"""
+        total = self.total
+        lines = [
+            f"{total.total_tokens} tokens ({total.prompt_tokens} prompt, {total.completion_tokens} completion) "
+            f"in {total.calls} calls" + (f", {total.estimated_calls} estimated" if total.estimated_calls else "")
+        ]
+        for dimension in ("run", "key", "task"):
+            for name, usage in sorted(self.totals(dimension).items(), key=lambda item: -item[1].total_tokens):
+                lines.append(f"- {dimension} {name}: {usage.total_tokens} tokens")
+        return "\n".join(lines)
@@ -24,12 +24,17 @@ def cli():
 @cli.command("import-plan")
 @click.argument("plan_file", type=click.Path(exists=True))
 @click.option("--output", "-o", help="インポート後のタスク一覧を出力するファイル")
+@click.option("--profile", "profile_path", type=click.Path(exists=True),
+              help="実測プロファイル（cProfileの出力かEvolveChipのhotness.json）。タスクを実測時間で順位付け")
 @click.option("--verbose", "-v", is_flag=True, help="詳細情報を表示")
-def import_plan(plan_file: str, output: Optional[str], verbose: bool):
+def import_plan(plan_file: str, output: Optional[str], profile_path: Optional[str], verbose: bool):
     """
     evolution_plan.yamlファイルをインポートし、EvolveChipのタスクとして登録します。
     
-    例：evolve-chip import-plan evolution_plan.yaml
+    タスクにスコア（実測の時間の割合 × 改善の見込み）があればスコアの高い順に登録します。
+    --profileを指定するとインポート時にスコアを計算し直します。
+    
+    例：evolve-chip import-plan evolution_plan.yaml --profile app.prof
     """
     try:
         # YAMLファイルを読み込む
@@ -49,6 +54,14 @@ def import_plan(plan_file: str, output: Optional[str], verbose: bool):
         if not tasks:
             click.echo("警告: タスクが定義されていません。", err=True)
             return
+        
+        # 実測プロファイルで順位付け（計画にスコアがあればその順）
+        if profile_path:
+            from evolve_chip.core.ranking import RuntimeProfile, rank_tasks
+            tasks = rank_tasks(tasks, RuntimeProfile.load(profile_path))
+        elif any('score' in task for task in tasks):
+            from evolve_chip.core.ranking import sort_tasks
+            tasks = sort_tasks(tasks)
             
         # タスク情報を保存
         config_dir = os.path.join(os.path.expanduser("~"), ".evolve_chip")
@@ -87,6 +100,9 @@ def import_plan(plan_file: str, output: Optional[str], verbose: bool):
                 'enabled': task.get('enabled', True),
                 'imported_from': plan_file
             }
+            if 'score' in task:
+                imported_task['score'] = task['score']
+                imported_task['profile'] = task.get('profile', {})
             
             imported_tasks.append(imported_task)
             
@@ -109,7 +125,8 @@ def import_plan(plan_file: str, output: Optional[str], verbose: bool):
             # タスク一覧を表示
             click.echo("\nインポートされたタスク:")
             for i, task in enumerate(imported_tasks, 1):
-                click.echo(f"{i}. [{task['priority']}] {task['description']}")
+                score = f" スコア {task['score']:.4f}" if 'score' in task else ""
+                click.echo(f"{i}. [{task['priority']}]{score} {task['description']}")
                 click.echo(f"   ファイル: {task['file']}, 関数: {task['function']}")
                 click.echo(f"   指示: {task['instructions'][:50]}..." if len(task['instructions']) > 50 else f"   指示: {task['instructions']}")
                 click.echo("")
@@ -121,6 +138,60 @@ def import_plan(plan_file: str, output: Optional[str], verbose: bool):
             traceback.print_exc()
         sys.exit(1)
 
+@cli.command("cache")
+@click.option("--clear", is_flag=True, help="キャッシュをすべて削除")
+@click.option("--path", help="キャッシュファイルのパス（省略時は~/.evolve_chip/response_cache.db）")
+def cache_command(clear: bool, path: Optional[str]):
+    """
+    AIレスポンスキャッシュの状態を表示します。
+    
+    例：evolve-chip cache --clear
+    """
+    from evolve_chip.ai.cache import ResponseCache
+    
+    cache = ResponseCache(path)
+    try:
+        if clear:
+            cache.clear()
+            click.echo("キャッシュを削除しました。")
+        removed = cache.evict()
+        stats = cache.stats
+        click.echo(f"キャッシュ: {cache.path}")
+        click.echo(f"エントリ数: {stats.entries}（期限切れ・上限超過で{removed}件削除）")
+        click.echo(f"サイズ: {stats.total_bytes / 1024 / 1024:.2f}MB / {cache.max_bytes / 1024 / 1024:.0f}MB")
+    finally:
+        cache.close()
+
+@cli.command("runs")
+@click.option("--reset", "reset_run", help="指定した実行の記録を削除（allですべて削除）")
+@click.option("--path", help="状態ファイルのパス（省略時は~/.evolve_chip/task_state.db）")
+def runs_command(reset_run: Optional[str], path: Optional[str]):
+    """
+    記録されている進化の実行と、タスクの進行状況を表示します。
+
+    中断した実行は、同じファイル（同じrun_id）で再度実行すると続きから再開します。
+
+    例：evolve-chip runs --reset all
+    """
+    from evolve_chip.core.state import DONE, FAILED, PENDING, RUNNING, TaskStateStore
+
+    with TaskStateStore(path) as store:
+        if reset_run:
+            removed = store.reset(None if reset_run == "all" else reset_run)
+            click.echo(f"{removed}件の実行の記録を削除しました。")
+        summaries = store.runs()
+        if not summaries:
+            click.echo("記録されている実行はありません。")
+            return
+        for summary in summaries:
+            counts = summary.counts
+            click.echo(f"{summary.run_id}")
+            click.echo(
+                f"   完了 {counts.get(DONE, 0)} / 失敗 {counts.get(FAILED, 0)} / "
+                f"実行中 {counts.get(RUNNING, 0)} / 待機 {counts.get(PENDING, 0)}"
+                f"（{summary.finished}/{summary.total}）"
+            )
+
 def main():
     """コマンドラインエントリーポイント"""
     cli()
@@ -0,0 +1,256 @@
+"""
+ベンチマーク
+
+関数を繰り返し実行して実行時間の分布を計測し、
+1回の計測のばらつきに左右されない統計量で制約を判定できるようにします。
+"""
+
+import gc
+import io
+import math
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+from contextlib import redirect_stdout
+
+logger = logging.getLogger(__name__)
+
+# 判定に使用できる統計量
+STATISTICS = ("min", "median", "mean", "p95", "p99")
+
+# 95%信頼区間に対応する標準正規分布の分位点
+_Z_95 = 1.959964
+
+
+class _NullWriter(io.TextIOBase):
+    """書き込まれた内容を捨てるストリーム"""
+
+    def write(self, s: str) -> int:
+        return len(s)
+
+
+@dataclass
+class BenchmarkConfig:
+    """ベンチマークの設定"""
+
+    warmup: int = 1                 # 計測前に捨てる実行回数
+    min_samples: int = 5            # 最低限集めるサンプル数
+    max_samples: int = 50           # 集めるサンプル数の上限
+    max_time: float = 1.0           # 計測に使う時間の目安（秒）
+    min_sample_time: float = 1e-3   # 1サンプルの最短計測時間（短い関数はループ回数を増やす）
+    outlier_iqr: Optional[float] = 1.5  # IQRの何倍を外れ値とするか（Noneで除外しない）
+    statistic: str = "median"       # 制約の判定に使用する統計量
+    suppress_output: bool = True    # 計測中の標準出力を捨てるかどうか
+
+    def __post_init__(self):
+        if self.statistic not in STATISTICS:
+            raise ValueError(f"サポートされていない統計量: {self.statistic}")
+        if self.min_samples < 1 or self.max_samples < self.min_samples:
+            raise ValueError(
+                f"サンプル数の指定が不正です: min={self.min_samples}, max={self.max_samples}"
+            )
+
+
+@dataclass
+class BenchmarkResult:
+    """ベンチマーク結果（時間はすべて1回あたりの秒）"""
+
+    samples: List[float]
+    loops: int
+    rejected: int = 0
+    ci: dict = field(default_factory=dict)
+
+    @property
+    def min(self) -> float:
+        return self.samples[0]
+
+    @property
+    def median(self) -> float:
+        return _quantile(self.samples, 0.5)
+
+    @property
+    def mean(self) -> float:
+        return sum(self.samples) / len(self.samples)
+
+    @property
+    def stdev(self) -> float:
+        n = len(self.samples)
+        if n < 2:
+            return 0.0
+        mean = self.mean
+        return math.sqrt(sum((s - mean) ** 2 for s in self.samples) / (n - 1))
+
+    @property
+    def p95(self) -> float:
+        return _quantile(self.samples, 0.95)
+
+    @property
+    def p99(self) -> float:
+        return _quantile(self.samples, 0.99)
+
+    def statistic(self, name: str) -> float:
+        """
+        名前で統計量を取得
+
+        Args:
+            name: STATISTICSのいずれか
+
+        Returns:
+            統計量の値（秒）
+        """
+        if name not in STATISTICS:
+            raise ValueError(f"サポートされていない統計量: {name}")
+        return getattr(self, name)
+
+    def format_report(self) -> str:
+        """統計量と信頼区間を整形して返す"""
+        lines = [
+            f"{len(self.samples)} samples × {self.loops} loops "
+            f"({self.rejected} outliers rejected)"
+        ]
+        for name in STATISTICS:
+            line = f"- {name}: {_format_seconds(self.statistic(name))}"
+            if name in self.ci:
+                low, high = self.ci[name]
+                line += f" (95% CI {_format_seconds(low)} .. {_format_seconds(high)})"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+def _format_seconds(seconds: float) -> str:
+    if seconds < 1e-6:
+        return f"{seconds * 1e9:.1f}ns"
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.2f}us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.3f}ms"
+    return f"{seconds:.4f}s"
+
+
+def _quantile(sorted_samples: List[float], q: float) -> float:
+    """ソート済みサンプルの分位点（線形補間）"""
+    position = (len(sorted_samples) - 1) * q
+    lower = math.floor(position)
+    upper = min(lower + 1, len(sorted_samples) - 1)
+    weight = position - lower
+    return sorted_samples[lower] * (1 - weight) + sorted_samples[upper] * weight
+
+
+def _quantile_ci(sorted_samples: List[float], q: float) -> Tuple[float, float]:
+    """
+    分位点の95%信頼区間（順序統計量による分布に依存しない区間）
+
+    サンプル数が少ない場合、区間はサンプルの最小値・最大値まで広がります。
+    """
+    n = len(sorted_samples)
+    half_width = _Z_95 * math.sqrt(n * q * (1 - q))
+    lower = max(0, math.floor(n * q - half_width))
+    upper = min(n - 1, math.ceil(n * q + half_width))
+    return sorted_samples[lower], sorted_samples[upper]
+
+
+def _mean_ci(result: BenchmarkResult) -> Tuple[float, float]:
+    """平均値の95%信頼区間（正規近似）"""
+    half_width = _Z_95 * result.stdev / math.sqrt(len(result.samples))
+    return result.mean - half_width, result.mean + half_width
+
+
+def reject_outliers(samples: List[float], factor: float) -> Tuple[List[float], int]:
+    """
+    Tukeyの方法で外れ値を除外
+
+    Args:
+        samples: ソート済みのサンプル
+        factor: 四分位範囲（IQR）に掛ける係数
+
+    Returns:
+        (除外後のサンプル, 除外した件数)のタプル
+    """
+    if len(samples) < 4:
+        return samples, 0
+    q1, q3 = _quantile(samples, 0.25), _quantile(samples, 0.75)
+    iqr = q3 - q1
+    low, high = q1 - factor * iqr, q3 + factor * iqr
+    kept = [s for s in samples if low <= s <= high]
+    return kept, len(samples) - len(kept)
+
+
+def _time_loops(func: Callable, loops: int) -> int:
+    """funcをloops回実行した時間（ナノ秒）"""
+    clock = time.perf_counter_ns
+    iterations = range(loops)
+    started = clock()
+    for _ in iterations:
+        func()
+    return clock() - started
+
+
+def _calibrate(func: Callable, min_sample_time: float) -> int:
+    """1サンプルがmin_sample_time以上になるループ回数を求める"""
+    target_ns = min_sample_time * 1e9
+    loops = 1
+    while True:
+        elapsed = _time_loops(func, loops)
+        if elapsed >= target_ns:
+            return loops
+        if elapsed <= 0:
+            loops *= 10
+            continue
+        # 計測値から必要な回数を見積もり、過大にならないよう10倍までに抑える
+        loops = max(loops + 1, min(loops * 10, math.ceil(loops * target_ns * 1.2 / elapsed)))
+
+
+def benchmark(func: Callable, config: Optional[BenchmarkConfig] = None) -> BenchmarkResult:
+    """
+    関数を繰り返し実行して実行時間の分布を計測
+
+    ウォームアップの後、1サンプルがmin_sample_time以上になるようループ回数を
+    調整し、max_timeに達するかmax_samplesを集めるまで計測します。
+    計測中はGCを止め、外れ値を除外してから統計量を計算します。
+
+    Args:
+        func: 引数なしで呼び出せる関数
+        config: ベンチマークの設定（未指定時は既定値）
+
+    Returns:
+        ベンチマーク結果
+    """
+    config = config or BenchmarkConfig()
+    sink = redirect_stdout(_NullWriter()) if config.suppress_output else None
+    gc_was_enabled = gc.isenabled()
+
+    if sink:
+        sink.__enter__()
+    try:
+        for _ in range(config.warmup):
+            func()
+        loops = _calibrate(func, config.min_sample_time)
+
+        gc.disable()
+        samples = []
+        deadline = time.perf_counter() + config.max_time
+        while len(samples) < config.max_samples:
+            samples.append(_time_loops(func, loops) / loops / 1e9)
+            if len(samples) >= config.min_samples and time.perf_counter() >= deadline:
+                break
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+        if sink:
+            sink.__exit__(None, None, None)
+
+    samples.sort()
+    rejected = 0
+    if config.outlier_iqr is not None:
+        samples, rejected = reject_outliers(samples, config.outlier_iqr)
+
+    result = BenchmarkResult(samples=samples, loops=loops, rejected=rejected)
+    result.ci = {
+        "median": _quantile_ci(samples, 0.5),
+        "mean": _mean_ci(result),
+        "p95": _quantile_ci(samples, 0.95),
+        "p99": _quantile_ci(samples, 0.99),
+    }
+    logger.debug(f"ベンチマーク結果:\n{result.format_report()}")
+    return result
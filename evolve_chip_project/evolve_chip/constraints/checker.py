@@ -8,11 +8,40 @@ import io
 import time
 import psutil
 import logging
-from typing import Dict, Tuple, Any, Callable
+from typing import Dict, Tuple, Any, Callable, Union
 from contextlib import redirect_stdout
 
+from .benchmark import BenchmarkConfig, benchmark
+from .memory import AllocationTracker
+from ..metrics import REGISTRY
+
 logger = logging.getLogger(__name__)
 
+CONSTRAINT_CHECKS = REGISTRY.counter(
+    "evolve_chip_constraint_checks", "制約チェックの回数", ("constraint", "result")
+)
+CONSTRAINT_CHECK_SECONDS = REGISTRY.histogram(
+    "evolve_chip_constraint_check_seconds", "制約チェックにかかった時間（秒）", ("check",)
+)
+
+
+def record_constraint_check(constraint: str, ok: bool) -> None:
+    """
+    制約チェックの結果をメトリクスに記録
+
+    サンドボックスのワーカープロセスで行ったチェックは、結果を受け取った側で記録します。
+
+    Args:
+        constraint: 制約の種類（"output"、"memory"、"runtime"、"cpu"）
+        ok: 制約を満たしたかどうか
+    """
+    CONSTRAINT_CHECKS.labels(constraint, "pass" if ok else "fail").inc()
+
+# メモリ制約の計測方法
+# - tracemalloc: 関数の実行中にPythonヒープへ確保されたメモリのピーク
+# - rss: プロセス全体の常駐メモリ（インタプリタやアロケータの分を含む）
+MEMORY_BACKENDS = ("tracemalloc", "rss")
+
 class ResourceMonitor:
     """リソース使用量を監視するクラス"""
     
@@ -27,14 +56,14 @@ class ResourceMonitor:
     
     def __enter__(self):
         """モニタリング開始"""
-        self.start_time = time.time()
+        self.start_time = time.perf_counter()
         self.peak_memory = self.process.memory_info().rss / 1024 / 1024  # MB
         self.peak_cpu = psutil.cpu_percent(interval=None)
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
         """モニタリング終了"""
-        self.end_time = time.time()
+        self.end_time = time.perf_counter()
         current_memory = self.process.memory_info().rss / 1024 / 1024
         current_cpu = psutil.cpu_percent(interval=None)
         self.peak_memory = max(self.peak_memory, current_memory)
@@ -90,7 +119,7 @@ def check_output(func: Callable, expected_output: str) -> bool:
     """
     # 標準出力をキャプチャ
     output = io.StringIO()
-    with redirect_stdout(output):
+    with CONSTRAINT_CHECK_SECONDS.labels("output").time(), redirect_stdout(output):
         func()
     actual_output = output.getvalue().strip()
     
@@ -98,11 +127,14 @@ def check_output(func: Callable, expected_output: str) -> bool:
     matches = actual_output == expected_output
     if not matches:
         logger.warning(f"出力が一致しません。期待値: '{expected_output}', 実際: '{actual_output}'")
+    record_constraint_check("output", matches)
     return matches
 
 def check_resource_constraints(
     func: Callable,
-    constraints: Dict[str, str]
+    constraints: Dict[str, str],
+    benchmark_config: Union[BenchmarkConfig, bool, None] = None,
+    memory_backend: str = "tracemalloc"
 ) -> Tuple[bool, bool, bool]:
     """
     関数のリソース使用量が制約を満たすかチェック
@@ -110,10 +142,33 @@ def check_resource_constraints(
     Args:
         func: チェック対象の関数
         constraints: 制約条件の辞書
+        benchmark_config: 指定すると関数を繰り返し実行し、設定した統計量
+                          （既定は中央値）で実行時間制約を判定します。
+                          Trueの場合は既定の設定を使用します
+        memory_backend: メモリ制約の計測方法（"tracemalloc"または"rss"）。
+                        tracemallocの場合は実行時間を計測する実行とは別に
+                        1回実行し、関数自身が確保したメモリで判定します
         
     Returns:
         (メモリ制約OK, 実行時間制約OK, CPU制約OK)のタプル
     """
+    if memory_backend not in MEMORY_BACKENDS:
+        raise ValueError(f"サポートされていないメモリ計測方法: {memory_backend}")
+    with CONSTRAINT_CHECK_SECONDS.labels("resources").time():
+        results = _check_resource_constraints(func, constraints, benchmark_config, memory_backend)
+    for name, ok in zip(("memory", "runtime", "cpu"), results):
+        if name in constraints:
+            record_constraint_check(name, ok)
+    return results
+
+
+def _check_resource_constraints(
+    func: Callable,
+    constraints: Dict[str, str],
+    benchmark_config: Union[BenchmarkConfig, bool, None],
+    memory_backend: str
+) -> Tuple[bool, bool, bool]:
+    """check_resource_constraintsの本体"""
     # 制約値をパース
     memory_limit = None
     if 'memory' in constraints:
@@ -139,22 +194,50 @@ def check_resource_constraints(
         else:
             raise ValueError(f"サポートされていないCPU単位: {cpu_unit}")
     
+    if benchmark_config is True:
+        benchmark_config = BenchmarkConfig()
+    
+    # 割り当ての追跡は実行を遅くするため、実行時間の計測とは別に行う
+    allocations = None
+    if memory_limit is not None and memory_backend == "tracemalloc":
+        with AllocationTracker() as tracker:
+            # 戻り値も関数が確保したメモリとして数える
+            returned = func()
+        del returned
+        allocations = tracker.report
+    
     # リソース使用量を計測
+    result = None
     with ResourceMonitor() as monitor:
-        func()
+        if benchmark_config:
+            result = benchmark(func, benchmark_config)
+        else:
+            func()
+    
+    runtime = monitor.runtime
+    runtime_label = ""
+    if result is not None:
+        runtime = result.statistic(benchmark_config.statistic)
+        runtime_label = f" ({benchmark_config.statistic})"
+    
+    memory_used = monitor.peak_memory
+    memory_label = " (RSS)"
+    if allocations is not None:
+        memory_used = allocations.peak_mb
+        memory_label = " (割り当てピーク)"
     
     # 制約チェック
     memory_ok = True
     if memory_limit is not None:
-        memory_ok = monitor.peak_memory < memory_limit
+        memory_ok = memory_used < memory_limit
         if not memory_ok:
-            logger.warning(f"メモリ制約違反: {monitor.peak_memory:.2f}MB > {memory_limit}MB")
+            logger.warning(f"メモリ制約違反{memory_label}: {memory_used:.2f}MB > {memory_limit}MB")
     
     runtime_ok = True
     if runtime_limit is not None:
-        runtime_ok = monitor.runtime < runtime_limit
+        runtime_ok = runtime < runtime_limit
         if not runtime_ok:
-            logger.warning(f"実行時間制約違反: {monitor.runtime:.4f}s > {runtime_limit}s")
+            logger.warning(f"実行時間制約違反{runtime_label}: {runtime:.4f}s > {runtime_limit}s")
     
     cpu_ok = True
     if cpu_limit is not None:
@@ -165,9 +248,13 @@ def check_resource_constraints(
     # 詳細なログ出力
     logger.info(
         f"リソース使用状況:\n"
-        f"- メモリ: {monitor.peak_memory:.2f}MB\n"
-        f"- 実行時間: {monitor.runtime:.4f}s\n"
+        f"- メモリ{memory_label}: {memory_used:.2f}MB\n"
+        f"- 実行時間{runtime_label}: {runtime:.4f}s\n"
         f"- CPU: {monitor.peak_cpu:.1f}%"
     )
+    if allocations is not None:
+        logger.info(f"メモリ割り当て:\n{allocations.format_report()}")
+    if result is not None:
+        logger.info(f"ベンチマーク:\n{result.format_report()}")
     
     return memory_ok, runtime_ok, cpu_ok 
\ No newline at end of file
@@ -0,0 +1,308 @@
+"""
+計算量の推定
+
+入力サイズを変えながら関数の実行時間を計測し、
+O(1)〜指数時間の各計算量クラスに当てはめて漸近的な振る舞いを推定します。
+"""
+
+import math
+import random
+import collections.abc
+import inspect
+import logging
+import typing
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .benchmark import BenchmarkConfig, _format_seconds, benchmark
+
+logger = logging.getLogger(__name__)
+
+# 計算量クラス（単純な順）。指数時間は別の方法で当てはめる
+COMPLEXITY_CLASSES: List[Tuple[str, Callable[[float], float]]] = [
+    ("O(1)", lambda n: 0.0),
+    ("O(log n)", lambda n: math.log(n)),
+    ("O(n)", lambda n: n),
+    ("O(n log n)", lambda n: n * math.log(n)),
+    ("O(n^2)", lambda n: n * n),
+]
+EXPONENTIAL = "O(2^n)"
+CLASS_NAMES = [name for name, _ in COMPLEXITY_CLASSES] + [EXPONENTIAL]
+
+# 最良の当てはまりとの誤差の差がこの範囲内なら、より単純なクラスを採用する
+# （計測のばらつきは相対誤差で数%あるため、絶対値の余裕も持たせる）
+_SIMPLICITY_MARGIN = 0.1
+_SIMPLICITY_SLACK = 0.05
+
+# 計測範囲全体での増加がこの割合未満の当てはめはO(1)と区別しない
+# （キャッシュの効き方などで、定数時間の関数も大きな入力でわずかに遅くなる）
+_MIN_GROWTH = 0.5
+
+
+@dataclass
+class ComplexityFit:
+    """1つの計算量クラスへの当てはめ結果（time ≈ intercept + coefficient * f(n)）"""
+
+    name: str
+    coefficient: float
+    intercept: float
+    error: float    # 相対誤差の二乗平均平方根
+
+    def predict(self, n: float) -> float:
+        """サイズnでの実行時間の予測値（秒）"""
+        if self.name == EXPONENTIAL:
+            return math.exp(self.intercept + self.coefficient * n)
+        basis = dict(COMPLEXITY_CLASSES)[self.name]
+        return self.intercept + self.coefficient * basis(n)
+
+
+@dataclass
+class ComplexityResult:
+    """計算量の推定結果"""
+
+    sizes: List[int]
+    times: List[float]
+    best: ComplexityFit
+    fits: List[ComplexityFit] = field(default_factory=list)
+
+    @property
+    def rank(self) -> int:
+        """計算量クラスの順位（小さいほど漸近的に速い）"""
+        return CLASS_NAMES.index(self.best.name)
+
+    def sort_key(self) -> Tuple[int, float]:
+        """候補を漸近的な振る舞い、次に最大サイズでの予測時間で並べるためのキー"""
+        return self.rank, self.best.predict(self.sizes[-1])
+
+    def format_report(self) -> str:
+        """当てはめたクラスと定数、計測値を整形して返す"""
+        lines = [
+            f"{self.best.name}: time ≈ {self.best.intercept:.3g} + "
+            f"{self.best.coefficient:.3g} * f(n) (error {self.best.error:.1%})"
+        ]
+        if self.best.name == EXPONENTIAL:
+            lines[0] = (
+                f"{EXPONENTIAL}: time ≈ {math.exp(self.best.intercept):.3g} * "
+                f"{math.exp(self.best.coefficient):.3g}^n (error {self.best.error:.1%})"
+            )
+        for size, seconds in zip(self.sizes, self.times):
+            lines.append(f"- n={size}: {_format_seconds(seconds)}")
+        return "\n".join(lines)
+
+
+def generate_value(annotation: Any, size: int, rng: random.Random) -> Any:
+    """
+    型ヒントからサイズsizeの値を生成
+
+    int/floatはsize自体、str/list/dict/set/tupleは長さsizeの値を返します。
+    コンテナの要素は小さな値で埋めます。未知の型はsizeを返します。
+
+    Args:
+        annotation: 型ヒント
+        size: 入力サイズ
+        rng: 乱数生成器
+
+    Returns:
+        生成した値
+    """
+    origin = typing.get_origin(annotation) or annotation
+    args = typing.get_args(annotation)
+    if origin is typing.Union:
+        # Optional[X]などは最初のNone以外の型を使う
+        annotation = next((a for a in args if a is not type(None)), int)
+        return generate_value(annotation, size, rng)
+    if origin is bool:
+        return bool(size % 2)
+    if origin is int:
+        return size
+    if origin is float:
+        return float(size)
+    if origin is str:
+        return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(size))
+    if origin is bytes:
+        return bytes(rng.getrandbits(8) for _ in range(size))
+    if origin in (list, set, frozenset, tuple, collections.abc.Sequence, collections.abc.Iterable):
+        item_type = args[0] if args and args[0] is not Ellipsis else int
+        items = [generate_value(item_type, rng.randint(0, 16), rng) for _ in range(size)]
+        if origin in (set, frozenset):
+            # 重複しない要素で長さをsizeに揃える
+            return origin(range(size)) if item_type is int else origin(items)
+        return tuple(items) if origin is tuple else items
+    if origin in (dict, collections.abc.Mapping):
+        value_type = args[1] if len(args) == 2 else int
+        return {f"key{i}": generate_value(value_type, rng.randint(0, 16), rng) for i in range(size)}
+    return size
+
+
+def inputs_from_hints(func: Callable) -> Callable[[int], tuple]:
+    """
+    関数の型ヒントから、サイズを受け取って引数を返す生成関数を作る
+
+    既定値を持つ引数は省略し、必須の引数だけを生成します。
+
+    Args:
+        func: 対象の関数
+
+    Returns:
+        サイズnを受け取り、位置引数のタプルを返す関数
+    """
+    target = inspect.unwrap(func)
+    try:
+        hints = typing.get_type_hints(target)
+    except Exception:
+        hints = {}
+    parameters = [
+        p for p in inspect.signature(target).parameters.values()
+        if p.default is inspect.Parameter.empty
+        and p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD)
+    ]
+
+    def generate(n: int) -> tuple:
+        rng = random.Random(n)
+        return tuple(generate_value(hints.get(p.name, int), n, rng) for p in parameters)
+    return generate
+
+
+def _fit_class(name: str, basis: Callable, sizes: Sequence[int], times: Sequence[float]) -> Optional[ComplexityFit]:
+    """相対誤差の重み付き最小二乗でtime ≈ a + b * f(n)を当てはめる"""
+    weights = [1 / (t * t) for t in times]
+    xs = [basis(n) for n in sizes]
+    sw = sum(weights)
+    if name == "O(1)":
+        a = sum(w * t for w, t in zip(weights, times)) / sw
+        b = 0.0
+    else:
+        sx = sum(w * x for w, x in zip(weights, xs))
+        sy = sum(w * t for w, t in zip(weights, times))
+        sxx = sum(w * x * x for w, x in zip(weights, xs))
+        sxy = sum(w * x * t for w, x, t in zip(weights, xs, times))
+        det = sw * sxx - sx * sx
+        if det <= 0:
+            return None
+        b = (sw * sxy - sx * sy) / det
+        a = (sy - b * sx) / sw
+        if b <= 0:
+            # 増加しない当てはめはこのクラスの説明になっていない
+            return None
+    error = math.sqrt(sum(((a + b * x) / t - 1) ** 2 for x, t in zip(xs, times)) / len(times))
+    return ComplexityFit(name=name, coefficient=b, intercept=a, error=error)
+
+
+def _fit_exponential(sizes: Sequence[int], times: Sequence[float]) -> Optional[ComplexityFit]:
+    """log(time) ≈ a + b * nを当てはめる"""
+    logs = [math.log(t) for t in times]
+    count = len(sizes)
+    mean_n = sum(sizes) / count
+    mean_log = sum(logs) / count
+    sxx = sum((n - mean_n) ** 2 for n in sizes)
+    if sxx <= 0:
+        return None
+    b = sum((n - mean_n) * (y - mean_log) for n, y in zip(sizes, logs)) / sxx
+    if b <= 0:
+        return None
+    a = mean_log - b * mean_n
+    error = math.sqrt(sum((math.exp(a + b * n) / t - 1) ** 2 for n, t in zip(sizes, times)) / count)
+    return ComplexityFit(name=EXPONENTIAL, coefficient=b, intercept=a, error=error)
+
+
+def fit_complexity(sizes: Sequence[int], times: Sequence[float]) -> ComplexityResult:
+    """
+    計測値を各計算量クラスに当てはめ、最もよく説明するクラスを選ぶ
+
+    相対誤差が最小のクラスを基準に、誤差の差が小さければより単純なクラスを採用します。
+    計測範囲でほとんど増加しない当てはめはO(1)とみなします。
+
+    Args:
+        sizes: 入力サイズ（昇順）
+        times: 各サイズでの実行時間（秒）
+
+    Returns:
+        推定結果
+
+    Raises:
+        ValueError: 計測値が3点未満の場合
+    """
+    if len(sizes) < 3 or len(sizes) != len(times):
+        raise ValueError(f"計算量の推定には3点以上の計測値が必要です: {len(sizes)}")
+    times = [max(t, 1e-12) for t in times]
+    fits = [fit for name, basis in COMPLEXITY_CLASSES if (fit := _fit_class(name, basis, sizes, times))]
+    exponential = _fit_exponential(sizes, times)
+    if exponential:
+        fits.append(exponential)
+    fits = [
+        fit for fit in fits
+        if fit.name == "O(1)" or fit.predict(sizes[-1]) >= fit.predict(sizes[0]) * (1 + _MIN_GROWTH)
+    ]
+
+    best_error = min(fit.error for fit in fits)
+    threshold = best_error * (1 + _SIMPLICITY_MARGIN) + _SIMPLICITY_SLACK
+    best = next(fit for fit in fits if fit.error <= threshold)
+    return ComplexityResult(sizes=list(sizes), times=list(times), best=best, fits=fits)
+
+
+def estimate_complexity(
+    func: Callable,
+    generator: Optional[Callable[[int], Any]] = None,
+    sizes: Optional[Sequence[int]] = None,
+    time_per_size: float = 0.05,
+    max_time: float = 2.0,
+    max_size: int = 1 << 16
+) -> ComplexityResult:
+    """
+    入力サイズを変えながら関数を計測して計算量を推定
+
+    sizesを省略すると8から倍々にサイズを増やし、1回の呼び出しが
+    time_per_sizeを超えるか、合計でmax_timeを使うと打ち切ります。
+    実行時間が急増した場合（指数時間の疑い）は増やし方を緩めます。
+
+    Args:
+        func: 対象の関数
+        generator: サイズnを受け取って引数を返す関数（タプルは位置引数として展開）。
+                   Noneの場合は型ヒントから生成
+        sizes: 計測する入力サイズ
+        time_per_size: 1サイズあたりの計測時間の目安（秒）
+        max_time: 計測全体の時間の目安（秒）
+        max_size: 自動で増やす場合のサイズの上限
+
+    Returns:
+        推定結果
+    """
+    generator = generator or inputs_from_hints(func)
+    config = BenchmarkConfig(
+        warmup=1, min_samples=3, max_samples=20, max_time=time_per_size, min_sample_time=1e-4
+    )
+
+    def measure(n: int) -> float:
+        args = generator(n)
+        if not isinstance(args, tuple):
+            args = (args,)
+        return benchmark(lambda: func(*args), config).median
+
+    measured_sizes: List[int] = []
+    times: List[float] = []
+    spent = 0.0
+    gradual = False
+    if sizes is not None:
+        for n in sizes:
+            measured_sizes.append(n)
+            times.append(measure(n))
+    else:
+        n = 8
+        while n <= max_size:
+            seconds = measure(n)
+            measured_sizes.append(n)
+            times.append(seconds)
+            # 計測時間の目安（ウォームアップと校正を含めて約2倍）
+            spent += max(time_per_size, seconds * config.min_samples) * 2
+            if len(times) >= 5 and (seconds > time_per_size or spent > max_time):
+                break
+            if len(times) >= 3 and seconds > time_per_size * 20:
+                break
+            # サイズを倍にして16倍以上遅くなった場合は以降、少しずつ増やす
+            if not gradual and len(times) >= 2 and times[-1] > times[-2] * 16:
+                gradual = True
+            n = n + max(1, n // 8) if gradual else n * 2
+
+    result = fit_complexity(measured_sizes, times)
+    logger.debug(f"計算量の推定:\n{result.format_report()}")
+    return result
@@ -0,0 +1,164 @@
+"""
+差分ベンチマーク
+
+元の関数と進化後の関数を同じ入力で交互に計測し、
+速度比とメモリ使用量の差から性能が改善したか・低下したかを判定します。
+"""
+
+import gc
+import time
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Sequence, Tuple
+from contextlib import redirect_stdout
+
+from .benchmark import (
+    BenchmarkConfig, _NullWriter, _calibrate, _format_seconds, _quantile,
+    _quantile_ci, _time_loops, reject_outliers
+)
+from .memory import AllocationTracker
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ComparisonResult:
+    """元の関数と候補の比較結果（speedupは1より大きいほど候補が速い）"""
+
+    speedup: float
+    ci: Tuple[float, float]
+    original_seconds: float
+    candidate_seconds: float
+    original_peak_bytes: int
+    candidate_peak_bytes: int
+    samples: int
+    rejected: int = 0
+
+    @property
+    def memory_delta_bytes(self) -> int:
+        """候補のメモリ割り当てピークの増分（負なら削減）"""
+        return self.candidate_peak_bytes - self.original_peak_bytes
+
+    def is_regression(self, tolerance: float = 0.05) -> bool:
+        """
+        候補が有意に遅くなったかどうか
+
+        Args:
+            tolerance: 許容する速度低下の割合（0.05なら5%までは低下とみなさない）
+
+        Returns:
+            速度比の信頼区間の上限が1 - tolerance未満の場合はTrue
+        """
+        return self.ci[1] < 1 - tolerance
+
+    def is_improvement(self) -> bool:
+        """候補が有意に速くなったかどうか（信頼区間の下限が1を超える）"""
+        return self.ci[0] > 1
+
+    def format_report(self) -> str:
+        """速度比とメモリ差を整形して返す"""
+        return (
+            f"speedup {self.speedup:.2f}x (95% CI {self.ci[0]:.2f}x .. {self.ci[1]:.2f}x, "
+            f"{self.samples} paired samples, {self.rejected} outliers rejected)\n"
+            f"- original: {_format_seconds(self.original_seconds)}, "
+            f"peak {self.original_peak_bytes / 1024:.1f}KiB\n"
+            f"- candidate: {_format_seconds(self.candidate_seconds)}, "
+            f"peak {self.candidate_peak_bytes / 1024:.1f}KiB "
+            f"({self.memory_delta_bytes / 1024:+.1f}KiB)"
+        )
+
+
+def _workload(func: Callable, inputs: Optional[Sequence[Any]]) -> Callable[[], Any]:
+    """すべての入力で関数を1回ずつ呼び出す、引数なしの関数を作る"""
+    if not inputs:
+        return func
+    calls = [args if isinstance(args, tuple) else (args,) for args in inputs]
+
+    def run():
+        for args in calls:
+            func(*args)
+    return run
+
+
+def _peak_bytes(func: Callable) -> int:
+    with AllocationTracker(top=0) as tracker:
+        returned = func()
+    del returned
+    return tracker.report.peak_bytes
+
+
+def compare_functions(
+    original: Callable,
+    candidate: Callable,
+    inputs: Optional[Sequence[Any]] = None,
+    config: Optional[BenchmarkConfig] = None
+) -> ComparisonResult:
+    """
+    元の関数と候補を同じ入力で交互に計測して比較
+
+    計測順による偏り（キャッシュや周波数の変化）を避けるため、ラウンドごとに
+    実行順を入れ替え、ラウンド内の実行時間の比を1つのサンプルとします。
+
+    Args:
+        original: 元の関数
+        candidate: 進化後の関数
+        inputs: 呼び出しに使う引数のリスト（タプルは位置引数として展開、
+                Noneの場合は引数なしで呼び出す）
+        config: 計測の設定（ウォームアップ、サンプル数、時間の目安、外れ値の除外）
+
+    Returns:
+        比較結果
+    """
+    config = config or BenchmarkConfig()
+    run_original = _workload(original, inputs)
+    run_candidate = _workload(candidate, inputs)
+    sink = redirect_stdout(_NullWriter()) if config.suppress_output else None
+    gc_was_enabled = gc.isenabled()
+
+    if sink:
+        sink.__enter__()
+    try:
+        original_peak = _peak_bytes(run_original)
+        candidate_peak = _peak_bytes(run_candidate)
+        for _ in range(config.warmup):
+            run_original()
+            run_candidate()
+        original_loops = _calibrate(run_original, config.min_sample_time)
+        candidate_loops = _calibrate(run_candidate, config.min_sample_time)
+
+        gc.disable()
+        pairs = []
+        deadline = time.perf_counter() + config.max_time
+        while len(pairs) < config.max_samples:
+            if len(pairs) % 2 == 0:
+                original_time = _time_loops(run_original, original_loops) / original_loops
+                candidate_time = _time_loops(run_candidate, candidate_loops) / candidate_loops
+            else:
+                candidate_time = _time_loops(run_candidate, candidate_loops) / candidate_loops
+                original_time = _time_loops(run_original, original_loops) / original_loops
+            pairs.append((original_time, max(candidate_time, 1.0)))
+            if len(pairs) >= config.min_samples and time.perf_counter() >= deadline:
+                break
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+        if sink:
+            sink.__exit__(None, None, None)
+
+    ratios = sorted(original_time / candidate_time for original_time, candidate_time in pairs)
+    rejected = 0
+    if config.outlier_iqr is not None:
+        ratios, rejected = reject_outliers(ratios, config.outlier_iqr)
+
+    result = ComparisonResult(
+        speedup=_quantile(ratios, 0.5),
+        ci=_quantile_ci(ratios, 0.5),
+        original_seconds=_quantile(sorted(p[0] for p in pairs), 0.5) / 1e9,
+        candidate_seconds=_quantile(sorted(p[1] for p in pairs), 0.5) / 1e9,
+        original_peak_bytes=original_peak,
+        candidate_peak_bytes=candidate_peak,
+        samples=len(ratios),
+        rejected=rejected
+    )
+    logger.debug(f"差分ベンチマーク:\n{result.format_report()}")
+    return result
@@ -0,0 +1,146 @@
+"""
+メモリ計測
+
+tracemallocでPythonヒープへの割り当てを追跡し、関数自身が確保した
+メモリ量をプロセスのRSSやアロケータのノイズと切り離して計測します。
+"""
+
+import logging
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 行ごとの集計に使うトレース数の上限（超えた分は等間隔に抽出して推定する）
+MAX_SAMPLED_TRACES = 20000
+
+
+@dataclass
+class AllocationLine:
+    """割り当てが多いソース行"""
+
+    location: str   # "ファイル:行番号"
+    size: int       # 計測終了時点で保持されているバイト数
+    count: int      # 保持されているブロック数
+
+    def __str__(self) -> str:
+        return f"{self.location}: {self.size / 1024:.1f}KiB ({self.count} blocks)"
+
+
+@dataclass
+class AllocationReport:
+    """メモリ計測の結果"""
+
+    peak_bytes: int = 0
+    net_bytes: int = 0
+    top_lines: List[AllocationLine] = field(default_factory=list)
+
+    @property
+    def peak_mb(self) -> float:
+        """計測中に確保されたメモリのピーク（MB）"""
+        return self.peak_bytes / 1024 / 1024
+
+    @property
+    def net_mb(self) -> float:
+        """計測終了時点で保持されているメモリ（MB）"""
+        return self.net_bytes / 1024 / 1024
+
+    def format_report(self) -> str:
+        """ピーク・保持量と割り当ての多い行を整形して返す"""
+        lines = [f"peak {self.peak_mb:.3f}MB, retained {self.net_mb:.3f}MB"]
+        lines.extend(f"- {line}" for line in self.top_lines)
+        return "\n".join(lines)
+
+
+class AllocationTracker:
+    """
+    ブロック内のPythonヒープ割り当てを計測するクラス
+
+    ピークは計測開始時点の使用量からの増分です。割り当ての多い行は
+    ブロック終了時点で保持されている割り当て（戻り値など）から集計するため、
+    関数が返した値はブロックを抜けるまで参照を保持してください。
+    保持されている割り当てが非常に多い場合、行ごとの集計は抽出による推定値です。
+
+    使用例:
+        with AllocationTracker() as tracker:
+            result = func()
+        tracker.report.peak_mb
+    """
+
+    def __init__(self, top: int = 5):
+        """
+        トラッカーの初期化
+
+        Args:
+            top: 記録する割り当ての多い行の数（0の場合はスナップショットを取らない）
+        """
+        self.top = top
+        self.report = AllocationReport()
+        self._started_tracing = False
+        self._baseline = 0
+        self._before = None
+
+    def __enter__(self):
+        """計測開始"""
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            # 既存の割り当ても追跡されているため、差分を取る基準にする
+            if self.top:
+                self._before = tracemalloc.take_snapshot()
+        else:
+            tracemalloc.start()
+            self._started_tracing = True
+        self._baseline = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """計測終了"""
+        current, peak = tracemalloc.get_traced_memory()
+        self.report.peak_bytes = max(0, peak - self._baseline)
+        self.report.net_bytes = max(0, current - self._baseline)
+        try:
+            if self.top:
+                self.report.top_lines = self._top_lines(tracemalloc.take_snapshot())
+        finally:
+            if self._started_tracing:
+                tracemalloc.stop()
+            self._before = None
+
+    def _top_lines(self, after: tracemalloc.Snapshot) -> List[AllocationLine]:
+        """計測中に増えた割り当てを行ごとに集計"""
+        totals = _line_totals(after)
+        if self._before is not None:
+            for key, (size, count) in _line_totals(self._before).items():
+                after_size, after_count = totals.get(key, (0, 0))
+                totals[key] = (after_size - size, after_count - count)
+
+        ranked = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+        return [
+            AllocationLine(location=f"{filename}:{lineno}", size=size, count=count)
+            for (filename, lineno), (size, count) in ranked[:self.top]
+            if size > 0
+        ]
+
+
+def _line_totals(snapshot: tracemalloc.Snapshot) -> Dict[Tuple[str, int], Tuple[int, int]]:
+    """
+    トレースを行ごとに集計
+
+    Snapshot.statistics()はトレース数に比例して遅くなるため（100万件で数秒）、
+    上限を超える場合は等間隔に抽出したトレースから推定します。
+    """
+    # トラッカー自身とtracemallocの割り当ては除外する
+    excluded = {tracemalloc.__file__, __file__}
+    traces = snapshot.traces
+    step = max(1, len(traces) // MAX_SAMPLED_TRACES)
+    totals: Dict[Tuple[str, int], Tuple[int, int]] = {}
+    for index in range(0, len(traces), step):
+        trace = traces[index]
+        frame = trace.traceback[0]
+        if frame.filename in excluded:
+            continue
+        key = (frame.filename, frame.lineno)
+        size, count = totals.get(key, (0, 0))
+        totals[key] = (size + trace.size * step, count + step)
+    return totals
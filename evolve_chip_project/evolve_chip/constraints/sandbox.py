@@ -0,0 +1,374 @@
+"""
+検証用サンドボックス
+
+進化後のコードを事前に起動したワーカープロセスで実行し、
+無限ループやメモリの浪費、グローバル状態の書き換えが
+オーケストレータ本体に影響しないようにします。
+"""
+
+import os
+import time
+import queue
+import signal
+import logging
+import threading
+import multiprocessing
+from dataclasses import dataclass, field
+from types import CodeType
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+try:
+    import resource
+except ImportError:  # Windowsでは資源制限を設定しない
+    resource = None
+
+from .benchmark import BenchmarkConfig
+from .checker import check_output, check_resource_constraints
+from .complexity import estimate_complexity
+from .differential import compare_functions
+
+logger = logging.getLogger(__name__)
+
+# forkserverに事前にインポートさせるモジュール（ワーカーの起動を速くする）
+DEFAULT_PRELOAD = (
+    "evolve_chip.constraints.checker",
+    "evolve_chip.core.decorators",
+)
+
+
+@dataclass
+class ValidationTask:
+    """ワーカーに渡す検証タスク"""
+
+    name: str
+    code: str
+    source: str = ""
+    constraints: Dict[str, Any] = field(default_factory=dict)
+    benchmark_config: Union[BenchmarkConfig, bool, None] = None
+    memory_backend: str = "tracemalloc"
+    compare: bool = False                 # source内の同名の関数と性能を比較するかどうか
+    inputs: Optional[List[Any]] = None    # 比較に使う引数のリスト
+    complexity: bool = False              # 元の関数と候補の計算量を推定するかどうか
+
+
+@dataclass
+class ValidationRecord:
+    """検証結果（プロセス間で受け渡す最小限の指標）"""
+
+    name: str
+    output_ok: bool = False
+    memory_ok: bool = False
+    runtime_ok: bool = False
+    cpu_ok: bool = False
+    error: Optional[str] = None
+    timed_out: bool = False
+    elapsed_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    speedup: Optional[float] = None
+    speedup_ci: Optional[Tuple[float, float]] = None
+    memory_delta_bytes: Optional[int] = None
+    complexity: Optional[str] = None
+    original_complexity: Optional[str] = None
+
+    @property
+    def passed(self) -> bool:
+        """すべての制約を満たしたかどうか"""
+        return (
+            self.error is None
+            and self.output_ok and self.memory_ok and self.runtime_ok and self.cpu_ok
+        )
+
+
+def _cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _set_limits(memory_limit_mb: Optional[int]) -> None:
+    """ワーカープロセスのアドレス空間を制限"""
+    if resource is None or not memory_limit_mb:
+        return
+    limit = memory_limit_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _set_cpu_deadline(cpu_seconds: Optional[float]) -> None:
+    """このタスクで使えるCPU時間を制限（超過するとSIGXCPUでワーカーが終了する）"""
+    if resource is None or not cpu_seconds:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = int(_cpu_time() + cpu_seconds) + 1
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def load_candidate(code: Any, globals_: Dict[str, Any], name: str) -> Callable:
+    """
+    候補のコードを元のモジュールの名前空間のコピーで評価し、関数を取り出す
+
+    元の関数は評価の前に取り除きます（候補が関数を定義しなかった場合に
+    元の関数を候補として検証しないように）。
+
+    Args:
+        code: 候補のソースまたはコンパイル済みのコード
+        globals_: 元のモジュールの名前空間（変更しない）
+        name: 候補が定義するはずの関数名
+
+    Returns:
+        候補の関数
+
+    Raises:
+        ValueError: 候補が関数nameを定義しなかった場合
+    """
+    namespace = dict(globals_)
+    namespace.pop(name, None)
+    exec(code, namespace)
+    func = namespace.get(name)
+    if not callable(func):
+        raise ValueError(f"候補のコードに関数 '{name}' が定義されていません")
+    return func
+
+
+def _fresh_namespace(source: CodeType) -> Dict[str, Any]:
+    """元のファイルを評価した新しい名前空間"""
+    namespace: Dict[str, Any] = {}
+    exec(source, namespace)
+    return namespace
+
+
+def _run_task(task: ValidationTask, compiled: Dict[int, CodeType]) -> ValidationRecord:
+    """ワーカー内で1件の候補を検証"""
+    record = ValidationRecord(name=task.name)
+    started = time.perf_counter()
+    cpu_started = _cpu_time() if resource else 0.0
+    try:
+        # 元のファイルのコンパイルはソースごとに1度だけ行い、評価は候補ごとにやり直す。
+        # 名前空間を使い回すと、候補がモジュールレベルのオブジェクトに加えた変更が
+        # 以降の候補や比較対象の元の関数に残るため
+        key = hash(task.source)
+        if key not in compiled:
+            compiled[key] = compile(task.source, "<source>", "exec")
+        func = load_candidate(task.code, _fresh_namespace(compiled[key]), task.name)
+
+        record.output_ok = check_output(func, task.constraints.get('output', ''))
+        record.memory_ok, record.runtime_ok, record.cpu_ok = check_resource_constraints(
+            func, task.constraints, task.benchmark_config, task.memory_backend
+        )
+        original = None
+        if task.compare or task.complexity:
+            original = _fresh_namespace(compiled[key]).get(task.name)
+        if task.compare and original is not None:
+            config = task.benchmark_config
+            comparison = compare_functions(
+                original, func, task.inputs, config if isinstance(config, BenchmarkConfig) else None
+            )
+            record.speedup = comparison.speedup
+            record.speedup_ci = comparison.ci
+            record.memory_delta_bytes = comparison.memory_delta_bytes
+        if task.complexity and original is not None:
+            generator = getattr(original, "size_generator", None)
+            record.original_complexity = estimate_complexity(original, generator).best.name
+            record.complexity = estimate_complexity(func, generator).best.name
+    except MemoryError:
+        record.error = "メモリ制限を超えました"
+    except Exception as e:
+        record.error = f"{type(e).__name__}: {e}"
+    record.elapsed_seconds = time.perf_counter() - started
+    if resource:
+        record.cpu_seconds = _cpu_time() - cpu_started
+    return record
+
+
+def _worker_main(conn, memory_limit_mb: Optional[int], cpu_seconds: Optional[float]) -> None:
+    """ワーカープロセスの本体"""
+    # Ctrl+Cは親プロセスが処理する
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _set_limits(memory_limit_mb)
+    compiled: Dict[int, CodeType] = {}
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        _set_cpu_deadline(cpu_seconds)
+        conn.send(_run_task(task, compiled))
+
+
+class _Worker:
+    """ワーカープロセスとその接続"""
+
+    def __init__(self, context, memory_limit_mb, cpu_seconds):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, memory_limit_mb, cpu_seconds),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def stop(self, timeout: float = 1.0) -> None:
+        """ワーカーを終了（応答しない場合は強制終了）"""
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+    def kill(self) -> None:
+        """ワーカーを強制終了"""
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class SandboxPool:
+    """
+    事前に起動した検証ワーカーのプール
+
+    各候補は空いているワーカーで実行され、タイムアウトした場合や
+    資源制限で異常終了した場合はワーカーを作り直します。
+    validate()はスレッドセーフで、複数のスレッドから呼び出すと
+    ワーカー数まで並列に検証します。
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        timeout: float = 30.0,
+        memory_limit_mb: Optional[int] = 1024,
+        cpu_seconds: Optional[float] = None,
+        preload: Sequence[str] = DEFAULT_PRELOAD
+    ):
+        """
+        プールの初期化
+
+        Args:
+            workers: ワーカープロセス数（Noneの場合はCPUコア数）
+            timeout: 1候補あたりの実行時間の上限（秒、実時間）
+            memory_limit_mb: ワーカーのアドレス空間の上限（MB、Noneで無制限）
+            cpu_seconds: 1候補あたりのCPU時間の上限（秒、Noneの場合はtimeoutと同じ）
+            preload: forkserverに事前にインポートさせるモジュール
+
+        Raises:
+            ValueError: ワーカー数またはタイムアウトが不正な場合
+        """
+        workers = workers or os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError(f"ワーカー数は1以上である必要があります: {workers}")
+        if timeout <= 0:
+            raise ValueError(f"タイムアウトは正の値である必要があります: {timeout}")
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.cpu_seconds = cpu_seconds or timeout
+
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            self._context = multiprocessing.get_context("forkserver")
+            self._context.set_forkserver_preload(list(preload))
+        else:
+            self._context = multiprocessing.get_context("spawn")
+
+        self._idle: "queue.Queue[Optional[_Worker]]" = queue.Queue()   # Noneはプールを閉じた印
+        self._all = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(workers):
+            self._idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._context, self.memory_limit_mb, self.cpu_seconds)
+        with self._lock:
+            self._all.add(worker)
+        return worker
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        worker.kill()
+        with self._lock:
+            self._all.discard(worker)
+        return self._spawn()
+
+    def validate(self, task: ValidationTask) -> ValidationRecord:
+        """
+        候補をワーカーで検証
+
+        Args:
+            task: 検証タスク
+
+        Returns:
+            検証結果。タイムアウトやワーカーの異常終了もerrorに記録されます
+
+        Raises:
+            RuntimeError: プールが閉じられている場合
+        """
+        if self._closed:
+            raise RuntimeError("サンドボックスプールは閉じられています")
+        worker = self._idle.get()
+        if worker is None:
+            # 閉じたことを空きを待っている他のスレッドにも伝える
+            self._idle.put(None)
+            raise RuntimeError("サンドボックスプールは閉じられています")
+        started = time.perf_counter()
+        try:
+            worker.conn.send(task)
+            if worker.conn.poll(self.timeout):
+                return worker.conn.recv()
+            logger.warning(f"{task.name}の検証が{self.timeout}秒でタイムアウトしました")
+            worker = self._replace(worker)
+            return ValidationRecord(
+                name=task.name,
+                error=f"タイムアウトしました（{self.timeout}秒）",
+                timed_out=True,
+                elapsed_seconds=time.perf_counter() - started
+            )
+        except (EOFError, OSError):
+            # 資源制限（SIGXCPUなど）でワーカーが終了した
+            worker.process.join(1.0)
+            exitcode = worker.process.exitcode
+            logger.warning(f"{task.name}の検証中にワーカーが終了しました (exitcode={exitcode})")
+            worker = self._replace(worker)
+            error = "ワーカーが異常終了しました"
+            sigxcpu = getattr(signal, "SIGXCPU", None)
+            if sigxcpu is not None and exitcode == -sigxcpu:
+                error = "CPU時間の制限を超えました"
+            return ValidationRecord(
+                name=task.name,
+                error=f"{error} (exitcode={exitcode})",
+                elapsed_seconds=time.perf_counter() - started
+            )
+        finally:
+            with self._lock:
+                closed = self._closed
+                if closed:
+                    self._all.discard(worker)
+                else:
+                    self._idle.put(worker)
+            if closed:
+                # 検証中にプールが閉じられた場合は、作り直したワーカーも含めて終了する
+                worker.stop()
+
+    def close(self) -> None:
+        """すべてのワーカーを終了"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            workers = list(self._all)
+            self._all.clear()
+        # 空きを待っているvalidate()を起こす
+        self._idle.put(None)
+        for worker in workers:
+            worker.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,585 @@
+"""
+コード解析
+
+ソースツリーのPython関数をASTで解析してメトリクスを計算し、
+cli.py import-planで読み込めるevolution_plan.yamlの内容を生成します。
+"""
+
+import os
+import ast
+import fnmatch
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import TYPE_CHECKING, Dict, Any, Iterable, Iterator, List, Optional, Sequence, Union
+
+if TYPE_CHECKING:
+    from .ranking import RuntimeProfile
+
+logger = logging.getLogger(__name__)
+
+# 常に解析から除外するディレクトリ名
+DEFAULT_EXCLUDES = (
+    ".git", ".hg", ".svn", "__pycache__", ".venv", "venv", "env",
+    "node_modules", "build", "dist", ".tox", ".nox", ".mypy_cache",
+    ".pytest_cache", "site-packages", "*.egg-info",
+)
+
+# プロセスプールに1回で渡すファイル数
+CHUNK_SIZE = 64
+
+# これ未満のファイル数ならプロセスプールを使わずに解析する
+PARALLEL_THRESHOLD = 256
+
+# タスク生成のしきい値
+COMPLEXITY_THRESHOLD = 10
+NESTING_THRESHOLD = 4
+LENGTH_THRESHOLD = 50
+
+_LOOP_NODES = (ast.For, ast.AsyncFor, ast.While)
+_BLOCK_NODES = _LOOP_NODES + (ast.If, ast.With, ast.AsyncWith, ast.Try)
+if hasattr(ast, "Match"):
+    _BLOCK_NODES += (ast.Match,)
+if hasattr(ast, "TryStar"):
+    _BLOCK_NODES += (ast.TryStar,)
+_FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef)
+_SCOPE_NODES = _FUNCTION_NODES + (ast.ClassDef, ast.Lambda)
+
+# 走査の高速化のため、型の集合で判定する
+_LOOP_TYPES = frozenset(_LOOP_NODES)
+_BLOCK_TYPES = frozenset(_BLOCK_NODES)
+_SCOPE_TYPES = frozenset(_SCOPE_NODES)
+_BRANCH_TYPES = frozenset(
+    _LOOP_NODES + (ast.If, ast.IfExp, ast.ExceptHandler, ast.Assert)
+    + ((ast.match_case,) if hasattr(ast, "match_case") else ())
+)
+_CONDITIONAL_BLOCK_TYPES = _BLOCK_TYPES - _LOOP_TYPES
+_STMT_TYPES = frozenset(
+    cls for cls in vars(ast).values() if isinstance(cls, type) and issubclass(cls, ast.stmt)
+)
+# 子を持たない、または複雑度に影響しないノード
+_LEAF_TYPES = frozenset(
+    [ast.Name, ast.Constant, ast.alias, ast.arg]
+    + [
+        cls for cls in vars(ast).values()
+        if isinstance(cls, type)
+        and issubclass(cls, (ast.expr_context, ast.operator, ast.unaryop, ast.cmpop, ast.boolop))
+    ]
+)
+
+
+@dataclass
+class FunctionMetrics:
+    """関数ごとのメトリクス"""
+
+    name: str
+    qualname: str
+    class_name: str
+    lineno: int
+    end_lineno: int
+    lines: int
+    statements: int
+    max_nesting: int
+    complexity: int
+    has_docstring: bool
+    missing_annotations: List[str] = field(default_factory=list)
+    loops: int = 0
+    max_loop_depth: int = 0
+    loop_patterns: List[str] = field(default_factory=list)
+
+    @property
+    def is_public(self) -> bool:
+        """公開関数かどうか（特殊メソッドは公開として扱う）"""
+        return not self.name.startswith("_") or (
+            self.name.startswith("__") and self.name.endswith("__")
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """辞書形式に変換"""
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FunctionMetrics":
+        """辞書から作成"""
+        return cls(**data)
+
+
+@dataclass
+class FileAnalysis:
+    """ファイルごとの解析結果"""
+
+    path: str
+    functions: List[FunctionMetrics] = field(default_factory=list)
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """辞書形式に変換"""
+        return {
+            "path": self.path,
+            "functions": [f.to_dict() for f in self.functions],
+            "error": self.error,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FileAnalysis":
+        """辞書から作成"""
+        return cls(
+            path=data["path"],
+            functions=[FunctionMetrics.from_dict(f) for f in data.get("functions", [])],
+            error=data.get("error"),
+        )
+
+
+class _BodyVisitor:
+    """関数本体を走査して複雑度・ネスト・ループパターンを数える（内側の関数は除く）"""
+
+    def __init__(self):
+        self.complexity = 1
+        self.statements = 0
+        self.max_nesting = 0
+        self.loops = 0
+        self.max_loop_depth = 0
+        self.patterns = set()
+
+    def visit_body(self, nodes: Iterable[ast.AST], nesting: int, loop_depth: int) -> None:
+        for node in nodes:
+            self.visit(node, nesting, loop_depth)
+
+    def visit(self, node: ast.AST, nesting: int, loop_depth: int) -> None:
+        node_type = type(node)
+        if node_type in _LEAF_TYPES or node_type in _SCOPE_TYPES:
+            return
+        if node_type in _STMT_TYPES:
+            self.statements += 1
+
+        if node_type in _BRANCH_TYPES:
+            self.complexity += 1
+        elif node_type is ast.BoolOp:
+            self.complexity += len(node.values) - 1
+        elif node_type is ast.comprehension:
+            self.complexity += 1 + len(node.ifs)
+
+        if node_type in _LOOP_TYPES:
+            self.loops += 1
+            loop_depth += 1
+            self.max_loop_depth = max(self.max_loop_depth, loop_depth)
+            if loop_depth >= 2:
+                self.patterns.add("nested_loop")
+            if node_type is not ast.While and _is_range_len(node.iter):
+                self.patterns.add("range_len")
+            for stmt in node.body:
+                self._check_loop_statement(stmt)
+
+        if node_type in _BLOCK_TYPES:
+            nesting += 1
+            if nesting > self.max_nesting:
+                self.max_nesting = nesting
+
+        for name in node._fields:
+            value = getattr(node, name, None)
+            if type(value) is list:
+                for child in value:
+                    if isinstance(child, ast.AST):
+                        self.visit(child, nesting, loop_depth)
+            elif isinstance(value, ast.AST):
+                self.visit(value, nesting, loop_depth)
+
+    def _check_loop_statement(self, stmt: ast.stmt) -> None:
+        """ループ本体にある典型的な非効率パターンを検出（内側のループは各自で検査）"""
+        if type(stmt) in _CONDITIONAL_BLOCK_TYPES:
+            for name in ("body", "orelse", "finalbody", "handlers"):
+                for child in getattr(stmt, name, ()):
+                    if isinstance(child, ast.ExceptHandler):
+                        for handler_stmt in child.body:
+                            self._check_loop_statement(handler_stmt)
+                    else:
+                        self._check_loop_statement(child)
+        elif (
+            isinstance(stmt, ast.Expr)
+            and isinstance(stmt.value, ast.Call)
+            and isinstance(stmt.value.func, ast.Attribute)
+            and stmt.value.func.attr == "append"
+        ):
+            self.patterns.add("append_in_loop")
+        elif (
+            isinstance(stmt, ast.AugAssign)
+            and isinstance(stmt.op, ast.Add)
+            and isinstance(stmt.value, (ast.JoinedStr, ast.Constant))
+            and isinstance(getattr(stmt.value, "value", ""), str)
+        ):
+            self.patterns.add("string_concat_in_loop")
+
+
+def _is_range_len(node: ast.expr) -> bool:
+    """range(len(x))の形かどうか"""
+    return (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Name)
+        and node.func.id == "range"
+        and len(node.args) == 1
+        and isinstance(node.args[0], ast.Call)
+        and isinstance(node.args[0].func, ast.Name)
+        and node.args[0].func.id == "len"
+    )
+
+
+def _missing_annotations(node: Union[ast.FunctionDef, ast.AsyncFunctionDef], is_method: bool) -> List[str]:
+    """型ヒントのない引数名（戻り値は'return'）を列挙"""
+    args = node.args
+    params = list(getattr(args, "posonlyargs", [])) + list(args.args) + list(args.kwonlyargs)
+    if args.vararg:
+        params.append(args.vararg)
+    if args.kwarg:
+        params.append(args.kwarg)
+    if is_method and params and params[0].arg in ("self", "cls"):
+        params = params[1:]
+    missing = [p.arg for p in params if p.annotation is None]
+    if node.returns is None and node.name != "__init__":
+        missing.append("return")
+    return missing
+
+
+def _measure_function(
+    node: Union[ast.FunctionDef, ast.AsyncFunctionDef],
+    qualname: str,
+    class_name: str
+) -> FunctionMetrics:
+    visitor = _BodyVisitor()
+    visitor.visit_body(node.body, 0, 0)
+    end_lineno = getattr(node, "end_lineno", None) or node.lineno
+    start = min([d.lineno for d in node.decorator_list] + [node.lineno])
+    return FunctionMetrics(
+        name=node.name,
+        qualname=qualname,
+        class_name=class_name,
+        lineno=node.lineno,
+        end_lineno=end_lineno,
+        lines=end_lineno - start + 1,
+        statements=visitor.statements,
+        max_nesting=visitor.max_nesting,
+        complexity=visitor.complexity,
+        has_docstring=ast.get_docstring(node) is not None,
+        missing_annotations=_missing_annotations(node, bool(class_name)),
+        loops=visitor.loops,
+        max_loop_depth=visitor.max_loop_depth,
+        loop_patterns=sorted(visitor.patterns),
+    )
+
+
+def _collect_functions(
+    nodes: Iterable[ast.AST],
+    prefix: str,
+    class_name: str,
+    out: List[FunctionMetrics]
+) -> None:
+    for node in nodes:
+        if isinstance(node, _FUNCTION_NODES):
+            qualname = f"{prefix}{node.name}"
+            out.append(_measure_function(node, qualname, class_name))
+            _collect_functions(node.body, f"{qualname}.<locals>.", "", out)
+        elif isinstance(node, ast.ClassDef):
+            _collect_functions(node.body, f"{prefix}{node.name}.", node.name, out)
+        elif isinstance(node, ast.stmt):
+            # if/try/with内で定義された関数も対象にする
+            _collect_functions(ast.iter_child_nodes(node), prefix, class_name, out)
+
+
+def analyze_source(source: Union[str, bytes], path: str = "<unknown>") -> FileAnalysis:
+    """
+    ソースコードを解析
+
+    Args:
+        source: Pythonソースコード
+        path: 結果に記録するファイルパス
+
+    Returns:
+        ファイルの解析結果。構文エラーの場合はerrorに内容を記録
+    """
+    try:
+        tree = ast.parse(source, filename=path)
+    except (SyntaxError, ValueError) as e:
+        return FileAnalysis(path=path, error=f"{type(e).__name__}: {e}")
+    functions: List[FunctionMetrics] = []
+    _collect_functions(tree.body, "", "", functions)
+    return FileAnalysis(path=path, functions=functions)
+
+
+def analyze_file(path: str, root: Optional[str] = None) -> FileAnalysis:
+    """
+    ファイルを解析
+
+    Args:
+        path: 解析するファイルのパス
+        root: 結果のパスをこのディレクトリからの相対パスにする
+
+    Returns:
+        ファイルの解析結果
+    """
+    display = _relative_path(path, root)
+    try:
+        with open(path, "rb") as f:
+            source = f.read()
+    except OSError as e:
+        return FileAnalysis(path=display, error=f"{type(e).__name__}: {e}")
+    return analyze_source(source, display)
+
+
+def _relative_path(path: str, root: Optional[str]) -> str:
+    if root is None:
+        return path
+    return os.path.relpath(path, root).replace(os.sep, "/")
+
+
+def _analyze_chunk(paths: Sequence[str], root: Optional[str]) -> List[FileAnalysis]:
+    """ワーカープロセスで複数ファイルをまとめて解析"""
+    return [analyze_file(path, root) for path in paths]
+
+
+def _is_excluded(name: str, rel_path: str, patterns: Sequence[str]) -> bool:
+    return any(
+        fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(rel_path, pattern)
+        for pattern in patterns
+    )
+
+
+def iter_python_files(root: str, exclude: Sequence[str] = ()) -> Iterator[str]:
+    """
+    ディレクトリ以下のPythonファイルを列挙
+
+    Args:
+        root: 探索するディレクトリ（ファイルの場合はそのファイルのみ）
+        exclude: 除外するディレクトリ名・ファイル名・相対パスのパターン
+
+    Yields:
+        Pythonファイルのパス
+    """
+    if os.path.isfile(root):
+        yield root
+        return
+
+    patterns = tuple(DEFAULT_EXCLUDES) + tuple(p.rstrip("/\\") for p in exclude)
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda e: e.name)
+        except OSError as e:
+            logger.warning(f"ディレクトリを読み込めません: {directory} ({e})")
+            continue
+        subdirs = []
+        for entry in entries:
+            rel_path = _relative_path(entry.path, root)
+            if _is_excluded(entry.name, rel_path, patterns):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.name.endswith(".py") and entry.is_file():
+                yield entry.path
+        stack.extend(reversed(subdirs))
+
+
+def analyze_tree(
+    root: str,
+    exclude: Sequence[str] = (),
+    workers: Optional[int] = None
+) -> List[FileAnalysis]:
+    """
+    ディレクトリ以下のPythonファイルを並列に解析
+
+    ファイル数が多い場合はCPUコア数分のプロセスで解析します。
+
+    Args:
+        root: 解析するディレクトリまたはファイル
+        exclude: 除外パターン
+        workers: ワーカープロセス数（Noneの場合はCPUコア数）
+
+    Returns:
+        ファイルごとの解析結果（パス順）
+    """
+    base = root if os.path.isdir(root) else os.path.dirname(root) or "."
+    paths = list(iter_python_files(root, exclude))
+    return analyze_paths(paths, base, workers)
+
+
+def analyze_paths(
+    paths: Sequence[str],
+    root: Optional[str] = None,
+    workers: Optional[int] = None
+) -> List[FileAnalysis]:
+    """
+    指定されたファイルを並列に解析
+
+    Args:
+        paths: 解析するファイルのパス
+        root: 結果のパスをこのディレクトリからの相対パスにする
+        workers: ワーカープロセス数（Noneの場合はCPUコア数）
+
+    Returns:
+        ファイルごとの解析結果（入力順）
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(paths) < PARALLEL_THRESHOLD:
+        return _analyze_chunk(paths, root)
+
+    chunks = [paths[i:i + CHUNK_SIZE] for i in range(0, len(paths), CHUNK_SIZE)]
+    results: List[FileAnalysis] = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk_result in executor.map(_analyze_chunk, chunks, [root] * len(chunks)):
+            results.extend(chunk_result)
+    return results
+
+
+def _task_id(kind: str, path: str, metrics: FunctionMetrics) -> str:
+    digest = hashlib.sha1(f"{path}:{metrics.qualname}:{kind}".encode("utf-8")).hexdigest()[:8]
+    return f"{kind}_{metrics.name.strip('_') or 'func'}_{digest}"
+
+
+def _task(
+    kind: str,
+    path: str,
+    metrics: FunctionMetrics,
+    description: str,
+    goals: List[str],
+    instructions: str,
+    priority: int
+) -> Dict[str, Any]:
+    target = {"file": path, "function": metrics.name}
+    if metrics.class_name:
+        target["class"] = metrics.class_name
+    return {
+        "id": _task_id(kind, path, metrics),
+        "description": description,
+        "target": target,
+        "goals": goals,
+        "instructions": instructions,
+        "priority": priority,
+        "enabled": True,
+        "status": "pending",
+        "metrics": {
+            "lineno": metrics.lineno,
+            "lines": metrics.lines,
+            "complexity": metrics.complexity,
+            "max_nesting": metrics.max_nesting,
+            "loops": metrics.loops,
+            "loop_patterns": list(metrics.loop_patterns),
+        },
+    }
+
+
+_LOOP_PATTERN_HINTS = {
+    "nested_loop": "ネストしたループを辞書・集合による検索やアルゴリズムの見直しで減らしてください。",
+    "append_in_loop": "ループ内のappendをリスト内包表記やジェネレータに置き換えてください。",
+    "string_concat_in_loop": "ループ内の文字列連結をstr.joinに置き換えてください。",
+    "range_len": "range(len(...))をenumerateや直接の反復に置き換えてください。",
+}
+
+
+def build_tasks(analysis: FileAnalysis) -> List[Dict[str, Any]]:
+    """
+    1ファイルの解析結果から進化タスクを生成
+
+    Args:
+        analysis: ファイルの解析結果
+
+    Returns:
+        evolution_tasksの要素となる辞書のリスト
+    """
+    tasks = []
+    for metrics in analysis.functions:
+        if "<locals>" in metrics.qualname:
+            continue
+
+        if (
+            metrics.complexity >= COMPLEXITY_THRESHOLD
+            or metrics.max_nesting >= NESTING_THRESHOLD
+            or metrics.lines >= LENGTH_THRESHOLD
+        ):
+            severe = metrics.complexity >= 2 * COMPLEXITY_THRESHOLD or metrics.lines >= 2 * LENGTH_THRESHOLD
+            tasks.append(_task(
+                "refactor", analysis.path, metrics,
+                f"複雑な関数の分割が必要です（循環的複雑度 {metrics.complexity}、"
+                f"ネスト {metrics.max_nesting}、{metrics.lines}行）",
+                ["MAINTAINABILITY", "READABILITY"],
+                "関数を小さな関数に分割し、各関数が明確な単一の責任を持つようにしてください。"
+                "制御フローを簡素化し、ネストを減らしてください。",
+                1 if severe else 2,
+            ))
+
+        if metrics.loop_patterns:
+            hints = "".join(_LOOP_PATTERN_HINTS[p] for p in metrics.loop_patterns)
+            tasks.append(_task(
+                "optimize", analysis.path, metrics,
+                f"ループの最適化が可能です（{', '.join(metrics.loop_patterns)}）",
+                ["PERFORMANCE"],
+                hints + "動作と出力は変えないでください。",
+                1 if "nested_loop" in metrics.loop_patterns else 2,
+            ))
+
+        if metrics.is_public and not metrics.has_docstring:
+            tasks.append(_task(
+                "add_doc", analysis.path, metrics,
+                "ドキュメントが不足しています",
+                ["DOCUMENTATION"],
+                "関数の目的、引数、戻り値、および例外について説明するドキュメントを追加してください。",
+                3,
+            ))
+
+        if metrics.is_public and metrics.missing_annotations:
+            tasks.append(_task(
+                "add_type_hints", analysis.path, metrics,
+                f"型ヒントが不足しています（{', '.join(metrics.missing_annotations)}）",
+                ["TYPE_SAFETY", "DOCUMENTATION"],
+                "パラメータと戻り値に適切な型ヒントを追加してください。",
+                3,
+            ))
+    return tasks
+
+
+def build_evolution_plan(
+    analyses: Iterable[FileAnalysis],
+    profile: Optional["RuntimeProfile"] = None
+) -> Dict[str, Any]:
+    """
+    解析結果からevolution_plan.yamlの内容を生成
+
+    Args:
+        analyses: ファイルごとの解析結果
+        profile: 実測プロファイル（指定時はタスクをスコア順に並べる）
+
+    Returns:
+        YAMLとして保存できる辞書
+    """
+    tasks = []
+    for analysis in analyses:
+        tasks.extend(build_tasks(analysis))
+    return plan_from_tasks(tasks, profile)
+
+
+def plan_from_tasks(
+    tasks: List[Dict[str, Any]],
+    profile: Optional["RuntimeProfile"] = None
+) -> Dict[str, Any]:
+    """
+    タスクのリストからevolution_plan.yamlの内容を生成
+
+    Args:
+        tasks: build_tasksで生成したタスク
+        profile: 実測プロファイル（指定時は実測の時間の割合 × 改善の見込みのスコア順）
+
+    Returns:
+        YAMLとして保存できる辞書（タスクは優先度・ファイル順、profile指定時はスコア順）
+    """
+    if profile is not None:
+        from .ranking import rank_tasks
+        ordered = rank_tasks(tasks, profile)
+    else:
+        ordered = sorted(tasks, key=lambda t: (t["priority"], t["target"]["file"]))
+    return {
+        "version": "1.0",
+        "project_settings": {
+            "default_goals": ["READABILITY", "MAINTAINABILITY"],
+            "default_constraints": ["preserve_semantics"],
+        },
+        "evolution_tasks": ordered,
+    }
@@ -0,0 +1,274 @@
+"""
+候補のコードの正規化
+
+空白・コメント・ドキュメント文字列・ローカル変数名だけが異なる候補を
+同じものとして扱うため、ASTを正規化してハッシュを求めます。
+ハッシュごとにコンパイル済みのコードと評価結果をキャッシュし、
+同じ候補を再び実行・計測しないようにします。
+"""
+
+import ast
+import hashlib
+import logging
+import symtable
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import CodeType
+from typing import Any, Dict, Optional, Set
+
+from ..metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+FITNESS_LOOKUPS = REGISTRY.counter(
+    "evolve_chip_fitness_cache_lookups", "候補の評価結果のキャッシュの参照回数", ("result",)
+)
+_HITS = FITNESS_LOOKUPS.labels("hit")
+_MISSES = FITNESS_LOOKUPS.labels("miss")
+
+# キャッシュするエントリ数の既定値
+DEFAULT_MAX_ENTRIES = 1024
+
+# 正規化したローカル変数名の接頭辞
+_LOCAL_PREFIX = "_l"
+
+
+def _strip_docstrings(tree: ast.AST) -> None:
+    """モジュール・クラス・関数の先頭のドキュメント文字列を取り除く"""
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        body = node.body
+        if body and isinstance(body[0], ast.Expr) and isinstance(getattr(body[0], "value", None), ast.Constant) \
+                and isinstance(body[0].value.value, str):
+            node.body = body[1:] or [ast.Pass()]
+
+
+def _local_names(table: symtable.SymbolTable) -> Set[str]:
+    """
+    関数のスコープ以下で、ローカル変数としてだけ使われている名前
+
+    引数・グローバル・インポート・クラス本体の名前として使われるものは、
+    名前を変えると振る舞いが変わるため除きます。
+    """
+    local: Set[str] = set()
+    blocked: Set[str] = set()
+
+    def visit(scope: symtable.SymbolTable) -> None:
+        if scope.get_type() != "function":
+            blocked.update(scope.get_identifiers())
+        else:
+            for symbol in scope.get_symbols():
+                name = symbol.get_name()
+                if symbol.is_parameter() or symbol.is_global() or symbol.is_imported():
+                    blocked.add(name)
+                elif symbol.is_local():
+                    local.add(name)
+                elif not symbol.is_free():
+                    blocked.add(name)
+        for child in scope.get_children():
+            visit(child)
+
+    visit(table)
+    return local - blocked
+
+
+class _LocalRenamer(ast.NodeTransformer):
+    """ローカル変数名を出現順に_l0, _l1, ...に置き換える"""
+
+    def __init__(self, names: Set[str]):
+        self.names = names
+        self.mapping: Dict[str, str] = {}
+
+    def _rename(self, name: Optional[str]) -> Optional[str]:
+        if name not in self.names:
+            return name
+        if name not in self.mapping:
+            self.mapping[name] = f"{_LOCAL_PREFIX}{len(self.mapping)}"
+        return self.mapping[name]
+
+    def visit_Name(self, node: ast.Name) -> ast.Name:
+        node.id = self._rename(node.id)
+        return node
+
+    def visit_FunctionDef(self, node):
+        node.name = self._rename(node.name)
+        return self.generic_visit(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ExceptHandler(self, node: ast.ExceptHandler):
+        node.name = self._rename(node.name)
+        return self.generic_visit(node)
+
+    def visit_Nonlocal(self, node: ast.Nonlocal) -> ast.Nonlocal:
+        node.names = [self._rename(name) for name in node.names]
+        return node
+
+    def visit_MatchAs(self, node):
+        node.name = self._rename(node.name)
+        return self.generic_visit(node)
+
+    def visit_MatchStar(self, node):
+        node.name = self._rename(node.name)
+        return node
+
+    def visit_MatchMapping(self, node):
+        node.rest = self._rename(node.rest)
+        return self.generic_visit(node)
+
+
+def normalize(code: str) -> ast.Module:
+    """
+    コードを正規化したAST
+
+    ドキュメント文字列を除き、モジュール直下の関数ごとにローカル変数名を
+    出現順の名前に置き換えます（関数名・引数名・グローバル変数名は変えません）。
+    コメントと空白はASTに含まれないため比較に影響しません。
+
+    Args:
+        code: 候補のコード
+
+    Returns:
+        正規化したAST
+
+    Raises:
+        SyntaxError: 構文エラーの場合
+    """
+    tree = ast.parse(code)
+    _strip_docstrings(tree)
+    identifiers = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+    if any(name.startswith(_LOCAL_PREFIX) for name in identifiers):
+        # 置き換え後の名前と衝突する可能性がある場合は名前を変えない
+        return tree
+    tables = {
+        (child.get_name(), child.get_lineno()): child
+        for child in symtable.symtable(code, "<candidate>", "exec").get_children()
+    }
+    for node in tree.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        table = tables.get((node.name, node.lineno))
+        if table is None:
+            continue
+        renamer = _LocalRenamer(_local_names(table))
+        # デコレータ・引数の既定値はモジュールのスコープで評価されるため本体だけを対象にする
+        node.body = [renamer.visit(statement) for statement in node.body]
+    return tree
+
+
+def canonical_hash(code: str) -> str:
+    """
+    正規化したASTのハッシュ
+
+    構文エラーのコードは元のテキストのハッシュを返します。
+
+    Args:
+        code: 候補のコード
+
+    Returns:
+        SHA-256ハッシュの16進文字列
+    """
+    try:
+        payload = ast.dump(normalize(code), annotate_fields=False)
+    except (SyntaxError, ValueError):
+        payload = "raw:" + code
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class FitnessCacheStats:
+    """適応度キャッシュの統計情報"""
+
+    hits: int = 0
+    misses: int = 0
+    compiled: int = 0
+
+
+class FitnessCache:
+    """
+    正規化したASTのハッシュごとのコンパイル済みコードと評価結果
+
+    LRUでエントリ数を制限します。操作はスレッドセーフです。
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """
+        初期化
+
+        Args:
+            max_entries: コンパイル済みコード・評価結果それぞれの最大エントリ数
+        """
+        self.max_entries = max_entries
+        self.stats = FitnessCacheStats()
+        self._results: "OrderedDict[str, Any]" = OrderedDict()
+        self._code: "OrderedDict[str, CodeType]" = OrderedDict()
+        self._hashes: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _store(self, entries: OrderedDict, key: str, value: Any) -> None:
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def hash(self, code: str) -> str:
+        """コードの正規化ハッシュ（同じテキストは再計算しない）"""
+        with self._lock:
+            digest = self._hashes.get(code)
+        if digest is None:
+            digest = canonical_hash(code)
+            with self._lock:
+                self._store(self._hashes, code, digest)
+        return digest
+
+    def key(self, code: str, scope: str = "") -> str:
+        """
+        評価結果のキー
+
+        Args:
+            code: 候補のコード
+            scope: 評価の条件（対象の関数名など）。条件が異なれば別のキーになる
+
+        Returns:
+            キー
+        """
+        return f"{scope}:{self.hash(code)}"
+
+    def get(self, key: str) -> Optional[Any]:
+        """評価結果を取得（なければNone）"""
+        with self._lock:
+            value = self._results.get(key)
+            if value is None:
+                self.stats.misses += 1
+                _MISSES.inc()
+                return None
+            self._results.move_to_end(key)
+            self.stats.hits += 1
+            _HITS.inc()
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        """評価結果を保存"""
+        with self._lock:
+            self._store(self._results, key, value)
+
+    def compile(self, code: str, filename: str = "<candidate>") -> CodeType:
+        """
+        コードをコンパイル（正規化して同じコードはコンパイル済みのものを返す）
+
+        Raises:
+            SyntaxError: 構文エラーの場合
+        """
+        digest = self.hash(code)
+        with self._lock:
+            compiled = self._code.get(digest)
+            if compiled is not None:
+                self._code.move_to_end(digest)
+                return compiled
+        compiled = compile(code, filename, "exec")
+        with self._lock:
+            self._store(self._code, digest, compiled)
+            self.stats.compiled += 1
+        return compiled
@@ -5,6 +5,8 @@ from typing import List, Dict, Optional, Any
 from dataclasses import dataclass
 from enum import Enum
 
+from .profiler import get_profiler
+
 class EvolutionGoal(Enum):
     READABILITY = "readability"
     PERFORMANCE = "performance"
@@ -39,6 +41,13 @@ class EvolveChip:
         self.constraints = constraints or ["preserve_semantics"]
         self.original_source = inspect.getsource(func)
         self.func_name = func.__name__
+        self.profile_key = f"{func.__module__}.{func.__qualname__}"
+        self._analyzed = False
+        
+        # 呼び出し回数・実行時間の記録（終了時に保存）
+        self._profiler = get_profiler()
+        self._profiler.register(self.profile_key, inspect.getsourcefile(func) or "", func.__code__.co_firstlineno)
+        self._profiler.register_atexit()
         
         # 関数メタデータの保持
         functools.update_wrapper(self, func)
@@ -47,14 +56,16 @@ class EvolveChip:
         """
         関数が呼び出された時の処理
         
-        開発モードの場合は自己解析と提案を行い、その後元の関数を実行
+        初回の呼び出しで自己解析を行い、その後はプロファイラを通して
+        元の関数を実行します（呼び出し回数と、サンプリングした実行時間を記録）
         """
-        # 開発モードの場合のみ分析を実行
-        if os.environ.get("EVOLVE_MODE") == "development":
+        # チップは開発モードでのみ付与されるため、毎回の環境変数の確認は行わない
+        if not self._analyzed:
+            self._analyzed = True
             self._analyze()
             
         # 元の関数を実行して結果を返す
-        return self.func(*args, **kwargs)
+        return self._profiler.call(self.profile_key, self.func, args, kwargs)
     
     def _analyze(self):
         """
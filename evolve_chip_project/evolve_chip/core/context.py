@@ -0,0 +1,379 @@
+"""
+プロンプトのコンテキスト組み立て
+
+プロジェクト全体のシンボル（関数・クラス・定数）と参照関係をASTで索引化し、
+進化対象の関数が参照するシンボルのシグネチャ・クラス定義・定数を
+トークン予算内でプロンプトに追加します。
+"""
+
+import os
+import ast
+import logging
+import textwrap
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+from evolve_chip.ai.tokens import estimate_tokens
+from .analyzer import iter_python_files
+
+logger = logging.getLogger(__name__)
+
+# 長い定数は値を省略する
+MAX_CONSTANT_TOKENS = 80
+
+# 既定で参照をたどる深さ（1は対象が直接参照するシンボルのみ）
+DEFAULT_MAX_DEPTH = 2
+
+_FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef)
+
+
+@dataclass
+class Symbol:
+    """索引化したシンボル"""
+
+    name: str
+    module: str
+    file: str
+    kind: str    # "function", "class", "constant"
+    lineno: int
+    snippet: str
+    references: List[str] = field(default_factory=list)
+
+    @property
+    def key(self) -> str:
+        return f"{self.module}.{self.name}"
+
+
+@dataclass
+class ModuleSymbols:
+    """1モジュール分のシンボルとインポート"""
+
+    name: str
+    file: str
+    symbols: Dict[str, Symbol] = field(default_factory=dict)
+    # ローカル名 → (モジュール名, 属性名)。モジュール自体のインポートは属性名がNone
+    imports: Dict[str, Tuple[str, Optional[str]]] = field(default_factory=dict)
+
+
+def _module_name(rel_path: str) -> str:
+    parts = rel_path.replace(os.sep, "/")[:-len(".py")].split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return ".".join(parts)
+
+
+def _references(node: ast.AST) -> List[str]:
+    """ノード内で読み込まれる名前と属性参照（a.b）を出現順に列挙"""
+    names: List[str] = []
+    seen: Set[str] = set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.Attribute) and isinstance(child.value, ast.Name):
+            name = f"{child.value.id}.{child.attr}"
+        elif isinstance(child, ast.Name) and isinstance(child.ctx, ast.Load):
+            name = child.id
+        else:
+            continue
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+
+def _docstring_summary(node: ast.AST, indent: str) -> str:
+    doc = ast.get_docstring(node)
+    if not doc:
+        return ""
+    return f'{indent}"""{doc.strip().splitlines()[0]}"""\n'
+
+
+def _header(lines: List[str], node: ast.AST) -> str:
+    """デコレータを含む定義の先頭から本体の直前まで（1行で書かれた定義は本体を除く）"""
+    start = min([d.lineno for d in node.decorator_list] + [node.lineno])
+    body = node.body[0]
+    header = "".join(lines[start - 1:body.lineno - 1])
+    # col_offsetはUTF-8のバイト数
+    prefix = lines[body.lineno - 1].encode("utf-8")[:body.col_offset].decode("utf-8", "ignore")
+    if prefix.strip():
+        header += prefix.rstrip() + "\n"
+    return header
+
+
+def _function_stub(lines: List[str], node: ast.AST) -> str:
+    header = _header(lines, node)
+    indent = " " * (node.col_offset + 4)
+    return header + _docstring_summary(node, indent) + f"{indent}...\n"
+
+
+def _class_outline(lines: List[str], node: ast.ClassDef) -> str:
+    """クラスの定義（クラス属性とメソッドのシグネチャ）"""
+    header = _header(lines, node)
+    indent = " " * (node.col_offset + 4)
+    parts = [header, _docstring_summary(node, indent)]
+    for stmt in node.body:
+        if isinstance(stmt, (ast.Assign, ast.AnnAssign)):
+            parts.append("".join(lines[stmt.lineno - 1:stmt.end_lineno]))
+        elif isinstance(stmt, _FUNCTION_NODES):
+            parts.append(_function_stub(lines, stmt))
+    if len(parts) == 2 and not parts[1]:
+        parts.append(f"{indent}...\n")
+    return "".join(parts)
+
+
+def _constant_source(lines: List[str], node: ast.stmt, name: str) -> str:
+    text = "".join(lines[node.lineno - 1:node.end_lineno])
+    if estimate_tokens(text) > MAX_CONSTANT_TOKENS:
+        return f"{name} = ...  # 値は省略\n"
+    return text
+
+
+def _is_constant_name(name: str) -> bool:
+    return name.isupper() or (name.startswith("_") and name[1:].isupper())
+
+
+class SymbolIndex:
+    """
+    プロジェクト全体のシンボルと参照関係の索引
+
+    トップレベルの関数・クラス・定数（大文字の名前）を対象にし、
+    各シンボルが参照する名前をインポートをたどって解決します。
+    """
+
+    def __init__(self):
+        self.modules: Dict[str, ModuleSymbols] = {}
+        self._by_file: Dict[str, ModuleSymbols] = {}
+
+    @classmethod
+    def build(cls, root: str, exclude: Sequence[str] = ()) -> "SymbolIndex":
+        """
+        ディレクトリ以下のPythonファイルから索引を作成
+
+        Args:
+            root: プロジェクトのルートディレクトリ
+            exclude: 除外パターン
+
+        Returns:
+            作成した索引
+        """
+        index = cls()
+        for path in iter_python_files(root, exclude):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    source = f.read()
+            except (OSError, UnicodeDecodeError) as e:
+                logger.debug(f"索引化できません: {path} ({e})")
+                continue
+            index.add_source(source, path, _module_name(os.path.relpath(path, root)))
+        return index
+
+    def add_source(self, source: str, path: str, module: str) -> Optional[ModuleSymbols]:
+        """
+        1ファイル分のシンボルを索引に追加
+
+        Args:
+            source: ソースコード
+            path: ファイルのパス
+            module: モジュール名
+
+        Returns:
+            追加したモジュール。構文エラーの場合はNone
+        """
+        try:
+            tree = ast.parse(source, filename=path)
+        except SyntaxError as e:
+            logger.debug(f"索引化できません: {path} ({e})")
+            return None
+        lines = source.splitlines(keepends=True)
+        info = ModuleSymbols(name=module, file=os.path.abspath(path))
+        package = module if os.path.basename(path) == "__init__.py" else module.rpartition(".")[0]
+
+        for node in tree.body:
+            if isinstance(node, _FUNCTION_NODES):
+                info.symbols[node.name] = Symbol(
+                    node.name, module, path, "function", node.lineno,
+                    _function_stub(lines, node), _references(node)
+                )
+            elif isinstance(node, ast.ClassDef):
+                info.symbols[node.name] = Symbol(
+                    node.name, module, path, "class", node.lineno,
+                    _class_outline(lines, node), _references(node)
+                )
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    if isinstance(target, ast.Name) and _is_constant_name(target.id):
+                        info.symbols[target.id] = Symbol(
+                            target.id, module, path, "constant", node.lineno,
+                            _constant_source(lines, node, target.id), _references(node.value or node)
+                        )
+            elif isinstance(node, ast.Import):
+                for alias in node.names:
+                    if alias.asname:
+                        info.imports[alias.asname] = (alias.name, None)
+                    else:
+                        head = alias.name.split(".")[0]
+                        info.imports[head] = (head, None)
+            elif isinstance(node, ast.ImportFrom):
+                base = node.module or ""
+                if node.level:
+                    parent = package.split(".") if package else []
+                    parent = parent[:len(parent) - (node.level - 1)] if node.level > 1 else parent
+                    base = ".".join(parent + ([node.module] if node.module else []))
+                for alias in node.names:
+                    if alias.name == "*":
+                        continue
+                    info.imports[alias.asname or alias.name] = (base, alias.name)
+
+        self.modules[module] = info
+        self._by_file[info.file] = info
+        return info
+
+    def module_for_file(self, path: str) -> Optional[ModuleSymbols]:
+        """ファイルのパスからモジュールを探す"""
+        return self._by_file.get(os.path.abspath(path))
+
+    def _find_module(self, name: str) -> Optional[ModuleSymbols]:
+        module = self.modules.get(name)
+        if module is None and name:
+            # 索引のルートとインポートの起点がずれている場合（src/配下やパッケージ内をルートにした場合）
+            matches = [
+                key for key in self.modules
+                if key.endswith("." + name) or name.endswith("." + key)
+            ]
+            if len(matches) == 1:
+                module = self.modules[matches[0]]
+            elif matches:
+                # 最も長く一致するものを選ぶ（同じ長さで複数あれば区別できない）
+                matches.sort(key=len, reverse=True)
+                if len(matches[0]) > len(matches[1]):
+                    module = self.modules[matches[0]]
+        return module
+
+    def _lookup(self, module: ModuleSymbols, name: str, depth: int = 0) -> Optional[Symbol]:
+        if name in module.symbols:
+            return module.symbols[name]
+        if name in module.imports and depth < 4:
+            target_module, attr = module.imports[name]
+            if attr is not None:
+                found = self._find_module(target_module)
+                if found is not None:
+                    return self._lookup(found, attr, depth + 1)
+        return None
+
+    def resolve(self, module: ModuleSymbols, reference: str) -> Optional[Symbol]:
+        """
+        モジュール内の参照（nameまたはalias.attr）をシンボルに解決
+
+        Args:
+            module: 参照元のモジュール
+            reference: 参照名
+
+        Returns:
+            解決したシンボル。プロジェクト外の名前や組み込みの場合はNone
+        """
+        head, _, attr = reference.partition(".")
+        if not attr:
+            return self._lookup(module, head)
+        imported = module.imports.get(head)
+        if imported and imported[1] is None:
+            # import pkg.mod as m; m.func
+            found = self._find_module(imported[0])
+            return self._lookup(found, attr) if found else None
+        if imported:
+            # from pkg import mod; mod.func（モジュール自体をfromでインポートした場合）
+            found = self._find_module(f"{imported[0]}.{imported[1]}" if imported[0] else imported[1])
+            if found is not None:
+                return self._lookup(found, attr)
+        # Class.methodなどはクラスの定義を参照として扱う
+        return self._lookup(module, head)
+
+
+@dataclass
+class PromptContext:
+    """プロンプトに追加するコンテキスト"""
+
+    symbols: List[Symbol] = field(default_factory=list)
+    tokens: int = 0
+    omitted: List[str] = field(default_factory=list)
+
+    def render(self) -> str:
+        """ファイルごとにまとめたPythonコードとして返す（シンボルがなければ空文字列）"""
+        if not self.symbols:
+            return ""
+        return "\n".join(f"# {symbol.module}\n{symbol.snippet}" for symbol in self.symbols).rstrip() + "\n"
+
+
+class ContextAssembler:
+    """
+    進化対象の関数が参照するシンボルをトークン予算内で集める
+
+    対象が直接参照するシンボルを先に、その先の参照を後に追加し、
+    予算を超えるシンボルは省略します。関数はシグネチャと
+    ドキュメント文字列の1行目、クラスは属性とメソッドのシグネチャのみを含めます。
+    """
+
+    def __init__(self, index: SymbolIndex, max_depth: int = DEFAULT_MAX_DEPTH):
+        """
+        初期化
+
+        Args:
+            index: シンボルの索引
+            max_depth: 参照をたどる深さ
+        """
+        self.index = index
+        self.max_depth = max_depth
+
+    def assemble(
+        self,
+        sources: Union[str, Iterable[str]],
+        file_path: str,
+        token_budget: int,
+        exclude: Iterable[str] = ()
+    ) -> PromptContext:
+        """
+        コンテキストを組み立てる
+
+        Args:
+            sources: 進化対象の関数のソース（バッチの場合は複数）
+            file_path: 対象の関数が定義されているファイル
+            token_budget: コンテキストに使うトークン数の上限
+            exclude: 含めないシンボル名（プロンプトに本体を含める関数など）
+
+        Returns:
+            組み立てたコンテキスト
+        """
+        if isinstance(sources, str):
+            sources = [sources]
+        context = PromptContext()
+        module = self.index.module_for_file(file_path)
+        if module is None or token_budget <= 0:
+            return context
+
+        excluded = {f"{module.name}.{name}" for name in exclude}
+        frontier: List[Tuple[ModuleSymbols, str]] = []
+        for source in sources:
+            try:
+                tree = ast.parse(textwrap.dedent(source))
+            except SyntaxError:
+                continue
+            frontier.extend((module, name) for name in _references(tree))
+
+        visited: Set[str] = set(excluded)
+        for _ in range(self.max_depth):
+            next_frontier: List[Tuple[ModuleSymbols, str]] = []
+            for origin, reference in frontier:
+                symbol = self.index.resolve(origin, reference)
+                if symbol is None or symbol.key in visited:
+                    continue
+                visited.add(symbol.key)
+                tokens = estimate_tokens(symbol.snippet)
+                if context.tokens + tokens > token_budget:
+                    context.omitted.append(symbol.key)
+                    continue
+                context.symbols.append(symbol)
+                context.tokens += tokens
+                symbol_module = self.index.modules[symbol.module]
+                next_frontier.extend((symbol_module, name) for name in symbol.references)
+            frontier = next_frontier
+        if context.omitted:
+            logger.debug(f"トークン予算を超えたため省略したシンボル: {', '.join(context.omitted)}")
+        return context
@@ -7,7 +7,9 @@
 import functools
 import inspect
 from enum import Enum
-from typing import List, Dict, Any, Callable, Optional
+from typing import List, Dict, Any, Callable, Optional, Tuple
+
+from evolve_chip.ai.tokens import estimate_tokens
 
 class EvolutionGoal(Enum):
     """進化の目標を定義する列挙型"""
@@ -16,7 +18,9 @@ class EvolutionGoal(Enum):
 
 def evolve(
     goals: Optional[List[EvolutionGoal]] = None,
-    constraints: Optional[Dict[str, str]] = None
+    constraints: Optional[Dict[str, str]] = None,
+    inputs: Optional[List[Any]] = None,
+    size_generator: Optional[Callable[[int], Any]] = None
 ):
     """
     コードを進化させるデコレータ
@@ -24,6 +28,10 @@ def evolve(
     Args:
         goals: 進化の目標リスト
         constraints: 制約条件の辞書
+        inputs: 元の関数と進化後の関数の性能比較に使う引数のリスト
+                （タプルは位置引数として展開、Noneの場合は引数なしで呼び出す）
+        size_generator: 計算量の推定に使う、サイズnから引数を作る関数
+                        （Noneの場合は型ヒントから生成）
         
     Example:
         @evolve(
@@ -40,6 +48,8 @@ def evolve(
         # 進化用のメタデータを設定
         func.goals = goals
         func.constraints = constraints
+        func.inputs = inputs
+        func.size_generator = size_generator
         
         # ソースコードを取得
         try:
@@ -58,32 +68,70 @@ def evolve(
         
     return decorator
 
-def generate_prompt(func: Callable) -> str:
+# 単体・バッチのどちらのプロンプトにも含める共通の指示
+_IMPROVEMENT_GUIDELINES = """以下の点に注意して改善を行ってください：
+1. コードの可読性を高める
+   - 適切な変数名を使用
+   - 明確なコメントを追加
+   - Pythonのドキュメント文字列を使用
+2. Pythonのベストプラクティスに従う
+   - PEP 8スタイルガイドに準拠
+   - 適切な型ヒントを使用
+   - 効率的なデータ構造を選択
+3. エラー処理を適切に実装
+   - 例外処理を追加
+   - エッジケースを考慮
+4. 制約条件を厳密に守る
+   - 出力形式を遵守
+   - リソース制限を遵守"""
+
+def _describe_goals(func: Callable) -> str:
+    """進化目標を文字列に変換（Enum・文字列のどちらにも対応）"""
+    return ", ".join(getattr(g, "value", str(g)) for g in func.goals)
+
+def _describe_constraints(constraints: Dict[str, str]) -> str:
+    """制約の詳細な説明を生成"""
+    constraints_text = ""
+    for k, v in constraints.items():
+        if k == 'output':
+            constraints_text += f"- 出力は正確に「{v}」と一致する必要があります\n"
+        elif k == 'memory':
+            constraints_text += f"- メモリ使用量は{v}以下に抑える必要があります\n"
+        elif k == 'runtime':
+            constraints_text += f"- 実行時間は{v}以下である必要があります\n"
+        elif k == 'cpu':
+            constraints_text += f"- CPU使用率は{v}以下に抑える必要があります\n"
+        else:
+            constraints_text += f"- {k}: {v}\n"
+    return constraints_text
+
+def _describe_context(context: str) -> str:
+    """参照しているシンボルの定義をプロンプトの1節にする（なければ空文字列）"""
+    if not context:
+        return ""
+    return f"""参考：このコードが参照している関数・クラス・定数（これらの定義は変更しないでください）：
+```python
+{context.rstrip()}
+```
+
+"""
+
+def generate_prompt(func: Callable, context: str = "") -> str:
     """
     AIに渡すプロンプトを生成
     
     Args:
         func: 進化対象の関数
+        context: 関数が参照しているシンボルの定義（core.context.ContextAssemblerで生成）
         
     Returns:
         生成されたプロンプト
     """
     code = func.source
-    goals = ", ".join(g.value for g in func.goals)
+    goals = _describe_goals(func)
     
     # 制約の詳細な説明を生成
-    constraints_text = ""
-    for k, v in func.constraints.items():
-        if k == 'output':
-            constraints_text += f"- 出力は正確に「{v}」と一致する必要があります\n"
-        elif k == 'memory':
-            constraints_text += f"- メモリ使用量は{v}以下に抑える必要があります\n"
-        elif k == 'runtime':
-            constraints_text += f"- 実行時間は{v}以下である必要があります\n"
-        elif k == 'cpu':
-            constraints_text += f"- CPU使用率は{v}以下に抑える必要があります\n"
-        else:
-            constraints_text += f"- {k}: {v}\n"
+    constraints_text = _describe_constraints(func.constraints)
     
     # プロンプトの生成
     return f"""あなたは熟練したPythonエンジニアです。以下のコードを改善してください：
@@ -92,31 +140,103 @@ def generate_prompt(func: Callable) -> str:
 {code}
 ```
 
-改善の目標：
+{_describe_context(context)}改善の目標：
 {goals}の観点から改善を行ってください。
 
 制約条件：
 {constraints_text}
 
-以下の点に注意して改善を行ってください：
-1. コードの可読性を高める
-   - 適切な変数名を使用
-   - 明確なコメントを追加
-   - Pythonのドキュメント文字列を使用
-2. Pythonのベストプラクティスに従う
-   - PEP 8スタイルガイドに準拠
-   - 適切な型ヒントを使用
-   - 効率的なデータ構造を選択
-3. エラー処理を適切に実装
-   - 例外処理を追加
-   - エッジケースを考慮
-4. 制約条件を厳密に守る
-   - 出力形式を遵守
-   - リソース制限を遵守
+{_IMPROVEMENT_GUIDELINES}
 
 改善したコードを単一のPythonコードブロックとして提供してください：
 ```python
 # ここに改善したコードを記述
 ```
 
-注意：コードブロック以外の説明は不要です。""" 
\ No newline at end of file
+注意：コードブロック以外の説明は不要です。"""
+
+def generate_batch_prompt(funcs: List[Callable], context: str = "") -> str:
+    """
+    複数の関数をまとめて進化させるプロンプトを生成
+    
+    共通の指示は1回だけ含め、応答は関数名をキーとしたJSONで求めます。
+    応答はcore.response.parse_batch_responseで関数ごとに分割できます。
+    
+    Args:
+        funcs: 進化対象の関数のリスト
+        context: 関数が参照しているシンボルの定義（バッチ全体で1つ）
+        
+    Returns:
+        生成されたプロンプト
+    """
+    sections = []
+    for func in funcs:
+        constraints_text = _describe_constraints(func.constraints) or "- なし\n"
+        sections.append(
+            f"### {func.__name__}\n"
+            f"改善の目標：{_describe_goals(func)}\n"
+            f"制約条件：\n{constraints_text}\n"
+            f"```python\n{func.source}\n```"
+        )
+    functions_text = "\n\n".join(sections)
+    example = ",\n".join(
+        f'    "{func.__name__}": {{"code": "改善したコード", "explanation": "変更点の要約"}}'
+        for func in funcs
+    )
+    
+    return f"""あなたは熟練したPythonエンジニアです。以下の{len(funcs)}個の関数をそれぞれ改善してください。
+関数ごとに指定された目標と制約条件に従ってください。
+
+{functions_text}
+
+{_describe_context(context)}{_IMPROVEMENT_GUIDELINES}
+5. 関数名とシグネチャの互換性を保つ
+
+次の形式のJSONオブジェクトのみを返してください：
+{{
+  "functions": {{
+{example}
+  }}
+}}
+
+注意："code"には関数定義全体（必要なimportを含む）を文字列として入れてください。JSON以外の説明は不要です。"""
+
+def plan_batches(
+    funcs: List[Tuple[str, Callable]],
+    token_budget: int,
+    max_function_tokens: Optional[int] = None
+) -> List[List[Tuple[str, Callable]]]:
+    """
+    関数をトークン予算内のバッチにまとめる
+    
+    小さな関数は予算に収まる限り同じバッチに詰め、
+    単体で予算を超える大きな関数は1関数だけのバッチにします。
+    
+    Args:
+        funcs: (関数名, 関数)のリスト
+        token_budget: 1バッチあたりのソースコードのトークン数上限
+        max_function_tokens: バッチに含める関数の最大トークン数
+                             （省略時はtoken_budgetの1/4）
+        
+    Returns:
+        バッチのリスト
+    """
+    if max_function_tokens is None:
+        max_function_tokens = max(1, token_budget // 4)
+    
+    batches: List[List[Tuple[str, Callable]]] = []
+    current: List[Tuple[str, Callable]] = []
+    current_tokens = 0
+    for name, func in funcs:
+        tokens = estimate_tokens(func.source)
+        if tokens > max_function_tokens:
+            batches.append([(name, func)])
+            continue
+        if current and current_tokens + tokens > token_budget:
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append((name, func))
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
@@ -8,10 +8,19 @@ import os
 import ast
 import inspect
 import logging
+from types import SimpleNamespace
 from typing import Dict, Any, List, Optional, Callable
 from enum import Enum
 
 from evolve_chip.ai import AIClientBase, MockAIClient
+from evolve_chip.constraints.checker import parse_constraint
+from evolve_chip.constraints.differential import compare_functions
+from evolve_chip.constraints.memory import AllocationTracker
+from evolve_chip.constraints.sandbox import load_candidate
+from .canonical import FitnessCache
+from .decorators import generate_prompt
+from .response import extract_code_block
+from .search import Evaluation, EvolutionarySearch, SearchConfig
 
 logger = logging.getLogger(__name__)
 
@@ -34,7 +43,8 @@ class Evolution:
         self,
         goals: List[EvolutionGoal],
         constraints: Optional[Dict[str, Any]] = None,
-        ai_client: Optional[AIClientBase] = None
+        ai_client: Optional[AIClientBase] = None,
+        search: Optional[SearchConfig] = None
     ):
         """
         進化マネージャーの初期化
@@ -43,10 +53,13 @@ class Evolution:
             goals: 進化の目標リスト
             constraints: 制約条件（オプション）
             ai_client: AIクライアント（オプション）
+            search: 指定すると候補を集団として生成し、世代を重ねて改善する（オプション）
         """
         self.goals = goals
         self.constraints = constraints or {}
         self.ai_client = ai_client or MockAIClient(delay_seconds=1.0)
+        self.search = search
+        self.fitness_cache = FitnessCache()
         
     def analyze_code(self, func: Callable) -> Dict[str, Any]:
         """
@@ -89,18 +102,21 @@ class Evolution:
             
         all_constraints_satisfied = True
             
-        # メモリ制約の検証
+        # メモリ制約の検証（関数の実行中にPythonヒープへ確保されたメモリのピーク）
         if 'memory' in self.constraints:
-            import psutil
-            process = psutil.Process()
-            before = process.memory_info().rss
-            func()
-            after = process.memory_info().rss
-            memory_used = (after - before) / 1024 / 1024  # MB
+            limit, unit = parse_constraint(self.constraints['memory'])
+            if unit != 'MB':
+                raise ValueError(f"サポートされていないメモリ単位: {unit}")
+            with AllocationTracker() as tracker:
+                returned = func()
+            del returned
+            memory_used = tracker.report.peak_mb
             
-            limit = float(self.constraints['memory'].replace('< ', '').replace('MB', ''))
             if memory_used > limit:
-                logger.warning(f"メモリ制約違反: {memory_used}MB > {limit}MB")
+                logger.warning(
+                    f"メモリ制約違反: {memory_used:.2f}MB > {limit}MB\n"
+                    f"{tracker.report.format_report()}"
+                )
                 all_constraints_satisfied = False
         
         # 出力制約の検証
@@ -141,6 +157,9 @@ class Evolution:
         # 制約を検証（厳格でないモード）
         self.validate_constraints(func, strict=strict_constraints)
         
+        if self.search is not None:
+            return self._search_evolution(func, features)
+        
         # 目標リストを文字列に変換
         goals_str = [g.value for g in self.goals]
         
@@ -157,4 +176,51 @@ class Evolution:
             return None
             
         logger.info(f"進化が完了しました: {result.get('explanation')}")
-        return result.get('evolved_code') 
\ No newline at end of file
+        return result.get('evolved_code')
+
+    def _search_evolution(self, func: Callable, features: Dict[str, Any]) -> Optional[str]:
+        """
+        候補の集団を生成・評価し、世代を重ねて最良の候補を選ぶ
+        
+        制約を満たすかどうかに加え、目標にパフォーマンスを含む場合は
+        元の関数との速度比とメモリの差を適応度に使います。
+        
+        Args:
+            func: 進化対象の関数
+            features: analyze_codeで抽出した特徴
+            
+        Returns:
+            最良の候補のコード、または制約を満たす候補がない場合はNone
+        """
+        target = SimpleNamespace(source=features['source'], goals=self.goals, constraints=self.constraints)
+        prompt = generate_prompt(target)
+        compare = EvolutionGoal.PERFORMANCE in self.goals
+        
+        def produce(candidate_prompt: str) -> str:
+            return extract_code_block(self.ai_client.generate_content(candidate_prompt))
+        
+        def evaluate(code: str) -> Evaluation:
+            # 候補ごとに関数のモジュールの名前空間をコピーして評価する
+            candidate = load_candidate(
+                self.fitness_cache.compile(code), getattr(func, '__globals__', {}), func.__name__
+            )
+            passed = self.validate_constraints(candidate, strict=True)
+            if not (compare and passed):
+                return Evaluation(passed=passed)
+            comparison = compare_functions(func, candidate)
+            return Evaluation(
+                passed=True,
+                speedup=comparison.speedup,
+                memory_delta_bytes=comparison.memory_delta_bytes,
+                detail=comparison
+            )
+        
+        logger.info(
+            f"進化的探索を開始します: 集団 {self.search.population_size}、最大 {self.search.generations}世代"
+        )
+        outcome = EvolutionarySearch(produce, evaluate, self.search).run(prompt)
+        logger.info(outcome.format_report())
+        if outcome.best is None:
+            logger.error("制約を満たす候補が見つかりませんでした")
+            return None
+        return outcome.best.code
@@ -5,7 +5,9 @@ EvolveExtract - コード解析とYAML設計書生成ツール
 
 import os
 import sys
+import time
 import click
+import yaml
 from typing import List, Optional
 
 # アプリケーションルートのパスを設定
@@ -13,6 +15,10 @@ root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if root_dir not in sys.path:
     sys.path.insert(0, root_dir)
 
+from evolve_chip.core.analyzer import analyze_tree, build_evolution_plan, plan_from_tasks
+from evolve_chip.core.index import ExtractionIndex
+from evolve_chip.core.ranking import RuntimeProfile
+
 @click.group()
 def cli():
     """EvolveExtract - コード解析ツール"""
@@ -22,107 +28,84 @@ def cli():
 @click.argument("target_path", type=click.Path(exists=True))
 @click.option("--output", "-o", default="evolution_plan.yaml", help="出力YAMLファイル名")
 @click.option("--exclude", "-e", multiple=True, help="解析から除外するディレクトリやファイル")
+@click.option("--workers", "-j", type=int, default=None, help="解析に使うプロセス数（省略時はCPUコア数）")
+@click.option("--index", "index_path", help="解析インデックスのパス（省略時は~/.evolve_chip/extract_index.db）")
+@click.option("--no-index", is_flag=True, help="インデックスを使わずにすべてのファイルを解析")
+@click.option("--profile", "profile_path", type=click.Path(exists=True),
+              help="実測プロファイル（cProfileの出力かEvolveChipのhotness.json）。タスクを実測時間で順位付け")
 @click.option("--verbose", "-v", is_flag=True, help="詳細情報を表示")
 def analyze_command(
     target_path: str,
     output: str,
     exclude: List[str],
+    workers: Optional[int],
+    index_path: Optional[str],
+    no_index: bool,
+    profile_path: Optional[str],
     verbose: bool
 ):
     """
     ターゲットディレクトリのコードを解析し、evolution_plan.yamlを生成します。
     """
     click.echo(f"[EvolveExtract] {target_path} を解析中...")
+    started = time.perf_counter()
     
-    # デモ用のYAMLを生成
-    generate_demo_yaml(target_path, output)
+    profile = None
+    if profile_path:
+        try:
+            profile = RuntimeProfile.load(profile_path)
+        except ValueError as e:
+            click.echo(f"エラー: {e}", err=True)
+            sys.exit(1)
     
-    click.echo(f"[EvolveExtract] 解析完了! 結果を {output} に保存しました。")
-
-def generate_demo_yaml(target_path: str, output_file: str):
-    """
-    デモ用のYAMLを生成する
-    """
-    # ここでは簡易的なデモを実装
-    # 実際のツールでは、AST解析やコード分析が行われる
+    if no_index:
+        analyses = analyze_tree(target_path, exclude=exclude, workers=workers)
+        plan = build_evolution_plan(analyses, profile)
+        file_count = len(analyses)
+        function_count = sum(len(a.functions) for a in analyses)
+        errors = [f"{a.path} ({a.error})" for a in analyses if a.error]
+        summary = ""
+    else:
+        # 前回から変更されたファイルだけを解析し、残りはインデックスから合成する
+        with ExtractionIndex(index_path) as index:
+            result = index.refresh(target_path, exclude=exclude, workers=workers)
+        plan = plan_from_tasks(result.tasks, profile)
+        file_count = result.files
+        function_count = result.functions
+        errors = result.errors
+        summary = f"（解析 {result.parsed}、再利用 {result.reused}、削除 {result.removed}）"
     
-    yaml_content = """version: '1.0'
-project_settings:
-  default_goals:
-  - READABILITY
-  - MAINTAINABILITY
-  default_constraints:
-  - preserve_semantics
-evolution_tasks:
-- id: refactor_complex_func_12345678
-  description: 複雑な関数の分割が必要です
-  target:
-    file: main.py
-    function: process_data
-  goals:
-  - MAINTAINABILITY
-  - READABILITY
-  instructions: 関数を小さな関数に分割し、各関数が明確な単一の責任を持つようにしてください。制御フローを簡素化し、ネストを減らしてください。
-  priority: 1
-  enabled: true
-  status: pending
-
-- id: add_doc_utils_abcd1234
-  description: ユーティリティ関数にドキュメントが不足しています
-  target:
-    file: utils.py
-    function: calculate_metrics
-  goals:
-  - DOCUMENTATION
-  instructions: 関数の目的、引数、戻り値、および例外について説明するドキュメントを追加してください。
-  priority: 2
-  enabled: true
-  status: pending
-
-- id: add_type_hints_ijkl9012
-  description: 型ヒントが不足しています
-  target:
-    file: data_processor.py
-    function: transform_data
-  goals:
-  - TYPE_SAFETY
-  - DOCUMENTATION
-  instructions: パラメータと戻り値に適切な型ヒントを追加してください。
-  priority: 3
-  enabled: true
-  status: pending
-"""
+    # 大きな計画でも速く書き出せるよう、利用可能ならlibyamlのダンパーを使う
+    dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+    with open(output, 'w', encoding='utf-8') as f:
+        yaml.dump(plan, f, Dumper=dumper, sort_keys=False, allow_unicode=True)
     
-    # 出力ファイルに書き込み
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(yaml_content)
+    elapsed = time.perf_counter() - started
+    click.echo(
+        f"[EvolveExtract] {file_count}ファイル・{function_count}関数を{elapsed:.2f}秒で解析し、"
+        f"{len(plan['evolution_tasks'])}個のタスクを生成しました。{summary}"
+    )
+    if profile is not None:
+        profiled = [t for t in plan["evolution_tasks"] if t.get("score", 0) > 0]
+        click.echo(f"[EvolveExtract] 実測プロファイルで{len(profiled)}個のタスクを順位付けしました。")
+        if verbose:
+            for task in profiled[:10]:
+                click.echo(
+                    f"  {task['score']:.4f} {task['target']['file']}:{task['target']['function']} "
+                    f"(時間の割合 {task['profile']['time_share']:.1%})"
+                )
+    if verbose:
+        for error in errors:
+            click.echo(f"  解析できませんでした: {error}", err=True)
+    click.echo(f"[EvolveExtract] 解析完了! 結果を {output} に保存しました。")
 
 def main():
     """コマンドラインエントリーポイント"""
-    # cli()からコマンドを直接実行
-    try:
-        sys.argv[0] = "evolve-extract"
-        if len(sys.argv) == 1:
-            # 引数がない場合はヘルプ表示
-            cli.main(["--help"])
-        else:
-            # 引数があれば直接analyzeコマンドを実行
-            target_path = sys.argv[1]
-            output = "evolution_plan.yaml"
-            
-            # --outputオプションの処理
-            if "--output" in sys.argv or "-o" in sys.argv:
-                try:
-                    output_index = sys.argv.index("--output") if "--output" in sys.argv else sys.argv.index("-o")
-                    if output_index + 1 < len(sys.argv):
-                        output = sys.argv[output_index + 1]
-                except:
-                    pass
-                    
-            analyze_command(target_path, output, [], False)
-    except Exception as e:
-        click.echo(f"エラーが発生しました: {e}", err=True)
-        sys.exit(1)
+    # 引数がない場合はヘルプ、サブコマンドが省略された場合はanalyzeを実行
+    args = sys.argv[1:]
+    if args and args[0] not in cli.commands and args[0] not in ("--help", "-h"):
+        args = ["analyze"] + args
+    cli.main(args=args or ["--help"], prog_name="evolve-extract")
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
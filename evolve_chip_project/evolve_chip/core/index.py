@@ -0,0 +1,229 @@
+"""
+インクリメンタル解析インデックス
+
+ファイルごとの内容ハッシュ・更新時刻と、そこから得た関数メトリクスと
+進化タスクをSQLiteに保存し、再解析を変更されたファイルだけに絞ります。
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Sequence
+
+from .analyzer import FileAnalysis, analyze_paths, build_tasks, iter_python_files
+
+logger = logging.getLogger(__name__)
+
+# 解析ロジックを変更したら上げる。値が異なるインデックスは破棄して作り直す
+INDEX_VERSION = "2"
+
+
+def default_index_path() -> str:
+    """インデックスファイルの既定パスを取得"""
+    return os.path.join(os.path.expanduser("~"), ".evolve_chip", "extract_index.db")
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@dataclass
+class IndexResult:
+    """インデックス更新の結果"""
+
+    tasks: List[Dict[str, Any]] = field(default_factory=list)
+    files: int = 0
+    functions: int = 0
+    parsed: int = 0
+    reused: int = 0
+    removed: int = 0
+    errors: List[str] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+
+
+class ExtractionIndex:
+    """
+    ファイル単位の解析結果を保持するインデックス
+
+    更新時刻とサイズが一致するファイルは読み込みもせずに再利用し、
+    一致しない場合も内容ハッシュが同じなら解析をスキップします。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        インデックスの初期化
+
+        Args:
+            path: インデックスファイルのパス（未指定時は~/.evolve_chip/extract_index.db）
+        """
+        self.path = path or default_index_path()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != INDEX_VERSION:
+            self._conn.execute("DROP TABLE IF EXISTS files")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (INDEX_VERSION,)
+            )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                root TEXT NOT NULL,
+                path TEXT NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                hash TEXT NOT NULL,
+                function_count INTEGER NOT NULL,
+                error TEXT,
+                analysis TEXT NOT NULL,
+                tasks TEXT NOT NULL,
+                PRIMARY KEY (root, path)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        """データベース接続を閉じる"""
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def refresh(
+        self,
+        root: str,
+        exclude: Sequence[str] = (),
+        workers: Optional[int] = None
+    ) -> IndexResult:
+        """
+        ツリーを走査し、変更されたファイルだけを解析してインデックスを更新
+
+        Args:
+            root: 解析するディレクトリまたはファイル
+            exclude: 除外パターン
+            workers: ワーカープロセス数（Noneの場合はCPUコア数）
+
+        Returns:
+            全ファイル分のタスクと、解析・再利用したファイル数などの統計
+        """
+        started = time.perf_counter()
+        root_key = os.path.abspath(root)
+        base = root if os.path.isdir(root) else os.path.dirname(root) or "."
+
+        known = {
+            path: (mtime_ns, size, file_hash, function_count, error, tasks)
+            for path, mtime_ns, size, file_hash, function_count, error, tasks in self._conn.execute(
+                "SELECT path, mtime_ns, size, hash, function_count, error, tasks "
+                "FROM files WHERE root = ?",
+                (root_key,)
+            )
+        }
+
+        result = IndexResult()
+        changed: List[str] = []
+        pending_stats: Dict[str, tuple] = {}
+        touched: List[tuple] = []
+        seen = set()
+
+        for path in iter_python_files(root, exclude):
+            rel_path = os.path.relpath(path, base).replace(os.sep, "/")
+            seen.add(rel_path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = known.get(rel_path)
+            if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+                self._reuse(result, rel_path, entry)
+                continue
+
+            file_hash = _file_hash(path)
+            if entry and entry[2] == file_hash:
+                # 内容は同じ（touchやチェックアウトで更新時刻だけ変わった）
+                self._reuse(result, rel_path, entry)
+                touched.append((stat.st_mtime_ns, stat.st_size, root_key, rel_path))
+                continue
+
+            changed.append(path)
+            pending_stats[rel_path] = (stat.st_mtime_ns, stat.st_size, file_hash)
+
+        rows = []
+        for analysis in analyze_paths(changed, base, workers):
+            mtime_ns, size, file_hash = pending_stats[analysis.path]
+            tasks = build_tasks(analysis)
+            rows.append((
+                root_key, analysis.path, mtime_ns, size, file_hash,
+                len(analysis.functions), analysis.error,
+                json.dumps(analysis.to_dict(), ensure_ascii=False),
+                json.dumps(tasks, ensure_ascii=False),
+            ))
+            result.tasks.extend(tasks)
+            result.files += 1
+            result.functions += len(analysis.functions)
+            result.parsed += 1
+            if analysis.error:
+                result.errors.append(f"{analysis.path} ({analysis.error})")
+
+        removed = [(root_key, path) for path in known if path not in seen]
+        result.removed = len(removed)
+
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files "
+                "(root, path, mtime_ns, size, hash, function_count, error, analysis, tasks) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.executemany(
+                "UPDATE files SET mtime_ns = ?, size = ? WHERE root = ? AND path = ?", touched
+            )
+            self._conn.executemany("DELETE FROM files WHERE root = ? AND path = ?", removed)
+
+        result.elapsed_seconds = time.perf_counter() - started
+        logger.info(
+            f"インデックスを更新しました: {result.parsed}ファイルを解析、"
+            f"{result.reused}ファイルを再利用、{result.removed}ファイルを削除"
+        )
+        return result
+
+    @staticmethod
+    def _reuse(result: IndexResult, rel_path: str, entry: tuple) -> None:
+        _, _, _, function_count, error, tasks = entry
+        result.tasks.extend(json.loads(tasks))
+        result.files += 1
+        result.functions += function_count
+        result.reused += 1
+        if error:
+            result.errors.append(f"{rel_path} ({error})")
+
+    def load_analyses(self, root: str) -> List[FileAnalysis]:
+        """
+        インデックスに保存されている解析結果を取得
+
+        Args:
+            root: refresh()に渡したルート
+
+        Returns:
+            ファイルごとの解析結果（パス順）
+        """
+        rows = self._conn.execute(
+            "SELECT analysis FROM files WHERE root = ? ORDER BY path", (os.path.abspath(root),)
+        )
+        return [FileAnalysis.from_dict(json.loads(analysis)) for (analysis,) in rows]
@@ -0,0 +1,438 @@
+"""
+ホットネスプロファイラ
+
+開発モードのEvolveChipが関数ごとの呼び出し回数・累積時間・自己時間と
+レイテンシのヒストグラムを記録します。計測はサンプリングで行い、
+計測のオーバーヘッドが関数の実行時間の約1%に収まるよう間隔を調整します。
+記録はスレッドごとに持つためロックを取らず、終了時にファイルへ保存します。
+"""
+
+import os
+import json
+import time
+import random
+import atexit
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ヒストグラムの精度（2のべき乗ごとに2^SUB_BUCKET_BITS個に分割、相対誤差約12%）
+SUB_BUCKET_BITS = 3
+_SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+# 計測のオーバーヘッドを関数の実行時間のこの割合以下に抑える
+TARGET_OVERHEAD = 0.01
+MAX_SAMPLE_INTERVAL = 1024
+
+PROFILE_VERSION = 2
+
+
+def default_profile_path() -> str:
+    """プロファイルの既定の保存先（環境変数EVOLVE_CHIP_PROFILEで変更可能）"""
+    return os.environ.get("EVOLVE_CHIP_PROFILE") or os.path.join(
+        os.path.expanduser("~"), ".evolve_chip", "hotness.json"
+    )
+
+
+def _bucket_index(value: int) -> int:
+    if value < 2 * _SUB_BUCKETS:
+        return max(value, 0)
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return shift * _SUB_BUCKETS + (value >> shift)
+
+
+def _bucket_lower_bound(index: int) -> int:
+    if index < 2 * _SUB_BUCKETS:
+        return index
+    shift = index // _SUB_BUCKETS - 1
+    return (index % _SUB_BUCKETS + _SUB_BUCKETS) << shift
+
+
+class LatencyHistogram:
+    """
+    HDR形式のレイテンシヒストグラム（ナノ秒）
+
+    2のべき乗ごとの区間を等分したバケットに数えるため、1ナノ秒から
+    数時間までを数百個以下のバケットで相対誤差を一定に保って記録できます。
+    使われたバケットだけを辞書に持ちます。
+    """
+
+    __slots__ = ("counts",)
+
+    def __init__(self, counts: Optional[Dict[int, int]] = None):
+        self.counts: Dict[int, int] = counts or {}
+
+    def record(self, value_ns: int) -> None:
+        index = _bucket_index(value_ns)
+        self.counts[index] = self.counts.get(index, 0) + 1
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for index, count in dict(other.counts).items():
+            self.counts[index] = self.counts.get(index, 0) + count
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def percentile(self, q: float) -> int:
+        """
+        分位点の近似値（バケットの下限、ナノ秒）
+
+        Args:
+            q: 0.0〜1.0の分位
+
+        Returns:
+            記録がない場合は0
+        """
+        total = self.total
+        if total == 0:
+            return 0
+        rank = max(1, int(q * total + 0.5))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return _bucket_lower_bound(index)
+        return _bucket_lower_bound(max(self.counts))
+
+    def to_dict(self) -> Dict[str, int]:
+        return {str(index): count for index, count in sorted(self.counts.items())}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, int]) -> "LatencyHistogram":
+        return cls({int(index): count for index, count in data.items()})
+
+
+class FunctionStats:
+    """
+    1関数・1スレッド分の統計
+
+    callsはすべての呼び出し、entriesはそのうち再帰の内側でない呼び出し
+    （このスレッドで同じ関数が呼び出し中でない時の呼び出し）の数です。
+    自己時間とレイテンシは呼び出しを、累積時間は再帰の外側の呼び出しを
+    それぞれの間隔で計測し、計測した値の平均から推定します。
+    locationは関数の定義位置（ファイル, 行番号）です。
+    """
+
+    __slots__ = (
+        "calls", "entries", "sampled", "sampled_entries", "sampled_ns", "sampled_self_ns", "histogram",
+        "next_sample", "next_entry_sample", "interval", "entry_interval", "location", "active"
+    )
+
+    def __init__(self):
+        self.calls = 0
+        self.entries = 0
+        self.sampled = 0
+        self.sampled_entries = 0
+        self.sampled_ns = 0
+        self.sampled_self_ns = 0
+        self.histogram = LatencyHistogram()
+        self.next_sample = 1
+        self.next_entry_sample = 1
+        self.interval = 1
+        self.entry_interval = 1
+        self.location: Optional[Tuple[str, int]] = None
+        self.active = 0  # このスレッドで呼び出し中の数（再帰の深さ）
+
+    @staticmethod
+    def _interval(overhead_ns: int, mean_ns: float) -> int:
+        interval = overhead_ns / (TARGET_OVERHEAD * mean_ns) if mean_ns > 0 else MAX_SAMPLE_INTERVAL
+        return int(min(MAX_SAMPLE_INTERVAL, max(1, interval)))
+
+    def record(self, elapsed_ns: int, self_ns: int, overhead_ns: int) -> None:
+        """計測した呼び出しを記録し、次に計測する呼び出しを決める"""
+        self.sampled += 1
+        self.sampled_self_ns += self_ns
+        self.histogram.record(elapsed_ns)
+
+        # 1回あたりの時間は、再帰の内側の呼び出しを重ねて数えない累積時間から求める
+        mean = self.total_ns / self.calls if self.sampled_entries else elapsed_ns
+        self.interval = self._interval(overhead_ns, mean)
+        # 周期的な呼び出しパターンと同期しないよう間隔をずらす
+        self.next_sample = self.calls + random.randint(1, 2 * self.interval - 1)
+
+    def record_entry(self, elapsed_ns: int, overhead_ns: int) -> None:
+        """計測した再帰の外側の呼び出しを記録し、次に計測する呼び出しを決める"""
+        self.sampled_entries += 1
+        self.sampled_ns += elapsed_ns
+        self.entry_interval = self._interval(overhead_ns, self.sampled_ns / self.sampled_entries)
+        self.next_entry_sample = self.entries + random.randint(1, 2 * self.entry_interval - 1)
+
+    def merge(self, other: "FunctionStats") -> None:
+        self.calls += other.calls
+        self.entries += other.entries
+        self.sampled += other.sampled
+        self.sampled_entries += other.sampled_entries
+        self.sampled_ns += other.sampled_ns
+        self.sampled_self_ns += other.sampled_self_ns
+        self.histogram.merge(other.histogram)
+        self.location = other.location or self.location
+
+    @property
+    def total_ns(self) -> float:
+        """推定累積時間（ナノ秒、再帰の内側の呼び出しは重ねて数えない）"""
+        return self.sampled_ns * self.entries / self.sampled_entries if self.sampled_entries else 0.0
+
+    @property
+    def self_ns(self) -> float:
+        """推定自己時間（ナノ秒、チップ付きの子関数の時間を除く）"""
+        return self.sampled_self_ns * self.calls / self.sampled if self.sampled else 0.0
+
+    def to_dict(self) -> dict:
+        data = {
+            "calls": self.calls,
+            "entries": self.entries,
+            "sampled": self.sampled,
+            "sampled_entries": self.sampled_entries,
+            "sampled_ns": self.sampled_ns,
+            "sampled_self_ns": self.sampled_self_ns,
+            "histogram": self.histogram.to_dict(),
+        }
+        if self.location:
+            data["file"], data["line"] = self.location
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FunctionStats":
+        stats = cls()
+        stats.calls = data.get("calls", 0)
+        stats.entries = data.get("entries", 0)
+        stats.sampled = data.get("sampled", 0)
+        stats.sampled_entries = data.get("sampled_entries", 0)
+        stats.sampled_ns = data.get("sampled_ns", 0)
+        stats.sampled_self_ns = data.get("sampled_self_ns", 0)
+        stats.histogram = LatencyHistogram.from_dict(data.get("histogram", {}))
+        if data.get("file"):
+            stats.location = (data["file"], data.get("line", 0))
+        return stats
+
+
+def _measure_overhead() -> int:
+    """計測1回あたりのオーバーヘッド（時刻の取得2回と記録）をナノ秒で見積もる"""
+    clock = time.perf_counter_ns
+    stats = FunctionStats()
+    rounds = 2000
+    started = clock()
+    for _ in range(rounds):
+        begin = clock()
+        stats.record(clock() - begin, 0, 1)
+    return max(1, (clock() - started) // rounds)
+
+
+class HotnessProfiler:
+    """
+    チップ付き関数のホットネスを記録するプロファイラ
+
+    記録はスレッドごとの辞書に行い、snapshot()で全スレッド分を合算します。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        プロファイラの初期化
+
+        Args:
+            path: 保存先（未指定時は~/.evolve_chip/hotness.json）
+        """
+        self.path = path or default_profile_path()
+        self.overhead_ns = _measure_overhead()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._thread_stats: List[Dict[str, FunctionStats]] = []
+        self._locations: Dict[str, Tuple[str, int]] = {}
+        self._atexit_registered = False
+
+    def register(self, key: str, filename: str, lineno: int) -> None:
+        """関数の定義位置を登録（保存するプロファイルに含め、解析結果との対応付けに使う）"""
+        self._locations[key] = (filename, lineno)
+
+    def _stats_table(self) -> Dict[str, FunctionStats]:
+        table = getattr(self._local, "stats", None)
+        if table is None:
+            table = self._local.stats = {}
+            self._local.stack = []
+            with self._lock:
+                self._thread_stats.append(table)
+        return table
+
+    def call(self, key: str, func, args, kwargs):
+        """
+        関数を呼び出し、必要に応じて実行時間を計測
+
+        計測するかどうかは関数ごとの間隔で決めます。計測中の親関数の
+        自己時間を求めるため子関数の時間も測りますが、子関数の統計には
+        記録しません（子関数は自分の間隔で計測する）。
+        """
+        table = getattr(self._local, "stats", None)
+        if table is None:
+            table = self._stats_table()
+        stats = table.get(key)
+        if stats is None:
+            stats = table[key] = FunctionStats()
+        stats.calls += 1
+        sampled = stats.calls >= stats.next_sample
+        entry_sampled = False
+        if stats.active == 0:
+            stats.entries += 1
+            entry_sampled = stats.entries >= stats.next_entry_sample
+
+        stack = self._local.stack
+        parent_sampled = bool(stack) and stack[-1] is not None
+        stats.active += 1
+        if not (sampled or entry_sampled or parent_sampled):
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.active -= 1
+
+        # [子関数の時間の合計, 時間を測った子関数の数]、自己時間を計測しない場合はNone
+        frame = [0, 0] if sampled else None
+        stack.append(frame)
+        clock = time.perf_counter_ns
+        started = clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = clock() - started
+            stats.active -= 1
+            stack.pop()
+            if parent_sampled:
+                stack[-1][0] += elapsed
+                stack[-1][1] += 1
+            if sampled:
+                # 子関数の時間を測ったオーバーヘッドは自己時間に含めない
+                self_ns = max(0, elapsed - frame[0] - frame[1] * self.overhead_ns)
+                stats.record(elapsed, self_ns, self.overhead_ns)
+            if entry_sampled:
+                stats.record_entry(elapsed, self.overhead_ns)
+
+    def snapshot(self) -> Dict[str, FunctionStats]:
+        """全スレッド分を合算した統計"""
+        with self._lock:
+            tables = list(self._thread_stats)
+        merged: Dict[str, FunctionStats] = {}
+        for table in tables:
+            for key, stats in list(table.items()):
+                merged.setdefault(key, FunctionStats()).merge(stats)
+        for key, stats in merged.items():
+            stats.location = self._locations.get(key)
+        return merged
+
+    def report(self, limit: Optional[int] = None) -> List[dict]:
+        """
+        推定累積時間の降順に並べた関数ごとの集計
+
+        Args:
+            limit: 返す件数の上限
+
+        Returns:
+            name, calls, total_ms, self_ms, p50_us, p99_us を含む辞書のリスト
+        """
+        rows = []
+        for key, stats in self.snapshot().items():
+            rows.append({
+                "name": key,
+                "calls": stats.calls,
+                "sampled": stats.sampled,
+                "total_ms": stats.total_ns / 1e6,
+                "self_ms": stats.self_ns / 1e6,
+                "p50_us": stats.histogram.percentile(0.5) / 1e3,
+                "p99_us": stats.histogram.percentile(0.99) / 1e3,
+            })
+        rows.sort(key=lambda row: row["total_ms"], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def format_report(self, limit: Optional[int] = 20) -> str:
+        """集計を表形式で返す"""
+        lines = [f"{'function':<40} {'calls':>10} {'total ms':>10} {'self ms':>10} {'p50 us':>9} {'p99 us':>9}"]
+        for row in self.report(limit):
+            lines.append(
+                f"{row['name'][:40]:<40} {row['calls']:>10} {row['total_ms']:>10.2f} "
+                f"{row['self_ms']:>10.2f} {row['p50_us']:>9.1f} {row['p99_us']:>9.1f}"
+            )
+        return "\n".join(lines)
+
+    def save(self, path: Optional[str] = None) -> None:
+        """
+        統計をファイルに保存（既存の記録に加算）
+
+        Args:
+            path: 保存先（未指定時はself.path）
+        """
+        path = path or self.path
+        merged = load_profile(path)
+        for key, stats in self.snapshot().items():
+            merged.setdefault(key, FunctionStats()).merge(stats)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = {
+            "version": PROFILE_VERSION,
+            "functions": {key: stats.to_dict() for key, stats in sorted(merged.items())},
+        }
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def clear(self) -> None:
+        """このプロセスで記録した統計を破棄"""
+        with self._lock:
+            for table in self._thread_stats:
+                table.clear()
+
+    def register_atexit(self) -> None:
+        """終了時に統計を保存するよう登録（1度だけ）"""
+        with self._lock:
+            if self._atexit_registered:
+                return
+            self._atexit_registered = True
+        atexit.register(self._save_at_exit)
+
+    def _save_at_exit(self) -> None:
+        if not any(self._thread_stats):
+            return
+        try:
+            self.save()
+        except OSError as e:
+            logger.warning(f"プロファイルを保存できませんでした: {e}")
+
+
+def load_profile(path: Optional[str] = None) -> Dict[str, FunctionStats]:
+    """
+    保存されたプロファイルを読み込む
+
+    Args:
+        path: プロファイルのパス（未指定時は既定の保存先）
+
+    Returns:
+        関数名をキーとする統計。ファイルがない場合は空
+    """
+    path = path or default_profile_path()
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"プロファイルを読み込めませんでした: {e}")
+        return {}
+    if data.get("version") != PROFILE_VERSION:
+        return {}
+    return {key: FunctionStats.from_dict(value) for key, value in data.get("functions", {}).items()}
+
+
+_profiler: Optional[HotnessProfiler] = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler() -> HotnessProfiler:
+    """プロセス全体で共有するプロファイラ"""
+    global _profiler
+    if _profiler is None:
+        with _profiler_lock:
+            if _profiler is None:
+                _profiler = HotnessProfiler()
+    return _profiler
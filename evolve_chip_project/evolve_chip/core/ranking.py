@@ -0,0 +1,238 @@
+"""
+プロファイルによるタスクの順位付け
+
+cProfile/pstatsの出力、またはEvolveChipが記録したホットネスプロファイルを読み込み、
+進化タスクを「実測の時間の割合 × 改善の見込み」のスコアで並べ替えます。
+AIに渡せる件数には限りがあるため、実行時間を占める関数のタスクを先に処理します。
+"""
+
+import os
+import logging
+import pstats
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 目標ごとの改善の見込み（実行時間がどれだけ減りうるかの目安）
+GOAL_IMPROVABILITY = {
+    "PERFORMANCE": 0.5,
+    "MAINTAINABILITY": 0.15,
+    "READABILITY": 0.1,
+}
+
+# ループのパターンごとの見込みの上乗せ
+LOOP_PATTERN_IMPROVABILITY = {
+    "nested_loop": 0.3,
+    "string_concat_in_loop": 0.15,
+    "append_in_loop": 0.1,
+    "range_len": 0.05,
+}
+
+# pstatsの行番号（デコレータを含む定義の先頭行）と関数定義の行のずれの許容範囲
+_DECORATOR_LINES = 10
+
+
+@dataclass
+class FunctionTime:
+    """1関数の実測時間"""
+
+    file: str
+    name: str
+    class_name: str = ""
+    line: Optional[int] = None
+    calls: int = 0
+    total_seconds: float = 0.0
+    self_seconds: float = 0.0
+
+
+@dataclass
+class RuntimeProfile:
+    """
+    実測プロファイル
+
+    時間の割合は、プロファイル内の全関数の自己時間の合計に対する自己時間の割合です。
+    """
+
+    functions: List[FunctionTime] = field(default_factory=list)
+
+    def __post_init__(self):
+        self._by_name: Dict[str, List[FunctionTime]] = {}
+        for entry in self.functions:
+            self._by_name.setdefault(entry.name, []).append(entry)
+
+    @property
+    def total_seconds(self) -> float:
+        """全関数の自己時間の合計"""
+        return sum(entry.self_seconds for entry in self.functions)
+
+    @classmethod
+    def from_pstats(cls, path: str) -> "RuntimeProfile":
+        """cProfileの出力（pstats形式）から作成"""
+        stats = pstats.Stats(path).stats
+        functions = []
+        for (filename, line, name), (_, calls, self_time, total_time, _) in stats.items():
+            # 組み込み関数（~）やコンパイル済みコード（<string>など）は対象外
+            if filename == "~" or filename.startswith("<"):
+                continue
+            functions.append(FunctionTime(
+                file=filename, name=name, line=line, calls=calls,
+                total_seconds=total_time, self_seconds=self_time
+            ))
+        return cls(functions)
+
+    @classmethod
+    def from_chip(cls, path: Optional[str] = None) -> "RuntimeProfile":
+        """EvolveChipのホットネスプロファイルから作成"""
+        from .profiler import load_profile
+
+        functions = []
+        for key, stats in load_profile(path).items():
+            if stats.location is None:
+                continue
+            qualname = key.rsplit(".<locals>.", 1)[-1]
+            filename, line = stats.location
+            parts = qualname.split(".")
+            functions.append(FunctionTime(
+                file=filename, name=parts[-1], class_name=".".join(parts[:-1]), line=line,
+                calls=stats.calls, total_seconds=stats.total_ns / 1e9, self_seconds=stats.self_ns / 1e9
+            ))
+        return cls(functions)
+
+    @classmethod
+    def load(cls, path: str) -> "RuntimeProfile":
+        """
+        プロファイルを読み込む（形式はファイルの内容から判定）
+
+        Args:
+            path: pstatsファイル、またはホットネスプロファイル（JSON）のパス
+
+        Returns:
+            読み込んだプロファイル
+
+        Raises:
+            ValueError: どちらの形式としても読み込めない場合
+        """
+        with open(path, "rb") as f:
+            head = f.read(64).lstrip()
+        if head.startswith(b"{"):
+            return cls.from_chip(path)
+        try:
+            return cls.from_pstats(path)
+        except (EOFError, ValueError, TypeError) as e:
+            raise ValueError(f"プロファイルを読み込めません: {path} ({e})") from e
+
+    def match(self, target: Dict[str, Any], lineno: Optional[int] = None) -> Optional[FunctionTime]:
+        """
+        タスクの対象関数に対応する実測時間を探す
+
+        ファイルはパスの末尾で照合します（プロファイルは絶対パス、タスクは相対パス）。
+        同じファイルに同名の関数が複数ある場合は、クラス名か行番号で絞り込みます。
+
+        Args:
+            target: タスクのtarget（file, function, class）
+            lineno: 関数定義の行番号（分かる場合）
+
+        Returns:
+            対応する実測時間。見つからない場合はNone
+        """
+        rel_path = target.get("file", "")
+        rel_path = os.path.normpath(rel_path).replace(os.sep, "/") if rel_path else ""
+        candidates = [
+            entry for entry in self._by_name.get(target.get("function", ""), [])
+            if _same_file(entry.file, rel_path)
+        ]
+        class_name = target.get("class", "")
+        if class_name:
+            named = [entry for entry in candidates if entry.class_name.split(".")[-1:] == [class_name]]
+            candidates = named or [entry for entry in candidates if not entry.class_name]
+        if len(candidates) > 1 and lineno is not None:
+            near = [
+                entry for entry in candidates
+                if entry.line is not None and lineno - _DECORATOR_LINES <= entry.line <= lineno
+            ]
+            if near:
+                candidates = [max(near, key=lambda entry: entry.line)]
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+        # 区別できない場合は合算する
+        return FunctionTime(
+            file=candidates[0].file, name=candidates[0].name,
+            calls=sum(entry.calls for entry in candidates),
+            total_seconds=sum(entry.total_seconds for entry in candidates),
+            self_seconds=sum(entry.self_seconds for entry in candidates),
+        )
+
+
+def _same_file(profile_path: str, rel_path: str) -> bool:
+    profile_path = profile_path.replace(os.sep, "/")
+    return bool(rel_path) and (profile_path == rel_path or profile_path.endswith("/" + rel_path))
+
+
+def estimate_improvability(task: Dict[str, Any]) -> float:
+    """
+    タスクを実施した場合に実行時間がどれだけ減りうるかの目安（0.0〜1.0）
+
+    目標（PERFORMANCEが最も大きい）と、解析で見つかったループのパターンから見積もります。
+    ドキュメントや型ヒントのみのタスクは0です。
+
+    Args:
+        task: evolution_tasksの要素
+
+    Returns:
+        改善の見込み
+    """
+    goals = [str(goal).upper() for goal in task.get("goals", [])]
+    improvability = max((GOAL_IMPROVABILITY.get(goal, 0.0) for goal in goals), default=0.0)
+    if "PERFORMANCE" in goals:
+        patterns = task.get("metrics", {}).get("loop_patterns", [])
+        improvability += sum(LOOP_PATTERN_IMPROVABILITY.get(p, 0.0) for p in patterns)
+    return min(1.0, improvability)
+
+
+def rank_tasks(tasks: Iterable[Dict[str, Any]], profile: RuntimeProfile) -> List[Dict[str, Any]]:
+    """
+    タスクに実測時間とスコアを付け、スコアの降順に並べ替える
+
+    各タスクにprofile（calls, total_seconds, self_seconds, time_share, improvability）と
+    score（time_share × improvability）を追加します。プロファイルにない関数のスコアは0です。
+    スコアが同じタスクは優先度・ファイル順に並べます。
+
+    Args:
+        tasks: evolution_tasksの要素
+        profile: 実測プロファイル
+
+    Returns:
+        並べ替えたタスクのリスト
+    """
+    total = profile.total_seconds
+    ranked = []
+    matched = 0
+    for task in tasks:
+        task = dict(task)
+        entry = profile.match(task.get("target", {}), task.get("metrics", {}).get("lineno"))
+        improvability = estimate_improvability(task)
+        share = entry.self_seconds / total if entry and total > 0 else 0.0
+        if entry:
+            matched += 1
+            task["profile"] = {
+                "calls": entry.calls,
+                "total_seconds": round(entry.total_seconds, 6),
+                "self_seconds": round(entry.self_seconds, 6),
+                "time_share": round(share, 6),
+                "improvability": round(improvability, 3),
+            }
+        task["score"] = round(share * improvability, 6)
+        ranked.append(task)
+    logger.info(f"プロファイルと{matched}/{len(ranked)}個のタスクを対応付けました")
+    return sort_tasks(ranked)
+
+
+def sort_tasks(tasks: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """スコアの降順、次に優先度・ファイル順に並べる（スコアがなければ0として扱う）"""
+    return sorted(
+        tasks,
+        key=lambda t: (-t.get("score", 0.0), t.get("priority", 3), t.get("target", {}).get("file", ""))
+    )
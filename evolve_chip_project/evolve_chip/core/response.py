@@ -0,0 +1,206 @@
+"""
+AI応答の解析
+
+AIの応答テキストからコードブロックや構造化データを取り出します。
+"""
+
+import re
+import ast
+import json
+import logging
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_CODE_BLOCK_PATTERN = re.compile(r"```(?:python|py)?[ \t]*\n(.*?)```", re.DOTALL)
+_JSON_BLOCK_PATTERN = re.compile(r"```(?:json)?[ \t]*\n(.*?)```", re.DOTALL)
+_OPEN_FENCE_PATTERN = re.compile(r"```(?:python|py)?[ \t]*\n")
+_CLOSE_FENCE_PATTERN = re.compile(r"^[ \t]*```", re.MULTILINE)
+
+# 続きを受け取れば解消しうる構文エラー（途中までのコードでは判定しない）
+_INCOMPLETE_MARKERS = (
+    "was never closed",
+    "unexpected EOF",
+    "unterminated triple-quoted",
+    "expected an indented block",
+)
+
+
+def extract_code_block(text: str) -> str:
+    """
+    応答から最初のPythonコードブロックを取り出す
+
+    Args:
+        text: AIの応答テキスト
+
+    Returns:
+        コードブロックの中身。ブロックがない場合は応答全体
+    """
+    match = _CODE_BLOCK_PATTERN.search(text)
+    if match:
+        return match.group(1).strip()
+    return text.strip()
+
+
+def _load_json_object(text: str) -> Optional[dict]:
+    """テキストからJSONオブジェクトを読み取る（前後の説明文やフェンスを許容）"""
+    candidates = [text.strip()]
+    candidates.extend(match.group(1).strip() for match in _JSON_BLOCK_PATTERN.finditer(text))
+    start, end = text.find("{"), text.rfind("}")
+    if 0 <= start < end:
+        candidates.append(text[start:end + 1])
+
+    for candidate in candidates:
+        try:
+            data = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            return data
+    return None
+
+
+def parse_batch_response(text: str, names: List[str]) -> Dict[str, Dict[str, str]]:
+    """
+    バッチプロンプトへのJSON応答を関数ごとに分割
+
+    期待する形式：
+        {"functions": {"関数名": {"code": "...", "explanation": "..."}}}
+
+    Args:
+        text: AIの応答テキスト
+        names: バッチに含めた関数名のリスト
+
+    Returns:
+        関数名をキーとし、"code"と"explanation"を含む辞書。
+        応答に含まれていない関数は結果に含まれません
+
+    Raises:
+        ValueError: 応答からJSONオブジェクトを読み取れない場合
+    """
+    data = _load_json_object(text)
+    if data is None:
+        raise ValueError("バッチ応答からJSONを読み取れません")
+
+    functions = data.get("functions", data)
+    results = {}
+    for name in names:
+        entry = functions.get(name)
+        if isinstance(entry, str):
+            entry = {"code": entry}
+        if not isinstance(entry, dict) or not entry.get("code"):
+            logger.warning(f"バッチ応答に関数 '{name}' が含まれていません")
+            continue
+        results[name] = {
+            # モデルがコードをフェンスで囲んで返した場合にも対応
+            "code": extract_code_block(entry["code"]),
+            "explanation": entry.get("explanation", "")
+        }
+    return results
+
+
+class CodeBlockStreamParser:
+    """
+    ストリーミング応答から最初のPythonコードブロックを逐次検出する
+
+    feed()でチャンクを渡すと、閉じフェンスを検出した時点でcompleteになり、
+    受信済みの行が確実に構文エラーだと分かった時点でmalformedになります。
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.code: Optional[str] = None
+        self.error: Optional[str] = None
+        self._code_start: Optional[int] = None
+        self._checked_lines = 0
+
+    @property
+    def complete(self) -> bool:
+        """コードブロックが閉じたかどうか"""
+        return self.code is not None
+
+    @property
+    def malformed(self) -> bool:
+        """受信済みのコードに確定した構文エラーがあるかどうか"""
+        return self.error is not None
+
+    def feed(self, chunk: str) -> None:
+        """
+        チャンクを追加して状態を更新
+
+        Args:
+            chunk: 受信したテキスト
+        """
+        if self.complete or self.malformed:
+            return
+        self.text += chunk
+
+        if self._code_start is None:
+            match = _OPEN_FENCE_PATTERN.search(self.text)
+            if match is None:
+                return
+            self._code_start = match.end()
+
+        body = self.text[self._code_start:]
+        closing = _CLOSE_FENCE_PATTERN.search(body)
+        if closing:
+            self.code = body[:closing.start()].strip()
+            return
+
+        # 閉じる前でも、最後の改行までの行で構文を確認する
+        complete_lines = body[:body.rfind("\n") + 1]
+        line_count = complete_lines.count("\n")
+        if line_count > self._checked_lines:
+            self._checked_lines = line_count
+            self.error = _definite_syntax_error(complete_lines, line_count)
+
+
+def _definite_syntax_error(source: str, line_count: int) -> Optional[str]:
+    """途中までのソースに、続きでは解消しない構文エラーがあれば説明を返す"""
+    try:
+        ast.parse(source)
+    except SyntaxError as e:
+        message = str(e.msg)
+        if any(marker in message for marker in _INCOMPLETE_MARKERS):
+            return None
+        # 最終行付近のエラーは続きの行で解消する可能性がある
+        if e.lineno is None or e.lineno >= line_count:
+            return None
+        return f"{message} (line {e.lineno})"
+    return None
+
+
+def collect_code_from_stream(chunks: Iterable[str]) -> str:
+    """
+    ストリームを読み、最初のコードブロックが閉じた時点で打ち切る
+
+    コードブロックの後に続く説明文は受信しません。受信済みのコードに
+    確定した構文エラーが見つかった場合も、その時点で打ち切ります。
+
+    Args:
+        chunks: テキストのチャンクを返すイテレータ（GeminiClient.stream_contentなど）
+
+    Returns:
+        コードブロックの中身。閉じフェンスがないまま終了した場合は受信したテキストから抽出
+
+    Raises:
+        ValueError: コードに構文エラーが見つかった場合
+    """
+    parser = CodeBlockStreamParser()
+    iterator = iter(chunks)
+    try:
+        for chunk in iterator:
+            parser.feed(chunk)
+            if parser.complete or parser.malformed:
+                break
+    finally:
+        # 生成を打ち切り、接続を閉じる
+        close = getattr(iterator, "close", None)
+        if close:
+            close()
+
+    if parser.malformed:
+        raise ValueError(f"生成中のコードに構文エラーがあるため打ち切りました: {parser.error}")
+    if parser.complete:
+        return parser.code
+    return extract_code_block(parser.text)
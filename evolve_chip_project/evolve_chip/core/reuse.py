@@ -0,0 +1,203 @@
+"""
+進化結果の再利用
+
+過去に進化させた関数のソースを埋め込みベクトルの索引に記録し、
+ほぼ同じ関数にはAIを呼ばずに以前の結果を使い回します。
+似ているが同じではない関数には、以前の結果を参考例としてプロンプトに添えます。
+"""
+
+import io
+import os
+import re
+import hashlib
+import logging
+import textwrap
+import tokenize
+from dataclasses import dataclass
+from typing import Any, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from evolve_chip.ai.embeddings import Embedder
+from .vector_index import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+# これ以上の類似度なら以前の結果を再利用し、ADAPT_THRESHOLD以上なら参考例として添える
+REUSE_THRESHOLD = 0.97
+ADAPT_THRESHOLD = 0.85
+
+_DEF_PATTERN = re.compile(r"^\s*(?:async\s+)?def\s+(\w+)", re.MULTILINE)
+
+
+def default_memory_path() -> str:
+    """進化結果の索引の既定の保存先"""
+    return os.path.join(os.path.expanduser("~"), ".evolve_chip", "evolution_index.npz")
+
+
+def _goal_names(goals: Iterable[Any]) -> List[str]:
+    return sorted(str(getattr(goal, "value", goal)).lower() for goal in goals)
+
+
+def rename_function(code: str, old_name: str, new_name: str) -> str:
+    """
+    コード中の名前old_nameをnew_nameに置き換える（文字列・コメント内は変更しない）
+
+    Args:
+        code: 対象のコード
+        old_name: 元の関数名
+        new_name: 新しい関数名
+
+    Returns:
+        置き換えたコード。トークン化できない場合は元のコード
+    """
+    if old_name == new_name:
+        return code
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(code).readline))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return code
+    lines = code.splitlines(keepends=True)
+    # 後ろから置き換えて、同じ行の前方の位置がずれないようにする
+    for token in reversed(tokens):
+        if token.type == tokenize.NAME and token.string == old_name:
+            row, col = token.start
+            line = lines[row - 1]
+            lines[row - 1] = line[:col] + new_name + line[col + len(old_name):]
+    return "".join(lines)
+
+
+def canonical_source(source: str) -> str:
+    """
+    比較用に正規化したソース（インデントを除き、関数自身の名前を共通の名前に置き換える）
+
+    名前だけが違う関数を同じものとして扱うために使います。
+    """
+    source = textwrap.dedent(source)
+    match = _DEF_PATTERN.search(source)
+    return rename_function(source, match.group(1), "_function") if match else source
+
+
+@dataclass
+class ReuseMatch:
+    """以前に進化させた類似関数"""
+
+    name: str
+    score: float
+    source: str
+    evolved_code: str
+
+    def adapt(self, name: str) -> str:
+        """以前の結果を関数名nameに合わせて返す"""
+        return rename_function(self.evolved_code, self.name, name)
+
+    def format_example(self) -> str:
+        """プロンプトに添える参考例"""
+        return (
+            f"# 参考：類似した関数（類似度 {self.score:.2f}）の改善前\n{self.source.rstrip()}\n\n"
+            f"# 参考：上の関数の改善後\n{self.evolved_code.rstrip()}\n"
+        )
+
+
+class EvolutionMemory:
+    """
+    進化結果の記録と類似関数の検索
+
+    ベクトルは関数のソースから作り、目標が同じ記録だけを照合します。
+    埋め込みのモデルが変わった場合は以前の記録を使いません。
+    """
+
+    def __init__(self, embedder: Optional[Embedder] = None, path: Optional[str] = None):
+        """
+        初期化
+
+        Args:
+            embedder: 埋め込みの生成器（未指定時はローカルのハッシュ埋め込み）
+            path: 索引の保存先（未指定時は~/.evolve_chip/evolution_index.npz）
+        """
+        self.embedder = embedder or Embedder()
+        self.path = path or default_memory_path()
+        self.index: Optional[VectorIndex] = None
+        if os.path.exists(self.path):
+            try:
+                self.index = VectorIndex.load(self.path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"進化結果の索引を読み込めませんでした: {e}")
+
+    def embed(self, sources: Sequence[str]) -> np.ndarray:
+        """関数のソースをまとめて埋め込む（関数名の違いは無視する）"""
+        return self.embedder.embed([canonical_source(source) for source in sources])
+
+    def _usable_index(self, dim: int) -> Optional[VectorIndex]:
+        index = self.index
+        if index is None or index.model != self.embedder.model or index.dim != dim:
+            return None
+        return index
+
+    def lookup(
+        self,
+        vector: np.ndarray,
+        goals: Iterable[Any],
+        min_score: float = ADAPT_THRESHOLD
+    ) -> Optional[ReuseMatch]:
+        """
+        目標が同じで最も類似した記録を探す
+
+        Args:
+            vector: 関数のソースの埋め込み
+            goals: 関数の進化目標
+            min_score: これ未満の類似度は対象外
+
+        Returns:
+            見つかった記録。なければNone
+        """
+        index = self._usable_index(len(vector))
+        if index is None:
+            return None
+        goal_names = _goal_names(goals)
+        for hit in index.search(vector, k=10, min_score=min_score):
+            if hit.metadata.get("goals") == goal_names:
+                return ReuseMatch(
+                    name=hit.metadata["name"],
+                    score=hit.score,
+                    source=hit.metadata["source"],
+                    evolved_code=hit.metadata["evolved_code"]
+                )
+        return None
+
+    def remember(
+        self,
+        name: str,
+        source: str,
+        evolved_code: str,
+        goals: Iterable[Any],
+        vector: Optional[np.ndarray] = None
+    ) -> None:
+        """
+        進化結果を記録
+
+        Args:
+            name: 関数名
+            source: 元のソース
+            evolved_code: 採用した進化後のコード
+            goals: 進化目標
+            vector: ソースの埋め込み（計算済みの場合）
+        """
+        if vector is None:
+            vector = self.embed([source])[0]
+        if self._usable_index(len(vector)) is None:
+            if self.index is not None and len(self.index):
+                logger.info(f"埋め込みのモデルが変わったため進化結果の索引を作り直します: {self.embedder.model}")
+            self.index = VectorIndex(len(vector), self.embedder.model)
+        record_id = hashlib.sha256(canonical_source(source).encode("utf-8")).hexdigest()
+        self.index.add(record_id, vector, {
+            "name": name,
+            "source": source,
+            "evolved_code": evolved_code,
+            "goals": _goal_names(goals),
+        })
+
+    def save(self) -> None:
+        """索引を保存（記録がなければ何もしない）"""
+        if self.index is not None and len(self.index):
+            self.index.save(self.path)
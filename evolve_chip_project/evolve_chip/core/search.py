@@ -0,0 +1,285 @@
+"""
+集団による進化的探索
+
+1つの関数について複数の候補を生成し、正しさと実測の速度・メモリから
+適応度を求めて上位の候補を親に選び、変異・交叉のプロンプトで次の世代を作ります。
+"""
+
+import math
+import random
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .canonical import FitnessCache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SearchConfig:
+    """進化的探索の設定"""
+
+    population_size: int = 4        # 1世代で生成する候補の数
+    generations: int = 3            # 世代数の上限
+    parents: int = 2                # 次の世代の親として残す候補の数
+    patience: int = 1               # 最良の適応度が改善しない世代がこれだけ続いたら打ち切る
+    min_improvement: float = 0.01   # 改善とみなす適応度の増分（対数速度比なので0.01は約1%）
+    crossover_rate: float = 0.5     # 親が2つ以上あるときに交叉で子を作る割合
+    memory_weight: float = 0.01     # メモリ割り当てのピーク増加1MiBあたりの適応度の減点
+    seed: Optional[int] = None      # 交叉・変異の選び方の乱数シード
+
+    def __post_init__(self):
+        if self.population_size < 1 or self.generations < 1 or self.parents < 1:
+            raise ValueError(
+                f"探索の設定が不正です: population_size={self.population_size}, "
+                f"generations={self.generations}, parents={self.parents}"
+            )
+
+
+@dataclass
+class Evaluation:
+    """候補の評価結果"""
+
+    passed: bool                              # エラーなくすべての制約を満たしたかどうか
+    speedup: Optional[float] = None           # 元の関数に対する速度比（計測した場合）
+    memory_delta_bytes: Optional[int] = None  # メモリ割り当てのピークの増分
+    error: Optional[str] = None
+    detail: Any = None                        # 呼び出し元が使う評価の詳細
+
+
+@dataclass
+class Candidate:
+    """探索中の候補"""
+
+    id: int
+    code: str
+    generation: int
+    operator: str                                 # "initial"、"mutation"、"crossover"
+    parents: Tuple[int, ...] = ()
+    evaluation: Optional[Evaluation] = None
+    fitness: float = -math.inf
+
+    @property
+    def feasible(self) -> bool:
+        return self.evaluation is not None and self.evaluation.passed
+
+
+@dataclass
+class SearchResult:
+    """探索の結果"""
+
+    best: Optional[Candidate]
+    candidates: List[Candidate] = field(default_factory=list)
+    generations: int = 0
+    stopped_early: bool = False
+
+    def format_report(self) -> str:
+        """世代ごとの最良の適応度を整形して返す"""
+        lines = [f"{self.generations} generations, {len(self.candidates)} candidates"]
+        for generation in range(self.generations):
+            members = [c for c in self.candidates if c.generation == generation]
+            feasible = [c for c in members if c.feasible]
+            best = max((c.fitness for c in feasible), default=None)
+            lines.append(
+                f"- generation {generation}: {len(feasible)}/{len(members)} passed"
+                + (f", best speedup {math.exp(best):.2f}x" if best is not None else "")
+            )
+        return "\n".join(lines)
+
+
+def fitness(evaluation: Evaluation, memory_weight: float = 0.01) -> float:
+    """
+    候補の適応度
+
+    制約を満たさない候補は-inf、満たす候補は対数速度比（速度を計測していない場合は0）から
+    メモリ増加分の減点を引いた値です。
+
+    Args:
+        evaluation: 評価結果
+        memory_weight: メモリ割り当てのピーク増加1MiBあたりの減点
+
+    Returns:
+        適応度（大きいほど良い）
+    """
+    if not evaluation.passed:
+        return -math.inf
+    speedup = evaluation.speedup if evaluation.speedup and evaluation.speedup > 0 else 1.0
+    score = math.log(speedup)
+    if evaluation.memory_delta_bytes:
+        score -= memory_weight * evaluation.memory_delta_bytes / (1 << 20)
+    return score
+
+
+def _describe_parent(candidate: Candidate) -> str:
+    speedup = candidate.evaluation.speedup if candidate.evaluation else None
+    measured = f"速度比 {speedup:.2f}x" if speedup else "速度は未計測"
+    return f"（候補{candidate.id}、{measured}）\n```python\n{candidate.code.rstrip()}\n```"
+
+
+def initial_prompt(base_prompt: str, index: int, population_size: int) -> str:
+    """最初の世代のプロンプト（1つ目は元のプロンプトのまま、以降は異なる方針を求める）"""
+    if index == 0:
+        return base_prompt
+    return (
+        f"{base_prompt}\n\n"
+        f"（案{index + 1}/{population_size}）他の案とは異なる実装方針（アルゴリズム、データ構造、"
+        f"標準ライブラリの活用など）で書いてください。"
+    )
+
+
+def mutation_prompt(base_prompt: str, parent: Candidate, index: int) -> str:
+    """親の候補をさらに改善させるプロンプト"""
+    return (
+        f"{base_prompt}\n\n"
+        f"以下は制約を満たした前の世代の候補です{_describe_parent(parent)}\n\n"
+        f"この候補を出発点に、振る舞いと出力を変えずにさらに高速化してください（変異{index + 1}）。"
+    )
+
+
+def crossover_prompt(base_prompt: str, first: Candidate, second: Candidate, index: int) -> str:
+    """2つの親の長所を組み合わせるプロンプト"""
+    return (
+        f"{base_prompt}\n\n"
+        f"以下は制約を満たした前の世代の2つの候補です。\n"
+        f"候補A{_describe_parent(first)}\n\n"
+        f"候補B{_describe_parent(second)}\n\n"
+        f"両方の長所を組み合わせ、振る舞いと出力を変えずにより高速な実装を書いてください（交叉{index + 1}）。"
+    )
+
+
+class EvolutionarySearch:
+    """
+    候補の集団を世代ごとに改善する探索
+
+    生成と評価はそれぞれスレッドプールで並行に行います。同じコードの候補は
+    （空白・コメント・ローカル変数名だけが異なるものを含む）一度だけ評価し、
+    親はそれまでのすべての世代から適応度の高い順に選びます（エリート保存）。
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[str], str],
+        evaluate: Callable[[str], Evaluation],
+        config: Optional[SearchConfig] = None,
+        generation_workers: int = 4,
+        evaluation_workers: int = 1,
+        cache: Optional[FitnessCache] = None
+    ):
+        """
+        初期化
+
+        Args:
+            generate: プロンプトから候補のコードを生成する関数
+            evaluate: 候補のコードを評価する関数
+            config: 探索の設定
+            generation_workers: 生成を並行して行うスレッド数
+            evaluation_workers: 評価を並行して行うスレッド数
+                                （プロセス内で標準出力をキャプチャする評価では1）
+            cache: 評価結果のキャッシュ（未指定時はこの探索の中だけで使う）
+        """
+        self.generate = generate
+        self.evaluate = evaluate
+        self.config = config or SearchConfig()
+        self.generation_workers = max(1, generation_workers)
+        self.evaluation_workers = max(1, evaluation_workers)
+        self.cache = cache or FitnessCache()
+        self._random = random.Random(self.config.seed)
+
+    def _prompts(self, base_prompt: str, parents: List[Candidate]) -> List[Tuple[str, str, Tuple[int, ...]]]:
+        """次の世代の(演算, プロンプト, 親のID)を作る"""
+        size = self.config.population_size
+        if not parents:
+            return [("initial", initial_prompt(base_prompt, i, size), ()) for i in range(size)]
+        prompts = []
+        for i in range(size):
+            if len(parents) >= 2 and self._random.random() < self.config.crossover_rate:
+                first, second = self._random.sample(parents, 2)
+                prompts.append((
+                    "crossover", crossover_prompt(base_prompt, first, second, i), (first.id, second.id)
+                ))
+            else:
+                parent = parents[i % len(parents)]
+                prompts.append(("mutation", mutation_prompt(base_prompt, parent, i), (parent.id,)))
+        return prompts
+
+    def _produce(self, prompt: str) -> Optional[str]:
+        try:
+            code = self.generate(prompt)
+        except Exception as e:
+            logger.warning(f"候補の生成に失敗しました: {e}")
+            return None
+        return code if code and code.strip() else None
+
+    def _evaluate(self, code: str) -> Evaluation:
+        try:
+            return self.evaluate(code)
+        except Exception as e:
+            return Evaluation(passed=False, error=f"{type(e).__name__}: {e}")
+
+    def run(self, base_prompt: str) -> SearchResult:
+        """
+        探索を実行
+
+        Args:
+            base_prompt: 関数を改善させる元のプロンプト
+
+        Returns:
+            最良の候補（制約を満たす候補がなければNone）と、評価したすべての候補
+        """
+        result = SearchResult(best=None)
+        best_fitness = -math.inf
+        stale = 0
+
+        with ThreadPoolExecutor(self.generation_workers, thread_name_prefix="search-generate") as generators, \
+                ThreadPoolExecutor(self.evaluation_workers, thread_name_prefix="search-evaluate") as evaluators:
+            for generation in range(self.config.generations):
+                feasible = sorted(
+                    (c for c in result.candidates if c.feasible), key=lambda c: c.fitness, reverse=True
+                )
+                prompts = self._prompts(base_prompt, feasible[:self.config.parents])
+                codes = list(generators.map(self._produce, [prompt for _, prompt, _ in prompts]))
+
+                members = []
+                for (operator, _, parents), code in zip(prompts, codes):
+                    if code is None:
+                        continue
+                    members.append(Candidate(
+                        id=len(result.candidates) + len(members), code=code,
+                        generation=generation, operator=operator, parents=parents
+                    ))
+                # 正規化して同じコードは一度だけ評価する（以前の世代で評価したものも含む）
+                keys = [self.cache.key(c.code) for c in members]
+                pending: Dict[str, str] = {}
+                for key, candidate in zip(keys, members):
+                    if key not in pending and self.cache.get(key) is None:
+                        pending[key] = candidate.code
+                for key, evaluation in zip(pending, evaluators.map(self._evaluate, pending.values())):
+                    self.cache.put(key, evaluation)
+                for key, candidate in zip(keys, members):
+                    candidate.evaluation = self.cache.get(key)
+                    candidate.fitness = fitness(candidate.evaluation, self.config.memory_weight)
+                result.candidates.extend(members)
+                result.generations = generation + 1
+
+                generation_best = max((c.fitness for c in members), default=-math.inf)
+                logger.info(
+                    f"Generation {generation}: {sum(c.feasible for c in members)}/{len(members)} passed, "
+                    f"best fitness {generation_best:.3f}"
+                )
+                # 制約を満たす候補がまだない間は打ち切らない
+                improved = generation_best > best_fitness + self.config.min_improvement
+                stale = 0 if improved else stale + 1
+                best_fitness = max(best_fitness, generation_best)
+                last = generation + 1 == self.config.generations
+                if not last and stale >= self.config.patience and best_fitness > -math.inf:
+                    result.stopped_early = True
+                    logger.info(f"適応度が{stale}世代改善しなかったため探索を打ち切ります")
+                    break
+
+        feasible = [c for c in result.candidates if c.feasible]
+        if feasible:
+            # 適応度が同じなら先に見つかった（世代の早い）候補を選ぶ
+            result.best = max(feasible, key=lambda c: (c.fitness, -c.id))
+        return result
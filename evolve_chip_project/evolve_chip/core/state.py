@@ -0,0 +1,368 @@
+"""
+タスクの進行状況の記録
+
+進化の実行（run）ごとに、タスクの状態・試行回数・生成した候補と計測結果を
+発生した時点でSQLite（WALモード）に書き込みます。中断した実行を再開すると、
+完了したタスクは記録した結果を使い、実行中だったタスクはやり直します。
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 記録の形式を変更したら上げる。値が異なるデータベースは破棄して作り直す
+STATE_VERSION = "1"
+
+# タスクの状態
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED = (DONE, FAILED)
+
+# 実行中に中断されたタスクをやり直す回数の上限（超えたタスクは失敗として扱う）
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def default_state_path() -> str:
+    """状態ファイルの既定パスを取得"""
+    path = os.environ.get("EVOLVE_CHIP_STATE")
+    if path:
+        return path
+    return os.path.join(os.path.expanduser("~"), ".evolve_chip", "task_state.db")
+
+
+@dataclass
+class TaskState:
+    """タスク1件の記録"""
+
+    task_id: str
+    status: str = PENDING
+    attempts: int = 0
+    error: Optional[str] = None
+    result: Dict[str, Any] = field(default_factory=dict)
+    updated_at: float = 0.0
+
+
+@dataclass
+class RunSummary:
+    """実行1件の状態ごとのタスク数"""
+
+    run_id: str
+    created_at: float
+    updated_at: float
+    counts: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    @property
+    def finished(self) -> int:
+        return sum(self.counts.get(status, 0) for status in FINISHED)
+
+
+class TaskStateStore:
+    """
+    タスクの状態を保持するストア
+
+    状態の変化はそれぞれ1トランザクションで書き込むため、プロセスが
+    途中で終了しても直前までの記録が残ります。パイプラインの各ステージから
+    呼び出せるよう、操作はスレッドセーフです。
+    """
+
+    def __init__(self, path: Optional[str] = None, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        """
+        ストアの初期化
+
+        Args:
+            path: 状態ファイルのパス（未指定時は~/.evolve_chip/task_state.db）
+            max_attempts: 中断されたタスクをやり直す回数の上限
+        """
+        self.path = path or default_state_path()
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != STATE_VERSION:
+            for table in ("runs", "tasks", "candidates"):
+                self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (STATE_VERSION,)
+            )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                run_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                result TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (run_id, task_id)
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS candidates (
+                run_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                attempt INTEGER NOT NULL,
+                code TEXT NOT NULL,
+                measurements TEXT NOT NULL,
+                accepted INTEGER,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_candidates_task ON candidates (run_id, task_id)"
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        """データベース接続を閉じる"""
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def begin_run(self, run_id: str, task_ids: Iterable[str]) -> Dict[str, TaskState]:
+        """
+        実行を開始または再開
+
+        未登録のタスクを待機中として追加し、前回の実行中に中断されたタスクを
+        待機中に戻します（試行回数が上限に達したものは失敗にします）。
+
+        Args:
+            run_id: 実行のID（同じIDで呼ぶと再開）
+            task_ids: 実行するタスクのID（順序を保持）
+
+        Returns:
+            タスクIDごとの現在の記録
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO runs (run_id, created_at, updated_at) VALUES (?, ?, ?)",
+                (run_id, now, now)
+            )
+            self._conn.execute("UPDATE runs SET updated_at = ? WHERE run_id = ?", (now, run_id))
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO tasks (run_id, task_id, position, status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(run_id, task_id, position, PENDING, now) for position, task_id in enumerate(task_ids)]
+            )
+            interrupted = self._conn.execute(
+                "SELECT task_id, attempts FROM tasks WHERE run_id = ? AND status = ?", (run_id, RUNNING)
+            ).fetchall()
+            for task_id, attempts in interrupted:
+                if attempts >= self.max_attempts:
+                    logger.warning(f"{task_id}は{attempts}回中断されたため失敗として扱います")
+                    self._conn.execute(
+                        "UPDATE tasks SET status = ?, error = ?, updated_at = ? WHERE run_id = ? AND task_id = ?",
+                        (FAILED, f"{attempts}回の試行がすべて中断されました", now, run_id, task_id)
+                    )
+                else:
+                    self._conn.execute(
+                        "UPDATE tasks SET status = ?, updated_at = ? WHERE run_id = ? AND task_id = ?",
+                        (PENDING, now, run_id, task_id)
+                    )
+        if interrupted:
+            logger.info(f"中断されていた{len(interrupted)}件のタスクをやり直します: {run_id}")
+        return self.tasks(run_id)
+
+    def start(self, run_id: str, task_id: str) -> int:
+        """
+        タスクを実行中にする
+
+        Returns:
+            今回の試行番号（1から）
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, attempts = attempts + 1, error = NULL, updated_at = ? "
+                "WHERE run_id = ? AND task_id = ?",
+                (RUNNING, time.time(), run_id, task_id)
+            )
+            row = self._conn.execute(
+                "SELECT attempts FROM tasks WHERE run_id = ? AND task_id = ?", (run_id, task_id)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def record_candidate(
+        self,
+        run_id: str,
+        task_id: str,
+        code: str,
+        measurements: Dict[str, Any],
+        accepted: Optional[bool] = None
+    ) -> None:
+        """
+        生成した候補と計測結果を記録
+
+        Args:
+            run_id: 実行のID
+            task_id: タスクのID
+            code: 候補のコード
+            measurements: 制約チェック・ベンチマークの結果（JSONに変換できる値）
+            accepted: 候補を採用したかどうか（未判定の場合はNone）
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT attempts FROM tasks WHERE run_id = ? AND task_id = ?", (run_id, task_id)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT INTO candidates (run_id, task_id, attempt, code, measurements, accepted, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    run_id, task_id, row[0] if row else 0, code,
+                    json.dumps(measurements, ensure_ascii=False, default=str),
+                    None if accepted is None else int(accepted),
+                    time.time()
+                )
+            )
+
+    def finish(
+        self,
+        run_id: str,
+        task_id: str,
+        result: Dict[str, Any],
+        error: Optional[str] = None
+    ) -> None:
+        """
+        タスクを完了にする
+
+        Args:
+            run_id: 実行のID
+            task_id: タスクのID
+            result: 再開時に復元する結果（JSONに変換できる値）
+            error: 失敗した場合のエラー（指定すると状態は失敗になる）
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, error = ?, result = ?, updated_at = ? "
+                "WHERE run_id = ? AND task_id = ?",
+                (
+                    FAILED if error else DONE, error,
+                    json.dumps(result, ensure_ascii=False, default=str),
+                    time.time(), run_id, task_id
+                )
+            )
+
+    def tasks(self, run_id: str) -> Dict[str, TaskState]:
+        """
+        実行のタスクの記録を取得
+
+        Returns:
+            タスクIDごとの記録（登録順）
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT task_id, status, attempts, error, result, updated_at FROM tasks "
+                "WHERE run_id = ? ORDER BY position",
+                (run_id,)
+            ).fetchall()
+        return {
+            task_id: TaskState(
+                task_id=task_id,
+                status=status,
+                attempts=attempts,
+                error=error,
+                result=json.loads(result) if result else {},
+                updated_at=updated_at
+            )
+            for task_id, status, attempts, error, result, updated_at in rows
+        }
+
+    def candidates(self, run_id: str, task_id: str) -> List[Dict[str, Any]]:
+        """
+        タスクの候補の記録を取得
+
+        Returns:
+            候補ごとの試行番号・コード・計測結果・採用の有無（記録順）
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT attempt, code, measurements, accepted FROM candidates "
+                "WHERE run_id = ? AND task_id = ? ORDER BY rowid",
+                (run_id, task_id)
+            ).fetchall()
+        return [
+            {
+                "attempt": attempt,
+                "code": code,
+                "measurements": json.loads(measurements),
+                "accepted": None if accepted is None else bool(accepted),
+            }
+            for attempt, code, measurements, accepted in rows
+        ]
+
+    def runs(self) -> List[RunSummary]:
+        """
+        記録されている実行の一覧を取得
+
+        Returns:
+            実行ごとの状態別のタスク数（更新が新しい順）
+        """
+        with self._lock:
+            runs = self._conn.execute(
+                "SELECT run_id, created_at, updated_at FROM runs ORDER BY updated_at DESC"
+            ).fetchall()
+            counts = self._conn.execute(
+                "SELECT run_id, status, COUNT(*) FROM tasks GROUP BY run_id, status"
+            ).fetchall()
+        summaries = {
+            run_id: RunSummary(run_id=run_id, created_at=created_at, updated_at=updated_at)
+            for run_id, created_at, updated_at in runs
+        }
+        for run_id, status, count in counts:
+            if run_id in summaries:
+                summaries[run_id].counts[status] = count
+        return list(summaries.values())
+
+    def reset(self, run_id: Optional[str] = None) -> int:
+        """
+        実行の記録を削除
+
+        Args:
+            run_id: 削除する実行（Noneの場合はすべて）
+
+        Returns:
+            削除した実行の数
+        """
+        where, params = ("WHERE run_id = ?", (run_id,)) if run_id is not None else ("", ())
+        with self._lock, self._conn:
+            removed = self._conn.execute(f"DELETE FROM runs {where}", params).rowcount
+            self._conn.execute(f"DELETE FROM tasks {where}", params)
+            self._conn.execute(f"DELETE FROM candidates {where}", params)
+        return removed
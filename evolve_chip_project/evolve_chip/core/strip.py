@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+"""
+EvolveStrip - 本番用成果物からチップのコードを取り除くビルドツール
+
+ソースツリーまたはwheelを書き換え、@evolve(...)デコレータと
+evolve_chipのインポートを削除します。削除はASTで位置を特定して
+該当する範囲だけを切り取るため、コメントや書式はそのまま残ります。
+"""
+
+import io
+import os
+import ast
+import sys
+import csv
+import base64
+import shutil
+import hashlib
+import zipfile
+import click
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+PACKAGE_NAME = "evolve_chip"
+
+# ツリーの書き換えで走査しないディレクトリ
+_SKIP_DIRS = {"__pycache__", ".git", ".hg", ".svn", ".tox", ".venv", "venv"}
+
+
+class StripError(Exception):
+    """チップのコードを安全に取り除けない場合の例外"""
+
+
+@dataclass
+class StripResult:
+    """1ファイル分の書き換え結果"""
+
+    source: str
+    decorators: int = 0
+    imports: int = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.decorators or self.imports)
+
+
+@dataclass
+class StripReport:
+    """ツリーまたはwheel全体の書き換え結果"""
+
+    files: int = 0
+    changed: int = 0
+    decorators: int = 0
+    imports: int = 0
+    skipped: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def add(self, result: StripResult) -> None:
+        self.files += 1
+        if result.changed:
+            self.changed += 1
+        self.decorators += result.decorators
+        self.imports += result.imports
+
+
+def _is_chip_module(module: Optional[str]) -> bool:
+    return module is not None and (module == PACKAGE_NAME or module.startswith(PACKAGE_NAME + "."))
+
+
+def _root_name(node: ast.AST) -> Optional[str]:
+    """evolve(...)、chip.evolve、evolve_chip.core.chip.evolve(...)などの先頭の名前"""
+    while True:
+        if isinstance(node, ast.Call):
+            node = node.func
+        elif isinstance(node, ast.Attribute):
+            node = node.value
+        elif isinstance(node, ast.Name):
+            return node.id
+        else:
+            return None
+
+
+def _statement_lists(tree: ast.AST):
+    """文のリストを持つすべてのブロック（関数本体、if/try節など）"""
+    for node in ast.walk(tree):
+        for name in ("body", "orelse", "finalbody"):
+            body = getattr(node, name, None)
+            if isinstance(body, list) and body and isinstance(body[0], ast.stmt):
+                yield body
+        for case in getattr(node, "cases", ()) or ():
+            yield case.body
+
+
+class _Source:
+    """ASTの位置（行番号とUTF-8のバイト列でのカラム）で編集できるソース"""
+
+    def __init__(self, source: str):
+        self.data = source.encode("utf-8")
+        self.line_starts = [0]
+        for index, byte in enumerate(self.data):
+            if byte == 0x0A:
+                self.line_starts.append(index + 1)
+        self.edits: List[Tuple[int, int, bytes]] = []
+
+    def offset(self, lineno: int, col: int) -> int:
+        return self.line_starts[lineno - 1] + col
+
+    def line_end(self, lineno: int) -> int:
+        """行末（改行を含む）のオフセット"""
+        if lineno < len(self.line_starts):
+            return self.line_starts[lineno]
+        return len(self.data)
+
+    def owns_lines(self, node: ast.AST) -> bool:
+        """ノードが行全体を占めているか（前は空白のみ、後ろは空白かコメントのみ）"""
+        start = self.offset(node.lineno, 0)
+        before = self.data[start:self.offset(node.lineno, node.col_offset)]
+        after = self.data[self.offset(node.end_lineno, node.end_col_offset):self.line_end(node.end_lineno)]
+        after = after.strip()
+        return not before.strip() and (not after or after.startswith(b"#"))
+
+    def remove_lines(self, first: int, last: int) -> None:
+        self.edits.append((self.offset(first, 0), self.line_end(last), b""))
+
+    def replace(self, node: ast.AST, text: str) -> None:
+        self.edits.append((
+            self.offset(node.lineno, node.col_offset),
+            self.offset(node.end_lineno, node.end_col_offset),
+            text.encode("utf-8")
+        ))
+
+    def render(self) -> str:
+        data = self.data
+        for start, end, text in sorted(self.edits, reverse=True):
+            data = data[:start] + text + data[end:]
+        return data.decode("utf-8")
+
+
+def strip_source(source: str, filename: str = "<string>") -> StripResult:
+    """
+    ソースからチップのデコレータとインポートを取り除く
+
+    evolve_chipからインポートした名前を根とするデコレータをすべて削除し、
+    evolve_chipのインポート文を削除します。インポートを削除したことで
+    ブロックが空になる場合はpassを残します。
+
+    Args:
+        source: Pythonのソースコード
+        filename: エラーメッセージに使うファイル名
+
+    Returns:
+        書き換え後のソースと削除した数
+
+    Raises:
+        StripError: デコレータ以外の場所でチップの名前が使われている場合
+        SyntaxError: ソースを解析できない場合
+    """
+    tree = ast.parse(source, filename=filename)
+
+    # evolve_chipから持ち込まれた名前と、削除するインポート文
+    chip_names: Set[str] = set()
+    imports: Dict[ast.stmt, List[ast.alias]] = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.level == 0 and _is_chip_module(node.module):
+            chip_names.update(alias.asname or alias.name for alias in node.names if alias.name != "*")
+            imports[node] = []
+        elif isinstance(node, ast.Import):
+            kept = [alias for alias in node.names if not _is_chip_module(alias.name)]
+            if len(kept) == len(node.names):
+                continue
+            for alias in node.names:
+                if _is_chip_module(alias.name):
+                    chip_names.add(alias.asname or alias.name.split(".")[0])
+            imports[node] = kept
+
+    if not imports:
+        return StripResult(source=source)
+
+    edited = _Source(source)
+    removed_nodes: Set[int] = set()
+    decorator_count = 0
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        for decorator in node.decorator_list:
+            if _root_name(decorator) in chip_names:
+                # "@"はデコレータ式の前にあり、デコレータは常に独立した行を占める
+                edited.remove_lines(decorator.lineno, decorator.end_lineno)
+                removed_nodes.update(id(child) for child in ast.walk(decorator))
+                decorator_count += 1
+
+    # 削除した範囲の外でチップの名前が使われていると、削除後に壊れる
+    for node in ast.walk(tree):
+        if id(node) in removed_nodes or node in imports:
+            continue
+        if isinstance(node, ast.Name) and node.id in chip_names:
+            raise StripError(
+                f"{filename}:{node.lineno}: '{node.id}'がデコレータ以外で使われているため削除できません"
+            )
+
+    removed_statements = {node for node, kept in imports.items() if not kept}
+    empty_blocks = {
+        id(body[0]) for body in _statement_lists(tree)
+        if all(statement in removed_statements for statement in body)
+    }
+    for node, kept in imports.items():
+        if kept:
+            # import os, evolve_chip のような文は残りの名前だけにする
+            names = ", ".join(
+                f"{alias.name} as {alias.asname}" if alias.asname else alias.name for alias in kept
+            )
+            edited.replace(node, f"import {names}")
+        elif id(node) in empty_blocks and node is not tree.body[0]:
+            edited.replace(node, "pass")
+        elif edited.owns_lines(node):
+            edited.remove_lines(node.lineno, node.end_lineno)
+        else:
+            # import os; import evolve_chip のように他の文と同じ行にある
+            edited.replace(node, "pass")
+
+    return StripResult(source=edited.render(), decorators=decorator_count, imports=len(imports))
+
+
+def strip_file(path: str, report: StripReport) -> None:
+    """
+    1ファイルをその場で書き換えてレポートに記録
+
+    Args:
+        path: 対象ファイル
+        report: 結果を追加するレポート
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        source = f.read()
+    try:
+        result = strip_source(source, path)
+    except (StripError, SyntaxError) as e:
+        report.errors.append(str(e))
+        result = StripResult(source=source)
+    report.add(result)
+    if result.changed:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(result.source)
+
+
+def strip_tree(src: str, dest: Optional[str] = None, keep_package: bool = False) -> StripReport:
+    """
+    ソースツリーを書き換える
+
+    Args:
+        src: 入力ディレクトリ
+        dest: 出力ディレクトリ（Noneの場合はその場で書き換え）
+        keep_package: ツリー内のevolve_chipパッケージ自体をコピーするかどうか
+
+    Returns:
+        書き換え結果
+    """
+    report = StripReport()
+    if dest and os.path.abspath(dest) != os.path.abspath(src):
+        def ignore(directory, names):
+            ignored = {name for name in names if name in _SKIP_DIRS}
+            if not keep_package and PACKAGE_NAME in names and os.path.isdir(os.path.join(directory, PACKAGE_NAME)):
+                ignored.add(PACKAGE_NAME)
+                report.skipped += 1
+            return ignored
+        shutil.copytree(src, dest, ignore=ignore, dirs_exist_ok=True)
+        root = dest
+    else:
+        root = src
+
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in _SKIP_DIRS)
+        for filename in sorted(filenames):
+            if filename.endswith(".py"):
+                strip_file(os.path.join(directory, filename), report)
+    return report
+
+
+def _record_hash(data: bytes) -> str:
+    digest = hashlib.sha256(data).digest()
+    return "sha256=" + base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def _strip_metadata(data: bytes) -> bytes:
+    """METADATAからevolve_chipへの依存を取り除く"""
+    lines = data.decode("utf-8").splitlines(keepends=True)
+    kept = [
+        line for line in lines
+        if not (
+            line.startswith("Requires-Dist:")
+            and line.split(":", 1)[1].strip().replace("-", "_").lower().startswith(PACKAGE_NAME)
+        )
+    ]
+    return "".join(kept).encode("utf-8")
+
+
+def strip_wheel(wheel_path: str, output_path: str) -> StripReport:
+    """
+    wheelを書き換え、RECORDを作り直す
+
+    Args:
+        wheel_path: 入力wheel
+        output_path: 出力wheel（入力と同じパスは指定できません）
+
+    Returns:
+        書き換え結果
+
+    Raises:
+        ValueError: 入力と出力が同じパスの場合
+    """
+    if os.path.abspath(wheel_path) == os.path.abspath(output_path):
+        raise ValueError("wheelの入力と出力には別のパスを指定してください")
+
+    report = StripReport()
+    records: List[Tuple[str, str, str]] = []
+    with zipfile.ZipFile(wheel_path) as source, zipfile.ZipFile(
+        output_path, "w", compression=zipfile.ZIP_DEFLATED
+    ) as target:
+        record_name = None
+        for info in source.infolist():
+            name = info.filename
+            if name.endswith(".dist-info/RECORD"):
+                record_name = name
+                continue
+            if name.split("/", 1)[0] == PACKAGE_NAME:
+                report.skipped += 1
+                continue
+            data = source.read(info)
+            if name.endswith(".py"):
+                try:
+                    result = strip_source(data.decode("utf-8"), name)
+                except (StripError, SyntaxError) as e:
+                    report.errors.append(str(e))
+                    result = StripResult(source=data.decode("utf-8"))
+                report.add(result)
+                data = result.source.encode("utf-8")
+            elif name.endswith(".dist-info/METADATA"):
+                data = _strip_metadata(data)
+            target.writestr(info, data)
+            records.append((name, _record_hash(data), str(len(data))))
+
+        if record_name is None:
+            raise ValueError(f"RECORDが見つかりません: {wheel_path}")
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerows(records)
+        writer.writerow((record_name, "", ""))
+        target.writestr(record_name, buffer.getvalue())
+    return report
+
+
+@click.command()
+@click.argument("target_path", type=click.Path(exists=True))
+@click.option("--output", "-o", help="出力先のディレクトリまたはwheel（ディレクトリで省略時はその場で書き換え）")
+@click.option("--keep-package", is_flag=True, help="ツリー内のevolve_chipパッケージを削除せずに残す")
+@click.option("--verbose", "-v", is_flag=True, help="詳細情報を表示")
+def cli(target_path: str, output: Optional[str], keep_package: bool, verbose: bool):
+    """
+    ソースツリーまたはwheelから@evolveデコレータとevolve_chipのインポートを取り除きます。
+
+    例：evolve-strip src -o build/src
+        evolve-strip dist/app-1.0-py3-none-any.whl -o dist/stripped/app-1.0-py3-none-any.whl
+    """
+    if target_path.endswith(".whl"):
+        if not output:
+            click.echo("エラー: wheelを書き換える場合は--outputを指定してください。", err=True)
+            sys.exit(1)
+        report = strip_wheel(target_path, output)
+    else:
+        report = strip_tree(target_path, output, keep_package=keep_package)
+
+    click.echo(
+        f"[EvolveStrip] {report.files}ファイル中{report.changed}ファイルを書き換えました"
+        f"（デコレータ {report.decorators}、インポート {report.imports}）。"
+    )
+    for error in report.errors:
+        click.echo(f"  書き換えられませんでした: {error}", err=True)
+    if report.errors:
+        sys.exit(1)
+
+
+def main():
+    """コマンドラインエントリーポイント"""
+    cli(prog_name="evolve-strip")
+
+
+if __name__ == '__main__':
+    main()
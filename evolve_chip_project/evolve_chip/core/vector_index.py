@@ -0,0 +1,155 @@
+"""
+ベクトル索引
+
+L2正規化したベクトルをNumPyの配列に保持し、内積（コサイン類似度）で
+上位k件を検索します。メタデータと合わせて.npzファイルに保存できます。
+"""
+
+import os
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 配列の初期容量（足りなくなると倍に拡張する）
+INITIAL_CAPACITY = 64
+
+
+@dataclass
+class SearchResult:
+    """検索結果の1件"""
+
+    id: str
+    score: float
+    metadata: Dict[str, Any]
+
+
+class VectorIndex:
+    """
+    コサイン類似度で検索するベクトル索引
+
+    追加と検索はスレッドセーフです。同じIDで追加すると置き換えます。
+    """
+
+    def __init__(self, dim: int, model: str = ""):
+        """
+        初期化
+
+        Args:
+            dim: ベクトルの次元数
+            model: ベクトルを生成したモデル（異なるモデルのベクトルは混ぜない）
+        """
+        self.dim = dim
+        self.model = model
+        self._vectors = np.zeros((INITIAL_CAPACITY, dim), dtype=np.float32)
+        self._ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._metadata: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, id: str) -> bool:
+        return id in self._positions
+
+    def add(self, id: str, vector: np.ndarray, metadata: Optional[Dict[str, Any]] = None) -> None:
+        """
+        ベクトルを追加
+
+        Args:
+            id: ID
+            vector: ベクトル（正規化して保存）
+            metadata: JSONに変換できる付加情報
+
+        Raises:
+            ValueError: 次元数が一致しない場合
+        """
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        if vector.shape[0] != self.dim:
+            raise ValueError(f"次元数が一致しません（索引 {self.dim}、ベクトル {vector.shape[0]}）")
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+        with self._lock:
+            position = self._positions.get(id)
+            if position is None:
+                position = len(self._ids)
+                if position == len(self._vectors):
+                    grown = np.zeros((len(self._vectors) * 2, self.dim), dtype=np.float32)
+                    grown[:position] = self._vectors[:position]
+                    self._vectors = grown
+                self._ids.append(id)
+                self._metadata.append({})
+                self._positions[id] = position
+            self._vectors[position] = vector
+            self._metadata[position] = dict(metadata or {})
+
+    def search(self, vector: np.ndarray, k: int = 5, min_score: float = -1.0) -> List[SearchResult]:
+        """
+        類似度の高い順に最大k件を検索
+
+        Args:
+            vector: 検索するベクトル
+            k: 件数
+            min_score: これ未満の類似度の結果は除く
+
+        Returns:
+            検索結果（類似度の降順）
+        """
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        with self._lock:
+            count = len(self._ids)
+            if count == 0 or norm == 0 or k <= 0:
+                return []
+            scores = self._vectors[:count] @ (vector / norm)
+            ids = list(self._ids)
+            metadata = list(self._metadata)
+        if k < count:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(count)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            SearchResult(id=ids[i], score=float(scores[i]), metadata=metadata[i])
+            for i in top if scores[i] >= min_score
+        ]
+
+    def save(self, path: str) -> None:
+        """索引を.npzファイルに保存（一時ファイルに書いてから置き換える）"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            count = len(self._ids)
+            vectors = self._vectors[:count].copy()
+            header = json.dumps(
+                {"model": self.model, "ids": self._ids, "metadata": self._metadata},
+                ensure_ascii=False
+            )
+        temp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(temp_path, vectors=vectors, header=np.array(header))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "VectorIndex":
+        """
+        保存した索引を読み込む
+
+        Raises:
+            OSError: ファイルを読み込めない場合
+            ValueError: 形式が不正な場合
+        """
+        with np.load(path, allow_pickle=False) as data:
+            vectors = data["vectors"].astype(np.float32)
+            header = json.loads(str(data["header"]))
+        index = cls(vectors.shape[1], header.get("model", ""))
+        for id, vector, metadata in zip(header["ids"], vectors, header["metadata"]):
+            index.add(id, vector, metadata)
+        return index
@@ -0,0 +1,415 @@
+"""
+メトリクス
+
+カウンター・ゲージ・ヒストグラムを登録するレジストリと、
+OpenMetrics（Prometheusのテキスト形式）での出力を提供します。
+長時間の実行のスループットやレイテンシを、ファイル（node_exporterの
+textfileコレクターなど）またはローカルのHTTPポートから収集できます。
+"""
+
+import os
+import math
+import bisect
+import logging
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# レイテンシ用のヒストグラムの既定のバケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return f"{value:.1f}"
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _CounterValue:
+    """ラベルの組み合わせ1つ分のカウンター"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        if amount < 0:
+            raise ValueError(f"カウンターは減らせません: {amount}")
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+class _GaugeValue:
+    """ラベルの組み合わせ1つ分のゲージ"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0.0
+
+    def set(self, value: float) -> None:
+        self._value = float(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+class _HistogramValue:
+    """ラベルの組み合わせ1つ分のヒストグラム"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self.upper_bounds = buckets
+        self._counts = [0] * (len(buckets) + 1)   # 最後は+Inf
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.upper_bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """ブロックの実行時間（秒）を記録"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        """(バケットごとの累積件数, 合計)"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = []
+        running = 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return cumulative, total
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+
+class _Family:
+    """
+    同じ名前のメトリクスをラベルの値ごとにまとめたもの
+
+    ラベルの値ごとの系列は最初に使われたときに作り、以降はロックなしで参照します。
+    値の更新は系列ごとのロックで行うため、異なる系列の更新は競合しません。
+    """
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **labels):
+        """
+        ラベルの値に対応する系列を取得
+
+        Args:
+            *values: labelnamesの順のラベルの値
+            **labels: ラベル名を指定したラベルの値
+
+        Raises:
+            ValueError: ラベルが定義と一致しない場合
+        """
+        if labels:
+            if values or set(labels) != set(self.labelnames):
+                raise ValueError(f"{self.name}のラベルが一致しません: {sorted(labels)}")
+            values = tuple(labels[name] for name in self.labelnames)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name}のラベルの数が一致しません: {values}")
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name}にはラベルが必要です: {self.labelnames}")
+        return self.labels()
+
+    def series(self) -> List[Tuple[Tuple[str, ...], object]]:
+        """(ラベルの値, 系列)の一覧"""
+        with self._lock:
+            return sorted(self._children.items())
+
+    def render(self, openmetrics: bool) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Family):
+    """単調に増えるカウンター（出力時の名前には_totalが付く）"""
+
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def render(self, openmetrics: bool) -> List[str]:
+        return [
+            f"{self.name}_total{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+            for values, child in self.series()
+        ]
+
+
+class Gauge(_Family):
+    """増減する値"""
+
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._default().dec(amount)
+
+    def render(self, openmetrics: bool) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+            for values, child in self.series()
+        ]
+
+
+class Histogram(_Family):
+    """値の分布（バケットごとの累積件数・合計・件数）"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets if not math.isinf(b)))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def render(self, openmetrics: bool) -> List[str]:
+        lines = []
+        for values, child in self.series():
+            cumulative, total = child.snapshot()
+            for bound, count in zip(self.buckets + (math.inf,), cumulative):
+                le = (("le", _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {count}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    メトリクスのレジストリ
+
+    同じ名前・種類で登録すると既存のメトリクスを返すため、
+    モジュールの読み込み時に定義しておけます。
+    """
+
+    def __init__(self):
+        self._families: Dict[str, _Family] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs):
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = cls(name, documentation, labelnames, **kwargs)
+                self._families[name] = family
+            elif type(family) is not cls or family.labelnames != tuple(labelnames):
+                raise ValueError(f"メトリクス{name}は別の種類またはラベルで登録されています")
+            return family
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """カウンターを登録（nameには_totalを含めない）"""
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """ゲージを登録"""
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        """ヒストグラムを登録"""
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name: str) -> Optional[_Family]:
+        """登録済みのメトリクスを取得（なければNone）"""
+        return self._families.get(name)
+
+    def render(self, openmetrics: bool = True) -> str:
+        """
+        すべてのメトリクスをテキスト形式で出力
+
+        Args:
+            openmetrics: OpenMetrics形式（末尾に# EOF）で出力するかどうか。
+                         Falseの場合はPrometheusのテキスト形式（0.0.4）
+
+        Returns:
+            出力したテキスト
+        """
+        with self._lock:
+            families = sorted(self._families.values(), key=lambda f: f.name)
+        lines = []
+        for family in families:
+            # Prometheusのテキスト形式ではカウンターの型名にも_totalを付ける
+            type_name = family.name if openmetrics or not isinstance(family, Counter) else f"{family.name}_total"
+            lines.append(f"# HELP {type_name} {_escape(family.documentation)}")
+            lines.append(f"# TYPE {type_name} {family.type_name}")
+            lines.extend(family.render(openmetrics))
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, openmetrics: bool = False) -> None:
+        """
+        メトリクスをファイルに書き出す
+
+        一時ファイルに書いてから置き換えるため、収集側が書きかけのファイルを
+        読むことはありません。既定の形式はnode_exporterのtextfileコレクターが
+        読めるPrometheusのテキスト形式です。
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self.render(openmetrics))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def serve(self, port: int = 0, host: str = "127.0.0.1") -> "MetricsServer":
+        """
+        メトリクスをHTTPで公開するサーバーをバックグラウンドで起動
+
+        Args:
+            port: 待ち受けるポート（0の場合は空いているポート）
+            host: 待ち受けるアドレス（既定ではローカルからのみ接続できる）
+
+        Returns:
+            起動したサーバー（close()で停止）
+        """
+        server = MetricsServer((host, port), self)
+        thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+        thread.start()
+        logger.info(f"メトリクスを公開しています: http://{host}:{server.port}/metrics")
+        return server
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        # OpenMetricsを受け付けるクライアントにはOpenMetrics形式で返す
+        openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+        body = self.server.registry.render(openmetrics).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"メトリクスへのリクエスト: {format % args}")
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """メトリクスを公開するHTTPサーバー"""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], registry: MetricsRegistry):
+        super().__init__(address, _MetricsHandler)
+        self.registry = registry
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def close(self) -> None:
+        """サーバーを停止"""
+        self.shutdown()
+        self.server_close()
+
+
+# 既定のレジストリ（各モジュールのメトリクスはここに登録される）
+REGISTRY = MetricsRegistry()
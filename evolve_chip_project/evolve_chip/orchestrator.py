@@ -6,14 +6,131 @@
 
 import ast
 import os
+import sys
+import hashlib
 import logging
-from typing import Dict, Any
-from core.decorators import evolve, generate_prompt
-from constraints.checker import check_output, check_resource_constraints
-from ai.factory import create_ai_client
+import threading
+import time
+from dataclasses import asdict, dataclass, field, fields
+from functools import partial
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+# アプリケーションルートのパスを設定
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from evolve_chip.core.decorators import evolve, EvolutionGoal, generate_prompt, generate_batch_prompt, plan_batches
+from evolve_chip.core.canonical import FitnessCache
+from evolve_chip.core.context import ContextAssembler, SymbolIndex
+from evolve_chip.core.reuse import ADAPT_THRESHOLD, REUSE_THRESHOLD, EvolutionMemory
+from evolve_chip.core.search import Evaluation, EvolutionarySearch, SearchConfig
+from evolve_chip.core.state import FINISHED, TaskStateStore
+from evolve_chip.core.response import extract_code_block, parse_batch_response, collect_code_from_stream
+from evolve_chip.constraints.checker import check_output, check_resource_constraints, record_constraint_check
+from evolve_chip.constraints.benchmark import BenchmarkConfig
+from evolve_chip.constraints.complexity import CLASS_NAMES, estimate_complexity
+from evolve_chip.constraints.differential import compare_functions
+from evolve_chip.constraints.sandbox import SandboxPool, ValidationTask, load_candidate
+from evolve_chip.ai.embeddings import Embedder
+from evolve_chip.ai.factory import create_ai_client
+from evolve_chip.ai.cache import CachedAIClient, ResponseCache
+from evolve_chip.ai.metered import MeteredAIClient
+from evolve_chip.ai.usage import BudgetExceededError, TokenBudget, TokenUsage, UsageLedger, usage_scope
+from evolve_chip.metrics import REGISTRY
+from evolve_chip.pipeline import Pipeline, Stage
 
 logger = logging.getLogger(__name__)
 
+FUNCTIONS = REGISTRY.counter("evolve_chip_functions", "進化を終えた関数の数（結果ごと）", ("outcome",))
+VALIDATION_SECONDS = REGISTRY.histogram(
+    "evolve_chip_validation_seconds", "候補の検証（制約チェックと元の関数との比較）にかかった時間（秒）", ("backend",)
+)
+
+
+@dataclass
+class FunctionEvolution:
+    """1関数分の進化結果"""
+    
+    name: str
+    prompt: str = ""
+    evolved_code: str = ""
+    explanation: str = ""
+    output_ok: Optional[bool] = None
+    memory_ok: Optional[bool] = None
+    runtime_ok: Optional[bool] = None
+    cpu_ok: Optional[bool] = None
+    error: Optional[str] = None
+    speedup: Optional[float] = None
+    speedup_ci: Optional[Tuple[float, float]] = None
+    memory_delta_bytes: Optional[int] = None
+    complexity: Optional[str] = None
+    original_complexity: Optional[str] = None
+    regressed: bool = False
+    rejected: bool = False
+    reused_from: Optional[str] = None
+    similarity: Optional[float] = None
+    search_generations: Optional[int] = None
+    search_candidates: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+@dataclass
+class EvolutionRun:
+    """
+    1回のevolve_codeの実行で各ステージが共有する状態
+    
+    ステージのメソッドはこれを引数で受け取るため、パイプラインを通さずに
+    個別に呼び出すことができます。
+    """
+    
+    funcs: Dict[str, Any]                   # 今回進化させる関数（前回完了した関数を除く）
+    order: List[str]                        # 元のファイル内の関数の順序
+    output_path: str                        # 進化後のコードの出力先
+    finished: Dict[str, FunctionEvolution] = field(default_factory=dict)  # 前回の実行で完了した関数
+    written: Dict[str, str] = field(default_factory=dict)   # 出力ファイルに書き出したコード
+    vectors: Dict[str, Any] = field(default_factory=dict)   # 関数のソースの埋め込み
+    matches: Dict[str, Any] = field(default_factory=dict)   # 過去に進化させた類似関数
+    reused: Set[str] = field(default_factory=set)           # 以前の結果を再利用する関数
+    searched: Set[str] = field(default_factory=set)         # 進化的探索を行う関数
+    pool: Optional[SandboxPool] = None                      # 候補を検証するサンドボックス（Noneはプロセス内）
+    write_lock: threading.Lock = field(default_factory=threading.Lock)
+    # プロセス内での検証は標準出力を差し替えるため、探索中の検証とも同時に行わない
+    inprocess_lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+def _targets_performance(func: Any) -> bool:
+    """関数の進化目標にパフォーマンスが含まれるかどうか"""
+    return any(
+        getattr(goal, "value", goal) == EvolutionGoal.PERFORMANCE.value
+        for goal in getattr(func, "goals", [])
+    )
+
+def _accepted(result: FunctionEvolution) -> bool:
+    """候補がエラーなく、すべての制約を満たしたかどうか"""
+    return bool(result.evolved_code) and not result.error and not result.rejected and all(
+        ok is not False for ok in (result.output_ok, result.memory_ok, result.runtime_ok, result.cpu_ok)
+    )
+
+def _restore_result(data: Dict[str, Any]) -> FunctionEvolution:
+    """状態ストアに記録した結果からFunctionEvolutionを復元"""
+    known = {f.name for f in fields(FunctionEvolution)}
+    result = FunctionEvolution(**{key: value for key, value in data.items() if key in known})
+    if result.speedup_ci is not None:
+        result.speedup_ci = tuple(result.speedup_ci)
+    return result
+
+def _measurements(result: FunctionEvolution) -> Dict[str, Any]:
+    """候補の制約チェック・ベンチマークの結果"""
+    return {
+        key: getattr(result, key)
+        for key in (
+            "output_ok", "memory_ok", "runtime_ok", "cpu_ok", "speedup", "speedup_ci",
+            "memory_delta_bytes", "complexity", "original_complexity", "regressed", "rejected", "error"
+        )
+    }
+
 class SimpleOrchestrator:
     """
     シンプルなオーケストレータ
@@ -22,32 +139,182 @@ class SimpleOrchestrator:
     AIを使用して進化を実行します。
     """
     
-    def __init__(self, file_path: str):
+    def __init__(
+        self,
+        file_path: str,
+        generation_workers: int = 4,
+        validation_workers: Optional[int] = None,
+        queue_size: int = 8,
+        use_cache: bool = False,
+        cache: Optional[ResponseCache] = None,
+        batch_token_budget: Optional[int] = None,
+        streaming: bool = True,
+        benchmark_config: Optional[BenchmarkConfig] = None,
+        sandbox: bool = True,
+        sandbox_timeout: float = 30.0,
+        sandbox_memory_mb: Optional[int] = 1024,
+        regression_tolerance: float = 0.05,
+        complexity_analysis: bool = False,
+        context_token_budget: Optional[int] = 1024,
+        context_root: Optional[str] = None,
+        reuse_similar: Optional[bool] = None,
+        memory: Optional[EvolutionMemory] = None,
+        reuse_threshold: float = REUSE_THRESHOLD,
+        adapt_threshold: float = ADAPT_THRESHOLD,
+        state: Optional[TaskStateStore] = None,
+        run_id: Optional[str] = None,
+        search: Optional[SearchConfig] = None,
+        metrics_file: Optional[str] = None,
+        metrics_port: Optional[int] = None,
+        token_budget: Optional[int] = None,
+        task_token_budget: Optional[int] = None,
+        usage: Optional[UsageLedger] = None
+    ):
         """
         初期化
         
         Args:
             file_path: 進化させるPythonファイルのパス
+            generation_workers: AI呼び出しを並行して行うワーカー数
+            validation_workers: 制約チェックを行うワーカー数。
+                                Noneの場合、サンドボックスではCPUコア数、
+                                プロセス内での検証では1（出力のキャプチャが
+                                プロセス全体のstdoutを差し替えるため）
+            queue_size: ステージ間キューの最大長
+            use_cache: AIの応答をディスクにキャッシュするかどうか。モックのクライアントでは
+                       常に無効で、候補が検証を通らなかった応答はキャッシュから削除します
+            cache: 使用するキャッシュ（未指定時は既定パスのキャッシュ）
+            batch_token_budget: 指定すると、小さな関数をこのトークン数まで
+                                1つのリクエストにまとめます（Noneの場合は関数ごと）
+            streaming: 単体の関数をストリーミングで生成し、
+                       コードブロックが閉じた時点で打ち切るかどうか
+            benchmark_config: 指定すると実行時間制約を1回の実行ではなく
+                              ベンチマークの統計量で判定します
+            sandbox: 候補を事前に起動したワーカープロセスで検証するかどうか
+                     （Falseの場合はオーケストレータのプロセス内で実行）
+            sandbox_timeout: サンドボックスでの1候補あたりの実行時間の上限（秒）
+            sandbox_memory_mb: サンドボックスのワーカーのアドレス空間の上限（MB）
+            regression_tolerance: 元の関数との比較で許容する速度低下の割合。
+                                  これを超えて有意に遅い候補は、目標に
+                                  パフォーマンスを含む関数では棄却されます
+            complexity_analysis: 目標にパフォーマンスを含む関数について、
+                                 入力サイズを変えて元の関数と候補の計算量を推定するかどうか
+            context_token_budget: 関数が参照する関数のシグネチャ・クラス定義・定数を
+                                  プロンプトに追加する際のトークン数の上限
+                                  （Noneまたは0の場合は追加しない）
+            context_root: シンボルを索引化するプロジェクトのルート
+                          （省略時は進化させるファイルのディレクトリ）
+            reuse_similar: 過去に進化させた関数とほぼ同じ関数には、AIを呼ばずに
+                           以前の結果を再利用するかどうか（Noneの場合は応答をキャッシュするかどうかに従う）
+            memory: 進化結果の記録（未指定時は~/.evolve_chip/evolution_index.npz）
+            reuse_threshold: 以前の結果を再利用する類似度（コサイン類似度）
+            adapt_threshold: 以前の結果を参考例としてプロンプトに添える類似度
+            state: 関数ごとの進行状況・候補・計測結果を記録するストア。
+                   指定すると、中断した実行を同じrun_idで再開したときに
+                   完了済みの関数は記録した結果を使い、実行中だった関数はやり直します
+            run_id: 実行のID（省略時はファイルのパスと内容のハッシュ。
+                    ファイルを変更すると別の実行になる）
+            search: 指定すると、目標にパフォーマンスを含む関数は候補を1つではなく
+                    集団として生成し、実測の速度・メモリで選んだ候補を親に
+                    世代を重ねて改善します（AIの呼び出しは最大で
+                    population_size × generations回）
+            metrics_file: 指定すると、関数の進化を終えるたびにメトリクスを
+                          Prometheusのテキスト形式で書き出します
+                          （未指定時は環境変数EVOLVE_CHIP_METRICS_FILE）
+            metrics_port: 指定すると、evolve_codeの実行中にメトリクスを
+                          http://127.0.0.1:<port>/metricsで公開します
+                          （未指定時は環境変数EVOLVE_CHIP_METRICS_PORT）
+            token_budget: 実行全体で使うトークン数の上限
+                          （未指定時は環境変数EVOLVE_CHIP_TOKEN_BUDGET、どちらもなければ無制限）
+            task_token_budget: 関数ごとに使うトークン数の上限
+                               （未指定時は環境変数EVOLVE_CHIP_TASK_TOKEN_BUDGET）。
+                               予算の残りが少なくなると進化的探索・参照先の定義・
+                               参考例を省いて1回の呼び出しで済ませ、予算を超える
+                               呼び出しは送信せずにその関数をエラーとします
+            usage: トークン使用量の集計（指定時はtoken_budgetとtask_token_budgetを無視）
         """
         self.file_path = file_path
         self.globals = {}
+        self.generation_workers = generation_workers
+        if validation_workers is None:
+            validation_workers = (os.cpu_count() or 1) if sandbox else 1
+        self.validation_workers = validation_workers
+        self.queue_size = queue_size
+        self.batch_token_budget = batch_token_budget
+        self.pipeline: Optional[Pipeline] = None
         
         # ファイルを読み込み
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                exec(f.read(), self.globals)
+                self.source = f.read()
+            self._compiled_source = compile(self.source, file_path, "exec")
+            exec(self._compiled_source, self.globals)
         except Exception as e:
             logger.error(f"ファイルの読み込みに失敗: {e}")
             raise
         
+        if usage is None:
+            if token_budget is None and os.environ.get("EVOLVE_CHIP_TOKEN_BUDGET"):
+                token_budget = int(os.environ["EVOLVE_CHIP_TOKEN_BUDGET"])
+            if task_token_budget is None and os.environ.get("EVOLVE_CHIP_TASK_TOKEN_BUDGET"):
+                task_token_budget = int(os.environ["EVOLVE_CHIP_TASK_TOKEN_BUDGET"])
+            usage = UsageLedger(TokenBudget(run=token_budget, task=task_token_budget))
+        self.usage = usage
+        
         # AIクライアントの初期化
         try:
-            self.ai_client = create_ai_client(
-                provider="gemini" if os.environ.get("GEMINI_API_KEY") else "mock"
-            )
+            # キャッシュから返した応答はトークンを使わないため、使用量はキャッシュの内側で数える
+            provider = "gemini" if os.environ.get("GEMINI_API_KEY") else "mock"
+            self.ai_client = MeteredAIClient(create_ai_client(provider=provider), usage=self.usage)
+            # ソース・目標・制約が変わらなければ同じプロンプトになり、再実行時はAPIを呼ばない。
+            # モックの応答をキャッシュすると本番の実行で再生されるため、モックでは使わない
+            use_cache = use_cache and provider != "mock"
+            if use_cache:
+                self.ai_client = CachedAIClient(self.ai_client, cache)
         except Exception as e:
             logger.error(f"AIクライアントの初期化に失敗: {e}")
             raise
+        
+        self.streaming = streaming
+        self.benchmark_config = benchmark_config
+        self.sandbox = sandbox
+        self.sandbox_timeout = sandbox_timeout
+        self.sandbox_memory_mb = sandbox_memory_mb
+        self.regression_tolerance = regression_tolerance
+        self.complexity_analysis = complexity_analysis
+        self.context_token_budget = context_token_budget
+        self.context_root = context_root or os.path.dirname(os.path.abspath(file_path))
+        self._context_assembler: Optional[ContextAssembler] = None
+        self._context_lock = threading.Lock()
+        if reuse_similar is None:
+            reuse_similar = use_cache
+        self.reuse_similar = reuse_similar
+        self.reuse_threshold = reuse_threshold
+        self.adapt_threshold = adapt_threshold
+        self.memory = memory
+        if reuse_similar and memory is None:
+            self.memory = EvolutionMemory(Embedder(self.ai_client))
+        self.state = state
+        if run_id is None:
+            digest = hashlib.sha256(self.source.encode("utf-8")).hexdigest()[:12]
+            run_id = f"{os.path.abspath(file_path)}@{digest}"
+        self.run_id = run_id
+        self.search = search
+        # 空白・コメント・ローカル変数名だけが異なる候補は一度だけ計測する
+        self.fitness_cache = FitnessCache()
+        self.metrics_file = metrics_file or os.environ.get("EVOLVE_CHIP_METRICS_FILE")
+        if metrics_port is None and os.environ.get("EVOLVE_CHIP_METRICS_PORT"):
+            metrics_port = int(os.environ["EVOLVE_CHIP_METRICS_PORT"])
+        self.metrics_port = metrics_port
+    
+    def write_metrics(self) -> None:
+        """metrics_fileにメトリクスを書き出す（未指定時は何もしない）"""
+        if not self.metrics_file:
+            return
+        try:
+            REGISTRY.write(self.metrics_file)
+        except OSError as e:
+            logger.warning(f"メトリクスを書き出せませんでした: {e}")
 
     def extract_evolve_functions(self) -> Dict[str, Any]:
         """
@@ -71,56 +338,493 @@ class SimpleOrchestrator:
             
         return functions
 
-    def evolve_code(self):
+    def build_context(self, funcs: List[Tuple[str, Any]]) -> str:
+        """
+        関数が参照するシンボルの定義をトークン予算内で集める
+        
+        Args:
+            funcs: (関数名, 関数)のリスト（1リクエストにまとめる関数）
+            
+        Returns:
+            プロンプトに追加するコンテキスト（予算がない場合は空文字列）
+        """
+        if not self.context_token_budget:
+            return ""
+        with self._context_lock:
+            if self._context_assembler is None:
+                self._context_assembler = ContextAssembler(SymbolIndex.build(self.context_root))
+        context = self._context_assembler.assemble(
+            [func.source for _, func in funcs],
+            self.file_path,
+            self.context_token_budget,
+            exclude=[name for name, _ in funcs]
+        )
+        logger.debug(
+            f"Context for {', '.join(name for name, _ in funcs)}: "
+            f"{len(context.symbols)} symbols, {context.tokens} tokens, {len(context.omitted)} omitted"
+        )
+        return context.render()
+
+    def evolve_code(self) -> List[FunctionEvolution]:
         """
         進化を実行し、結果を保存
         
-        各関数に対して：
-        1. プロンプトを生成
-        2. AIからコード提案を取得
-        3. 制約チェック
-        4. 進化後のコードを保存
+        各関数は次のステージを順に流れ、ステージ同士は並行に動作します：
+        1. generate: プロンプトを生成し、AIからコード提案を取得
+           （batch_token_budget指定時は小さな関数をまとめて1リクエスト）。
+           参照している関数・クラス・定数の定義をcontext_token_budgetの範囲で添える。
+           過去に進化させたほぼ同じ関数があればAIを呼ばずにその結果を使い、
+           似た関数があれば参考例として添える。
+           searchを指定した場合、目標にパフォーマンスを含む関数は進化的探索で
+           候補を生成・検証し、最良の候補を選ぶ
+        2. validate: 制約チェック（既定ではサンドボックスのワーカープロセスで実行）。
+           目標にパフォーマンスを含む関数は元の関数と速度を比較し、
+           有意に遅くなった候補を棄却
+        3. write: 進化後のコードを保存
+        
+        stateを指定した場合、各ステージの進行を記録し、前回完了した関数は
+        AIを呼ばずに記録した結果を使います。
+        
+        Returns:
+            関数ごとの進化結果
         """
         funcs = self.extract_evolve_functions()
         if not funcs:
             logger.warning("進化対象の関数が見つかりません")
-            return
+            return []
+        
+        run = self._prepare_run(funcs)
+        self.pipeline = Pipeline(
+            [
+                Stage("generate", partial(self._generate, run), workers=self.generation_workers, fan_out=True),
+                Stage("validate", partial(self._validate, run), workers=self.validation_workers),
+                Stage("write", partial(self._write, run), workers=1),
+            ],
+            queue_size=self.queue_size
+        )
+        # 候補の実行はワーカープロセスに隔離し、タイムアウトや資源制限で打ち切る
+        if self.sandbox:
+            run.pool = SandboxPool(
+                workers=self.validation_workers,
+                timeout=self.sandbox_timeout,
+                memory_limit_mb=self.sandbox_memory_mb
+            )
+        server = REGISTRY.serve(self.metrics_port) if self.metrics_port is not None else None
+        try:
+            results = self.pipeline.run(self._plan_batches(run))
+        finally:
+            if run.pool is not None:
+                run.pool.close()
+            if self.memory is not None:
+                self.memory.save()
+            if server is not None:
+                server.close()
+            self.write_metrics()
+        logger.info(self.pipeline.format_report())
+        if self.usage.total.calls:
+            logger.info(f"Token usage: {self.usage.format_report()}")
+        fitness_stats = self.fitness_cache.stats
+        if fitness_stats.hits:
+            logger.info(f"Fitness cache: {fitness_stats.hits} hits, {fitness_stats.misses} misses")
+        if isinstance(self.ai_client, CachedAIClient):
+            stats = self.ai_client.cache.stats
+            logger.info(
+                f"Response cache: {stats.hits} hits, {stats.misses} misses "
+                f"({stats.hit_rate * 100:.0f}% hit rate), {stats.entries} entries, "
+                f"{stats.total_bytes / 1024:.1f}KB"
+            )
+        
+        results.extend(run.finished.values())
+        results.sort(key=lambda r: run.order.index(r.name))
+        return results
+
+    def _prepare_run(self, funcs: Dict[str, Any]) -> EvolutionRun:
+        """
+        実行の状態を準備
+        
+        前回の実行で完了した関数は記録した結果を使って対象から外し、
+        残りの関数について過去の進化結果から類似関数を探します。
+        
+        Args:
+            funcs: @evolveデコレータ付きの関数（元のファイル内の順序）
             
-        for name, func in funcs.items():
-            try:
-                # プロンプト生成
-                prompt = generate_prompt(func)
-                logger.info(f"Generated prompt for {name}:\n{prompt}")
-                
-                # AIからコード提案を取得
-                evolved_code = self.ai_client.generate_content(prompt)
-                logger.info(f"Generated code for {name}:\n{evolved_code}")
-                
-                # コードブロックの抽出（もしあれば）
-                if "```python" in evolved_code:
-                    evolved_code = evolved_code.split("```python")[1].split("```")[0].strip()
-                
-                # 進化後のコードを保存
-                output_path = os.path.join(os.path.dirname(self.file_path), "v2_evolved.py")
-                with open(output_path, "w", encoding='utf-8') as f:
-                    f.write(evolved_code)
-                logger.info(f"Evolved code saved to {output_path}")
-                
-                # 制約チェック
-                exec(evolved_code, self.globals)
-                evolved_func = self.globals[name]
-                output_ok = check_output(evolved_func, func.constraints.get('output', ''))
-                memory_ok, runtime_ok, cpu_ok = check_resource_constraints(evolved_func, func.constraints)
+        Returns:
+            各ステージに渡す実行の状態
+        """
+        run = EvolutionRun(
+            funcs=funcs,
+            order=list(funcs),
+            output_path=os.path.join(os.path.dirname(self.file_path), "v2_evolved.py")
+        )
+        
+        # 前回の実行で完了した関数は記録した結果を使い、残りだけを実行する
+        if self.state is not None:
+            for name, record in self.state.begin_run(self.run_id, run.order).items():
+                if name in funcs and record.status in FINISHED and record.result:
+                    run.finished[name] = _restore_result(record.result)
+            if run.finished:
+                logger.info(f"前回の実行で完了した{len(run.finished)}件の関数をスキップします: {self.run_id}")
+            for name, result in run.finished.items():
+                if result.evolved_code and not result.rejected:
+                    run.written[name] = result.evolved_code
+                # 前回までに使ったトークンも予算に含める
+                self.usage.restore(
+                    TokenUsage(
+                        prompt_tokens=result.prompt_tokens,
+                        completion_tokens=result.completion_tokens,
+                        total_tokens=result.prompt_tokens + result.completion_tokens
+                    ),
+                    self.run_id, [name]
+                )
+            run.funcs = {name: func for name, func in funcs.items() if name not in run.finished}
+        
+        # 過去の進化結果から類似関数を探す（埋め込みはまとめて1回で取得）
+        if self.memory is not None and run.funcs:
+            with usage_scope(self.run_id):
+                embedded = self.memory.embed([func.source for func in run.funcs.values()])
+            run.vectors = dict(zip(run.funcs, embedded))
+            for name, func in run.funcs.items():
+                match = self.memory.lookup(run.vectors[name], func.goals, self.adapt_threshold)
+                if match is not None:
+                    run.matches[name] = match
+                    logger.info(f"{name}は過去に進化させた{match.name}と類似しています（類似度 {match.score:.3f}）")
+        run.reused = {name for name, match in run.matches.items() if match.score >= self.reuse_threshold}
+        run.searched = {
+            name for name, func in run.funcs.items()
+            if self.search is not None and _targets_performance(func) and name not in run.reused
+        }
+        return run
+
+    def _plan_batches(self, run: EvolutionRun) -> List[List[Tuple[str, Any]]]:
+        """generateステージに流すバッチ（再利用する関数と探索する関数は1つずつ）"""
+        single = run.reused | run.searched
+        pending = [(name, func) for name, func in run.funcs.items() if name not in single]
+        if self.batch_token_budget:
+            batches = plan_batches(pending, self.batch_token_budget)
+        else:
+            batches = [[item] for item in pending]
+        return batches + [[(name, run.funcs[name])] for name in run.funcs if name in single]
+
+    def _downgraded(self, names: List[str]) -> bool:
+        """予算の残りが少なく、1回の呼び出しで済ませるべきかどうか"""
+        return self.usage.should_downgrade(self.run_id, names)
+
+    def _context_for(self, run: EvolutionRun, batch: List[Tuple[str, Any]]) -> str:
+        """バッチのプロンプトに添える参照先の定義と参考例"""
+        if self._downgraded([name for name, _ in batch]):
+            # 予算の残りが少なければ参照先の定義と参考例を省く
+            return ""
+        examples = "".join(
+            "\n" + run.matches[name].format_example() for name, _ in batch if name in run.matches
+        )
+        return self.build_context(batch) + examples
+
+    def _generate_single(self, run: EvolutionRun, name: str, func: Any) -> Tuple[Any, FunctionEvolution]:
+        """1つの関数の候補を生成（再利用・探索の対象ならそちらを使う）"""
+        result = FunctionEvolution(name=name)
+        if name in run.reused:
+            # ほぼ同じ関数の結果を関数名だけ合わせて使う（検証は通常どおり行う）
+            match = run.matches[name]
+            result.evolved_code = match.adapt(name)
+            result.reused_from = match.name
+            result.similarity = match.score
+            logger.info(f"Reused evolved code of {match.name} for {name} (similarity {match.score:.3f})")
+            return (func, result)
+        if name in run.searched and not self._downgraded([name]):
+            return self._search_single(run, name, func)
+        try:
+            # プロンプト生成
+            result.prompt = generate_prompt(func, self._context_for(run, [(name, func)]))
+            logger.info(f"Generated prompt for {name}:\n{result.prompt}")
+
+            with usage_scope(self.run_id, [name]):
+                if self.streaming:
+                    # コードブロックが閉じた時点で生成を打ち切る
+                    result.evolved_code = collect_code_from_stream(
+                        self.ai_client.stream_content(result.prompt)
+                    )
+                    logger.info(f"Generated code for {name}:\n{result.evolved_code}")
+                else:
+                    # AIからコード提案を取得
+                    evolved_code = self.ai_client.generate_content(result.prompt)
+                    logger.info(f"Generated code for {name}:\n{evolved_code}")
+
+                    # コードブロックの抽出（もしあれば）
+                    result.evolved_code = extract_code_block(evolved_code)
+        except BudgetExceededError as e:
+            result.error = str(e)
+            logger.warning(f"Skipped {name}: {e}")
+        except Exception as e:
+            result.error = str(e)
+            logger.error(f"Error evolving {name}: {e}")
+        return (func, result)
+
+    def _search_single(self, run: EvolutionRun, name: str, func: Any) -> Tuple[Any, FunctionEvolution]:
+        """進化的探索で候補を生成・検証し、最良の候補を選ぶ"""
+        prompt = generate_prompt(func, self._context_for(run, [(name, func)]))
+        # 候補のコード -> そのコードを生成したプロンプト
+        prompts: Dict[str, str] = {}
+
+        def produce(candidate_prompt):
+            # 探索のワーカースレッドで呼ばれるため、ここで帰属先を指定する
+            with usage_scope(self.run_id, [name]):
+                if self.streaming:
+                    code = collect_code_from_stream(self.ai_client.stream_content(candidate_prompt))
+                else:
+                    code = extract_code_block(self.ai_client.generate_content(candidate_prompt))
+            prompts[code] = candidate_prompt
+            return code
+
+        def evaluate(code):
+            candidate = self._check(run, func, FunctionEvolution(name=name, prompt=prompt, evolved_code=code))
+            if not _accepted(candidate) and code in prompts:
+                self._forget_response(prompts[code])
+            return Evaluation(
+                passed=_accepted(candidate),
+                speedup=candidate.speedup,
+                memory_delta_bytes=candidate.memory_delta_bytes,
+                error=candidate.error,
+                detail=candidate
+            )
+
+        outcome = EvolutionarySearch(
+            produce, evaluate, self.search,
+            generation_workers=self.generation_workers,
+            evaluation_workers=self.validation_workers
+        ).run(prompt)
+        logger.info(f"Search for {name}: {outcome.format_report()}")
+        if outcome.best is not None:
+            result = outcome.best.evaluation.detail
+        elif outcome.candidates:
+            # 制約を満たす候補がなければ最後に評価した候補を返す
+            result = outcome.candidates[-1].evaluation.detail
+        else:
+            result = FunctionEvolution(name=name, prompt=prompt, error="候補を生成できませんでした")
+        result.search_generations = outcome.generations
+        result.search_candidates = len(outcome.candidates)
+        return (func, result)
+
+    def _generate(self, run: EvolutionRun, batch: List[Tuple[str, Any]]) -> List[Tuple[Any, FunctionEvolution]]:
+        """generateステージ: バッチの関数ごとに(関数, 結果)を返す"""
+        # 失敗した関数もエラー付きの結果として書き込みステージまで流し、状態ストアに記録する
+        try:
+            return self._generate_batch(run, batch)
+        except Exception as e:
+            names = ", ".join(name for name, _ in batch)
+            logger.error(f"Error evolving {names}: {e}")
+            return [(func, FunctionEvolution(name=name, error=str(e))) for name, func in batch]
+
+    def _generate_batch(self, run: EvolutionRun, batch: List[Tuple[str, Any]]) -> List[Tuple[Any, FunctionEvolution]]:
+        """バッチをまとめて1リクエストで生成（応答から欠けた関数は個別に生成）"""
+        if self.state is not None:
+            for name, _ in batch:
+                self.state.start(self.run_id, name)
+        if len(batch) == 1:
+            return [self._generate_single(run, *batch[0])]
+
+        names = [name for name, _ in batch]
+        prompt = generate_batch_prompt([func for _, func in batch], self._context_for(run, batch))
+        logger.info(f"Generated batch prompt for {', '.join(names)}:\n{prompt}")
+        try:
+            with usage_scope(self.run_id, names):
+                parsed = parse_batch_response(self.ai_client.generate_content(prompt), names)
+        except BudgetExceededError as e:
+            logger.warning(f"Skipped batch of {', '.join(names)}: {e}")
+            parsed = {}
+        except Exception as e:
+            logger.warning(f"バッチ応答の解析に失敗したため関数ごとに再試行します: {e}")
+            parsed = {}
+
+        outputs = []
+        for name, func in batch:
+            if name not in parsed:
+                # バッチ応答から欠けた関数だけを個別に生成し直す
+                outputs.append(self._generate_single(run, name, func))
+                continue
+            result = FunctionEvolution(
+                name=name,
+                prompt=prompt,
+                evolved_code=parsed[name]["code"],
+                explanation=parsed[name]["explanation"]
+            )
+            logger.info(f"Generated code for {name}:\n{result.evolved_code}")
+            outputs.append((func, result))
+        return outputs
+
+    def _measure(self, run: EvolutionRun, func: Any, result: FunctionEvolution) -> bool:
+        """候補の制約チェックと元の関数との比較を行い、resultに記録する（完了した場合はTrue）"""
+        compare = _targets_performance(func)
+        started = time.perf_counter()
+        try:
+            if run.pool is not None:
+                record = run.pool.validate(ValidationTask(
+                    name=result.name,
+                    code=result.evolved_code,
+                    source=self.source,
+                    constraints=dict(func.constraints),
+                    benchmark_config=self.benchmark_config,
+                    compare=compare,
+                    inputs=getattr(func, "inputs", None),
+                    complexity=compare and self.complexity_analysis
+                ))
+                if record.error:
+                    raise RuntimeError(record.error)
+                result.output_ok = record.output_ok
+                result.memory_ok = record.memory_ok
+                result.runtime_ok = record.runtime_ok
+                result.cpu_ok = record.cpu_ok
+                result.speedup = record.speedup
+                result.speedup_ci = record.speedup_ci
+                result.memory_delta_bytes = record.memory_delta_bytes
+                result.complexity = record.complexity
+                result.original_complexity = record.original_complexity
+                # ワーカープロセスで行った制約チェックはここで記録する
+                record_constraint_check("output", result.output_ok)
+                for name in ("memory", "runtime", "cpu"):
+                    if name in func.constraints:
+                        record_constraint_check(name, getattr(result, f"{name}_ok"))
+            else:
+                with run.inprocess_lock:
+                    # 候補ごとに元のファイルを評価し直した名前空間で評価し、
+                    # モジュールレベルのオブジェクトの変更を元の関数や他の候補に残さない
+                    namespace: Dict[str, Any] = {}
+                    exec(self._compiled_source, namespace)
+                    evolved_func = load_candidate(
+                        self.fitness_cache.compile(result.evolved_code), namespace, result.name
+                    )
+                    result.output_ok = check_output(evolved_func, func.constraints.get('output', ''))
+                    result.memory_ok, result.runtime_ok, result.cpu_ok = check_resource_constraints(
+                        evolved_func, func.constraints, self.benchmark_config
+                    )
+                    if compare:
+                        comparison = compare_functions(
+                            func, evolved_func, getattr(func, "inputs", None),
+                            self.benchmark_config if isinstance(self.benchmark_config, BenchmarkConfig) else None
+                        )
+                        result.speedup = comparison.speedup
+                        result.speedup_ci = comparison.ci
+                        result.memory_delta_bytes = comparison.memory_delta_bytes
+                    if compare and self.complexity_analysis:
+                        generator = getattr(func, "size_generator", None)
+                        result.original_complexity = estimate_complexity(func, generator).best.name
+                        result.complexity = estimate_complexity(evolved_func, generator).best.name
+            VALIDATION_SECONDS.labels("sandbox" if run.pool is not None else "inprocess").observe(
+                time.perf_counter() - started
+            )
+
+            if result.complexity:
+                logger.info(
+                    f"Complexity for {result.name}: "
+                    f"{result.original_complexity} -> {result.complexity}"
+                )
+                if CLASS_NAMES.index(result.complexity) > CLASS_NAMES.index(result.original_complexity):
+                    logger.warning(f"{result.name}の候補は計算量が悪化している可能性があります")
+
+            if result.speedup_ci is not None:
+                result.regressed = result.speedup_ci[1] < 1 - self.regression_tolerance
                 logger.info(
-                    f"Constraints check for {name}:\n"
-                    f"- Output: {'✓' if output_ok else '✗'}\n"
-                    f"- Memory: {'✓' if memory_ok else '✗'}\n"
-                    f"- Runtime: {'✓' if runtime_ok else '✗'}\n"
-                    f"- CPU: {'✓' if cpu_ok else '✗'}"
+                    f"Speedup for {result.name}: {result.speedup:.2f}x "
+                    f"(95% CI {result.speedup_ci[0]:.2f}x .. {result.speedup_ci[1]:.2f}x), "
+                    f"memory {result.memory_delta_bytes / 1024:+.1f}KiB"
                 )
-                
+                if result.regressed:
+                    # 計測できた性能低下は、パフォーマンス目標の関数では採用しない
+                    result.rejected = True
+                    result.error = f"元の関数より遅くなりました（{result.speedup:.2f}x）"
+                    logger.warning(f"{result.name}の候補を棄却しました: {result.error}")
+            logger.info(
+                f"Constraints check for {result.name}:\n"
+                f"- Output: {'✓' if result.output_ok else '✗'}\n"
+                f"- Memory: {'✓' if result.memory_ok else '✗'}\n"
+                f"- Runtime: {'✓' if result.runtime_ok else '✗'}\n"
+                f"- CPU: {'✓' if result.cpu_ok else '✗'}"
+            )
+        except Exception as e:
+            result.error = str(e)
+            logger.error(f"Error evolving {result.name}: {e}")
+            return False
+        return True
+
+    def _check(self, run: EvolutionRun, func: Any, result: FunctionEvolution) -> FunctionEvolution:
+        """計測済みの候補なら記録した結果を使い、そうでなければ計測する"""
+        key = self.fitness_cache.key(result.evolved_code, result.name)
+        cached = self.fitness_cache.get(key)
+        if cached is not None:
+            # 正規化すると計測済みの候補と同じなら、その結果を使う
+            for field_name, value in cached.items():
+                setattr(result, field_name, value)
+            logger.info(f"{result.name}の候補は計測済みの候補と同じため計測を省略しました")
+        elif self._measure(run, func, result):
+            self.fitness_cache.put(key, _measurements(result))
+        if self.state is not None:
+            self.state.record_candidate(
+                self.run_id, result.name, result.evolved_code, _measurements(result), _accepted(result)
+            )
+        return result
+
+    def _validate(self, run: EvolutionRun, item: Tuple[Any, FunctionEvolution]) -> FunctionEvolution:
+        """validateステージ: 生成した候補の制約をチェック"""
+        func, result = item
+        if result.error or result.search_generations is not None:
+            # 進化的探索の候補は探索中に検証済み
+            return result
+        try:
+            return self._check(run, func, result)
+        except Exception as e:
+            result.error = str(e)
+            logger.error(f"Error validating {result.name}: {e}")
+            return result
+
+    def _forget_response(self, prompt: str) -> None:
+        """検証を通らなかった候補の応答をキャッシュから削除し、次回の実行で再生しない"""
+        if not isinstance(self.ai_client, CachedAIClient):
+            return
+        try:
+            if self.ai_client.invalidate(prompt):
+                logger.info("検証を通らなかった候補の応答をキャッシュから削除しました")
+        except Exception as e:
+            logger.warning(f"キャッシュから応答を削除できませんでした: {e}")
+
+    def _write(self, run: EvolutionRun, result: FunctionEvolution) -> FunctionEvolution:
+        """writeステージ: トークン使用量を記録し、結果を保存して完了とする"""
+        # 関数の生成・探索の呼び出しはすべて終わっている
+        used = self.usage.usage("task", result.name)
+        result.prompt_tokens = used.prompt_tokens
+        result.completion_tokens = used.completion_tokens
+        if result.prompt and result.search_generations is None and not _accepted(result):
+            # バッチの応答は、1つでも検証を通らなければ全体を生成し直す
+            self._forget_response(result.prompt)
+        try:
+            self._save(run, result)
+        except Exception as e:
+            result.error = f"結果を保存できませんでした: {e}"
+            logger.error(f"Error saving {result.name}: {e}")
+        if self.state is not None:
+            # 出力ファイルへの書き込み後に完了とする（再開時に書き込みが欠けないように）
+            try:
+                self.state.finish(self.run_id, result.name, asdict(result), result.error)
             except Exception as e:
-                logger.error(f"Error evolving {name}: {e}")
+                logger.error(f"{result.name}の状態を記録できませんでした: {e}")
+        FUNCTIONS.labels(
+            "accepted" if _accepted(result) else "rejected" if result.rejected else "failed"
+        ).inc()
+        self.write_metrics()
+        return result
+
+    def _save(self, run: EvolutionRun, result: FunctionEvolution) -> None:
+        """進化後のコードを出力ファイルに書き出し、制約を満たした結果を記憶する"""
+        if result.evolved_code and not result.rejected:
+            # 完了した関数を元のファイル内の順序で書き出す
+            with run.write_lock:
+                run.written[result.name] = result.evolved_code
+                content = "\n\n\n".join(run.written[n] for n in run.order if n in run.written)
+                with open(run.output_path, "w", encoding='utf-8') as f:
+                    f.write(content + "\n")
+            logger.info(f"Evolved code for {result.name} saved to {run.output_path}")
+        if self.memory is not None and result.reused_from is None and _accepted(result):
+            # 制約を満たした結果だけを次回以降の再利用の候補にする
+            func = run.funcs[result.name]
+            self.memory.remember(result.name, func.source, result.evolved_code, func.goals, run.vectors.get(result.name))
 
 if __name__ == "__main__":
     logging.basicConfig(
@@ -0,0 +1,265 @@
+"""
+ステージ型パイプライン
+
+有界キューでつながれた複数のステージを並行に動かし、
+ネットワーク待ちの処理とCPU処理を重ね合わせます。
+"""
+
+import queue
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, List, Optional
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+STAGE_ITEMS = REGISTRY.counter(
+    "evolve_chip_stage_items", "パイプラインのステージが処理した要素の数", ("stage", "outcome")
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "evolve_chip_stage_seconds", "パイプラインのステージの1要素あたりの処理時間（秒）", ("stage",)
+)
+STAGE_IN_FLIGHT = REGISTRY.gauge(
+    "evolve_chip_stage_in_flight", "パイプラインのステージで処理中の要素の数", ("stage",)
+)
+
+# ステージの終端を示す番兵
+_STOP = object()
+
+
+@dataclass
+class StageStats:
+    """ステージごとの処理統計"""
+
+    name: str
+    workers: int
+    processed: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """1秒あたりの処理件数"""
+        if self.elapsed_seconds <= 0:
+            return 0.0
+        return self.processed / self.elapsed_seconds
+
+    @property
+    def utilization(self) -> float:
+        """ワーカーが処理中だった時間の割合（0.0〜1.0）"""
+        capacity = self.elapsed_seconds * self.workers
+        if capacity <= 0:
+            return 0.0
+        return min(1.0, self.busy_seconds / capacity)
+
+
+class Stage:
+    """
+    パイプラインの1ステージ
+
+    funcは1件の入力を受け取り、次のステージへ渡す値を返します。
+    Noneを返した場合、その要素はそこで破棄されます。funcが送出した例外は
+    記録して要素を破棄します。結果として残したい失敗はfunc自身で捕捉してください。
+    Exception以外の例外（KeyboardInterruptなど）はパイプライン全体を中止させ、
+    Pipeline.run()から送出されます。
+    fan_outを指定すると、funcが返したリストの各要素を個別に次段へ渡します。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Any], Any],
+        workers: int = 1,
+        fan_out: bool = False
+    ):
+        """
+        ステージの初期化
+
+        Args:
+            name: ステージ名（統計の表示に使用）
+            func: 各要素に適用する処理
+            workers: このステージのワーカースレッド数
+            fan_out: funcの戻り値を複数の要素として展開するかどうか
+
+        Raises:
+            ValueError: ワーカー数が1未満の場合
+        """
+        if workers < 1:
+            raise ValueError(f"ワーカー数は1以上である必要があります: {name}={workers}")
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.fan_out = fan_out
+        self.stats = StageStats(name=name, workers=workers)
+        self._lock = threading.Lock()
+        self._finished_workers = 0
+        self._ok = STAGE_ITEMS.labels(name, "ok")
+        self._failed = STAGE_ITEMS.labels(name, "failed")
+        self._seconds = STAGE_SECONDS.labels(name)
+        self._in_flight = STAGE_IN_FLIGHT.labels(name)
+
+    def _work(
+        self,
+        in_queue: queue.Queue,
+        out_queue: queue.Queue,
+        abort: threading.Event,
+        fatal: List[BaseException]
+    ) -> None:
+        """ワーカースレッドの本体"""
+        while True:
+            item = in_queue.get()
+            if item is _STOP:
+                # 兄弟ワーカーにも終了を伝え、最後のワーカーが次段へ伝搬する
+                in_queue.put(_STOP)
+                with self._lock:
+                    self._finished_workers += 1
+                    is_last = self._finished_workers == self.workers
+                if is_last:
+                    out_queue.put(_STOP)
+                return
+            if abort.is_set():
+                # 中止後は番兵が届くまで要素を読み捨て、上流のワーカーを待たせない
+                continue
+
+            started = time.perf_counter()
+            self._in_flight.inc()
+            try:
+                result = self.func(item)
+            except Exception as e:
+                logger.error(f"ステージ '{self.name}' で処理に失敗: {e}")
+                result = None
+                failed = True
+            except BaseException as e:
+                # ワーカーは終了させずに番兵を伝搬させ、run()で送出する
+                logger.error(f"ステージ '{self.name}' で致命的なエラーが発生したため中止します: {e!r}")
+                fatal.append(e)
+                abort.set()
+                result = None
+                failed = True
+            else:
+                failed = False
+            busy = time.perf_counter() - started
+            self._in_flight.dec()
+            self._seconds.observe(busy)
+            (self._failed if failed else self._ok).inc()
+
+            with self._lock:
+                self.stats.busy_seconds += busy
+                if failed:
+                    self.stats.failed += 1
+                else:
+                    self.stats.processed += 1
+
+            if result is None:
+                continue
+            # 次段のキューが満杯の場合はここで待機する（バックプレッシャー）
+            for output in (result if self.fan_out else (result,)):
+                if output is not None:
+                    out_queue.put(output)
+
+
+class Pipeline:
+    """
+    有界キューでステージをつないだパイプライン
+
+    各ステージは独立したワーカースレッド群で動作し、
+    キューが満杯になると上流のステージが待機します。
+    """
+
+    def __init__(self, stages: List[Stage], queue_size: int = 8):
+        """
+        パイプラインの初期化
+
+        Args:
+            stages: 先頭から順に実行するステージのリスト
+            queue_size: ステージ間キューの最大長
+
+        Raises:
+            ValueError: ステージが空、またはキューサイズが1未満の場合
+        """
+        if not stages:
+            raise ValueError("ステージが1つも指定されていません")
+        if queue_size < 1:
+            raise ValueError(f"キューサイズは1以上である必要があります: {queue_size}")
+        self.stages = stages
+        self.queue_size = queue_size
+        self.elapsed_seconds = 0.0
+
+    def run(self, items: Iterable[Any]) -> List[Any]:
+        """
+        パイプラインを実行
+
+        Args:
+            items: 先頭ステージに投入する要素
+
+        Returns:
+            最終ステージの出力（完了順）
+
+        Raises:
+            BaseException: ステージでException以外の例外が発生した場合
+                           （残りの要素は処理せずに中止する）
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results_queue: queue.Queue = queue.Queue()
+        abort = threading.Event()
+        fatal: List[BaseException] = []
+
+        threads = []
+        for index, stage in enumerate(self.stages):
+            stage._finished_workers = 0
+            out_queue = queues[index + 1] if index + 1 < len(self.stages) else results_queue
+            for worker_index in range(stage.workers):
+                thread = threading.Thread(
+                    target=stage._work,
+                    args=(queues[index], out_queue, abort, fatal),
+                    name=f"pipeline-{stage.name}-{worker_index}",
+                    daemon=True
+                )
+                threads.append(thread)
+
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        for item in items:
+            if abort.is_set():
+                break
+            queues[0].put(item)
+        queues[0].put(_STOP)
+
+        results = []
+        while True:
+            result = results_queue.get()
+            if result is _STOP:
+                break
+            results.append(result)
+
+        for thread in threads:
+            thread.join()
+
+        self.elapsed_seconds = time.perf_counter() - started
+        for stage in self.stages:
+            stage.stats.elapsed_seconds = self.elapsed_seconds
+        if fatal:
+            raise fatal[0]
+        return results
+
+    @property
+    def stats(self) -> List[StageStats]:
+        """ステージごとの統計"""
+        return [stage.stats for stage in self.stages]
+
+    def format_report(self) -> str:
+        """ステージごとのスループットを整形して返す"""
+        lines = [f"Pipeline finished in {self.elapsed_seconds:.2f}s"]
+        for stats in self.stats:
+            lines.append(
+                f"- {stats.name}: {stats.processed} ok, {stats.failed} failed, "
+                f"{stats.throughput:.2f} items/s, "
+                f"utilization {stats.utilization * 100:.0f}% ({stats.workers} workers)"
+            )
+        return "\n".join(lines)
@@ -4,5 +4,10 @@ setup(
     name="evolve_chip",
     version="0.1",
     packages=find_packages(),
-    install_requires=["psutil"],
+    install_requires=["psutil", "numpy"],
+    entry_points={
+        "console_scripts": [
+            "evolve-strip=evolve_chip.core.strip:main",
+        ],
+    },
 ) 
\ No newline at end of file
@@ -0,0 +1,206 @@
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+import yaml
+
+from evolve_chip.core.analyzer import analyze_paths, analyze_source, analyze_tree, build_evolution_plan
+from evolve_chip.core.index import ExtractionIndex
+from evolve_chip.core.profiler import HotnessProfiler
+from evolve_chip.core.ranking import RuntimeProfile
+
+SOURCE = '''
+def simple(x: int) -> int:
+    """Return x."""
+    return x
+
+def messy(items, flag):
+    out = []
+    for i in range(len(items)):
+        for j in items:
+            if flag and i > j or j < 0:
+                out.append(i)
+    return out
+
+class Greeter:
+    def hello(self, name: str) -> str:
+        """Say hello."""
+        def inner():
+            return name
+        return inner()
+'''
+
+
+class TestAnalyzer(unittest.TestCase):
+    def test_function_metrics(self):
+        analysis = analyze_source(SOURCE, "sample.py")
+        metrics = {m.qualname: m for m in analysis.functions}
+        self.assertEqual(
+            sorted(metrics), ["Greeter.hello", "Greeter.hello.<locals>.inner", "messy", "simple"]
+        )
+
+        simple = metrics["simple"]
+        self.assertEqual(simple.complexity, 1)
+        self.assertTrue(simple.has_docstring)
+        self.assertEqual(simple.missing_annotations, [])
+
+        messy = metrics["messy"]
+        # for ×2 + if + and/or の2
+        self.assertEqual(messy.complexity, 6)
+        self.assertEqual(messy.max_nesting, 3)
+        self.assertEqual(messy.max_loop_depth, 2)
+        self.assertEqual(messy.loop_patterns, ["append_in_loop", "nested_loop", "range_len"])
+        self.assertEqual(messy.missing_annotations, ["items", "flag", "return"])
+
+        hello = metrics["Greeter.hello"]
+        self.assertEqual(hello.class_name, "Greeter")
+        self.assertEqual(hello.missing_annotations, [])
+
+    def test_syntax_error_is_recorded(self):
+        analysis = analyze_source("def broken(:\n", "bad.py")
+        self.assertIn("SyntaxError", analysis.error)
+        self.assertEqual(analysis.functions, [])
+
+    def test_tree_plan_is_importable(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "pkg"))
+            os.makedirs(os.path.join(tmp, "skipme"))
+            with open(os.path.join(tmp, "pkg", "mod.py"), "w") as f:
+                f.write(SOURCE)
+            with open(os.path.join(tmp, "skipme", "other.py"), "w") as f:
+                f.write(SOURCE)
+
+            analyses = analyze_tree(tmp, exclude=["skipme"])
+            self.assertEqual([a.path for a in analyses], ["pkg/mod.py"])
+
+            plan = yaml.safe_load(yaml.dump(build_evolution_plan(analyses)))
+            tasks = plan["evolution_tasks"]
+            ids = [t["id"] for t in tasks]
+            self.assertEqual(len(ids), len(set(ids)))
+            optimize = [t for t in tasks if t["id"].startswith("optimize_messy")]
+            self.assertEqual(len(optimize), 1)
+            self.assertEqual(optimize[0]["target"], {"file": "pkg/mod.py", "function": "messy"})
+            self.assertEqual(optimize[0]["priority"], 1)
+            self.assertEqual([t["priority"] for t in tasks], sorted(t["priority"] for t in tasks))
+
+    def test_process_pool_matches_serial(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for i in range(3):
+                path = os.path.join(tmp, f"m{i}.py")
+                with open(path, "w") as f:
+                    f.write(SOURCE)
+                paths.append(path)
+            with unittest.mock.patch("evolve_chip.core.analyzer.PARALLEL_THRESHOLD", 0):
+                parallel = analyze_paths(paths, tmp, workers=2)
+            self.assertEqual(parallel, analyze_paths(paths, tmp, workers=1))
+
+
+class TestExtractionIndex(unittest.TestCase):
+    def test_only_changed_files_are_parsed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "src")
+            os.makedirs(src)
+            for name in ("a.py", "b.py", "c.py"):
+                with open(os.path.join(src, name), "w") as f:
+                    f.write(SOURCE)
+
+            with ExtractionIndex(os.path.join(tmp, "index.db")) as index:
+                first = index.refresh(src)
+                self.assertEqual((first.parsed, first.reused), (3, 0))
+
+                # 内容を変えたファイル、更新時刻だけ変えたファイル、削除したファイル
+                with open(os.path.join(src, "a.py"), "a") as f:
+                    f.write("\ndef added():\n    pass\n")
+                os.utime(os.path.join(src, "b.py"), ns=(0, 0))
+                os.remove(os.path.join(src, "c.py"))
+
+                second = index.refresh(src)
+                self.assertEqual((second.parsed, second.reused, second.removed), (1, 1, 1))
+                self.assertEqual(second.files, 2)
+                self.assertIn("added", [t["target"]["function"] for t in second.tasks])
+
+                expected = build_evolution_plan(analyze_tree(src))["evolution_tasks"]
+                self.assertEqual(
+                    sorted(t["id"] for t in second.tasks), sorted(t["id"] for t in expected)
+                )
+                self.assertEqual([a.path for a in index.load_analyses(src)], ["a.py", "b.py"])
+
+
+HOT_SOURCE = '''
+def hot(items):
+    total = 0
+    for i in items:
+        for j in items:
+            total += i * j
+    return total
+
+def cold(items):
+    out = []
+    for i in items:
+        for j in items:
+            out.append(i)
+    return out
+
+def run():
+    for _ in range(20):
+        hot(list(range(200)))
+    cold(list(range(10)))
+'''
+
+
+class TestProfileRanking(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, "src")
+        os.makedirs(os.path.join(self.root, "pkg"))
+        self.path = os.path.join(self.root, "pkg", "hot.py")
+        with open(self.path, "w") as f:
+            f.write(HOT_SOURCE)
+        self.namespace = {}
+        exec(compile(HOT_SOURCE, self.path, "exec"), self.namespace)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assert_hot_first(self, profile):
+        tasks = build_evolution_plan(analyze_tree(self.root), profile)["evolution_tasks"]
+        optimize = [t for t in tasks if t["id"].startswith("optimize_")]
+        self.assertEqual([t["target"]["function"] for t in optimize], ["hot", "cold"])
+        self.assertIs(tasks[0], optimize[0])
+        self.assertGreater(optimize[0]["profile"]["time_share"], 0.5)
+        self.assertGreater(optimize[0]["score"], optimize[1]["score"])
+        # 実行時間に影響しないタスクのスコアは0
+        self.assertTrue(all(t["score"] == 0 for t in tasks if t["goals"] == ["DOCUMENTATION"]))
+
+    def test_pstats_profile(self):
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.runcall(self.namespace["run"])
+        stats_path = os.path.join(self.tmp.name, "run.prof")
+        profiler.dump_stats(stats_path)
+        self.assert_hot_first(RuntimeProfile.load(stats_path))
+
+    def test_chip_profile(self):
+        profiler = HotnessProfiler(os.path.join(self.tmp.name, "hotness.json"))
+        for name in ("hot", "cold"):
+            func = self.namespace[name]
+            profiler.register(f"pkg.hot.{name}", self.path, func.__code__.co_firstlineno)
+        for _ in range(5):
+            profiler.call("pkg.hot.hot", self.namespace["hot"], (list(range(200)),), {})
+        profiler.call("pkg.hot.cold", self.namespace["cold"], (list(range(10)),), {})
+        profiler.save()
+        self.assert_hot_first(RuntimeProfile.load(profiler.path))
+
+    def test_invalid_profile(self):
+        path = os.path.join(self.tmp.name, "bad.prof")
+        with open(path, "wb") as f:
+            f.write(b"not a profile")
+        with self.assertRaises(ValueError):
+            RuntimeProfile.load(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
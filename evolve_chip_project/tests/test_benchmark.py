@@ -0,0 +1,61 @@
+import time
+import unittest
+
+from evolve_chip.constraints.benchmark import BenchmarkConfig, benchmark, reject_outliers
+from evolve_chip.constraints.checker import check_resource_constraints
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_fast_function_is_calibrated(self):
+        calls = []
+        result = benchmark(lambda: calls.append(1), BenchmarkConfig(max_time=0.05))
+
+        # 1サンプルが1ms以上になるよう、1回の計測で何度も呼び出す
+        self.assertGreater(result.loops, 100)
+        self.assertGreaterEqual(len(result.samples), 5)
+        self.assertLess(result.median, 1e-5)
+        self.assertLessEqual(result.min, result.median)
+        self.assertLessEqual(result.median, result.p95)
+        self.assertLessEqual(result.p95, result.p99)
+        low, high = result.ci["median"]
+        self.assertLessEqual(low, result.median)
+        self.assertGreaterEqual(high, result.median)
+
+    def test_outliers_are_rejected(self):
+        samples = sorted([1.0] * 10 + [1.1] * 10 + [50.0])
+        kept, rejected = reject_outliers(samples, 1.5)
+        self.assertEqual(rejected, 1)
+        self.assertEqual(max(kept), 1.1)
+
+    def test_output_is_suppressed(self):
+        result = benchmark(lambda: print("noise"), BenchmarkConfig(max_time=0.01))
+        self.assertTrue(result.samples)
+
+    def test_invalid_statistic(self):
+        with self.assertRaises(ValueError):
+            BenchmarkConfig(statistic="max")
+
+    def test_constraint_judged_on_statistic(self):
+        calls = []
+
+        def sometimes_slow():
+            # 最初の呼び出し（ウォームアップ）だけが遅い
+            calls.append(1)
+            if len(calls) == 1:
+                time.sleep(0.2)
+
+        config = BenchmarkConfig(max_time=0.05)
+        _, runtime_ok, _ = check_resource_constraints(
+            sometimes_slow, {'runtime': '< 0.1s'}, config
+        )
+        self.assertTrue(runtime_ok)
+
+        _, runtime_ok, _ = check_resource_constraints(
+            lambda: time.sleep(0.02), {'runtime': '< 0.01s'},
+            BenchmarkConfig(max_time=0, min_samples=3, statistic="min")
+        )
+        self.assertFalse(runtime_ok)
+
+
+if __name__ == '__main__':
+    unittest.main()
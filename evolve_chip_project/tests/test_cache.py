@@ -0,0 +1,157 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from evolve_chip.ai.cache import CachedAIClient, ResponseCache
+from evolve_chip.ai.mock import MockAIClient
+from evolve_chip.core.response import collect_code_from_stream
+from evolve_chip.orchestrator import SimpleOrchestrator
+
+SAMPLE = '''from evolve_chip.core.decorators import evolve, EvolutionGoal
+
+@evolve(goals=[EvolutionGoal.READABILITY], constraints={'output': 'Hello World'})
+def greet():
+    print("HW")
+'''
+
+
+class CountingClient(MockAIClient):
+    def __init__(self):
+        super().__init__(delay_seconds=0)
+        self.calls = 0
+
+    def generate_content(self, prompt: str) -> str:
+        self.calls += 1
+        return f"response to {prompt}"
+
+
+class StreamingClient(MockAIClient):
+    def __init__(self, chunks, error=None):
+        super().__init__(delay_seconds=0)
+        self.chunks = chunks
+        self.error = error
+
+    def stream_content(self, prompt: str):
+        yield from self.chunks
+        if self.error is not None:
+            raise self.error
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "cache.db")
+
+    def make_cache(self, **kwargs):
+        cache = ResponseCache(self.path, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_key_depends_on_model_prompt_and_options(self):
+        key = ResponseCache.make_key("m", "p", {"temperature": 0.1})
+        self.assertEqual(key, ResponseCache.make_key("m", "p", {"temperature": 0.1}))
+        self.assertNotEqual(key, ResponseCache.make_key("other", "p", {"temperature": 0.1}))
+        self.assertNotEqual(key, ResponseCache.make_key("m", "p", {"temperature": 0.2}))
+
+    def test_cached_client_persists_across_runs(self):
+        client = CountingClient()
+        first = CachedAIClient(client, self.make_cache())
+        self.assertEqual(first.generate_content("a"), "response to a")
+        self.assertEqual(first.generate_content("a"), "response to a")
+        self.assertEqual(client.calls, 1)
+
+        # 別インスタンス（再実行相当）でもAPIは呼ばれない
+        second = CachedAIClient(client, self.make_cache())
+        second.generate_content("a")
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(second.cache.stats.hits, 1)
+        self.assertEqual(second.cache.stats.misses, 0)
+
+    def test_stream_saved_only_when_complete(self):
+        cache = self.make_cache()
+        fenced = ["```python\n", "def f():\n", "    return 1\n", "```\n", "説明"]
+        client = CachedAIClient(StreamingClient(fenced), cache)
+        self.assertEqual(collect_code_from_stream(client.stream_content("ok")), "def f():\n    return 1")
+        self.assertEqual(cache.stats.entries, 1)
+
+        # 途中で失敗したストリームは保存しない
+        failing = CachedAIClient(StreamingClient(fenced[:2], error=ConnectionError("reset")), cache)
+        with self.assertRaises(ConnectionError):
+            list(failing.stream_content("failed"))
+        # 構文エラーで打ち切ったストリームも保存しない
+        broken = ["```python\n", "def f(:\n", "    return 1\n", "x = 1\n", "```\n"]
+        malformed = CachedAIClient(StreamingClient(broken), cache)
+        with self.assertRaises(ValueError):
+            collect_code_from_stream(malformed.stream_content("malformed"))
+        self.assertEqual(cache.stats.entries, 1)
+
+    def test_invalidate_removes_stored_response(self):
+        cache = self.make_cache()
+        client = CountingClient()
+        cached = CachedAIClient(client, cache)
+        cached.generate_content("a")
+        self.assertTrue(cached.invalidate("a"))
+        self.assertFalse(cached.invalidate("a"))
+        cached.generate_content("a")
+        self.assertEqual(client.calls, 2)
+
+    def test_lru_eviction_by_size(self):
+        cache = self.make_cache(max_bytes=300)
+        for i in range(3):
+            cache.put(f"k{i}", os.urandom(60).hex())
+            time.sleep(0.01)
+        cache.get("k0")  # k0を最近使用したことにする
+        cache.put("k3", os.urandom(60).hex())
+
+        self.assertLessEqual(cache.stats.total_bytes, 300)
+        self.assertIsNotNone(cache.get("k0"))
+        self.assertIsNone(cache.get("k1"))
+
+    def test_ttl_expiry(self):
+        cache = self.make_cache(ttl_seconds=0.05)
+        cache.put("k", "v")
+        self.assertEqual(cache.get("k"), "v")
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.stats.entries, 0)
+
+
+class TestOrchestratorCache(unittest.TestCase):
+    def make_orchestrator(self, tmp, response, env, **kwargs):
+        path = os.path.join(tmp, "v1_initial.py")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(SAMPLE)
+        client = mock.Mock(model="stub")
+        client.generate_content.return_value = response
+        with mock.patch.dict("os.environ", env, clear=True), \
+                mock.patch("evolve_chip.orchestrator.create_ai_client", return_value=client):
+            return SimpleOrchestrator(
+                path, sandbox=False, streaming=False, reuse_similar=False, **kwargs
+            )
+
+    def test_cache_is_opt_in_and_never_used_with_mock(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            orchestrator = self.make_orchestrator(tmp, "", {"GEMINI_API_KEY": "key"})
+            self.assertNotIsInstance(orchestrator.ai_client, CachedAIClient)
+            orchestrator = self.make_orchestrator(tmp, "", {}, use_cache=True)
+            self.assertNotIsInstance(orchestrator.ai_client, CachedAIClient)
+
+    def test_only_validated_responses_are_kept(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ResponseCache(os.path.join(tmp, "cache.db"))
+            self.addCleanup(cache.close)
+            for code, entries in (("print('HW')", 0), ("print('Hello World')", 1)):
+                orchestrator = self.make_orchestrator(
+                    tmp, f"```python\ndef greet():\n    {code}\n```", {"GEMINI_API_KEY": "key"},
+                    use_cache=True, cache=cache
+                )
+                self.assertIsInstance(orchestrator.ai_client, CachedAIClient)
+                orchestrator.evolve_code()
+                self.assertEqual(cache.stats.entries, entries)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from evolve_chip.constraints import checker
+from evolve_chip.core.canonical import FitnessCache, canonical_hash
+from evolve_chip.core.search import SearchConfig
+from evolve_chip.orchestrator import SimpleOrchestrator
+
+TOTAL = '''def total(n):
+    """合計を返す"""
+    result = 0  # 累積
+    for i in range(n):
+        result += i
+    return result
+'''
+
+RENAMED = '''def total(n):
+    acc = 0
+    for k in range(n): acc += k
+    return acc
+'''
+
+SAMPLE = '''from evolve_chip.core.decorators import evolve, EvolutionGoal
+
+@evolve(goals=[EvolutionGoal.PERFORMANCE], constraints={'output': ''})
+def total(n=100):
+    result = 0
+    for i in range(n):
+        result += i
+    return result
+'''
+
+
+class TestCanonicalHash(unittest.TestCase):
+    def test_formatting_docstrings_and_locals_are_ignored(self):
+        self.assertEqual(canonical_hash(TOTAL), canonical_hash(RENAMED))
+        self.assertNotEqual(canonical_hash(TOTAL), canonical_hash(RENAMED.replace("acc += k", "acc += k * 2")))
+        # 引数名と関数名はインターフェースの一部
+        self.assertNotEqual(canonical_hash(TOTAL), canonical_hash(TOTAL.replace("(n)", "(m)")))
+        self.assertNotEqual(canonical_hash(TOTAL), canonical_hash(TOTAL.replace("def total", "def summed")))
+
+    def test_globals_shadowed_in_nested_scopes_are_not_renamed(self):
+        code = "def f():\n    def g():\n        x = 1\n        return x\n    return x + g()\n"
+        self.assertNotEqual(canonical_hash(code), canonical_hash(code.replace("x", "y")))
+        closure = "def f():\n    x = 1\n    def g():\n        return x\n    return g()\n"
+        self.assertEqual(canonical_hash(closure), canonical_hash(closure.replace("x", "y")))
+
+    def test_syntax_errors_hash_raw_text(self):
+        self.assertNotEqual(canonical_hash("def f(:"), canonical_hash("def f( :"))
+
+
+class TestFitnessCache(unittest.TestCase):
+    def test_compile_and_results_are_shared_by_equivalent_code(self):
+        cache = FitnessCache(max_entries=2)
+        self.assertIs(cache.compile(TOTAL), cache.compile(RENAMED))
+        self.assertEqual(cache.stats.compiled, 1)
+        namespace = {}
+        exec(cache.compile(RENAMED), namespace)
+        self.assertEqual(namespace["total"](5), 10)
+
+        cache.put(cache.key(TOTAL, "total"), {"speedup": 2.0})
+        self.assertEqual(cache.get(cache.key(RENAMED, "total")), {"speedup": 2.0})
+        self.assertIsNone(cache.get(cache.key(RENAMED, "other")))
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertIsNone(cache.get(cache.key(TOTAL, "total")))
+
+    def test_orchestrator_measures_equivalent_candidates_once(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "v1_initial.py")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(SAMPLE)
+            with mock.patch.dict("os.environ", {}, clear=True):
+                orchestrator = SimpleOrchestrator(
+                    path, use_cache=False, sandbox=False, streaming=False,
+                    search=SearchConfig(population_size=3, generations=1)
+                )
+            variants = iter([
+                "def total(n=100):\n    return n * (n - 1) // 2\n",
+                "def total(n=100):\n    # 等差数列の和\n    return n * (n - 1) // 2\n",
+                'def total(n=100):\n    """和"""\n    return n*(n-1)//2\n',
+            ])
+            orchestrator.ai_client = mock.Mock()
+            orchestrator.ai_client.generate_content.side_effect = lambda prompt: next(variants)
+            with mock.patch("evolve_chip.orchestrator.check_output", wraps=checker.check_output) as check:
+                result, = orchestrator.evolve_code()
+            self.assertEqual(check.call_count, 1)
+            self.assertEqual(result.search_candidates, 3)
+            self.assertTrue(result.output_ok)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import math
+import random
+import unittest
+from typing import Dict, List, Optional
+
+from evolve_chip.constraints.complexity import (
+    estimate_complexity, fit_complexity, generate_value, inputs_from_hints
+)
+
+
+def quadratic(s: str) -> int:
+    count = 0
+    for a in s:
+        for b in s:
+            count += a == b
+    return count
+
+
+def linear(xs: List[int]) -> int:
+    return sum(xs)
+
+
+def constant(n: int) -> int:
+    return n + 1
+
+
+def exponential(n: int) -> int:
+    return n if n < 2 else exponential(n - 1) + exponential(n - 2)
+
+
+class TestFitComplexity(unittest.TestCase):
+    sizes = [8, 16, 32, 64, 128, 256, 512]
+
+    def test_synthetic_curves(self):
+        curves = {
+            "O(1)": lambda n: 1e-6,
+            "O(log n)": lambda n: 1e-6 * math.log(n),
+            "O(n)": lambda n: 2e-7 + 1e-8 * n,
+            "O(n log n)": lambda n: 1e-8 * n * math.log(n),
+            "O(n^2)": lambda n: 1e-9 * n * n,
+        }
+        for name, curve in curves.items():
+            result = fit_complexity(self.sizes, [curve(n) for n in self.sizes])
+            self.assertEqual(result.best.name, name)
+
+        result = fit_complexity(range(10, 24, 2), [1e-7 * 1.6 ** n for n in range(10, 24, 2)])
+        self.assertEqual(result.best.name, "O(2^n)")
+        self.assertAlmostEqual(math.exp(result.best.coefficient), 1.6, places=2)
+
+    def test_requires_three_points(self):
+        with self.assertRaises(ValueError):
+            fit_complexity([1, 2], [1.0, 2.0])
+
+
+class TestInputGeneration(unittest.TestCase):
+    def test_values_from_hints(self):
+        rng = random.Random(0)
+        self.assertEqual(generate_value(int, 5, rng), 5)
+        self.assertEqual(len(generate_value(str, 5, rng)), 5)
+        self.assertEqual(len(generate_value(List[str], 5, rng)), 5)
+        self.assertEqual(len(generate_value(Dict[str, int], 5, rng)), 5)
+        self.assertEqual(generate_value(Optional[int], 5, rng), 5)
+
+    def test_only_required_arguments(self):
+        def func(xs: List[int], scale: float = 1.0):
+            return xs
+
+        args = inputs_from_hints(func)(4)
+        self.assertEqual(len(args), 1)
+        self.assertEqual(len(args[0]), 4)
+
+
+class TestEstimateComplexity(unittest.TestCase):
+    def test_measured_classes(self):
+        self.assertEqual(estimate_complexity(constant).best.name, "O(1)")
+        self.assertEqual(estimate_complexity(linear).best.name, "O(n)")
+        self.assertEqual(estimate_complexity(quadratic).best.name, "O(n^2)")
+        result = estimate_complexity(exponential, time_per_size=0.01)
+        self.assertEqual(result.best.name, "O(2^n)")
+        self.assertLess(estimate_complexity(linear).sort_key(), result.sort_key())
+
+    def test_custom_generator(self):
+        result = estimate_complexity(
+            sum, generator=lambda n: [1] * n, sizes=[100, 1000, 10000, 100000]
+        )
+        self.assertEqual(result.sizes, [100, 1000, 10000, 100000])
+        self.assertEqual(result.best.name, "O(n)")
+
+
+if __name__ == '__main__':
+    unittest.main()
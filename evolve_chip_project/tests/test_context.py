@@ -0,0 +1,116 @@
+import os
+import tempfile
+import unittest
+
+from evolve_chip.ai.tokens import estimate_tokens
+from evolve_chip.core.context import ContextAssembler, SymbolIndex
+from evolve_chip.core.decorators import evolve, generate_prompt
+
+MODELS = '''
+from dataclasses import dataclass
+
+RATE = 0.1
+
+
+@dataclass
+class Order:
+    """注文"""
+    price: int
+    quantity: int
+
+    def total(self) -> int:
+        """合計金額"""
+        return self.price * self.quantity
+'''
+
+HELPERS = '''
+from .models import RATE, Order
+
+
+def tax(amount: int) -> float:
+    """税額を計算"""
+    return amount * RATE
+
+
+def unused() -> None:
+    pass
+'''
+
+APP = '''
+from typing import List
+
+from pkg import helpers
+from pkg.models import Order
+
+LIMIT = 100
+
+
+def checkout(orders: List[Order]) -> int:
+    total = 0
+    for order in orders:
+        total += order.total() + helpers.tax(order.total())
+    return min(total, LIMIT)
+
+
+def one_liner(x): return x
+'''
+
+
+class TestContextAssembler(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tmp.name, "pkg"))
+        files = {
+            "pkg/__init__.py": "",
+            "pkg/models.py": MODELS,
+            "pkg/helpers.py": HELPERS,
+            "app.py": APP,
+        }
+        for name, source in files.items():
+            with open(os.path.join(self.tmp.name, name), "w", encoding="utf-8") as f:
+                f.write(source)
+        self.app = os.path.join(self.tmp.name, "app.py")
+        self.index = SymbolIndex.build(self.tmp.name)
+        self.target = APP[APP.index("def checkout"):APP.index("def one_liner")]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_resolves_imports_and_transitive_references(self):
+        context = ContextAssembler(self.index).assemble(self.target, self.app, 1000, exclude=["checkout"])
+        keys = [symbol.key for symbol in context.symbols]
+        # 直接の参照が先、税額計算が参照する定数はその後
+        self.assertEqual(keys, ["app.LIMIT", "pkg.models.Order", "pkg.helpers.tax", "pkg.models.RATE"])
+        rendered = context.render()
+        self.assertIn("def tax(amount: int) -> float:\n    \"\"\"税額を計算\"\"\"\n    ...", rendered)
+        self.assertIn("@dataclass\nclass Order:", rendered)
+        self.assertIn("    def total(self) -> int:", rendered)
+        self.assertNotIn("self.price * self.quantity", rendered)
+        self.assertNotIn("unused", rendered)
+
+    def test_depth_and_budget_limits(self):
+        direct = ContextAssembler(self.index, max_depth=1).assemble(self.target, self.app, 1000)
+        self.assertNotIn("pkg.models.RATE", [symbol.key for symbol in direct.symbols])
+
+        budget = 40
+        limited = ContextAssembler(self.index).assemble(self.target, self.app, budget)
+        self.assertLessEqual(limited.tokens, budget)
+        self.assertEqual(limited.tokens, sum(estimate_tokens(s.snippet) for s in limited.symbols))
+        self.assertTrue(limited.omitted)
+
+    def test_one_line_definition_stub(self):
+        symbol = self.index.module_for_file(self.app).symbols["one_liner"]
+        self.assertEqual(symbol.snippet, "def one_liner(x):\n    ...\n")
+
+    def test_prompt_includes_context(self):
+        @evolve(constraints={"output": "1"})
+        def sample():
+            return 1
+
+        self.assertNotIn("参考", generate_prompt(sample))
+        prompt = generate_prompt(sample, "LIMIT = 100\n")
+        self.assertIn("```python\nLIMIT = 100\n```", prompt)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+from evolve_chip.constraints.benchmark import BenchmarkConfig
+from evolve_chip.constraints.differential import compare_functions
+
+
+def slow_sum(n):
+    total = 0
+    for i in range(n):
+        total += i
+    return total
+
+
+def fast_sum(n):
+    return n * (n - 1) // 2
+
+
+def copying_sum(n):
+    return sum(list(range(n)))
+
+
+class TestCompareFunctions(unittest.TestCase):
+    config = BenchmarkConfig(max_time=0.05, min_samples=7)
+
+    def test_faster_candidate_is_improvement(self):
+        result = compare_functions(slow_sum, fast_sum, inputs=[2000, (500,)], config=self.config)
+        self.assertGreater(result.speedup, 5)
+        self.assertTrue(result.is_improvement())
+        self.assertFalse(result.is_regression())
+        self.assertIn("speedup", result.format_report())
+
+    def test_slower_candidate_is_regression(self):
+        result = compare_functions(fast_sum, slow_sum, inputs=[2000], config=self.config)
+        self.assertLess(result.speedup, 0.2)
+        self.assertTrue(result.is_regression())
+
+    def test_memory_delta(self):
+        result = compare_functions(slow_sum, copying_sum, inputs=[20000], config=self.config)
+        self.assertGreater(result.memory_delta_bytes, 100 * 1024)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from evolve_chip.ai.embeddings import HASHED_MODEL, Embedder, hashed_embedding
+from evolve_chip.ai.gemini import GeminiClient
+from evolve_chip.ai.mock import MockAIClient
+from evolve_chip.core.reuse import EvolutionMemory, rename_function
+from evolve_chip.core.vector_index import VectorIndex
+from evolve_chip.orchestrator import SimpleOrchestrator
+
+from .test_gemini_client import FakeResponse
+
+TOTAL = '''
+def total_price(items):
+    result = 0
+    for item in items:
+        result = result + item["price"] * item["count"]
+    return result
+'''
+
+# 名前だけ違う同じ処理
+SUM_COST = '''
+def sum_cost(rows):
+    acc = 0
+    for row in rows:
+        acc = acc + row["price"] * row["count"]
+    return acc
+'''
+
+GREET = '''
+def greet(name):
+    message = "Hello, " + name
+    print(message.upper())
+'''
+
+SAMPLE = '''
+from evolve_chip.core.decorators import evolve, EvolutionGoal
+
+@evolve(goals=[EvolutionGoal.READABILITY], constraints={"output": "Hello World"})
+def greet():
+    print("HW")
+'''
+
+
+def cosine(a, b):
+    return float(np.dot(a, b))
+
+
+class TestHashedEmbedding(unittest.TestCase):
+    def test_renamed_function_is_closer_than_unrelated(self):
+        total, renamed, greet = (hashed_embedding(s) for s in (TOTAL, SUM_COST, GREET))
+        self.assertAlmostEqual(float(np.linalg.norm(total)), 1.0, places=5)
+        self.assertGreater(cosine(total, renamed), 0.5)
+        self.assertLess(cosine(total, greet), cosine(total, renamed) - 0.3)
+        self.assertEqual(cosine(total, hashed_embedding(TOTAL + "# comment\n")), cosine(total, total))
+
+    def test_embedder_falls_back_on_unusable_vectors(self):
+        client = mock.Mock(spec=["embed"])
+        client.embed.return_value = [[0.0, 0.0]]
+        embedder = Embedder(client)
+        vectors = embedder.embed([TOTAL])
+        self.assertTrue(embedder.uses_fallback)
+        self.assertEqual(embedder.model, HASHED_MODEL)
+        np.testing.assert_allclose(vectors[0], hashed_embedding(TOTAL))
+
+    def test_gemini_embed_batches_requests(self):
+        with mock.patch.dict("os.environ", {}, clear=True):
+            client = GeminiClient(api_key="key-a")
+        self.addCleanup(client.close)
+        calls = []
+
+        class EmbedSession:
+            def post(self, url, headers=None, json=None, **kwargs):
+                calls.append((url, len(json["requests"])))
+                return FakeResponse({
+                    "embeddings": [{"values": [len(r["content"]["parts"][0]["text"]), 1.0]} for r in json["requests"]]
+                })
+
+            def close(self):
+                pass
+
+        client._session = EmbedSession()
+        texts = ["x" * i for i in range(1, 151)]
+        vectors = client.embed(texts)
+        self.assertEqual(sorted(n for _, n in calls), [50, 100])
+        self.assertTrue(all(url.endswith("text-embedding-004:batchEmbedContents") for url, _ in calls))
+        self.assertEqual([v[0] for v in vectors], list(range(1, 151)))
+        self.assertEqual(client.embed("abc"), [3, 1.0])
+
+
+class TestVectorIndex(unittest.TestCase):
+    def test_top_k_replace_and_persistence(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(200, 16)).astype(np.float32)
+        index = VectorIndex(16, "test")
+        for i, vector in enumerate(vectors):
+            index.add(f"v{i}", vector, {"i": i})
+        self.assertEqual(len(index), 200)
+
+        hits = index.search(vectors[42], k=3)
+        self.assertEqual(hits[0].id, "v42")
+        self.assertAlmostEqual(hits[0].score, 1.0, places=5)
+        self.assertGreaterEqual(hits[1].score, hits[2].score)
+
+        index.add("v42", vectors[7], {"i": 7})
+        self.assertEqual(len(index), 200)
+        replaced = index.search(vectors[7], k=2)
+        self.assertEqual({h.id for h in replaced}, {"v7", "v42"})
+        self.assertEqual([h.metadata for h in replaced], [{"i": 7}, {"i": 7}])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.npz")
+            index.save(path)
+            loaded = VectorIndex.load(path)
+        self.assertEqual((loaded.dim, loaded.model, len(loaded)), (16, "test", 200))
+        self.assertEqual(
+            [h.id for h in loaded.search(vectors[3], k=5)], [h.id for h in index.search(vectors[3], k=5)]
+        )
+
+    def test_dimension_mismatch(self):
+        with self.assertRaises(ValueError):
+            VectorIndex(4).add("a", np.ones(3))
+
+
+class TestReuse(unittest.TestCase):
+    def test_rename_function_skips_strings(self):
+        code = 'def total_price(items):\n    return total_price(items[1:]) if items else "total_price"\n'
+        self.assertEqual(
+            rename_function(code, "total_price", "sum_cost"),
+            'def sum_cost(items):\n    return sum_cost(items[1:]) if items else "total_price"\n'
+        )
+
+    def test_memory_matches_same_goals_only(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            memory = EvolutionMemory(path=os.path.join(tmp, "memory.npz"))
+            memory.remember("total_price", TOTAL, "def total_price(items):\n    return 1\n", ["performance"])
+            memory.save()
+
+            reloaded = EvolutionMemory(path=memory.path)
+            vector = reloaded.embed([SUM_COST])[0]
+            match = reloaded.lookup(vector, ["performance"], min_score=0.5)
+            self.assertEqual(match.name, "total_price")
+            self.assertEqual(match.adapt("sum_cost"), "def sum_cost(items):\n    return 1\n")
+            self.assertIsNone(reloaded.lookup(vector, ["readability"], min_score=0.5))
+
+    def test_orchestrator_reuses_previous_results(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            memory_path = os.path.join(tmp, "memory.npz")
+
+            def run(source):
+                path = os.path.join(tmp, "v1_initial.py")
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(source)
+                with mock.patch.dict("os.environ", {}, clear=True):
+                    orchestrator = SimpleOrchestrator(
+                        path, use_cache=False, sandbox=False, memory=EvolutionMemory(path=memory_path)
+                    )
+                orchestrator.ai_client = mock.Mock(wraps=MockAIClient(delay_seconds=0))
+                return orchestrator, orchestrator.evolve_code()
+
+            first, results = run(SAMPLE)
+            self.assertTrue(first.ai_client.stream_content.called)
+            self.assertIsNone(results[0].reused_from)
+
+            # 名前だけ違う関数は、以前の結果の関数名を合わせて再利用する
+            second, results = run(SAMPLE.replace("def greet", "def greet_again"))
+            self.assertEqual(results[0].reused_from, "greet")
+            self.assertGreaterEqual(results[0].similarity, 0.97)
+            self.assertIn("def greet_again():", results[0].evolved_code)
+            self.assertTrue(results[0].output_ok)
+            second.ai_client.stream_content.assert_not_called()
+            second.ai_client.generate_content.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,228 @@
+import json as json_module
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from evolve_chip.ai.gemini import GeminiClient
+from evolve_chip.ai.retry import DeadlineExceededError, FatalAPIError, RetryPolicy
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200, headers=None):
+        self._payload = payload
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+            raise requests.HTTPError(f"{self.status_code} error", response=self)
+
+    def json(self):
+        return self._payload
+
+
+def text_payload(text):
+    return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+
+class SlowSession:
+    """同時実行数を記録する擬似セッション"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def post(self, url, headers=None, json=None, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        return FakeResponse(text_payload(json["contents"][0]["parts"][0]["text"].upper()))
+
+    def close(self):
+        pass
+
+
+class TestGeminiClient(unittest.TestCase):
+    def make_client(self, **kwargs):
+        with mock.patch.dict("os.environ", {}, clear=True):
+            client = GeminiClient(api_key="key-a", **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_sync_wrapper_returns_text(self):
+        client = self.make_client()
+        client._session = SlowSession(delay=0)
+        self.assertEqual(client.generate_content("hello"), "HELLO")
+        self.assertEqual(client.chat([{"role": "user", "content": "hi"}]), "USER: HI")
+
+    def test_async_calls_overlap_within_limit(self):
+        client = self.make_client(max_concurrency=4)
+        session = SlowSession(delay=0.05)
+        client._session = session
+
+        async def run():
+            return await asyncio.gather(*(client.agenerate_content(f"p{i}") for i in range(12)))
+
+        started = time.perf_counter()
+        results = asyncio.run(run())
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(results, [f"P{i}" for i in range(12)])
+        self.assertEqual(session.max_in_flight, 4)
+        # 12件 × 0.05秒を直列に実行した場合の0.6秒より十分短い
+        self.assertLess(elapsed, 0.4)
+
+    def test_rate_limited_key_is_skipped(self):
+        client = self.make_client(api_keys=["key-b"])
+        seen = []
+
+        class LimitedSession(SlowSession):
+            def post(self, url, headers=None, json=None, **kwargs):
+                seen.append(headers["x-goog-api-key"])
+                if headers["x-goog-api-key"] == "key-a":
+                    return FakeResponse({}, status_code=429, headers={"Retry-After": "30"})
+                return FakeResponse(text_payload("ok"))
+
+        client._session = LimitedSession()
+        self.assertEqual(client.generate_content("p"), "ok")
+        self.assertEqual(client.generate_content("p"), "ok")
+        # 2回目はクールダウン中のkey-aを使わない
+        self.assertEqual(seen, ["key-a", "key-b", "key-b"])
+
+    def test_falls_back_to_failed_key_when_all_keys_are_rate_limited(self):
+        client = self.make_client(api_keys=["key-b"])
+        client.key_manager.report_rate_limited("key-b", retry_after=60)
+        seen = []
+
+        class LimitedSession(SlowSession):
+            def post(self, url, headers=None, json=None, **kwargs):
+                seen.append(headers["x-goog-api-key"])
+                if len(seen) == 1:
+                    return FakeResponse({}, status_code=429, headers={"Retry-After": "0.1"})
+                return FakeResponse(text_payload("ok"))
+
+        client._session = LimitedSession()
+        # key-bは期限を過ぎるまで使えないため、クールダウンの短いkey-aを待って再試行する
+        self.assertEqual(client.generate_content("p", deadline=5), "ok")
+        self.assertEqual(seen, ["key-a", "key-a"])
+
+    def test_stream_content_parses_sse_and_closes(self):
+        client = self.make_client()
+        events = [
+            {"candidates": [{"content": {"parts": [{"text": "```python\n"}]}}]},
+            {"candidates": [{"content": {"parts": [{"text": "x = 1\n```"}]}}],
+             "usageMetadata": {"totalTokenCount": 42}},
+            {"candidates": [{"content": {"parts": [{"text": "trailing prose"}]}}]},
+        ]
+
+        class StreamResponse(FakeResponse):
+            closed = False
+
+            def iter_lines(self, decode_unicode=False):
+                for event in events:
+                    yield "data: " + json_module.dumps(event)
+                    yield ""
+
+            def close(self):
+                StreamResponse.closed = True
+
+        posted = {}
+
+        class StreamSession(SlowSession):
+            def post(self, url, headers=None, json=None, stream=False, **kwargs):
+                posted.update(url=url, stream=stream)
+                return StreamResponse({})
+
+        client._session = StreamSession()
+        stream = client.stream_content("p")
+        self.assertEqual(next(stream), "```python\n")
+        self.assertEqual(next(stream), "x = 1\n```")
+        stream.close()
+
+        self.assertTrue(posted["url"].endswith(":streamGenerateContent?alt=sse"))
+        self.assertTrue(posted["stream"])
+        self.assertTrue(StreamResponse.closed)
+        self.assertEqual(list(client.key_utilization().values())[0]["tokens_last_minute"], 42)
+
+    def test_transient_errors_are_retried_with_backoff(self):
+        client = self.make_client(api_keys=["key-b"], retry_policy=RetryPolicy(base_delay=0.01, deadline=5))
+        calls = []
+
+        class FlakySession(SlowSession):
+            def post(self, url, headers=None, json=None, timeout=None, **kwargs):
+                calls.append((headers["x-goog-api-key"], timeout))
+                if len(calls) == 1:
+                    raise requests.ConnectionError("reset")
+                if len(calls) == 2:
+                    return FakeResponse({}, status_code=503)
+                if len(calls) == 3:
+                    return FakeResponse({}, status_code=401)
+                return FakeResponse(text_payload("ok"))
+
+        client._session = FlakySession()
+        self.assertEqual(client.generate_content("p"), "ok")
+        # 一時的なエラーの後は別のキーに切り替え、無効なキーは除外する
+        self.assertEqual([key for key, _ in calls], ["key-a", "key-b", "key-a", "key-b"])
+        connect, read = calls[0][1]
+        self.assertLessEqual(read, 5)
+        stats = client.retry_stats()
+        self.assertEqual((stats["calls"], stats["attempts"], stats["retries"]), (1, 4, 3))
+        self.assertEqual(stats["errors"], {"ConnectionError": 1, "503": 1, "401": 1})
+        self.assertIsNotNone(stats["latency_p50"])
+
+    def test_fatal_errors_are_not_retried(self):
+        client = self.make_client(api_keys=["key-b"])
+
+        class BadRequestSession(SlowSession):
+            calls = 0
+
+            def post(self, url, headers=None, json=None, **kwargs):
+                BadRequestSession.calls += 1
+                return FakeResponse({}, status_code=400)
+
+        client._session = BadRequestSession()
+        with self.assertRaises(FatalAPIError):
+            client.generate_content("p")
+        self.assertEqual(BadRequestSession.calls, 1)
+        self.assertEqual(client.retry_stats()["fatal"], 1)
+
+    def test_deadline_bounds_retries_and_timeouts(self):
+        client = self.make_client(retry_policy=RetryPolicy(max_attempts=100, base_delay=0.05))
+        timeouts = []
+
+        class HangingSession(SlowSession):
+            def post(self, url, headers=None, json=None, timeout=None, **kwargs):
+                timeouts.append(timeout)
+                raise requests.Timeout("read timed out")
+
+        client._session = HangingSession()
+        started = time.monotonic()
+        with self.assertRaises(DeadlineExceededError):
+            client.generate_content("p", deadline=0.3)
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertGreater(len(timeouts), 1)
+        self.assertTrue(all(read <= 0.3 for _, read in timeouts))
+        self.assertEqual(client.retry_stats()["deadline_exceeded"], 1)
+
+    def test_backoff_honors_retry_after_and_cap(self):
+        policy = RetryPolicy(base_delay=1.0, max_delay=8.0)
+        self.assertGreaterEqual(policy.backoff(0, retry_after=3.0), 3.0)
+        self.assertTrue(all(0 <= policy.backoff(10) <= 8.0 for _ in range(20)))
+
+    def test_invalid_concurrency(self):
+        with self.assertRaises(ValueError):
+            self.make_client(max_concurrency=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import json
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from evolve_chip.ai.gemini import GeminiClient
+from evolve_chip.ai.hedge import HedgeConfig, Hedger
+from .test_gemini_client import FakeResponse, SlowSession, text_payload
+
+FAST = HedgeConfig(budget=1.0, initial_delay=0.05, min_delay=0.0)
+
+
+class TestHedger(unittest.TestCase):
+    def make_hedger(self, config):
+        hedger = Hedger(config, max_workers=4)
+        self.addCleanup(hedger.shutdown)
+        return hedger
+
+    def test_slow_request_is_hedged_and_loser_cancelled(self):
+        hedger = self.make_hedger(FAST)
+        cancelled = []
+
+        def call(cancel, in_use):
+            if not in_use:
+                in_use.add("primary")
+                cancelled.append(cancel.wait(1.0))
+                return "slow"
+            return "fast"
+
+        started = time.monotonic()
+        self.assertEqual(hedger.run(call), "fast")
+        self.assertLess(time.monotonic() - started, 0.5)
+        stats = hedger.snapshot()
+        self.assertEqual((stats["calls"], stats["hedged"], stats["hedge_wins"]), (1, 1, 1))
+        self.assertEqual(stats["hit_rate"], 1.0)
+        # 負けたリクエストには取り消しが通知される
+        hedger.shutdown()
+        self.assertEqual(cancelled, [True])
+
+    def test_budget_caps_hedges_and_threshold_adapts(self):
+        config = HedgeConfig(budget=0.5, initial_delay=0.02, min_delay=0.0, min_samples=3)
+        hedger = self.make_hedger(config)
+        calls = []
+
+        def call(cancel, in_use):
+            calls.append(1)
+            if not cancel.wait(0.05):
+                hedger.observe(0.05)
+            return "ok"
+
+        for _ in range(4):
+            self.assertEqual(hedger.run(call), "ok")
+        stats = hedger.snapshot()
+        self.assertLessEqual(stats["hedged"], 2)
+        self.assertGreaterEqual(stats["budget_denied"], 1)
+        self.assertEqual(len(calls), 4 + stats["hedged"])
+        # 観測したレイテンシの分位点が閾値になる
+        self.assertGreaterEqual(stats["threshold"], 0.04)
+
+    def test_failure_is_raised_when_all_requests_fail(self):
+        hedger = self.make_hedger(FAST)
+        with self.assertRaises(RuntimeError):
+            hedger.run(mock.Mock(side_effect=RuntimeError("boom")))
+        self.assertEqual(hedger.snapshot()["hedged"], 0)
+
+
+class TestGeminiHedging(unittest.TestCase):
+    def test_duplicate_is_sent_on_another_key(self):
+        with mock.patch.dict("os.environ", {}, clear=True):
+            client = GeminiClient(api_key="key-a", api_keys=["key-b"], hedge=FAST)
+        self.addCleanup(client.close)
+        seen = []
+        lock = threading.Lock()
+
+        class StallingSession(SlowSession):
+            def post(self, url, headers=None, json=None, **kwargs):
+                key = headers["x-goog-api-key"]
+                with lock:
+                    seen.append(key)
+                    first = len(seen) == 1
+                if first:
+                    time.sleep(0.3)
+                return FakeResponse(text_payload(key))
+
+        client._session = StallingSession()
+        started = time.monotonic()
+        winner = client.generate_content("p")
+        self.assertLess(time.monotonic() - started, 0.25)
+        self.assertEqual(len(set(seen)), 2)
+        self.assertEqual(winner, seen[1])
+        self.assertEqual(client.hedge_stats()["hedge_wins"], 1)
+
+    def test_duplicate_needs_a_free_concurrency_slot(self):
+        with mock.patch.dict("os.environ", {}, clear=True):
+            client = GeminiClient(api_key="key-a", api_keys=["key-b"], hedge=FAST, max_concurrency=2)
+        self.addCleanup(client.close)
+        session = SlowSession(delay=0.2)
+        client._session = session
+        # 2つの呼び出しで枠を使い切っているときは複製を送らない
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            self.assertEqual(list(pool.map(client.generate_content, ["p", "q"])), ["P", "Q"])
+        stats = client.hedge_stats()
+        self.assertEqual(stats["hedged"], 0)
+        self.assertEqual(stats["budget_denied"], 2)
+        self.assertLessEqual(session.max_in_flight, 2)
+        # 枠が空いていれば複製を送り、終了後に枠を返す
+        self.assertEqual(client.generate_content("p"), "P")
+        self.assertEqual(client.hedge_stats()["hedged"], 1)
+        client.hedger.shutdown()
+        self.assertTrue(all(client._slots.acquire(blocking=False) for _ in range(2)))
+
+    def test_losing_request_is_disconnected(self):
+        disconnected = threading.Event()
+        lock = threading.Lock()
+        received = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                with lock:
+                    received.append(self.headers["x-goog-api-key"])
+                    first = len(received) == 1
+                if first:
+                    # 応答せずに待ち、クライアントが接続を切断したかを記録する
+                    self.connection.settimeout(5)
+                    try:
+                        if self.connection.recv(1) == b"":
+                            disconnected.set()
+                    except OSError:
+                        disconnected.set()
+                    return
+                body = json.dumps(text_payload("fast")).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        with mock.patch.dict("os.environ", {}, clear=True):
+            client = GeminiClient(api_key="key-a", api_keys=["key-b"], hedge=FAST)
+        self.addCleanup(client.close)
+        client.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        client._session.mount("http://", client._session.get_adapter("https://"))
+
+        started = time.monotonic()
+        self.assertEqual(client.generate_content("p"), "fast")
+        self.assertLess(time.monotonic() - started, 2)
+        # 負けたリクエストは応答を待たずに接続ごと打ち切られる
+        self.assertTrue(disconnected.wait(2))
+        client.hedger.shutdown()
+        self.assertEqual(len(received), 2)
+        # 閾値には勝ったリクエストのレイテンシだけを使う
+        self.assertEqual(len(client.hedger._latencies), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
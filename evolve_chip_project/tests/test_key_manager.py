@@ -0,0 +1,66 @@
+import time
+import unittest
+
+from evolve_chip.ai.key_manager import APIKeyManager, UsageEntry, mask_key, parse_retry_after
+
+
+class TestAPIKeyManager(unittest.TestCase):
+    def test_unlimited_keys_rotate(self):
+        manager = APIKeyManager(keys=["AIza-key-aaaa", "AIza-key-bbbb", "AIza-key-cccc"])
+        picked = [manager.acquire() for _ in range(6)]
+        self.assertEqual(picked, ["AIza-key-aaaa", "AIza-key-bbbb", "AIza-key-cccc"] * 2)
+
+    def test_prefers_key_with_most_headroom(self):
+        manager = APIKeyManager(keys=["AIza-key-aaaa", "AIza-key-bbbb"], tokens_per_minute=1000)
+        self.assertEqual(manager.acquire(estimated_tokens=600), "AIza-key-aaaa")
+        # key-aの残りは400、key-bは1000
+        self.assertEqual(manager.acquire(estimated_tokens=100), "AIza-key-bbbb")
+        self.assertEqual(manager.acquire(estimated_tokens=100), "AIza-key-bbbb")
+
+    def test_rate_limited_key_cools_down(self):
+        manager = APIKeyManager(keys=["AIza-key-aaaa", "AIza-key-bbbb"])
+        manager.report_rate_limited("AIza-key-aaaa", retry_after=60)
+        self.assertEqual([manager.acquire() for _ in range(3)], ["AIza-key-bbbb"] * 3)
+        self.assertIsNone(manager.acquire(exclude=["AIza-key-bbbb"], max_wait=0.1))
+        stats = manager.utilization()[mask_key("AIza-key-aaaa")]
+        self.assertGreater(stats["cooldown_remaining"], 50)
+        self.assertEqual(stats["rate_limited"], 1)
+
+    def test_waits_for_request_budget(self):
+        manager = APIKeyManager(keys=["AIza-key-aaaa"], requests_per_minute=600)  # 0.1秒ごとに1件補充
+        manager._states["AIza-key-aaaa"].request_budget = 0
+        started = time.monotonic()
+        self.assertEqual(manager.acquire(), "AIza-key-aaaa")
+        self.assertGreater(time.monotonic() - started, 0.05)
+
+    def test_record_usage_adjusts_estimate(self):
+        manager = APIKeyManager(keys=["AIza-key-aaaa"], tokens_per_minute=10000)
+        first = manager.acquire_lease(estimated_tokens=100)
+        second = manager.acquire_lease(estimated_tokens=50)
+        # 後から割り当てたリクエストが先に終わっても、それぞれの履歴を調整する
+        manager.record_usage(second, actual_tokens=60)
+        manager.record_usage(first, actual_tokens=400)
+        history = manager._states["AIza-key-aaaa"].history
+        self.assertEqual([entry.tokens for entry in history], [400, 60])
+        stats = manager.utilization()[mask_key("AIza-key-aaaa")]
+        self.assertEqual(stats["tokens_last_minute"], 460)
+        self.assertAlmostEqual(stats["token_utilization"], 0.046)
+
+    def test_acquire_drops_expired_history(self):
+        manager = APIKeyManager(keys=["AIza-key-aaaa"])
+        history = manager._states["AIza-key-aaaa"].history
+        old = time.monotonic() - 120
+        history.extend(UsageEntry(old, 10) for _ in range(100))
+        manager.acquire(estimated_tokens=5)
+        self.assertEqual([entry.tokens for entry in history], [5])
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("7"), 7.0)
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertAlmostEqual(
+            parse_retry_after("Thu, 01 Jan 1970 00:01:40 GMT", now=40), 60.0
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import tracemalloc
+import unittest
+
+from evolve_chip.constraints.checker import check_resource_constraints
+from evolve_chip.constraints.memory import AllocationTracker
+from evolve_chip.core.evolution import Evolution, EvolutionGoal
+
+
+def transient():
+    # 一時的に約8MBを確保し、戻る前に解放する
+    data = bytearray(8 * 1024 * 1024)
+    return len(data)
+
+
+def retained():
+    return [bytes(1024) for _ in range(1024)]
+
+
+class TestAllocationTracker(unittest.TestCase):
+    def test_transient_peak_is_captured(self):
+        with AllocationTracker() as tracker:
+            transient()
+        self.assertGreater(tracker.report.peak_mb, 7.5)
+        self.assertLess(tracker.report.net_mb, 0.1)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_retained_allocations_and_top_lines(self):
+        with AllocationTracker(top=3) as tracker:
+            result = retained()
+        self.assertGreater(tracker.report.net_bytes, 1024 * 1024)
+        self.assertTrue(tracker.report.top_lines)
+        self.assertIn("test_memory.py", tracker.report.top_lines[0].location)
+        self.assertEqual(len(result), 1024)
+
+    def test_nested_tracing_is_left_running(self):
+        tracemalloc.start()
+        try:
+            with AllocationTracker(top=0) as tracker:
+                transient()
+            self.assertTrue(tracemalloc.is_tracing())
+            self.assertGreater(tracker.report.peak_mb, 7.5)
+        finally:
+            tracemalloc.stop()
+
+
+class TestMemoryConstraints(unittest.TestCase):
+    def test_constraint_uses_function_allocation(self):
+        memory_ok, _, _ = check_resource_constraints(lambda: sum(range(100)), {'memory': '< 1MB'})
+        self.assertTrue(memory_ok)
+        memory_ok, _, _ = check_resource_constraints(transient, {'memory': '< 1MB'})
+        self.assertFalse(memory_ok)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            check_resource_constraints(transient, {'memory': '< 1MB'}, memory_backend="heap")
+
+    def test_evolution_validate_constraints(self):
+        evolution = Evolution([EvolutionGoal.MEMORY], constraints={'memory': '< 1MB'})
+        self.assertFalse(evolution.validate_constraints(transient, strict=True))
+        self.assertTrue(evolution.validate_constraints(lambda: None, strict=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import os
+import tempfile
+import unittest
+import urllib.request
+from unittest import mock
+
+from evolve_chip.ai.metered import MeteredAIClient
+from evolve_chip.ai.mock import MockAIClient
+from evolve_chip.metrics import REGISTRY, MetricsRegistry
+from evolve_chip.orchestrator import SimpleOrchestrator
+
+SAMPLE = '''from evolve_chip.core.decorators import evolve, EvolutionGoal
+
+@evolve(goals=[EvolutionGoal.READABILITY], constraints={'output': 'hi', 'runtime': '< 1s'})
+def greet():
+    print("hi")
+'''
+
+
+def value(name, *labels):
+    return REGISTRY.get(name).labels(*labels).value
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_render_openmetrics_and_prometheus(self):
+        registry = MetricsRegistry()
+        calls = registry.counter("calls", "呼び出し回数", ("method",))
+        calls.labels("get").inc()
+        calls.labels(method='say "hi"').inc(2)
+        registry.gauge("depth", "キューの長さ").set(3)
+        latency = registry.histogram("latency", "レイテンシ", buckets=(0.1, 1.0))
+        for seconds in (0.05, 0.5, 5.0):
+            latency.observe(seconds)
+        self.assertIs(registry.counter("calls", "呼び出し回数", ("method",)), calls)
+        with self.assertRaises(ValueError):
+            registry.gauge("calls", "別の種類")
+        with self.assertRaises(ValueError):
+            calls.inc()
+
+        text = registry.render()
+        self.assertIn("# TYPE calls counter", text)
+        self.assertIn('calls_total{method="get"} 1.0', text)
+        self.assertIn('calls_total{method="say \\"hi\\""} 2.0', text)
+        self.assertIn("depth 3.0", text)
+        self.assertIn('latency_bucket{le="0.1"} 1', text)
+        self.assertIn('latency_bucket{le="1.0"} 2', text)
+        self.assertIn('latency_bucket{le="+Inf"} 3', text)
+        self.assertIn("latency_count 3", text)
+        self.assertTrue(text.endswith("# EOF\n"))
+        prometheus = registry.render(openmetrics=False)
+        self.assertIn("# TYPE calls_total counter", prometheus)
+        self.assertNotIn("# EOF", prometheus)
+
+    def test_write_and_serve(self):
+        registry = MetricsRegistry()
+        registry.counter("runs", "実行回数").inc()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "metrics", "evolve_chip.prom")
+            registry.write(path)
+            with open(path, encoding="utf-8") as f:
+                self.assertIn("runs_total 1.0", f.read())
+            self.assertEqual(os.listdir(os.path.dirname(path)), ["evolve_chip.prom"])
+
+        server = registry.serve(port=0)
+        self.addCleanup(server.close)
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{server.port}/metrics", headers={"Accept": "application/openmetrics-text"}
+        )
+        with urllib.request.urlopen(request, timeout=5) as response:
+            self.assertTrue(response.headers["Content-Type"].startswith("application/openmetrics-text"))
+            self.assertIn("runs_total 1.0", response.read().decode("utf-8"))
+
+
+class TestInstrumentation(unittest.TestCase):
+    def test_metered_client_records_calls_and_errors(self):
+        client = MockAIClient()
+        client.generate_content = mock.Mock(side_effect=["ok", RuntimeError("boom")])
+        metered = MeteredAIClient(client)
+        before_ok = value("evolve_chip_ai_calls", "MockAIClient", "generate_content", "ok")
+        before_error = value("evolve_chip_ai_calls", "MockAIClient", "generate_content", "RuntimeError")
+
+        self.assertEqual(metered.generate_content("p"), "ok")
+        with self.assertRaises(RuntimeError):
+            metered.generate_content("p")
+        self.assertEqual(value("evolve_chip_ai_calls", "MockAIClient", "generate_content", "ok"), before_ok + 1)
+        self.assertEqual(
+            value("evolve_chip_ai_calls", "MockAIClient", "generate_content", "RuntimeError"), before_error + 1
+        )
+        self.assertEqual(value("evolve_chip_ai_in_flight", "MockAIClient"), 0)
+
+    def test_orchestrator_exports_stage_and_constraint_metrics(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "v1_initial.py")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(SAMPLE)
+            metrics_file = os.path.join(tmp, "evolve_chip.prom")
+            with mock.patch.dict("os.environ", {}, clear=True):
+                orchestrator = SimpleOrchestrator(
+                    path, use_cache=False, sandbox=False, streaming=False, metrics_file=metrics_file
+                )
+            client = mock.Mock()
+            client.generate_content.return_value = '```python\ndef greet():\n    print("hi")\n```'
+            orchestrator.ai_client = MeteredAIClient(client)
+            before = value("evolve_chip_constraint_checks", "output", "pass")
+
+            result, = orchestrator.evolve_code()
+
+            self.assertTrue(result.output_ok)
+            self.assertEqual(value("evolve_chip_constraint_checks", "output", "pass"), before + 1)
+            with open(metrics_file, encoding="utf-8") as f:
+                text = f.read()
+            self.assertIn('evolve_chip_stage_items_total{stage="validate",outcome="ok"}', text)
+            self.assertIn('evolve_chip_functions_total{outcome="accepted"}', text)
+            self.assertIn('evolve_chip_validation_seconds_count{backend="inprocess"}', text)
+            self.assertIn('evolve_chip_constraint_checks_total{constraint="runtime",result="pass"}', text)
+            self.assertIn('evolve_chip_ai_calls_total{client="Mock",method="generate_content",outcome="ok"}', text)
+
+
+if __name__ == "__main__":
+    unittest.main()
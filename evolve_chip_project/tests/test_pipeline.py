@@ -0,0 +1,165 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from evolve_chip.ai.mock import MockAIClient
+from evolve_chip.core.search import SearchConfig
+from evolve_chip.core.state import FAILED, TaskStateStore
+from evolve_chip.orchestrator import FunctionEvolution, SimpleOrchestrator
+from evolve_chip.pipeline import Pipeline, Stage
+
+SAMPLE = '''from evolve_chip.core.decorators import evolve, EvolutionGoal
+
+@evolve(goals=[EvolutionGoal.READABILITY], constraints={'output': 'Hello World'})
+def greet():
+    print("HW")
+'''
+
+
+class TestPipeline(unittest.TestCase):
+    def test_stages_overlap(self):
+        def slow_io(x):
+            time.sleep(0.05)
+            return x
+
+        pipeline = Pipeline([
+            Stage("io", slow_io, workers=4),
+            Stage("cpu", lambda x: x * 2, workers=1),
+        ], queue_size=2)
+
+        started = time.perf_counter()
+        results = pipeline.run(range(8))
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(sorted(results), [x * 2 for x in range(8)])
+        self.assertLess(elapsed, 0.3)
+        io_stats, cpu_stats = pipeline.stats
+        self.assertEqual(io_stats.processed, 8)
+        self.assertGreater(cpu_stats.throughput, 0)
+        self.assertIn("io: 8 ok", pipeline.format_report())
+
+    def test_backpressure_bounds_queue(self):
+        produced = []
+        release = threading.Event()
+
+        def source():
+            for i in range(20):
+                produced.append(i)
+                yield i
+
+        def blocked(x):
+            release.wait()
+            return x
+
+        pipeline = Pipeline([Stage("blocked", blocked, workers=1)], queue_size=2)
+        worker = threading.Thread(target=pipeline.run, args=(source(),))
+        worker.start()
+        time.sleep(0.1)
+        # 処理中の1件 + キュー内の2件 + 投入待ちの1件を超えて先読みしない
+        self.assertLessEqual(len(produced), 4)
+        release.set()
+        worker.join()
+        self.assertEqual(len(produced), 20)
+
+    def test_failures_are_counted_and_dropped(self):
+        def flaky(x):
+            if x % 2:
+                raise RuntimeError("boom")
+            return x
+
+        pipeline = Pipeline([Stage("flaky", flaky, workers=2)])
+        self.assertEqual(sorted(pipeline.run(range(6))), [0, 2, 4])
+        self.assertEqual(pipeline.stats[0].failed, 3)
+
+    def test_fatal_error_is_raised_instead_of_hanging(self):
+        class Fatal(BaseException):
+            pass
+
+        def fatal(x):
+            if x == 3:
+                raise Fatal("stop")
+            return x
+
+        pipeline = Pipeline([
+            Stage("fatal", fatal, workers=1),
+            Stage("next", lambda x: x, workers=1),
+        ], queue_size=1)
+        outcome = []
+        worker = threading.Thread(target=lambda: outcome.append(self._run(pipeline, range(100))))
+        worker.start()
+        worker.join(5)
+        self.assertFalse(worker.is_alive())
+        self.assertIsInstance(outcome[0], Fatal)
+        self.assertLess(pipeline.stats[0].processed, 100)
+
+    @staticmethod
+    def _run(pipeline, items):
+        try:
+            return pipeline.run(items)
+        except BaseException as e:
+            return e
+
+
+class TestOrchestratorPipeline(unittest.TestCase):
+    def test_evolve_code_writes_and_validates(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "v1_initial.py")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(SAMPLE)
+
+            with mock.patch.dict("os.environ", {}, clear=True):
+                orchestrator = SimpleOrchestrator(path, use_cache=False)
+            orchestrator.ai_client = MockAIClient(delay_seconds=0)
+            results = orchestrator.evolve_code()
+
+            self.assertEqual(len(results), 1)
+            self.assertTrue(results[0].output_ok)
+            with open(os.path.join(tmp, "v2_evolved.py"), encoding="utf-8") as f:
+                self.assertIn("Hello World", f.read())
+            self.assertEqual(orchestrator.pipeline.stats[-1].processed, 1)
+
+    def test_stage_errors_are_reported_and_persisted(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "v1_initial.py")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(SAMPLE.replace("READABILITY", "PERFORMANCE"))
+            state = TaskStateStore(os.path.join(tmp, "state.db"))
+            self.addCleanup(state.close)
+            with mock.patch.dict("os.environ", {}, clear=True):
+                orchestrator = SimpleOrchestrator(
+                    path, use_cache=False, sandbox=False, state=state, run_id="run", search=SearchConfig()
+                )
+            orchestrator.ai_client = MockAIClient(delay_seconds=0)
+            # 探索のプロンプトの生成は関数ごとのエラー処理の外で失敗する
+            with mock.patch("evolve_chip.orchestrator.generate_prompt", side_effect=RuntimeError("boom")):
+                result, = orchestrator.evolve_code()
+
+            self.assertEqual(result.error, "boom")
+            self.assertEqual(state.tasks("run")["greet"].status, FAILED)
+
+    def test_stages_can_be_called_without_the_pipeline(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "v1_initial.py")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(SAMPLE)
+            with mock.patch.dict("os.environ", {}, clear=True):
+                orchestrator = SimpleOrchestrator(path, use_cache=False, sandbox=False)
+            funcs = orchestrator.extract_evolve_functions()
+            run = orchestrator._prepare_run(funcs)
+
+            wrong = FunctionEvolution(name="greet", evolved_code="def greet():\n    print('HW')")
+            result = orchestrator._write(run, orchestrator._validate(run, (funcs["greet"], wrong)))
+            self.assertFalse(result.output_ok)
+
+            fixed = FunctionEvolution(name="greet", evolved_code="def greet():\n    print('Hello World')")
+            result = orchestrator._write(run, orchestrator._validate(run, (funcs["greet"], fixed)))
+            self.assertTrue(result.output_ok)
+            with open(run.output_path, encoding="utf-8") as f:
+                self.assertEqual(f.read(), fixed.evolved_code + "\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
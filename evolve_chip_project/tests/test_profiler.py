@@ -0,0 +1,130 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from evolve_chip.core.chip import EvolveChip
+from evolve_chip.core.profiler import (
+    HotnessProfiler, LatencyHistogram, _bucket_index, _bucket_lower_bound, load_profile
+)
+
+
+def leaf():
+    time.sleep(0.002)
+    return 1
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_bucket_bounds_are_within_relative_error(self):
+        for value in [0, 1, 15, 16, 17, 1000, 123456, 10 ** 9, 3 * 10 ** 12]:
+            lower = _bucket_lower_bound(_bucket_index(value))
+            self.assertLessEqual(lower, value)
+            self.assertLessEqual(value - lower, value / 8)
+
+    def test_percentiles_and_roundtrip(self):
+        histogram = LatencyHistogram()
+        for value in range(1, 1001):
+            histogram.record(value * 1000)
+        self.assertLess(len(histogram.counts), 100)
+        self.assertAlmostEqual(histogram.percentile(0.5), 500000, delta=500000 / 8)
+        self.assertAlmostEqual(histogram.percentile(0.99), 990000, delta=990000 / 8)
+        restored = LatencyHistogram.from_dict(histogram.to_dict())
+        self.assertEqual(restored.counts, histogram.counts)
+
+
+class TestHotnessProfiler(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "hotness.json")
+        self.profiler = HotnessProfiler(self.path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_counts_are_exact_and_fast_calls_are_sampled(self):
+        for _ in range(20000):
+            self.profiler.call("fast", abs, (-1,), {})
+        stats = self.profiler.snapshot()["fast"]
+        self.assertEqual(stats.calls, 20000)
+        self.assertLess(stats.sampled, 20000 / 4)
+        self.assertGreater(stats.total_ns, 0)
+
+    def test_self_time_excludes_nested_chip_calls(self):
+        def parent():
+            return self.profiler.call("leaf", leaf, (), {}) + 1
+
+        for _ in range(5):
+            self.profiler.call("parent", parent, (), {})
+        stats = self.profiler.snapshot()
+        self.assertEqual(stats["leaf"].calls, 5)
+        self.assertEqual(stats["leaf"].sampled, 5)
+        self.assertGreater(stats["parent"].total_ns, stats["leaf"].total_ns * 0.9)
+        self.assertLess(stats["parent"].self_ns, stats["parent"].total_ns * 0.5)
+
+    def test_recursive_calls_are_not_counted_twice(self):
+        def fib(n):
+            sum(range(2000))
+            if n < 2:
+                return n
+            return self.profiler.call("fib", fib, (n - 1,), {}) + self.profiler.call("fib", fib, (n - 2,), {})
+
+        started = time.perf_counter_ns()
+        for _ in range(20):
+            self.profiler.call("fib", fib, (10,), {})
+        wall = time.perf_counter_ns() - started
+        stats = self.profiler.snapshot()["fib"]
+        self.assertEqual(stats.entries, 20)
+        self.assertEqual(stats.calls, 20 * 177)
+        # 再帰の深さだけ重ねて数えないので、累積時間は実時間を超えない
+        self.assertLessEqual(stats.total_ns, wall)
+        self.assertGreater(stats.total_ns, wall * 0.5)
+        # 自己時間はサンプリングによる推定のため誤差を許す
+        self.assertLess(stats.self_ns, wall * 1.5)
+
+    def test_nested_functions_keep_their_own_sample_rate(self):
+        def parent():
+            return self.profiler.call("child", leaf, (), {})
+
+        self.profiler.call("child", abs, (-1,), {})
+        child = self.profiler._local.stats["child"]
+        child.next_sample = child.next_entry_sample = 10 ** 9
+        for _ in range(5):
+            self.profiler.call("parent", parent, (), {})
+        stats = self.profiler.snapshot()
+        # 親を計測した呼び出しでも、子は自分の間隔になるまで計測しない
+        self.assertEqual(stats["parent"].sampled, 5)
+        self.assertEqual((stats["child"].calls, stats["child"].sampled), (6, 1))
+        self.assertLess(stats["parent"].self_ns, stats["parent"].total_ns * 0.5)
+
+    def test_threads_are_merged(self):
+        def worker():
+            for _ in range(1000):
+                self.profiler.call("shared", abs, (1,), {})
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.profiler.snapshot()["shared"].calls, 4000)
+
+    def test_save_accumulates_across_runs(self):
+        self.profiler.call("leaf", leaf, (), {})
+        self.profiler.save()
+        self.profiler.save()
+        saved = load_profile(self.path)
+        self.assertEqual(saved["leaf"].calls, 2)
+        self.assertEqual(self.profiler.report()[0]["name"], "leaf")
+
+    def test_chip_records_calls(self):
+        chip = EvolveChip(leaf)
+        chip._profiler = self.profiler
+        self.assertEqual(chip(), 1)
+        self.assertEqual(chip(), 1)
+        self.assertEqual(self.profiler.snapshot()[chip.profile_key].calls, 2)
+        self.assertTrue(chip.profile_key.endswith(".leaf"))
+
+
+if __name__ == "__main__":
+    unittest.main()
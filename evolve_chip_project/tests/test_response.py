@@ -0,0 +1,132 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from evolve_chip.ai.mock import MockAIClient
+from evolve_chip.core.decorators import evolve, EvolutionGoal, generate_batch_prompt, plan_batches
+from evolve_chip.core.response import (
+    CodeBlockStreamParser, collect_code_from_stream, extract_code_block, parse_batch_response
+)
+from evolve_chip.orchestrator import SimpleOrchestrator
+
+SAMPLE = '''from evolve_chip.core.decorators import evolve, EvolutionGoal
+
+@evolve(goals=[EvolutionGoal.READABILITY], constraints={'output': 'Hello World'})
+def greet():
+    print("HW")
+
+@evolve(goals=[EvolutionGoal.READABILITY], constraints={'output': 'Bye'})
+def farewell():
+    print("B")
+'''
+
+
+class BatchClient(MockAIClient):
+    def __init__(self):
+        super().__init__(delay_seconds=0)
+        self.prompts = []
+
+    def generate_content(self, prompt: str) -> str:
+        self.prompts.append(prompt)
+        return "結果です:\n```json\n" + json.dumps({"functions": {
+            "greet": {"code": "def greet():\n    print('Hello World')", "explanation": "展開"},
+            "farewell": {"code": "```python\ndef farewell():\n    print('Bye')\n```"},
+        }}) + "\n```"
+
+
+class TestResponseParsing(unittest.TestCase):
+    def test_extract_code_block(self):
+        self.assertEqual(extract_code_block("前置き\n```python\nx = 1\n```\n後書き"), "x = 1")
+        self.assertEqual(extract_code_block("```\ny = 2\n```"), "y = 2")
+        self.assertEqual(extract_code_block("z = 3\n"), "z = 3")
+
+    def test_parse_batch_response_skips_missing(self):
+        text = 'ok {"functions": {"a": {"code": "def a(): pass"}}}'
+        parsed = parse_batch_response(text, ["a", "b"])
+        self.assertEqual(parsed, {"a": {"code": "def a(): pass", "explanation": ""}})
+        with self.assertRaises(ValueError):
+            parse_batch_response("no json here", ["a"])
+
+
+class TestStreamingExtraction(unittest.TestCase):
+    def test_stops_after_closing_fence(self):
+        consumed = []
+
+        def chunks():
+            for chunk in ["改善版です\n```py", "thon\ndef f():\n", "    return 1\n``", "`\n", "長い説明..."]:
+                consumed.append(chunk)
+                yield chunk
+
+        self.assertEqual(collect_code_from_stream(chunks()), "def f():\n    return 1")
+        self.assertNotIn("長い説明...", consumed)
+
+    def test_aborts_on_definite_syntax_error(self):
+        closed = []
+
+        def chunks():
+            try:
+                yield "```python\ndef f(:\n"
+                yield "    pass\n"
+                yield "x = 1\n"
+                yield "y = 2\n```"
+            finally:
+                closed.append(True)
+
+        with self.assertRaises(ValueError):
+            collect_code_from_stream(chunks())
+        self.assertEqual(closed, [True])
+
+    def test_incomplete_code_is_not_malformed(self):
+        parser = CodeBlockStreamParser()
+        for chunk in ["```python\n", "def f(items):\n", "    total = sum(\n", "        items,\n"]:
+            parser.feed(chunk)
+        self.assertFalse(parser.malformed)
+        self.assertFalse(parser.complete)
+
+
+class TestBatching(unittest.TestCase):
+    def make_funcs(self, sizes):
+        funcs = []
+        for i, size in enumerate(sizes):
+            @evolve(goals=[EvolutionGoal.PERFORMANCE])
+            def f():
+                pass
+            f.__name__ = f"f{i}"
+            f.source = "x" * (size * 4)
+            funcs.append((f.__name__, f))
+        return funcs
+
+    def test_plan_batches_respects_budget(self):
+        funcs = self.make_funcs([10, 10, 10, 500, 10])
+        batches = plan_batches(funcs, token_budget=25, max_function_tokens=100)
+        self.assertEqual([[n for n, _ in b] for b in batches], [["f0", "f1"], ["f3"], ["f2", "f4"]])
+
+    def test_batch_prompt_lists_each_function_once(self):
+        funcs = [f for _, f in self.make_funcs([1, 1])]
+        prompt = generate_batch_prompt(funcs)
+        self.assertEqual(prompt.count("### f0"), 1)
+        self.assertEqual(prompt.count("PEP 8"), 1)
+        self.assertIn('"f1": {"code"', prompt)
+
+    def test_orchestrator_sends_one_request_per_batch(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "v1_initial.py")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(SAMPLE)
+            with mock.patch.dict("os.environ", {}, clear=True):
+                orchestrator = SimpleOrchestrator(path, use_cache=False, batch_token_budget=1000)
+            client = BatchClient()
+            orchestrator.ai_client = client
+
+            results = orchestrator.evolve_code()
+
+            self.assertEqual(len(client.prompts), 1)
+            self.assertEqual([r.name for r in results], ["greet", "farewell"])
+            self.assertTrue(all(r.output_ok for r in results))
+            self.assertEqual(results[0].explanation, "展開")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import threading
+import time
+import unittest
+
+from evolve_chip.constraints.sandbox import SandboxPool, ValidationTask
+
+
+class TestSandboxPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = SandboxPool(workers=2, timeout=1.0, memory_limit_mb=1024)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def test_valid_candidate(self):
+        record = self.pool.validate(ValidationTask(
+            name="greet",
+            code="def greet():\n    print(GREETING)\n",
+            source="GREETING = 'Hello World'\n",
+            constraints={'output': 'Hello World', 'memory': '< 1MB'}
+        ))
+        self.assertIsNone(record.error)
+        self.assertTrue(record.passed)
+
+    def test_timeout_respawns_worker(self):
+        record = self.pool.validate(ValidationTask(
+            name="spin", code="def spin():\n    while True:\n        pass\n"
+        ))
+        self.assertTrue(record.timed_out)
+        self.assertFalse(record.passed)
+
+        # 作り直したワーカーで続けて検証できる
+        for _ in range(3):
+            record = self.pool.validate(ValidationTask(name="ok", code="def ok():\n    pass\n"))
+            self.assertIsNone(record.error)
+
+    def test_memory_limit(self):
+        record = self.pool.validate(ValidationTask(
+            name="hog", code="def hog():\n    return bytearray(4 * 1024 ** 3)\n"
+        ))
+        self.assertIn("メモリ", record.error)
+
+    def test_globals_are_isolated(self):
+        code = "def mutate():\n    global COUNTER\n    COUNTER += 1\n    print(COUNTER)\n"
+        for _ in range(2):
+            record = self.pool.validate(ValidationTask(
+                name="mutate", code=code, source="COUNTER = 0\n",
+                constraints={'output': '1'}
+            ))
+            self.assertTrue(record.output_ok)
+
+    def test_module_objects_are_not_shared(self):
+        # 候補がモジュールレベルのオブジェクトを書き換えても、元の関数や次の候補には残らない
+        code = "def record():\n    SEEN.append(1)\n    print(len(SEEN))\n    return len(SEEN)\n"
+        # 同じワーカーで続けて検証されるよう、ワーカー数より多く検証する
+        for _ in range(self.pool.workers + 1):
+            record = self.pool.validate(ValidationTask(
+                name="record", code=code, source="SEEN = []\n\ndef record():\n    return len(SEEN)\n",
+                constraints={'output': '1'}, compare=True, inputs=[]
+            ))
+            self.assertIsNone(record.error)
+            self.assertTrue(record.output_ok)
+
+    def test_candidate_must_define_function(self):
+        # 元の関数が残っていても、候補が定義しなければ検証しない
+        record = self.pool.validate(ValidationTask(
+            name="greet",
+            code="def helper():\n    print('Hello World')\n",
+            source="def greet():\n    print('Hello World')\n",
+            constraints={'output': 'Hello World'}
+        ))
+        self.assertIn("greet", record.error)
+        self.assertFalse(record.passed)
+
+    def test_close_during_validation_stops_workers(self):
+        pool = SandboxPool(workers=1, timeout=5.0, memory_limit_mb=1024)
+        task = ValidationTask(name="wait", code="import time\ndef wait():\n    time.sleep(0.5)\n", source="")
+        outcomes = []
+
+        def validate():
+            try:
+                outcomes.append(pool.validate(task))
+            except RuntimeError as e:
+                outcomes.append(e)
+
+        threads = [threading.Thread(target=validate) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)
+        pool.close()
+        for thread in threads:
+            thread.join(5)
+        # 検証中だったワーカーはプールに戻さずに終了し、空きを待っていた呼び出しは失敗する
+        self.assertEqual(len(outcomes), 2)
+        self.assertEqual(sum(isinstance(o, RuntimeError) for o in outcomes), 1)
+        self.assertEqual([w for w in pool._idle.queue if w is not None], [])
+        self.assertEqual(pool._all, set())
+
+    def test_compare_with_original(self):
+        record = self.pool.validate(ValidationTask(
+            name="total",
+            code="def total(n=100):\n    return n * (n - 1) // 2\n",
+            source="def total(n=100):\n    return sum(i for i in range(n))\n",
+            compare=True,
+            inputs=[1000]
+        ))
+        self.assertGreater(record.speedup, 1)
+        self.assertLessEqual(record.speedup_ci[0], record.speedup)
+
+
+if __name__ == '__main__':
+    unittest.main()
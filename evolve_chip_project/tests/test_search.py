@@ -0,0 +1,106 @@
+import os
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+from evolve_chip.constraints.benchmark import BenchmarkConfig
+from evolve_chip.core.search import Evaluation, EvolutionarySearch, SearchConfig
+from evolve_chip.orchestrator import SimpleOrchestrator
+
+SAMPLE = '''from evolve_chip.core.decorators import evolve, EvolutionGoal
+
+@evolve(goals=[EvolutionGoal.PERFORMANCE], constraints={'output': ''}, inputs=[(3000,)])
+def total(n=3000):
+    result = 0
+    for i in range(n):
+        result += i
+    return result
+'''
+
+FAST = "def total(n=3000):\n    return n * (n - 1) // 2\n"
+
+
+def speed_of(code):
+    return float(re.search(r"speed=([\d.]+)", code).group(1))
+
+
+class TestEvolutionarySearch(unittest.TestCase):
+    def test_parents_are_improved_across_generations(self):
+        prompts = []
+
+        def generate(prompt):
+            prompts.append(prompt)
+            parents = [float(s) for s in re.findall(r"speed=([\d.]+)", prompt)]
+            if not parents:
+                index = re.search(r"案(\d+)", prompt)
+                return f"speed={[1.0, 1.2, 0.0, 1.1][int(index.group(1)) - 1 if index else 0]}"
+            return f"speed={max(parents) * 1.5:.3f}"
+
+        def evaluate(code):
+            speed = speed_of(code)
+            return Evaluation(passed=speed > 0, speedup=speed or None)
+
+        config = SearchConfig(population_size=4, generations=3, parents=2, patience=2, seed=1)
+        result = EvolutionarySearch(generate, evaluate, config).run("base")
+
+        self.assertEqual(result.generations, 3)
+        self.assertEqual(len(prompts), 12)
+        self.assertAlmostEqual(speed_of(result.best.code), 1.2 * 1.5 * 1.5, places=2)
+        self.assertEqual(result.best.generation, 2)
+        self.assertIn(result.best.operator, ("mutation", "crossover"))
+        # 2世代目の親は1世代目の上位2件（1.2xと1.1x）
+        second = [c for c in result.candidates if c.generation == 1]
+        self.assertEqual({p for c in second for p in c.parents}, {1, 3})
+        self.assertIn("generation 2: 4/4 passed", result.format_report())
+
+    def test_plateau_stops_early_and_duplicates_are_evaluated_once(self):
+        evaluate = mock.Mock(return_value=Evaluation(passed=True, speedup=1.3))
+        config = SearchConfig(population_size=3, generations=5, patience=1)
+        result = EvolutionarySearch(lambda prompt: "same", evaluate, config).run("base")
+
+        self.assertTrue(result.stopped_early)
+        self.assertEqual(result.generations, 2)
+        self.assertEqual(evaluate.call_count, 1)
+        self.assertEqual(result.best.id, 0)
+
+    def test_no_feasible_candidate(self):
+        evaluate = mock.Mock(side_effect=RuntimeError("boom"))
+        config = SearchConfig(population_size=2, generations=2)
+        result = EvolutionarySearch(lambda prompt: prompt, evaluate, config).run("base")
+
+        self.assertIsNone(result.best)
+        self.assertFalse(result.stopped_early)
+        self.assertEqual(result.candidates[0].evaluation.error, "RuntimeError: boom")
+
+
+class TestOrchestratorSearch(unittest.TestCase):
+    def test_performance_functions_are_searched(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "v1_initial.py")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(SAMPLE)
+
+            with mock.patch.dict("os.environ", {}, clear=True):
+                orchestrator = SimpleOrchestrator(
+                    path, use_cache=False, sandbox=False, streaming=False,
+                    benchmark_config=BenchmarkConfig(max_time=0.02, min_samples=3, max_samples=10),
+                    search=SearchConfig(population_size=2, generations=2, patience=2)
+                )
+            slow = SAMPLE[SAMPLE.index("def total"):]
+            orchestrator.ai_client = mock.Mock()
+            orchestrator.ai_client.generate_content.side_effect = lambda prompt: (
+                f"```python\n{FAST if '前の世代' in prompt else slow}```"
+            )
+            result, = orchestrator.evolve_code()
+
+            self.assertEqual((result.search_generations, result.search_candidates), (2, 4))
+            self.assertEqual(orchestrator.ai_client.generate_content.call_count, 4)
+            self.assertEqual(result.evolved_code.strip(), FAST.strip())
+            self.assertGreater(result.speedup, 1)
+            with open(os.path.join(tmp, "v2_evolved.py"), encoding="utf-8") as f:
+                self.assertIn("n * (n - 1) // 2", f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
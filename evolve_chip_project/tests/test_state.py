@@ -0,0 +1,105 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from evolve_chip.ai.mock import MockAIClient
+from evolve_chip.core.state import DONE, FAILED, PENDING, RUNNING, TaskStateStore
+from evolve_chip.orchestrator import SimpleOrchestrator
+
+SAMPLE = '''from evolve_chip.core.decorators import evolve, EvolutionGoal
+
+@evolve(goals=[EvolutionGoal.READABILITY], constraints={'output': 'Hello World'})
+def greet():
+    print("HW")
+
+@evolve(goals=[EvolutionGoal.READABILITY], constraints={'output': 'Hello World'})
+def greet_twice():
+    print("HW")
+'''
+
+
+class TestTaskStateStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "state.db")
+
+    def make_store(self, **kwargs):
+        store = TaskStateStore(self.path, **kwargs)
+        self.addCleanup(store.close)
+        return store
+
+    def test_resume_restarts_in_flight_tasks(self):
+        store = self.make_store()
+        store.begin_run("run", ["a", "b", "c"])
+        self.assertEqual(store.start("run", "a"), 1)
+        store.record_candidate("run", "a", "def a(): pass", {"speedup": 1.5}, accepted=True)
+        store.finish("run", "a", {"name": "a"})
+        store.start("run", "b")
+        store.close()  # bの実行中にプロセスが終了した
+
+        resumed = self.make_store()
+        tasks = resumed.begin_run("run", ["a", "b", "c"])
+        self.assertEqual([t.status for t in tasks.values()], [DONE, PENDING, PENDING])
+        self.assertEqual(tasks["a"].result, {"name": "a"})
+        self.assertEqual(tasks["b"].attempts, 1)
+        self.assertEqual(resumed.start("run", "b"), 2)
+        self.assertEqual(
+            resumed.candidates("run", "a"),
+            [{"attempt": 1, "code": "def a(): pass", "measurements": {"speedup": 1.5}, "accepted": True}]
+        )
+        summary, = resumed.runs()
+        self.assertEqual((summary.finished, summary.total), (1, 3))
+        self.assertEqual(summary.counts[RUNNING], 1)
+
+    def test_repeatedly_interrupted_task_fails(self):
+        store = self.make_store(max_attempts=2)
+        for _ in range(2):
+            store.begin_run("run", ["a"])
+            store.start("run", "a")
+        task = store.begin_run("run", ["a"])["a"]
+        self.assertEqual((task.status, task.attempts), (FAILED, 2))
+
+        self.assertEqual(store.reset("run"), 1)
+        self.assertEqual(store.runs(), [])
+
+
+class TestOrchestratorResume(unittest.TestCase):
+    def test_resume_skips_finished_functions(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "v1_initial.py")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(SAMPLE)
+            store = TaskStateStore(os.path.join(tmp, "state.db"))
+            self.addCleanup(store.close)
+
+            def run():
+                with mock.patch.dict("os.environ", {}, clear=True):
+                    orchestrator = SimpleOrchestrator(path, use_cache=False, sandbox=False, state=store)
+                orchestrator.ai_client = mock.Mock(wraps=MockAIClient(delay_seconds=0))
+                return orchestrator, orchestrator.evolve_code()
+
+            first, results = run()
+            self.assertTrue(results[0].output_ok)
+            tasks = store.tasks(first.run_id)
+            self.assertEqual(tasks["greet"].status, DONE)
+            self.assertEqual(len(store.candidates(first.run_id, "greet")), 1)
+
+            # greet_twiceの処理中に中断した状態にする
+            store.start(first.run_id, "greet_twice")
+            os.remove(os.path.join(tmp, "v2_evolved.py"))
+
+            second, resumed = run()
+            self.assertEqual(second.run_id, first.run_id)
+            self.assertEqual([r.name for r in resumed], ["greet", "greet_twice"])
+            self.assertEqual(resumed[0].evolved_code, results[0].evolved_code)
+            self.assertEqual(second.ai_client.stream_content.call_count, 1)
+            # 1回目の実行・中断した試行に続く3回目の試行
+            self.assertEqual(store.tasks(first.run_id)["greet_twice"].attempts, 3)
+            with open(os.path.join(tmp, "v2_evolved.py"), encoding="utf-8") as f:
+                self.assertIn("def greet():", f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
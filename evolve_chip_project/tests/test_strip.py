@@ -0,0 +1,120 @@
+import os
+import csv
+import base64
+import hashlib
+import tempfile
+import textwrap
+import unittest
+import zipfile
+
+from evolve_chip.core.strip import StripError, strip_source, strip_tree, strip_wheel
+
+DECORATED = textwrap.dedent('''\
+    """サンプル"""
+    import os, evolve_chip.core.chip as chip
+    from evolve_chip.core.decorators import evolve, EvolutionGoal
+
+    try:
+        from evolve_chip import EvolveChip  # 開発時のみ
+    except ImportError:
+        pass
+
+
+    @evolve(
+        goals=[EvolutionGoal.PERFORMANCE],
+        constraints={'runtime': '< 0.1s'}
+    )
+    def greet(name: str) -> str:
+        # 挨拶を返す
+        return f"こんにちは、{name}"
+
+
+    class Greeter:
+        @staticmethod
+        @chip.evolve()
+        def hello():
+            return os.sep
+''')
+
+
+class TestStripSource(unittest.TestCase):
+    def test_decorators_and_imports_are_removed(self):
+        result = strip_source(DECORATED)
+        self.assertEqual(result.decorators, 2)
+        self.assertEqual(result.imports, 3)
+        self.assertNotIn("evolve", result.source)
+        self.assertIn("import os\n", result.source)
+        self.assertIn("    pass  # 開発時のみ\n", result.source)
+        self.assertIn("    @staticmethod\n    def hello():", result.source)
+        self.assertIn("    # 挨拶を返す\n", result.source)
+
+        namespace = {}
+        exec(result.source, namespace)
+        # ラッパーが残らず、元の関数そのものになる
+        self.assertFalse(hasattr(namespace["greet"], "__wrapped__"))
+        self.assertEqual(namespace["greet"]("世界"), "こんにちは、世界")
+
+    def test_untouched_without_chip_imports(self):
+        source = "import os\n\n@decorator\ndef f():\n    pass\n"
+        result = strip_source(source)
+        self.assertFalse(result.changed)
+        self.assertEqual(result.source, source)
+
+    def test_other_usage_is_rejected(self):
+        source = "from evolve_chip.constraints.checker import check_output\n\ncheck_output(print, '')\n"
+        with self.assertRaises(StripError):
+            strip_source(source)
+
+
+class TestStripArtifacts(unittest.TestCase):
+    def test_tree_is_copied_without_package(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "src")
+            os.makedirs(os.path.join(src, "app"))
+            os.makedirs(os.path.join(src, "evolve_chip"))
+            with open(os.path.join(src, "app", "main.py"), "w", encoding="utf-8") as f:
+                f.write(DECORATED)
+            with open(os.path.join(src, "evolve_chip", "__init__.py"), "w") as f:
+                f.write("")
+
+            report = strip_tree(src, os.path.join(tmp, "out"))
+            self.assertEqual((report.files, report.changed, report.skipped), (1, 1, 1))
+            self.assertFalse(os.path.exists(os.path.join(tmp, "out", "evolve_chip")))
+            with open(os.path.join(tmp, "out", "app", "main.py"), encoding="utf-8") as f:
+                self.assertNotIn("evolve", f.read())
+            # 入力は変更しない
+            with open(os.path.join(src, "app", "main.py"), encoding="utf-8") as f:
+                self.assertEqual(f.read(), DECORATED)
+
+    def test_wheel_record_is_regenerated(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            wheel = os.path.join(tmp, "app-1.0-py3-none-any.whl")
+            with zipfile.ZipFile(wheel, "w") as zf:
+                zf.writestr("app/main.py", DECORATED)
+                zf.writestr(
+                    "app-1.0.dist-info/METADATA",
+                    "Metadata-Version: 2.1\nName: app\nRequires-Dist: evolve-chip>=0.1\nRequires-Dist: requests\n"
+                )
+                zf.writestr("app-1.0.dist-info/RECORD", "stale\n")
+
+            output = os.path.join(tmp, "stripped.whl")
+            report = strip_wheel(wheel, output)
+            self.assertEqual(report.changed, 1)
+
+            with zipfile.ZipFile(output) as zf:
+                self.assertNotIn("evolve", zf.read("app/main.py").decode("utf-8"))
+                metadata = zf.read("app-1.0.dist-info/METADATA").decode("utf-8")
+                self.assertNotIn("evolve-chip", metadata)
+                self.assertIn("Requires-Dist: requests", metadata)
+
+                rows = list(csv.reader(zf.read("app-1.0.dist-info/RECORD").decode("utf-8").splitlines()))
+                self.assertEqual(rows[-1], ["app-1.0.dist-info/RECORD", "", ""])
+                for name, digest, size in rows[:-1]:
+                    data = zf.read(name)
+                    expected = base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b"=")
+                    self.assertEqual(digest, "sha256=" + expected.decode("ascii"))
+                    self.assertEqual(int(size), len(data))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from evolve_chip.ai.gemini import GeminiClient
+from evolve_chip.ai.key_manager import mask_key
+from evolve_chip.ai.metered import MeteredAIClient
+from evolve_chip.ai.usage import BudgetExceededError, TokenBudget, TokenUsage, UsageLedger, usage_scope
+from evolve_chip.core.search import SearchConfig
+from evolve_chip.orchestrator import SimpleOrchestrator
+from .test_gemini_client import FakeResponse, text_payload
+
+SAMPLE = '''from evolve_chip.core.decorators import evolve, EvolutionGoal
+
+@evolve(goals=[EvolutionGoal.PERFORMANCE], constraints={'output': '4950', 'runtime': '< 1s'})
+def total(n=100):
+    print(sum(range(n)))
+'''
+
+EVOLVED = "```python\ndef total(n=100):\n    print(n * (n - 1) // 2)\n```"
+
+
+class TestUsageLedger(unittest.TestCase):
+    def test_batch_usage_is_split_and_budget_enforced(self):
+        ledger = UsageLedger(TokenBudget(run=1000, task=400))
+        with usage_scope("run", ["a", "b"]):
+            with ledger.call("p" * 40) as call:
+                call.completion = "c" * 40
+        self.assertEqual(ledger.total.calls, 1)
+        self.assertEqual(ledger.total.estimated_calls, 1)
+        a, b = ledger.usage("task", "a"), ledger.usage("task", "b")
+        self.assertEqual(a.total_tokens + b.total_tokens, ledger.usage("run", "run").total_tokens)
+        self.assertLessEqual(abs(a.total_tokens - b.total_tokens), 1)
+
+        ledger.record(TokenUsage(prompt_tokens=300, completion_tokens=50, total_tokens=350, calls=1), "run", ["a"])
+        self.assertTrue(ledger.should_downgrade("run", ["a"]))
+        self.assertFalse(ledger.should_downgrade("run", ["b"]))
+        with usage_scope("run", ["a"]):
+            with self.assertRaises(BudgetExceededError):
+                with ledger.call("p" * 400):
+                    self.fail("予算を超える呼び出しが実行された")
+        # 送信しなかった呼び出しは記録しない
+        self.assertEqual(ledger.total.calls, 2)
+
+
+class TestGeminiUsage(unittest.TestCase):
+    def test_reported_usage_is_recorded_per_key(self):
+        with mock.patch.dict("os.environ", {}, clear=True):
+            client = GeminiClient(api_key="key-a")
+        self.addCleanup(client.close)
+        payload = text_payload("ok")
+        payload["usageMetadata"] = {
+            "promptTokenCount": 12, "candidatesTokenCount": 3, "thoughtsTokenCount": 2, "totalTokenCount": 17
+        }
+        client._session = mock.Mock()
+        client._session.post.return_value = FakeResponse(payload)
+
+        response = client.generate_response("hello")
+        self.assertEqual(response.text, "ok")
+        self.assertEqual(response.usage, {"prompt_tokens": 12, "completion_tokens": 5, "total_tokens": 17})
+        self.assertEqual(response.token_count, 17)
+
+        ledger = UsageLedger()
+        metered = MeteredAIClient(client, usage=ledger)
+        with usage_scope("run", ["total"]):
+            self.assertEqual(metered.generate_content("hello"), "ok")
+        self.assertEqual(ledger.usage("key", mask_key("key-a")).total_tokens, 17)
+        self.assertEqual(ledger.usage("task", "total").completion_tokens, 5)
+        self.assertEqual(ledger.total.estimated_calls, 0)
+
+
+class TestOrchestratorBudget(unittest.TestCase):
+    def make_orchestrator(self, tmp, used, **kwargs):
+        path = os.path.join(tmp, "v1_initial.py")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(SAMPLE)
+        ledger = UsageLedger(TokenBudget(run=10000))
+        with mock.patch.dict("os.environ", {}, clear=True):
+            orchestrator = SimpleOrchestrator(
+                path, use_cache=False, sandbox=False, streaming=False, run_id="run", usage=ledger, **kwargs
+            )
+        ledger.restore(TokenUsage(total_tokens=used), "run")
+        client = mock.Mock()
+        client.generate_content.return_value = EVOLVED
+        orchestrator.ai_client = MeteredAIClient(client, usage=ledger)
+        return orchestrator, client
+
+    def test_search_is_skipped_when_budget_runs_low(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            orchestrator, client = self.make_orchestrator(
+                tmp, 8500, search=SearchConfig(population_size=3, generations=2)
+            )
+            result, = orchestrator.evolve_code()
+            self.assertEqual(client.generate_content.call_count, 1)
+            self.assertIsNone(result.search_generations)
+            self.assertTrue(result.output_ok)
+            self.assertGreater(result.prompt_tokens, 0)
+            self.assertGreater(result.completion_tokens, 0)
+
+    def test_exhausted_budget_stops_without_calling_ai(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            orchestrator, client = self.make_orchestrator(tmp, 9990)
+            result, = orchestrator.evolve_code()
+            client.generate_content.assert_not_called()
+            self.assertIn("トークン予算", result.error)
+            self.assertEqual(result.prompt_tokens, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()